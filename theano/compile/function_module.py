@@ -24,7 +24,9 @@ from theano.compile.io import (
     In, SymbolicInput, SymbolicInputKit, SymbolicOutput)
 from theano.compile.ops import deep_copy_op, view_op
 from theano.gof.graph import is_same_graph
+from theano.gof import cpu_pool
 from theano.gof.op import ops_with_inner_function
+from theano.misc.threads import thread_budget
 
 import logging
 _logger = logging.getLogger('theano.compile.function_module')
@@ -239,6 +241,11 @@ class Function(object):
     numpy tensor.  C code should raise an error if you pass an object
     of the wrong type.
 
+    A Function instance have a ``threads`` field that default to None.
+    When set, the function uses at most that many threads in BLAS and
+    OpenMP ops, otherwise it uses its share of ``config.threads``. See
+    `theano.misc.threads`.
+
     Attributes
     ----------
     finder
@@ -360,6 +367,7 @@ class Function(object):
         self.maker = maker
         self.profile = None  # reassigned in FunctionMaker.create
         self.trust_input = False  # If True, we don't check the input parameter
+        self.threads = None  # If set, the maximum number of CPU threads
         self.name = None
         self.nodes_with_inner_function = []
         self.output_keys = output_keys
@@ -729,6 +737,7 @@ class Function(object):
                 in_cpy.variable = swap[in_ori.variable]
 
         f_cpy.name = name
+        f_cpy.threads = self.threads
         f_cpy.maker.fgraph.name = name
         return f_cpy
 
@@ -836,6 +845,8 @@ class Function(object):
 
         # Do the actual work
         t0_fn = time.time()
+        thread_budget.acquire(self.threads)
+        previous_allocator = cpu_pool.activate()
         try:
             outputs = self.fn()
         except Exception:
@@ -859,6 +870,9 @@ class Function(object):
             else:
                 # old-style linkers raise their own exceptions
                 raise
+        finally:
+            cpu_pool.deactivate(previous_allocator)
+            thread_budget.release()
 
         dt_fn = time.time() - t0_fn
         self.maker.mode.fn_time += dt_fn
@@ -28,7 +28,8 @@ import numpy
 
 import theano
 from six import iteritems
-from theano.gof import graph
+from theano.gof import cpu_pool, graph
+from theano.gof.op import apply_cost
 from theano.configparser import AddConfigVar, BoolParam, IntParam, StrParam
 
 
@@ -551,6 +552,25 @@ class ProfileStats(object):
               file=file)
         print('', file=file)
 
+    def apply_cost(self, node):
+        """
+        Return the estimated (flops, bytes_read, bytes_written) of one
+        execution of `node`, using the shapes recorded during the last
+        call.
+
+        Returns None if the shapes were not recorded or if the Op does
+        not provide a cost model (see `PureOp.cost`).
+
+        """
+        shapes = []
+        for var in node.inputs + node.outputs:
+            sh = self.variable_shape.get(var, None)
+            if not isinstance(sh, (tuple, list)):
+                return None
+            shapes.append(sh)
+        nin = len(node.inputs)
+        return apply_cost(node, shapes[:nin], shapes[nin:])
+
     def summary_nodes(self, file=sys.stderr, N=None):
         if self.apply_time:
             local_time = sum(self.apply_time.values())
@@ -586,9 +606,9 @@ class ProfileStats(object):
         hs += ['<id>']
         es += ['%3d']
 
-        es += ['%s', '%s']
+        es += ['%s', '%s', '%s']
         if self.variable_shape:
-            hs += ['<Mflops>', '<Gflops/s>']
+            hs += ['<Mflops>', '<Gflops/s>', '<GB/s>']
 
         upto_length = numpy.sum([len(x) for x in hs]) + len(hs)
         maxlen = max(self.line_width - upto_length, 0)
@@ -623,22 +643,25 @@ class ProfileStats(object):
             ftot = tot * 100 / local_time
             if nb_call == 0:
                 continue
+            cost = self.apply_cost(a)
             if not self.variable_shape:
                 flops = ""
                 flops_s = ""
-            elif hasattr(a.op, 'flops'):
-                fl = a.op.flops([self.variable_shape[var]
-                                 for var in a.inputs],
-                                [self.variable_shape[var]
-                                 for var in a.outputs])
+                bandwidth = ""
+            elif cost is not None and t > 0:
+                fl, bytes_read, bytes_written = cost
+                t_call = t / nb_call
                 flops = '%8.1f' % (fl / 1024. / 1024)
-                flops_s = '%10.1f' % (fl / 1024. / 1024 / 1024 / t)
+                flops_s = '%10.1f' % (fl / 1024. / 1024 / 1024 / t_call)
+                bandwidth = '%6.1f' % ((bytes_read + bytes_written) /
+                                       1024. / 1024 / 1024 / t_call)
             else:
                 flops = "        "
                 flops_s = "          "
+                bandwidth = "      "
             print(format_str % (f, ftot, t, t / nb_call, nb_call,
                                 nd_id,
-                                flops, flops_s,
+                                flops, flops_s, bandwidth,
                                 str(a)[:maxlen]), file=file)
             if not config.profile_memory:
                 continue
@@ -698,6 +721,16 @@ class ProfileStats(object):
               theano.gradient.grad_time, file=file)
         total_time = time.time() - theano_imported_time
         print('Time since theano import %.3fs' % (total_time), file=file)
+        pool_stats = cpu_pool.stats()
+        if pool_stats is not None:
+            pooled = pool_stats['hits'] + pool_stats['misses']
+            print('CPU memory pool: %d hits, %d misses (%.1f%% hit rate), '
+                  '%.1fMB cached (peak %.1fMB, limit %.1fMB)' % (
+                      pool_stats['hits'], pool_stats['misses'],
+                      100. * pool_stats['hits'] / max(pooled, 1),
+                      pool_stats['cached'] / 1024. / 1024.,
+                      pool_stats['peak_cached'] / 1024. / 1024.,
+                      pool_stats['limit'] / 1024. / 1024.), file=file)
 
     def summary_memory(self, file, N=None):
         fct_memory = {}  # fgraph->dict(node->[outputs size])
@@ -4,7 +4,8 @@ import logging
 
 import theano
 from theano.configparser import (AddConfigVar, BoolParam, ConfigParam, EnumStr,
-                                 IntParam, StrParam, TheanoConfigParser)
+                                 FloatParam, IntParam, StrParam,
+                                 TheanoConfigParser)
 from theano.misc.cpucount import cpuCount
 from theano.misc.windows import call_subprocess_Popen
 
@@ -519,6 +520,15 @@ AddConfigVar(
     in_c_key=False)
 
 
+AddConfigVar(
+    'intern_apply',
+    ("If True, calling an Op on the same inputs as an Apply node built "
+     "before returns the outputs of that node instead of a new node. "
+     "This removes duplicated nodes when the graph is built, instead of "
+     "in the merge optimization."),
+    BoolParam(False),
+    in_c_key=False)
+
 AddConfigVar('compute_test_value_opt',
              ("For debugging Theano optimization only."
               " Same as compute_test_value, but is used"
@@ -599,6 +609,32 @@ AddConfigVar('openmp',
              in_c_key=False,
              )
 
+AddConfigVar('threads',
+             "Number of CPU threads that the Theano functions of this "
+             "process may use, in BLAS and in OpenMP ops. 0 means "
+             "OMP_NUM_THREADS if it is set, otherwise the number of CPU "
+             "cores. It is split evenly between the functions that run at "
+             "the same time. Lower it when several processes share a host.",
+             IntParam(0, lambda i: i >= 0),
+             in_c_key=False,
+             )
+
+AddConfigVar('cpu_pool.limit',
+             "Size of the memory that the pool of CPU buffers may keep "
+             "between the allocations of Theano functions. 0: no pool. "
+             "0 < N <= 1: fraction of the physical memory. N > 1: MB. "
+             "It needs numpy 1.22 or later.",
+             FloatParam(0, lambda i: i >= 0),
+             in_c_key=False,
+             )
+
+AddConfigVar('cpu_pool.min_size',
+             "Size in bytes of the smallest buffer that the pool of CPU "
+             "buffers recycles. malloc is fast enough for smaller ones.",
+             IntParam(65536, lambda i: i >= 0),
+             in_c_key=False,
+             )
+
 AddConfigVar('openmp_elemwise_minsize',
              "If OpenMP is enabled, this is the minimum size of vectors "
              "for which the openmp parallelization is enabled "
@@ -607,6 +643,17 @@ AddConfigVar('openmp_elemwise_minsize',
              in_c_key=False,
              )
 
+AddConfigVar('openmp_elemwise_autotune',
+             "If True, element wise ops use openmp from the minimum sizes "
+             "measured on this machine, for each dtype and for cheap and "
+             "costly scalar ops, by "
+             "theano/misc/elemwise_openmp_speedup.py --calibrate and kept "
+             "in the compiledir. If False, or for the sizes not measured, "
+             "openmp_elemwise_minsize is used.",
+             BoolParam(False),
+             in_c_key=False,
+             )
+
 AddConfigVar(
     'check_input',
     "Specify if types should check their input in their C code. "
@@ -55,7 +55,8 @@ from theano.gof.link import \
     Container, Linker, LocalLinker, PerformLinker, WrapLinker, WrapLinkerMany
 
 from theano.gof.op import \
-    Op, OpenMPOp, PureOp, COp, ops_with_inner_function
+    Op, OpenMPOp, PureOp, COp, ops_with_inner_function, apply_cost, \
+    shapes_nbytes
 
 from theano.gof.opt import (
     Optimizer,
@@ -0,0 +1,508 @@
+"""
+A memory pool for the ndarrays that Theano functions allocate on the CPU.
+
+Each call of a Theano function allocates its intermediate results and
+outputs, in `Alloc` and `AllocEmpty` and in every C thunk that needs a
+new output, and frees them when the VM garbage collects them. Large
+buffers then go through mmap and munmap each time, and their pages are
+faulted in again on each call.
+
+When ``config.cpu_pool.limit`` is not 0, the numpy arrays created during
+a function call get their memory from this pool, through the memory
+handler API of numpy (numpy 1.22 or later). Freed buffers of at least
+``config.cpu_pool.min_size`` bytes are kept, up to the limit, and given
+back to the next allocation of the same size class. There are four size
+classes per power of two, so a buffer is at most 25% larger than asked.
+
+`stats` reports the hits and misses of the pool, and `clear` frees the
+buffers it keeps. This is the CPU counterpart of CNMeM (``lib.cnmem``)
+on the GPU.
+
+"""
+from __future__ import absolute_import
+
+import errno
+import logging
+import os
+import sys
+import warnings
+
+import numpy
+
+from theano import config
+from theano.gof import cmodule
+from theano.gof.compilelock import get_lock, release_lock
+
+_logger = logging.getLogger('theano.gof.cpu_pool')
+
+# Part of the name of the compiled module, increase it when the C code
+# changes.
+version = 1
+
+_code = """
+#include <Python.h>
+#include <pythread.h>
+#include <stdlib.h>
+#include <string.h>
+#include "numpy/arrayobject.h"
+
+// The buffers have a header before their data, that keeps their size
+// class, or -1 for the buffers that are not pooled. It also links the
+// buffers kept in the pool. It preserves the alignment of malloc.
+#define HEADER 64
+// Size classes per power of two.
+#define N_SUB 4
+#define N_CLASSES (64 * N_SUB)
+
+typedef struct {
+    npy_intp klass;
+    void* next;
+} header_t;
+
+static PyThread_type_lock lock = NULL;
+static void* free_lists[N_CLASSES];
+static size_t limit = 0;
+static size_t min_size = 0;
+static size_t cached = 0;
+static size_t peak_cached = 0;
+static unsigned long long hits = 0;
+static unsigned long long misses = 0;
+static unsigned long long released = 0;
+static unsigned long long unpooled = 0;
+
+static header_t* header_of(void* p)
+{
+    return (header_t*)((char*)p - HEADER);
+}
+
+// The smallest size class of at least n bytes, n >= N_SUB.
+static npy_intp class_of(size_t n)
+{
+    int e = 0;
+    while (((size_t)2 << e) <= n)
+        ++e;
+    const size_t base = (size_t)1 << e;
+    const size_t step = base / N_SUB;
+    const size_t k = (n - base + step - 1) / step;
+    return e * N_SUB + k;
+}
+
+static size_t capacity_of(npy_intp klass)
+{
+    const size_t base = (size_t)1 << (klass / N_SUB);
+    return base + (base / N_SUB) * (klass % N_SUB);
+}
+
+static void* raw_alloc(size_t size, npy_intp klass, int zero)
+{
+    char* raw = (char*)(zero ? calloc(1, size + HEADER)
+                             : malloc(size + HEADER));
+    if (!raw)
+        return NULL;
+    ((header_t*)raw)->klass = klass;
+    return raw + HEADER;
+}
+
+static void* pool_alloc(size_t size, int zero)
+{
+    if (size < min_size || size < N_SUB)
+    {
+        ++unpooled;
+        return raw_alloc(size, -1, zero);
+    }
+    const npy_intp klass = class_of(size);
+    const size_t cap = capacity_of(klass);
+    void* p = NULL;
+    PyThread_acquire_lock(lock, WAIT_LOCK);
+    if (free_lists[klass])
+    {
+        p = free_lists[klass];
+        free_lists[klass] = header_of(p)->next;
+        cached -= cap;
+        ++hits;
+    }
+    else
+    {
+        ++misses;
+    }
+    PyThread_release_lock(lock);
+    if (p)
+    {
+        if (zero)
+            memset(p, 0, size);
+        return p;
+    }
+    return raw_alloc(cap, klass, zero);
+}
+
+static void pool_free(void* p)
+{
+    if (!p)
+        return;
+    header_t* h = header_of(p);
+    if (h->klass >= 0)
+    {
+        const size_t cap = capacity_of(h->klass);
+        PyThread_acquire_lock(lock, WAIT_LOCK);
+        if (cap >= min_size && cached + cap <= limit)
+        {
+            h->next = free_lists[h->klass];
+            free_lists[h->klass] = p;
+            cached += cap;
+            if (cached > peak_cached)
+                peak_cached = cached;
+            p = NULL;
+        }
+        else
+        {
+            ++released;
+        }
+        PyThread_release_lock(lock);
+    }
+    if (p)
+        free(h);
+}
+
+static void* handler_malloc(void* ctx, size_t size)
+{
+    return pool_alloc(size, 0);
+}
+
+static void* handler_calloc(void* ctx, size_t nelem, size_t elsize)
+{
+    if (elsize && nelem > ((size_t)-1 - HEADER) / elsize)
+        return NULL;
+    return pool_alloc(nelem * elsize, 1);
+}
+
+static void* handler_realloc(void* ctx, void* p, size_t new_size)
+{
+    if (!p)
+        return pool_alloc(new_size, 0);
+    header_t* h = header_of(p);
+    if (h->klass < 0)
+    {
+        char* raw = (char*)realloc(h, new_size + HEADER);
+        return raw ? raw + HEADER : NULL;
+    }
+    const size_t cap = capacity_of(h->klass);
+    if (new_size <= cap)
+        return p;
+    void* q = pool_alloc(new_size, 0);
+    if (!q)
+        return NULL;
+    memcpy(q, p, cap);
+    pool_free(p);
+    return q;
+}
+
+static void handler_free(void* ctx, void* p, size_t size)
+{
+    pool_free(p);
+}
+
+static PyDataMem_Handler handler = {
+    "theano_cpu_pool",
+    1,
+    {
+        NULL,
+        handler_malloc,
+        handler_calloc,
+        handler_realloc,
+        handler_free
+    }
+};
+
+static PyObject* handler_capsule = NULL;
+
+// Free the kept buffers until at most `keep` bytes are kept.
+static void trim(size_t keep)
+{
+    PyThread_acquire_lock(lock, WAIT_LOCK);
+    for (int k = N_CLASSES - 1; k >= 0 && cached > keep; --k)
+    {
+        while (free_lists[k] && cached > keep)
+        {
+            void* p = free_lists[k];
+            free_lists[k] = header_of(p)->next;
+            cached -= capacity_of(k);
+            free(header_of(p));
+        }
+    }
+    PyThread_release_lock(lock);
+}
+
+static PyObject* set_limits(PyObject* self, PyObject* args)
+{
+    unsigned long long new_limit, new_min_size;
+    if (!PyArg_ParseTuple(args, "KK", &new_limit, &new_min_size))
+        return NULL;
+    limit = new_limit;
+    min_size = new_min_size;
+    trim(limit);
+    Py_RETURN_NONE;
+}
+
+static PyObject* activate(PyObject* self, PyObject* args)
+{
+    return PyDataMem_SetHandler(handler_capsule);
+}
+
+static PyObject* deactivate(PyObject* self, PyObject* args)
+{
+    PyObject* previous;
+    if (!PyArg_ParseTuple(args, "O", &previous))
+        return NULL;
+    PyObject* ours = PyDataMem_SetHandler(previous);
+    if (!ours)
+        return NULL;
+    Py_DECREF(ours);
+    Py_RETURN_NONE;
+}
+
+static PyObject* clear(PyObject* self, PyObject* args)
+{
+    trim(0);
+    Py_RETURN_NONE;
+}
+
+static PyObject* stats(PyObject* self, PyObject* args)
+{
+    return Py_BuildValue(
+        "{s:K,s:K,s:K,s:K,s:K,s:K,s:K}",
+        "hits", hits, "misses", misses, "released", released,
+        "unpooled", unpooled,
+        "cached", (unsigned long long)cached,
+        "peak_cached", (unsigned long long)peak_cached,
+        "limit", (unsigned long long)limit);
+}
+
+static PyObject* reset_stats(PyObject* self, PyObject* args)
+{
+    hits = misses = released = unpooled = 0;
+    peak_cached = cached;
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef methods[] = {
+    {"set_limits", set_limits, METH_VARARGS, NULL},
+    {"activate", activate, METH_NOARGS, NULL},
+    {"deactivate", deactivate, METH_VARARGS, NULL},
+    {"clear", clear, METH_NOARGS, NULL},
+    {"stats", stats, METH_NOARGS, NULL},
+    {"reset_stats", reset_stats, METH_NOARGS, NULL},
+    {NULL, NULL, 0, NULL}
+};
+
+static int init_pool(void)
+{
+    lock = PyThread_allocate_lock();
+    if (!lock)
+        return -1;
+    handler_capsule = PyCapsule_New(&handler, "mem_handler", NULL);
+    return handler_capsule ? 0 : -1;
+}
+"""
+
+_code_py3 = """
+static struct PyModuleDef moduledef = {
+    PyModuleDef_HEAD_INIT, "%(name)s", NULL, -1, methods,
+};
+
+PyMODINIT_FUNC PyInit_%(name)s(void)
+{
+    import_array();
+    if (init_pool())
+        return NULL;
+    return PyModule_Create(&moduledef);
+}
+"""
+
+_code_py2 = """
+PyMODINIT_FUNC init%(name)s(void)
+{
+    import_array();
+    if (init_pool())
+        return;
+    Py_InitModule("%(name)s", methods);
+}
+"""
+
+_ext = None
+_unsupported = False
+_limits = None
+
+
+def supported():
+    """
+    Return True if numpy lets Theano give it a memory handler.
+
+    """
+    return hasattr(numpy.core.multiarray, 'get_handler_name')
+
+
+def _module_name():
+    return 'cpu_pool_ext_%d' % version
+
+
+def _compile(name, location):
+    if sys.version_info[0] >= 3:
+        init = _code_py3
+    else:
+        init = _code_py2
+    code = _code + init % dict(name=name)
+    args = cmodule.GCC_compiler.compile_args()
+    cmodule.GCC_compiler.compile_str(name, code, location=location,
+                                     preargs=args)
+
+
+def _import_ext():
+    """
+    Return the compiled module of the pool, compiling it if needed.
+
+    As for cutils_ext, the module lives in a package of the compiledir,
+    so that a directory of the same name is not imported instead.
+
+    """
+    name = _module_name()
+    location = os.path.join(config.compiledir, 'cpu_pool_ext')
+    sys.path.insert(0, config.compiledir)
+    try:
+        if not os.path.exists(location):
+            try:
+                os.mkdir(location)
+            except OSError as e:
+                assert e.errno == errno.EEXIST
+        if not os.path.exists(os.path.join(location, '__init__.py')):
+            open(os.path.join(location, '__init__.py'), 'w').close()
+        full_name = 'cpu_pool_ext.' + name
+        try:
+            return __import__(full_name, fromlist=[name])
+        except ImportError:
+            pass
+        get_lock()
+        try:
+            # Another process may have compiled it while we waited.
+            try:
+                return __import__(full_name, fromlist=[name])
+            except ImportError:
+                pass
+            _logger.info("Compiling the CPU memory pool")
+            _compile(name, location)
+            return __import__(full_name, fromlist=[name])
+        finally:
+            release_lock()
+    finally:
+        if sys.path[0] == config.compiledir:
+            del sys.path[0]
+
+
+def limit_bytes(limit=None):
+    """
+    Return the number of bytes that ``config.cpu_pool.limit`` stands for.
+
+    As for ``lib.cnmem``, a value of at most 1 is a fraction of the
+    physical memory, a larger one a number of MB.
+
+    """
+    if limit is None:
+        limit = config.cpu_pool.limit
+    if limit <= 0:
+        return 0
+    if limit <= 1:
+        try:
+            total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (AttributeError, ValueError, OSError):
+            warnings.warn("Theano cannot find the size of the physical "
+                          "memory. Set cpu_pool.limit in MB instead of as "
+                          "a fraction. The CPU memory pool is disabled.")
+            return 0
+        return int(total * limit)
+    return int(limit * 1024 * 1024)
+
+
+def _get_ext():
+    """
+    Return the compiled module with the current limits, or None.
+
+    """
+    global _ext, _unsupported, _limits
+    if _unsupported:
+        return None
+    if _ext is None:
+        if not supported():
+            _unsupported = True
+            warnings.warn("The CPU memory pool (config.cpu_pool.limit) "
+                          "needs numpy 1.22 or later. It is disabled.")
+            return None
+        try:
+            _ext = _import_ext()
+        except Exception as e:
+            _unsupported = True
+            warnings.warn("The CPU memory pool could not be compiled, it "
+                          "is disabled: %s" % e)
+            return None
+    limits = (config.cpu_pool.limit, config.cpu_pool.min_size)
+    if limits != _limits:
+        _ext.set_limits(limit_bytes(limits[0]), limits[1])
+        _limits = limits
+    return _ext
+
+
+def activate():
+    """
+    Make the pool allocate the numpy arrays created from now on.
+
+    Return what `deactivate` takes to restore the previous allocator, or
+    None when the pool is disabled.
+
+    """
+    if not config.cpu_pool.limit:
+        if _limits is not None and _limits[0]:
+            # The pool was disabled: do not keep the memory.
+            _get_ext()
+        return None
+    ext = _get_ext()
+    if ext is None:
+        return None
+    return ext.activate()
+
+
+def deactivate(previous):
+    """
+    Restore the allocator replaced by `activate`.
+
+    The arrays allocated by the pool keep returning their memory to it.
+
+    """
+    if previous is not None:
+        _ext.deactivate(previous)
+
+
+def stats():
+    """
+    Return a dict with the statistics of the pool, or None if it is unused.
+
+    hits and misses count the pooled allocations that reused a buffer or
+    not; unpooled those smaller than ``cpu_pool.min_size``; released the
+    freed buffers that did not fit under the limit. cached, peak_cached and
+    limit are in bytes.
+
+    """
+    if _ext is None:
+        return None
+    return _ext.stats()
+
+
+def reset_stats():
+    if _ext is not None:
+        _ext.reset_stats()
+
+
+def clear():
+    """
+    Free the buffers that the pool keeps.
+
+    """
+    if _ext is not None:
+        _ext.clear()
@@ -186,6 +186,29 @@ def _contains_cycle(fgraph, orderings):
     return visited != len(parent_counts)
 
 
+def _apply_parents(app, orderings):
+    """
+    Return the Apply instances that must be executed before `app`.
+
+    """
+    parents = [i.owner for i in app.inputs if i.owner is not None]
+    parents.extend(orderings.get(app, []))
+    return parents
+
+
+def _apply_children(app, successors):
+    """
+    Return the Apply instances that must be executed after `app`.
+
+    `successors` is the inverse of the orderings dictionary.
+
+    """
+    children = [c for o in app.outputs for c, i in o.clients
+                if c != 'output']
+    children.extend(successors.get(app, []))
+    return children
+
+
 def _build_droot_impact(destroy_handler):
     droot = {}   # destroyed view + nonview variables -> foundation
     impact = {}  # destroyed nonview variable -> it + all views of it
@@ -658,7 +681,10 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
 
     It is a work in progress. The following data structures have been
     converted to use the incremental strategy:
-        <none>
+        The topological order used to detect cycles. It is updated by
+        the Pearce-Kelly dynamic topological sort algorithm, so that
+        checking a replacement only visits the nodes whose position
+        lies between the two ends of the new dependency.
 
     The following data structures remain to be converted:
         <unknown>
@@ -744,6 +770,16 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         self.clients = OrderedDict()  # variable -> apply -> ninputs
         self.stale_droot = True
 
+        # Apply -> position in a topological order of the graph plus the
+        # orderings of the last validate. New nodes are appended at the
+        # end as they are imported after their inputs.
+        self.order = {}
+        self.next_order = 0
+        # (parent, child) dependencies added by change_input since the
+        # last validate. They can break self.order.
+        self.pending_edges = []
+        self.stale_order = not self.do_imports_on_attach
+
         self.debug_all_apps = OrderedSet()
         if self.do_imports_on_attach:
             toolbox.Bookkeeper.on_attach(self, fgraph)
@@ -777,6 +813,9 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         del self.view_o
         del self.clients
         del self.stale_droot
+        del self.order
+        del self.pending_edges
+        del self.stale_order
         assert self.fgraph.destroyer_handler is self
         delattr(self.fgraph, 'destroyers')
         delattr(self.fgraph, 'destroy_handler')
@@ -791,6 +830,12 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         if app in self.debug_all_apps:
             raise ProtocolError("double import")
         self.debug_all_apps.add(app)
+
+        # Nodes are imported after the owners of their inputs, so
+        # appending them keeps self.order valid.
+        if not self.stale_order:
+            self.order[app] = self.next_order
+            self.next_order += 1
         # print 'DH IMPORT', app, id(app), id(self), len(self.debug_all_apps)
 
         # If it's a destructive op, add it to our watch list
@@ -826,6 +871,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         if app not in self.debug_all_apps:
             raise ProtocolError("prune without import")
         self.debug_all_apps.remove(app)
+        self.order.pop(app, None)
 
         # UPDATE self.clients
         for i, input in enumerate(OrderedSet(app.inputs)):
@@ -868,6 +914,13 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             if app not in self.debug_all_apps:
                 raise ProtocolError("change without import")
 
+            if new_r.owner is not None and not self.stale_order:
+                self.pending_edges.append((new_r.owner, app))
+                if len(self.pending_edges) > len(self.order):
+                    # Cheaper to sort everything again.
+                    self.stale_order = True
+                    self.pending_edges = []
+
             # UPDATE self.clients
             self.clients[old_r][app] -= 1
             if self.clients[old_r][app] == 0:
@@ -910,7 +963,7 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
         if self.destroyers:
             ords = self.orderings(fgraph)
 
-            if _contains_cycle(fgraph, ords):
+            if self.order_contains_cycle(fgraph, ords):
                 raise InconsistencyError("Dependency graph contains cycles")
         else:
             # James's Conjecture:
@@ -926,6 +979,158 @@ class DestroyHandler(toolbox.Bookkeeper):  # noqa
             pass
         return True
 
+    def order_contains_cycle(self, fgraph, orderings):
+        """
+        Incremental version of `_contains_cycle(fgraph, orderings)`.
+
+        Update self.order with the dependencies added since the last call
+        and with `orderings`. Only the dependencies that are not already
+        satisfied by self.order cost something. For each of them, the
+        nodes whose position lies between its two ends are visited and
+        reordered (Pearce and Kelly, "A dynamic topological sort
+        algorithm for directed acyclic graphs", 2006).
+
+        Returns
+        -------
+        bool
+            True if the graph contains a cycle, False otherwise.
+
+        """
+        if self.stale_order:
+            return self._rebuild_order(fgraph, orderings)
+
+        order = self.order
+        pending = self.pending_edges
+        self.pending_edges = []
+        edges = list(pending)
+        for app, prereqs in iteritems(orderings):
+            edges.extend((p, app) for p in prereqs)
+
+        successors = None
+        for idx, (parent, child) in enumerate(edges):
+            if parent not in order or child not in order:
+                # Pruned since the change.
+                continue
+            if order[parent] < order[child]:
+                continue
+            if (idx < len(pending) and
+                    not any(i.owner is parent for i in child.inputs)):
+                # The change was reverted.
+                continue
+            if successors is None:
+                successors = {}
+                for app, prereqs in iteritems(orderings):
+                    for p in prereqs:
+                        successors.setdefault(p, []).append(app)
+            if not self._reorder(parent, child, orderings, successors):
+                # Keep the changes that were not checked. If the optimizer
+                # does not revert them, the next validate will see them.
+                self.pending_edges = pending[idx:]
+                return True
+        return False
+
+    def _reorder(self, parent, child, orderings, successors):
+        """
+        Update self.order to add the dependency parent -> child.
+
+        self.order[parent] must be greater than self.order[child].
+
+        Returns
+        -------
+        bool
+            False if the dependency closes a cycle. self.order is then left
+            unchanged.
+
+        """
+        order = self.order
+        lower = order[child]
+        upper = order[parent]
+
+        # Other dependencies checked later in the same validate can still
+        # be unsatisfied, so both searches are bounded on both sides and a
+        # node reached by both of them also means there is a cycle.
+
+        # Nodes reachable from child that are placed between child and
+        # parent.
+        forward = [child]
+        seen = set(forward)
+        stack = [child]
+        while stack:
+            for c in _apply_children(stack.pop(), successors):
+                if c is parent:
+                    return False
+                if (c not in seen and c in order and
+                        lower < order[c] < upper):
+                    seen.add(c)
+                    forward.append(c)
+                    stack.append(c)
+
+        # Nodes that reach parent and are placed between child and parent.
+        forward_set = seen
+        backward = [parent]
+        seen = set(backward)
+        stack = [parent]
+        while stack:
+            for p in _apply_parents(stack.pop(), orderings):
+                if p in forward_set:
+                    return False
+                if (p not in seen and p in order and
+                        lower < order[p] < upper):
+                    seen.add(p)
+                    backward.append(p)
+                    stack.append(p)
+
+        # Reuse the positions of the visited nodes, putting all the
+        # backward nodes before the forward ones.
+        backward.sort(key=order.__getitem__)
+        forward.sort(key=order.__getitem__)
+        nodes = backward + forward
+        positions = sorted(order[n] for n in nodes)
+        for n, pos in zip(nodes, positions):
+            order[n] = pos
+        return True
+
+    def _rebuild_order(self, fgraph, orderings):
+        """
+        Compute self.order from scratch.
+
+        Returns
+        -------
+        bool
+            True if the graph contains a cycle, False otherwise. In that
+            case, self.order stays stale.
+
+        """
+        parent_counts = {}
+        visitable = deque()
+        for app in fgraph.apply_nodes:
+            count = len(_apply_parents(app, orderings))
+            parent_counts[app] = count
+            if not count:
+                visitable.append(app)
+        successors = {}
+        for app, prereqs in iteritems(orderings):
+            for p in prereqs:
+                successors.setdefault(p, []).append(app)
+
+        order = {}
+        while visitable:
+            app = visitable.popleft()
+            order[app] = len(order)
+            for c in _apply_children(app, successors):
+                parent_counts[c] -= 1
+                if not parent_counts[c]:
+                    visitable.append(c)
+
+        self.pending_edges = []
+        if len(order) != len(parent_counts):
+            self.stale_order = True
+            return True
+        self.order = order
+        self.next_order = len(order)
+        self.stale_order = False
+        return False
+
     def orderings(self, fgraph):
         """
         Return orderings induced by destructive operations.
@@ -136,6 +136,10 @@ class FunctionGraph(utils.object2):
         self.inputs = list(inputs)
         self.outputs = outputs
 
+        # Result of the last toposort. It is dropped each time the graph
+        # or the features (that can give orderings) change.
+        self._toposort = None
+
         for f in features:
             self.attach_feature(f)
         self.attach_feature(toolbox.ReplaceValidate())
@@ -217,6 +221,7 @@ class FunctionGraph(utils.object2):
         self.variables = set()
         self.inputs = None
         self.outputs = None
+        self._toposort = None
 
     # clients #
     def clients(self, r):
@@ -242,14 +247,17 @@ class FunctionGraph(utils.object2):
             List of (node, i) pairs such that node.inputs[i] is r.
 
         """
-        if set(r.clients).intersection(set(new_clients)):
+        # Don't build sets of the clients here, variables with many
+        # clients would make each import quadratic.
+        clients = r.clients
+        if any(c in clients for c in new_clients):
             print('ERROR: clients intersect!', file=sys.stderr)
             print('  RCLIENTS of', r, [(n, i, type(n), id(n))
                                        for n, i in r.clients], file=sys.stderr)
             print('  NCLIENTS of', r, [(n, i, type(n), id(n))
                                        for n, i in new_clients], file=sys.stderr)
-        assert not set(r.clients).intersection(set(new_clients))
-        r.clients += new_clients
+            raise AssertionError("clients intersect")
+        clients.extend(new_clients)
 
     def __remove_clients__(self, r, clients_to_remove,
                            prune=True, reason=None):
@@ -266,9 +274,9 @@ class FunctionGraph(utils.object2):
             List of (op, i) pairs such that node.inputs[i] is not r anymore.
 
         """
+        # An (op, i) pair is unique, __add_clients__ checks it.
         for entry in clients_to_remove:
             r.clients.remove(entry)
-            assert entry not in r.clients  # an op,i pair should be unique
         if not r.clients:
             if prune:
                 self.__prune_r__(r, reason)
@@ -311,6 +319,8 @@ class FunctionGraph(utils.object2):
         # (the functions in the graph module only use the input set to
         # know where to stop going down)
         new_nodes = graph.io_toposort(self.variables, apply_node.outputs)
+        if new_nodes:
+            self._toposort = None
 
         if check:
             for node in new_nodes:
@@ -471,6 +481,7 @@ class FunctionGraph(utils.object2):
                 return
         self.apply_nodes.remove(apply_node)
         self.variables.difference_update(apply_node.outputs)
+        self._toposort = None
         self.execute_callbacks('on_prune', apply_node, reason)
 
         for i, input in enumerate(apply_node.inputs):
@@ -513,6 +524,7 @@ class FunctionGraph(utils.object2):
         if r is new_r:
             return
 
+        self._toposort = None
         self.__import_r__(new_r, reason=reason)
         self.__add_clients__(new_r, [(node, i)])
         prune = self.__remove_clients__(r, [(node, i)], False)
@@ -612,6 +624,8 @@ class FunctionGraph(utils.object2):
             except toolbox.AlreadyThere:
                 return
         self.execute_callbacks_times.setdefault(feature, 0)
+        if hasattr(feature, 'orderings'):
+            self._toposort = None
         # it would be nice if we could require a specific class instead of
         # a "workalike" so we could do actual error checking
         # if not isinstance(feature, toolbox.Feature):
@@ -636,6 +650,8 @@ class FunctionGraph(utils.object2):
             self._features.remove(feature)
         except ValueError:
             return
+        if hasattr(feature, 'orderings'):
+            self._toposort = None
         detach = getattr(feature, 'on_detach', None)
         if detach is not None:
             detach(self)
@@ -697,6 +713,11 @@ class FunctionGraph(utils.object2):
         {node: predecessors} where predecessors is a list of nodes
         that should be computed before the key node.
 
+        The order is cached until the next change to the graph, so calling
+        this many times between two changes is cheap. A feature whose
+        orderings change without a change to the graph must call
+        `invalidate_toposort`.
+
         """
         if len(self.apply_nodes) < 2:
             # optimization
@@ -704,13 +725,22 @@ class FunctionGraph(utils.object2):
             # This special case happens a lot because the OpWiseCLinker
             # produces 1-element graphs.
             return list(self.apply_nodes)
-        fg = self
+        if self._toposort is None:
+            fg = self
+
+            ords = self.orderings()
 
-        ords = self.orderings()
+            self._toposort = graph.io_toposort(fg.inputs, fg.outputs, ords)
 
-        order = graph.io_toposort(fg.inputs, fg.outputs, ords)
+        # Callers are allowed to modify the list they get.
+        return list(self._toposort)
 
-        return order
+    def invalidate_toposort(self):
+        """
+        Drop the cached result of `toposort`.
+
+        """
+        self._toposort = None
 
     def orderings(self):
         """
@@ -860,10 +890,12 @@ class FunctionGraph(utils.object2):
         # be pickled as the decorators with parameters aren't pickable.
         if "execute_callbacks_times" in d:
             del d["execute_callbacks_times"]
+        d["_toposort"] = None
 
         return d
 
     def __setstate__(self, dct):
+        self._toposort = None
         self.__dict__.update(dct)
         for feature in self._features:
             if hasattr(feature, "unpickle"):
@@ -10,6 +10,7 @@ from __future__ import print_function
 from collections import deque
 from copy import copy
 from itertools import count
+import weakref
 
 import theano
 from theano.gof import utils
@@ -544,6 +545,43 @@ class Constant(Variable):
     # index is not defined, because the `owner` attribute must necessarily be None
 
 
+# Apply nodes built by Op.__call__ while config.intern_apply is True, keyed
+# by their op and the ids of their inputs. The nodes keep their inputs
+# alive, so the ids are not reused while the entry exists.
+_interned_apply = weakref.WeakValueDictionary()
+
+
+def intern_apply(node):
+    """
+    Return the Apply node equivalent to `node` built before, or `node`.
+
+    Two nodes are equivalent when their ops are equal and they have the same
+    input Variable instances. This is the merge done by MergeOptimizer, but
+    at construction time, so duplicated nodes never enter the graph.
+
+    Nodes of destructive ops are never shared. Nodes owned by a
+    FunctionGraph are never returned, as the optimizations may modify them.
+
+    """
+    op = node.op
+    if getattr(op, 'destroy_map', None):
+        return node
+    key = (op, tuple(id(i) for i in node.inputs))
+    try:
+        existing = _interned_apply.get(key)
+    except TypeError:
+        # The op is not hashable.
+        return node
+    if (existing is not None and
+            existing.op == op and
+            getattr(existing, 'fgraph', None) is None and
+            len(existing.inputs) == len(node.inputs) and
+            all(a is b for a, b in zip(existing.inputs, node.inputs))):
+        return existing
+    _interned_apply[key] = node
+    return node
+
+
 def stack_search(start, expand, mode='bfs', build_inv=False):
     """
     Search through a graph, either breadth- or depth-first.
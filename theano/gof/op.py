@@ -598,6 +598,8 @@ class PureOp(object):
         """
         return_list = kwargs.pop('return_list', False)
         node = self.make_node(*inputs, **kwargs)
+        if config.intern_apply and not kwargs:
+            node = graph.intern_apply(node)
 
         if config.compute_test_value != 'off':
             run_perform = True
@@ -759,6 +761,74 @@ class PureOp(object):
         """
         return True
 
+    def cost(self, node, input_shapes, output_shapes):
+        """
+        Optional: estimate the work done by one execution of `node`.
+
+        This is used by the profiler to report the achieved GFLOP/s and
+        memory bandwidth of each Apply node, and can be used by
+        optimizations to compare alternative implementations.
+
+        Parameters
+        ----------
+        node : Apply instance
+            The node whose cost is estimated. `node.op` is self.
+        input_shapes : list of tuples of int
+            The numeric shape of each input of `node`.
+        output_shapes : list of tuples of int
+            The numeric shape of each output of `node`.
+
+        Returns
+        -------
+        tuple of int
+            (flops, bytes_read, bytes_written). `flops` counts the
+            floating point (or integer) operations, the two other
+            values count the bytes read from the inputs and written to
+            the outputs.
+
+        Raises
+        ------
+        MethodNotDefined
+            The subclass does not override this method.
+
+        """
+        raise utils.MethodNotDefined("cost", type(self),
+                                     self.__class__.__name__)
+
+    def input_views(self, node, inputs, outputs):
+        """
+        Optional: views of the outputs in which the inputs can be computed.
+
+        After `node` has run, the linker can put these views in the storage
+        of the inputs that no other Apply node uses. The Ops computing these
+        inputs then write their next value straight into the outputs of
+        `node`, if they reuse their output storage, and `node` finds them
+        already in place instead of copying them.
+
+        Parameters
+        ----------
+        node : Apply instance
+            The node that has run. `node.op` is self.
+        inputs : list
+            The values of the inputs of `node`.
+        outputs : list
+            The values of the outputs of `node`.
+
+        Returns
+        -------
+        list
+            For each input, a view of one of the outputs that has the shape
+            and dtype of the input, or None.
+
+        Raises
+        ------
+        MethodNotDefined
+            The subclass does not override this method.
+
+        """
+        raise utils.MethodNotDefined("input_views", type(self),
+                                     self.__class__.__name__)
+
 
 class Op(utils.object2, PureOp, CLinkerOp):
     """
@@ -1047,6 +1117,52 @@ def get_debug_values(*args):
     return [tuple(rval)]
 
 
+def shapes_nbytes(variables, shapes):
+    """
+    Return the number of bytes used by `variables` if they had `shapes`.
+
+    Variables whose type has no `dtype` attribute are ignored.
+
+    """
+    total = 0
+    for var, shp in zip(variables, shapes):
+        dtype = getattr(var.type, 'dtype', None)
+        if dtype is None:
+            continue
+        size = 1
+        for s in shp:
+            size *= int(s)
+        total += size * numpy.dtype(dtype).itemsize
+    return total
+
+
+def apply_cost(node, input_shapes, output_shapes):
+    """
+    Return the estimated (flops, bytes_read, bytes_written) of `node`.
+
+    This calls `node.op.cost`. Ops that only define the older
+    `flops(input_shapes, output_shapes)` method get their byte counts
+    estimated from the size of their inputs and outputs.
+
+    Returns
+    -------
+    tuple of int or None
+        None if the Op does not provide a cost model.
+
+    """
+    op = node.op
+    if hasattr(op, 'cost'):
+        try:
+            return op.cost(node, input_shapes, output_shapes)
+        except utils.MethodNotDefined:
+            pass
+    if hasattr(op, 'flops'):
+        return (op.flops(input_shapes, output_shapes),
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+    return None
+
+
 ops_with_inner_function = {}
 """
 Registry of Ops that have an inner compiled Theano function.
@@ -1065,7 +1065,23 @@ class LocalMetaOptimizer(LocalOptimizer):
         if self._tracks is not None:
             if not isinstance(node.op, tuple(self._tracks)):
                 return
-        # first, we need to provide dummy values for all inputs
+        givens = self.get_givens(node)
+        if givens is None:
+            return
+        timings = self.benchmark(node, givens)
+        # finally, we choose the fastest one
+        if timings:
+            return timings[0][1]
+        return
+
+    def get_givens(self, node):
+        """
+        Return a dictionary mapping the inputs of ``node`` that are not
+        shared variables to shared variables of dummy values, or None if
+        some of their shapes are unknown.
+
+        """
+        # we need to provide dummy values for all inputs
         # to the node that are not shared variables anyway
         givens = {}
         missing = set()
@@ -1090,8 +1106,20 @@ class LocalMetaOptimizer(LocalOptimizer):
                        "%d of %d input shapes unknown" %
                        (self.__class__.__name__, node, len(missing), node.nin)))
             return
-        # now we can apply the different optimizations in turn,
-        # compile the resulting subgraphs and time their execution
+        return givens
+
+    def benchmark(self, node, givens):
+        """
+        Apply the different optimizations in turn to ``node``, compile the
+        resulting subgraphs and time their execution.
+
+        Returns
+        -------
+        list
+            The (timing, outputs, optimizer) of the applicable optimizers,
+            fastest first.
+
+        """
         if self.verbose:
             print(("%s meta-optimizing %s (%d choices):" %
                    (self.__class__.__name__, node, len(self.optimizers))))
@@ -1100,8 +1128,7 @@ class LocalMetaOptimizer(LocalOptimizer):
             outputs = opt.transform(node)
             if outputs:
                 try:
-                    fn = theano.function([], outputs, givens=givens,
-                                         on_unused_input='ignore')
+                    fn = self.compile(outputs, givens)
                     timing = min(self.time_call(fn) for _ in range(3))
                 except Exception as e:
                     if self.verbose:
@@ -1114,13 +1141,18 @@ class LocalMetaOptimizer(LocalOptimizer):
             else:
                 if self.verbose:
                     print("* %s: not applicable" % opt)
-        # finally, we choose the fastest one
-        if timings:
-            timings.sort()
-            if self.verbose:
-                print("= %s" % timings[0][2])
-            return timings[0][1]
-        return
+        timings.sort(key=lambda t: t[0])
+        if timings and self.verbose:
+            print("= %s" % timings[0][2])
+        return timings
+
+    def compile(self, outputs, givens):
+        """
+        Compile the replacement ``outputs`` of one optimizer for timing.
+
+        """
+        return theano.function([], outputs, givens=givens,
+                               on_unused_input='ignore')
 
     def provide_inputs(self, node, inputs):
         """
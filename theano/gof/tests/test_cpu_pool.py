@@ -0,0 +1,51 @@
+import numpy
+from nose.plugins.skip import SkipTest
+
+import theano
+import theano.tensor as T
+from theano import config
+from theano.gof import cpu_pool
+
+
+def test_cpu_pool():
+    if not cpu_pool.supported():
+        raise SkipTest("The CPU memory pool needs numpy 1.22")
+    orig = config.cpu_pool.limit
+    try:
+        config.cpu_pool.limit = 64
+        x = T.matrix()
+        f = theano.function([x], ((x * 2) + 1).sum(axis=0))
+        xv = numpy.random.rand(300, 400).astype(config.floatX)
+        cpu_pool.clear()
+        cpu_pool.reset_stats()
+        for i in range(3):
+            out = f(xv)
+            assert numpy.allclose(out, (xv * 2 + 1).sum(axis=0))
+        stats = cpu_pool.stats()
+        assert stats['hits'] > 0, stats
+        assert stats['cached'] > 0, stats
+        assert stats['limit'] == 64 * 1024 * 1024
+
+        # Arrays allocated outside of a call do not use the pool.
+        cpu_pool.reset_stats()
+        numpy.empty((300, 400))
+        assert cpu_pool.stats()['hits'] == 0
+        assert cpu_pool.stats()['misses'] == 0
+
+        cpu_pool.clear()
+        assert cpu_pool.stats()['cached'] == 0
+
+        # Disabling the pool frees the buffers that it keeps.
+        f(xv)
+        config.cpu_pool.limit = 0
+        assert cpu_pool.activate() is None
+        assert cpu_pool.stats()['cached'] == 0
+        assert numpy.allclose(f(xv), (xv * 2 + 1).sum(axis=0))
+    finally:
+        config.cpu_pool.limit = orig
+
+
+def test_limit_bytes():
+    assert cpu_pool.limit_bytes(0) == 0
+    assert cpu_pool.limit_bytes(2) == 2 * 1024 * 1024
+    assert cpu_pool.limit_bytes(0.5) > 0
@@ -432,3 +432,34 @@ def test_value_repl_2():
     consistent(g)
     g.replace(sy, transpose_view(MyConstant("abc")))
     consistent(g)
+
+
+def test_incremental_order():
+    # The order maintained by the DestroyHandler must stay a valid
+    # topological order when replacements are done and reverted.
+    x, y, z = inputs()
+    e1 = add(x, y)
+    e2 = add(y, x)
+    g = Env([x, y, z], [dot(e1, sigmoid(e2))])
+    dh = g.destroy_handler
+
+    def check_order():
+        g.validate()
+        ords = dh.orderings(g)
+        assert not destroyhandler._contains_cycle(g, ords)
+        assert not dh.stale_order
+        for app in g.apply_nodes:
+            for parent in destroyhandler._apply_parents(app, ords):
+                assert dh.order[parent] < dh.order[app]
+
+    check_order()
+    g.replace_validate(e1, add_in_place(x, y))
+    check_order()
+    try:
+        g.replace_validate(e2, add_in_place(y, x))
+        raise Exception("Shouldn't have reached this point.")
+    except InconsistencyError:
+        pass
+    check_order()
+    g.replace_validate(e2, transpose_view(z))
+    check_order()
@@ -30,6 +30,23 @@ class TFunctionGraph(unittest.TestCase):
         s = pickle.dumps(func)
         pickle.loads(s)
 
+    def test_toposort_cache(self):
+        x = tt.vector()
+        y = tt.exp(x)
+        fg = FunctionGraph([x], [y * x], clone=False)
+        topo = fg.toposort()
+        assert fg.toposort() == topo
+        assert fg.toposort() is not fg.toposort()
+        # Changing the graph drops the cached order.
+        fg.replace(y, tt.log(x))
+        topo = fg.toposort()
+        assert [n.op for n in topo] == [n.op for n in
+                                        theano.gof.graph.io_toposort(
+                                            fg.inputs, fg.outputs)]
+        assert topo[0].op == tt.log
+        fg.replace(fg.outputs[0], tt.sqrt(x))
+        assert len(fg.toposort()) == 1
+
     def test_node_outputs_not_used(self):
         """In the past, we where removing some not used variable from
         fgraph.variables event if the apply had other output used in
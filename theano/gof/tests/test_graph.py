@@ -5,9 +5,12 @@ import numpy
 from itertools import count
 
 
+import theano
 from theano import (
     sparse,
     shared, tensor)
+from theano.gof import FunctionGraph
+from theano.tensor import inplace
 from theano.gof.graph import (
     Apply,
     as_string, clone, general_toposort, inputs, io_toposort,
@@ -305,6 +308,38 @@ class TestIsSameGraph(unittest.TestCase):
                    debug=False)
 
 
+################
+# intern_apply #
+################
+
+class TestInternApply(unittest.TestCase):
+
+    def setUp(self):
+        self.orig = theano.config.intern_apply
+        theano.config.intern_apply = True
+
+    def tearDown(self):
+        theano.config.intern_apply = self.orig
+
+    def test_same_inputs(self):
+        x, y = tensor.vectors('x', 'y')
+        assert (x + y) is (x + y)
+        assert tensor.exp(x + y) is tensor.exp(x + y)
+        assert (x + y) is not (y + x)
+        assert (x - y) is not (x + y)
+        theano.config.intern_apply = False
+        assert (x + y) is not (x + y)
+
+    def test_not_shared(self):
+        x = tensor.vector('x')
+        # Destructive nodes are not shared.
+        assert inplace.exp_inplace(x) is not inplace.exp_inplace(x)
+        # Nor the nodes owned by a FunctionGraph.
+        y = tensor.exp(x)
+        FunctionGraph([x], [y], clone=False)
+        assert tensor.exp(x) is not y
+
+
 ################
 # eval         #
 ################
@@ -104,6 +104,10 @@ class Feature(object):
         {node: predecessors} where predecessors is a list of
         nodes that should be computed before the key node.
 
+        The result of toposort is cached until the graph changes. If the
+        orderings change for another reason, call
+        function_graph.invalidate_toposort().
+
         If you raise an exception in this function, the state of the graph
         might be broken for all intents and purposes.
 
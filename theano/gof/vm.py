@@ -143,6 +143,43 @@ def calculate_reallocate_info(order, fgraph, storage_map, compute_map_re,
     return reallocated_info
 
 
+class InputViewsThunk(object):
+    """
+    Run a thunk, then put views of its outputs in the storage of its inputs.
+
+    See `Op.input_views`. The Ops that compute these inputs can then write
+    their next value in place in the outputs of the node.
+
+    Parameters
+    ----------
+    node
+        The Apply node of `thunk`.
+    thunk
+        The thunk of `node`, with its `inputs` and `outputs` storage.
+    view_inputs
+        The indices of the inputs of `node` that can receive the views.
+
+    """
+
+    def __init__(self, node, thunk, view_inputs):
+        self.node = node
+        self.thunk = thunk
+        self.view_inputs = view_inputs
+        self.lazy = thunk.lazy
+        self.inputs = thunk.inputs
+        self.outputs = thunk.outputs
+
+    def __call__(self):
+        rval = self.thunk()
+        views = self.node.op.input_views(
+            self.node, [s[0] for s in self.inputs],
+            [s[0] for s in self.outputs])
+        for i in self.view_inputs:
+            if views[i] is not None:
+                self.inputs[i][0] = views[i]
+        return rval
+
+
 class VM(object):
     """
     A VM object's __call__ method evaluates a Theano program.
@@ -230,7 +267,9 @@ class VM(object):
             profile.apply_callcount.setdefault(node, 0)
             profile.apply_callcount[node] += c
 
-            profile.apply_cimpl[node] = hasattr(thunk, 'cthunk')
+            # Look through the InputViewsThunk wrappers.
+            profile.apply_cimpl[node] = hasattr(getattr(thunk, 'thunk', thunk),
+                                                'cthunk')
 
         if hasattr(self, 'variable_shape'):
             profile.variable_shape = self.variable_shape.copy()
@@ -1048,6 +1087,12 @@ class VM_Linker(link.LocalLinker):
             thunk.inputs = [storage_map[v] for v in node.inputs]
             thunk.outputs = [storage_map[v] for v in node.outputs]
 
+        if not self.allow_gc:
+            # Without gc, the outputs of a node are still there at the next
+            # call, so their producers can be given views of them.
+            thunks = [self.input_views_thunk(node, thunk, reallocated_info)
+                      for node, thunk in zip(order, thunks)]
+
         lazy = self.lazy
         if lazy is None:
             lazy = config.vm.lazy
@@ -1091,6 +1136,40 @@ class VM_Linker(link.LocalLinker):
                 thunks,
                 order)
 
+    def input_views_thunk(self, node, thunk, reallocated_info):
+        """
+        Return `thunk`, wrapped in an InputViewsThunk if some inputs of
+        `node` can be computed in views of its outputs.
+
+        An input can when it is computed in the graph, is used only once and
+        only by `node`, and neither it nor the outputs of `node` are
+        returned by the function or share their storage with other
+        variables.
+
+        """
+        op_input_views = getattr(type(node.op), 'input_views', None)
+        if (op_input_views is None or
+                op_input_views == theano.gof.op.PureOp.input_views):
+            return thunk
+        fgraph = self.fgraph
+        shared = set(reallocated_info)
+        for pair in itervalues(reallocated_info):
+            shared.update(pair)
+
+        def private(var):
+            return (var not in fgraph.outputs and
+                    var not in self.no_recycling and
+                    var not in shared)
+
+        if not all(private(out) for out in node.outputs):
+            return thunk
+        view_inputs = [i for i, var in enumerate(node.inputs)
+                       if (var.owner is not None and private(var) and
+                           len(var.clients) == 1)]
+        if not view_inputs:
+            return thunk
+        return InputViewsThunk(node, thunk, view_inputs)
+
     def __setstate__(self, d):
         self.__dict__.update(d)
         if not hasattr(self, 'c_thunks'):
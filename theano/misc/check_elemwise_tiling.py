@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Time the C loops of Elemwise on matrices whose inputs have different
+# layouts, to check the choice between the row by row and the tiled loops.
+# A broadcasted input must not slow down the loops compared with a control
+# of the same number of elements.
+from __future__ import print_function
+
+import sys
+import time
+from optparse import OptionParser
+
+import numpy
+import theano
+import theano.tensor as T
+from six.moves import xrange
+
+parser = OptionParser(usage='%prog <options>\n Compute the time of x + y'
+                      ' for x and y of different layouts')
+parser.add_option('-r', '--rows', action='store', dest='rows',
+                  default=2000, type="int",
+                  help="Number of rows of x")
+parser.add_option('-c', '--cols', action='store', dest='cols',
+                  default=8192, type="int",
+                  help="Number of columns of x")
+parser.add_option('-i', '--iters', action='store', dest='iters',
+                  default=10, type="int",
+                  help="Number of calls to the Theano function")
+
+
+def execute(x_value, y_value, iters=10):
+    """
+    Return the best time of one call to a function that computes x + y.
+
+    """
+    x = T.TensorType(x_value.dtype, [s == 1 for s in x_value.shape])()
+    y = T.TensorType(y_value.dtype, [s == 1 for s in y_value.shape])()
+    f = theano.function([x, y], x + y)
+    f(x_value, y_value)
+    best = float('inf')
+    for i in xrange(iters):
+        t0 = time.time()
+        f(x_value, y_value)
+        best = min(best, time.time() - t0)
+    return best
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args(sys.argv)
+    if not theano.config.cxx:
+        print("Theano has no C++ compiler, so the C loops are not used.")
+        sys.exit(1)
+    rows, cols = options.rows, options.cols
+    rng = numpy.random.RandomState(0)
+    x = rng.rand(rows, cols)
+    x_t = rng.rand(cols, rows).T
+    cases = [
+        ("x + row", x, rng.rand(1, cols)),
+        ("x + col", x, rng.rand(rows, 1)),
+        ("x.T + row", x_t, rng.rand(1, cols)),
+        ("x + y", x, rng.rand(rows, cols)),
+        ("x.T + y", x_t, rng.rand(rows, cols)),
+        # About the same number of elements as x + row, with rows too
+        # short for the tiles.
+        ("control + row", rng.rand(rows * cols // 4000, 4000),
+         rng.rand(1, 4000)),
+    ]
+    print("Time of x + y for a (%d, %d) float64 x, in milliseconds" %
+          (rows, cols))
+    for name, x_value, y_value in cases:
+        print("%15s %10.2f" % (name, execute(x_value, y_value,
+                                             options.iters) * 1e3))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Compare the time of Dot22 on small square matrices with the unrolled C
+# loops and with the BLAS, to choose the Theano flag blas.small_gemm.
+from __future__ import print_function
+
+import sys
+import time
+from optparse import OptionParser
+
+import numpy
+import theano
+import theano.tensor as T
+from six.moves import xrange
+
+parser = OptionParser(usage='%prog <options>\n Compute the time of Dot22'
+                      ' with and without the small matrix loops')
+parser.add_option('-M', '--max', action='store', dest='max',
+                  default=64, type="int",
+                  help="Largest size of the matrices")
+parser.add_option('-n', '--nb-dot', action='store', dest='nb_dot',
+                  default=50, type="int",
+                  help="Number of Dot22 in the Theano function")
+parser.add_option('-i', '--iters', action='store', dest='iters',
+                  default=200, type="int",
+                  help="Number of calls to the Theano function")
+
+
+def execute(size, small_gemm, nb_dot=50, iters=200, dtype=None):
+    """
+    Return the time of one Dot22 of two `size` x `size` matrices.
+
+    The Theano function chains `nb_dot` Dot22, so that the time of
+    calling it is small compared with the time of the Dot22.
+
+    Parameters
+    ----------
+    size : int
+        The number of rows and columns of the matrices.
+    small_gemm : int
+        The value of the Theano flag blas.small_gemm to compile with.
+
+    """
+    if dtype is None:
+        dtype = theano.config.floatX
+    orig = theano.config.blas.small_gemm
+    try:
+        theano.config.blas.small_gemm = small_gemm
+        x = T.matrix(dtype=dtype)
+        w = T.matrix(dtype=dtype)
+        z = x
+        for i in xrange(nb_dot):
+            z = T.dot(z, w)
+        f = theano.function([x, w], z)
+    finally:
+        theano.config.blas.small_gemm = orig
+    assert any(isinstance(n.op, T.blas.Dot22)
+               for n in f.maker.fgraph.toposort())
+    rng = numpy.random.RandomState(0)
+    xv = rng.rand(size, size).astype(dtype)
+    # An orthogonal matrix keeps the values away from overflow and from
+    # the denormals.
+    wv = numpy.linalg.qr(rng.rand(size, size))[0].astype(dtype)
+    f(xv, wv)
+    best = float('inf')
+    for r in xrange(3):
+        t0 = time.time()
+        for i in xrange(iters):
+            f(xv, wv)
+        best = min(best, time.time() - t0)
+    return best / (iters * nb_dot)
+
+
+if __name__ == '__main__':
+    options, arguments = parser.parse_args(sys.argv)
+    if not theano.config.blas.ldflags:
+        print("Theano does not use the BLAS (the flag blas.ldflags is"
+              " empty), so the comparison is meaningless.")
+        sys.exit(1)
+    sizes = [s for s in [2, 4, 6, 8, 12, 16, 20, 24, 32, 48, 64, 96, 128]
+             if s <= options.max]
+    print("Time of one Dot22 in %s, in microseconds" %
+          theano.config.floatX)
+    print("%6s %10s %10s %8s" % ("size", "loops", "BLAS", "speedup"))
+    # The largest size up to which the loops are always faster.
+    crossover = 0
+    faster = True
+    for size in sizes:
+        t_small = execute(size, size, options.nb_dot, options.iters)
+        t_blas = execute(size, 0, options.nb_dot, options.iters)
+        print("%6d %10.2f %10.2f %8.2f" % (size, t_small * 1e6,
+                                           t_blas * 1e6, t_blas / t_small))
+        faster = faster and t_small < t_blas
+        if faster:
+            crossover = size
+    print("The loops are faster up to size %d (blas.small_gemm=%d now)" %
+          (crossover, theano.config.blas.small_gemm))
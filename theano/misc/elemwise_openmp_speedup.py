@@ -11,6 +11,14 @@ parser = OptionParser(usage='%prog <options>\n Compute time for'
 parser.add_option('-N', '--N', action='store', dest='N',
                   default=theano.config.openmp_elemwise_minsize, type="int",
                   help="Number of vector elements")
+parser.add_option('-c', '--calibrate', action='store_true',
+                  dest='calibrate', default=False,
+                  help="Measure the minimum sizes used by the Theano flag"
+                  " openmp_elemwise_autotune and keep them in the compiledir")
+parser.add_option('-f', '--force', action='store_true', dest='force',
+                  default=False,
+                  help="With --calibrate, measure again the sizes already"
+                  " kept")
 
 
 def runScript(N):
@@ -30,6 +38,13 @@ if __name__ == '__main__':
     if hasattr(options, "help"):
         print(options.help)
         sys.exit(0)
+    if options.calibrate:
+        from theano.tensor import elemwise_openmp
+        thresholds = elemwise_openmp.calibrate_all(force=options.force)
+        print("Minimum sizes kept in %s" % elemwise_openmp.thresholds_file())
+        for (cost_class, dtype), minsize in sorted(thresholds.items()):
+            print("%7s %7s %10d" % (cost_class, dtype, minsize))
+        sys.exit(0)
     orig_flags = os.environ.get('THEANO_FLAGS', '')
     os.environ['THEANO_FLAGS'] = orig_flags + ',openmp=false'
     (cheapTime, costlyTime) = runScript(N=options.N)
@@ -0,0 +1,58 @@
+import threading
+
+import numpy
+
+import theano
+from theano import config
+from theano.misc.threads import ThreadBudget, thread_budget
+
+
+class RecordingBudget(ThreadBudget):
+    def __init__(self):
+        super(RecordingBudget, self).__init__()
+        self.calls = []
+
+    def set_num_threads(self, n):
+        self.calls.append(n)
+
+
+def test_thread_budget():
+    orig = config.threads
+    try:
+        config.threads = 4
+        budget = RecordingBudget()
+        assert budget.acquire() == 4
+        # A nested call stays within the budget of its caller.
+        assert budget.acquire() == 4
+        assert budget.acquire(limit=3) == 3
+        budget.release()
+        assert budget.calls[-1] == 4
+
+        # A call running at the same time in another Python thread gets
+        # half of the budget.
+        res = []
+
+        def other():
+            res.append(budget.acquire())
+            budget.release()
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+        assert res == [2]
+
+        budget.release()
+        budget.release()
+        assert budget.acquire(limit=8) == 4
+        budget.release()
+    finally:
+        config.threads = orig
+
+
+def test_function_threads():
+    x = theano.tensor.matrix()
+    f = theano.function([x], theano.tensor.dot(x, x).sum())
+    f.threads = 1
+    xv = numpy.ones((5, 5), dtype=config.floatX)
+    assert f(xv) == 125
+    assert f.copy().threads == 1
+    assert thread_budget._active == 0
@@ -0,0 +1,201 @@
+"""
+Share the CPU threads of a process between BLAS and OpenMP.
+
+Ops that inherit from `OpenMPOp` start OpenMP teams, and the BLAS
+library of ``config.blas.ldflags`` starts its own threads. Both use all
+the cores by default, so Theano functions that run at the same time in
+different Python threads, or several Theano processes on one host,
+oversubscribe the CPUs.
+
+`ThreadBudget` gives a number of threads to each call of a Theano
+function. The budget of the process is ``config.threads`` (all the
+cores if it is 0) and it is split evenly between the functions running
+at the same time. A function can use fewer threads with its
+``threads`` attribute. The number of threads is set with the runtime
+API of the OpenMP and BLAS libraries before the function runs, and it
+is only changed when it differs from what was set before.
+
+"""
+from __future__ import absolute_import
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+
+from theano import config
+from theano.misc.cpucount import cpuCount
+
+_logger = logging.getLogger('theano.misc.threads')
+
+# Functions setting the number of threads of the BLAS libraries we know.
+# They all take the number of threads as an int.
+_blas_setter_names = ('openblas_set_num_threads', 'goto_set_num_threads',
+                      'MKL_Set_Num_Threads')
+
+# The OpenMP runtimes of gcc, Intel and LLVM.
+_openmp_library_names = ('gomp', 'iomp5', 'omp')
+
+
+def default_num_threads():
+    """
+    Return the number of threads of a process when nothing limits it.
+
+    This is the environment variable OMP_NUM_THREADS if it is set,
+    otherwise the number of CPUs.
+
+    """
+    var = os.getenv('OMP_NUM_THREADS', None)
+    if var:
+        try:
+            return max(1, int(var))
+        except ValueError:
+            pass
+    return max(1, cpuCount())
+
+
+def _load_libraries(names, dirs=()):
+    """
+    Return the shared libraries `names` that could be loaded.
+
+    The directories `dirs` are searched before the default ones.
+
+    """
+    libs = []
+    for name in names:
+        paths = [os.path.join(d, 'lib%s%s' % (name, ext))
+                 for d in dirs for ext in ('.so', '.dylib')]
+        paths = [p for p in paths if os.path.exists(p)]
+        found = ctypes.util.find_library(name)
+        if found:
+            paths.append(found)
+        for path in paths:
+            try:
+                libs.append(ctypes.CDLL(path))
+                break
+            except OSError:
+                continue
+    return libs
+
+
+def _find_setters(libs, names):
+    setters = []
+    for lib in libs:
+        for name in names:
+            setter = getattr(lib, name, None)
+            if setter is not None:
+                setter.argtypes = [ctypes.c_int]
+                setter.restype = None
+                setters.append(setter)
+                break
+    return setters
+
+
+class ThreadBudget(object):
+    """
+    Hand out the threads of the process to the running Theano functions.
+
+    A function called while another one runs in the same Python thread
+    (e.g. by an OpFromGraph) stays within the budget of its caller.
+
+    Notes
+    -----
+    OpenMP takes its number of threads per Python thread, but BLAS
+    libraries only have a process-wide setting. When functions run at
+    the same time, BLAS uses the share of the last one that started.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._local = threading.local()
+        self._default = default_num_threads()
+        self._openmp_setters = None
+        self._blas_ldflags = None
+        self._blas_setters = []
+        self._blas_threads = self._default
+
+    def total(self):
+        """
+        Return the number of threads of the process.
+
+        """
+        return config.threads or self._default
+
+    def acquire(self, limit=None):
+        """
+        Give threads to a function call and return how many.
+
+        `release` must be called when the call returns.
+
+        Parameters
+        ----------
+        limit : int or None
+            The maximum number of threads of the call.
+
+        """
+        local = self._local
+        stack = getattr(local, 'stack', None)
+        if stack is None:
+            stack = local.stack = []
+        if stack:
+            n = stack[-1]
+        else:
+            with self._lock:
+                self._active += 1
+                active = self._active
+            n = max(1, self.total() // active)
+        if limit:
+            n = max(1, min(n, limit))
+        stack.append(n)
+        self.set_num_threads(n)
+        return n
+
+    def release(self):
+        """
+        Give back the threads of the last call of this Python thread.
+
+        """
+        stack = self._local.stack
+        stack.pop()
+        if stack:
+            self.set_num_threads(stack[-1])
+        else:
+            with self._lock:
+                self._active -= 1
+
+    def set_num_threads(self, n):
+        """
+        Use `n` threads in BLAS and in OpenMP regions of this Python thread.
+
+        """
+        local = self._local
+        if getattr(local, 'openmp_threads', self._default) != n:
+            if self._openmp_setters is None:
+                self._openmp_setters = _find_setters(
+                    _load_libraries(_openmp_library_names),
+                    ('omp_set_num_threads',))[:1]
+            for setter in self._openmp_setters:
+                setter(n)
+            local.openmp_threads = n
+
+        if self._blas_threads != n:
+            ldflags = config.blas.ldflags
+            if ldflags != self._blas_ldflags:
+                flags = ldflags.split()
+                dirs = [f[2:] for f in flags if f.startswith('-L')]
+                names = [f[2:] for f in flags if f.startswith('-l')]
+                self._blas_setters = _find_setters(
+                    _load_libraries(names, dirs), _blas_setter_names)
+                self._blas_ldflags = ldflags
+                if not self._blas_setters:
+                    _logger.debug("Could not find how to set the number of"
+                                  " threads of the BLAS in %s", ldflags)
+            for setter in self._blas_setters:
+                setter(n)
+            self._blas_threads = n
+
+
+thread_budget = ThreadBudget()
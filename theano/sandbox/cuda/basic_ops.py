@@ -2894,8 +2894,22 @@ class GpuAdvancedIncSubtensor1(tensor.AdvancedIncSubtensor1, GpuOp):
                     x[i] += y
         out[0] = x
 
+    # The parent's helpers and OpenMP flags are for its CPU C code.
+    def c_support_code(self):
+        return ""
+
+    def c_headers(self):
+        return []
+
+    def c_compile_args(self):
+        return []
+
     def c_code_cache_version(self):
-        return (5,)
+        return (6,)
+
+    def c_code_cache_version_apply(self, node):
+        # Not the one of the CPU op, which depends on its thresholds.
+        return self.c_code_cache_version()
 
     def c_code(self, node, name, inputs, outputs, sub):
         if (self.set_instead_of_inc) or \
@@ -3037,7 +3051,7 @@ class GpuAdvancedIncSubtensor1_dev20(GpuAdvancedIncSubtensor1):
         return Apply(self, [x_, y_, ilist_], [x_.type()])
 
     def c_code_cache_version(self):
-        return (6,)
+        return (7,)
 
     def c_code(self, node, name, inputs, outputs, sub):
         active_device_no = theano.sandbox.cuda.active_device_number()
@@ -27,6 +27,8 @@ class GpuCumsum(CumsumOp, GpuOp):
 
     def __init__(self, axis):
         self.axis = axis
+        self.inplace = False
+        self.openmp = False
         self.max_threads_dim0 = None
         self.max_grid_size1 = None
         self.max_grid_size2 = None
@@ -34,6 +36,8 @@ class GpuCumsum(CumsumOp, GpuOp):
     # We must reuse the same method, not reimplement and call it.
     # Otherwise DebugMode will print many warnings.
     perform = Op.perform
+    # CumsumOp versions its C code per node, this op does not.
+    c_code_cache_version_apply = Op.c_code_cache_version_apply
 
     def make_node(self, x):
         assert x.dtype == 'float32'
@@ -37,6 +37,7 @@ from theano.sandbox.cuda.blas import (
     GpuCorr3dMM, GpuCorr3dMM_gradInputs, GpuCorr3dMM_gradWeights)
 
 from theano.sandbox.cuda.blas import gpu_gemv_inplace
+from theano.sandbox.cuda.blas import batched_dot as gpu_batched_dot
 from theano.sandbox.cuda.cula import gpu_solve
 
 from theano.sandbox.cuda.blas import gpu_gemv_no_inplace
@@ -603,6 +604,37 @@ def local_gpu_dot22(node):
     return False
 
 
+@register_opt()
+@local_optimizer([gpu_from_host, tensor.blas.BatchedGemm])
+def local_gpu_batched_gemm(node):
+    """
+    gpu_from_host(batched_gemm) -> gpu_batched_dot(gpu_from_host)
+
+    batched_gemm(host_from_gpu) -> host_from_gpu(gpu_batched_dot)
+
+    The GPU op does not broadcast the batch dimension.
+
+    """
+    def ok(x, y):
+        return (x.dtype == 'float32' and
+                x.broadcastable[0] == y.broadcastable[0])
+    if isinstance(node.op, GpuFromHost):
+        host_input = node.inputs[0]
+        if host_input.owner and isinstance(host_input.owner.op,
+                                           tensor.blas.BatchedGemm):
+            x, y = host_input.owner.inputs
+            if ok(x, y):
+                return [gpu_batched_dot(as_cuda_ndarray_variable(x),
+                                        as_cuda_ndarray_variable(y))]
+    if isinstance(node.op, tensor.blas.BatchedGemm):
+        x, y = node.inputs
+        if ok(x, y) and any([(i.owner and isinstance(i.owner.op, HostFromGpu))
+                             for i in node.inputs]):
+            return [host_from_gpu(gpu_batched_dot(
+                as_cuda_ndarray_variable(x), as_cuda_ndarray_variable(y)))]
+    return False
+
+
 @register_opt()
 @local_optimizer([gpu_from_host, tensor.blas.Dot22Scalar])
 def local_gpu_dot22scalar(node):
@@ -0,0 +1,380 @@
+"""
+Fast approximations of transcendental scalar ops.
+
+The C code of these ops has no call to libm and no branch, so that the
+compiler can vectorize the Elemwise loops that use them. The maximum
+errors, measured on float32 and float64, are documented on each op.
+
+They are not used unless asked for, directly or with the optimization
+tag ``fast_approx`` (e.g. ``optimizer_including=fast_approx``), that
+replaces the exact ops listed in `approximations` in the Elemwise and
+Composite nodes of float32 and float64.
+
+"""
+from __future__ import print_function
+import numpy
+
+from theano.scalar.basic import (UnaryScalarOp, upgrade_to_float,
+                                 get_scalar_type, Exp, Log, Tanh)
+from theano.scalar.basic_scipy import Erf
+
+# P with exp(r) = 1 + r * P(r) on [-log(2)/2, log(2)/2], fitted for the
+# minimum relative error of exp(r), from the constant term up.
+_exp_coefs = {
+    'float32': [0.9999997071807556, 0.49999149531247156, 0.16667636241076256,
+                0.041897929266621045, 0.008290310642528016],
+    'float64': [1.0000000000000104, 0.5000000000000138, 0.16666666666494176,
+                0.04166666666583332, 0.008333333406088377,
+                0.0013888889029692898, 0.0001984114623586493,
+                2.4801441617643653e-05, 2.7649307834513724e-06,
+                2.764417346117177e-07]}
+
+# exp underflows to 0 below, and overflows to inf above.
+_exp_range = {'float32': (-103.9, 88.72),
+              'float64': (-745.1, 709.78)}
+
+# Number of terms of log(m) = 2 * sum(s ** (2k + 1) / (2k + 1)), with
+# s = (m - 1) / (m + 1) and m in [sqrt(0.5), sqrt(2)[.
+_log_terms = {'float32': 4, 'float64': 9}
+
+_c_types = {'float32': ('float', 'npy_int32', 23, 127, 'f'),
+            'float64': ('double', 'npy_int64', 52, 1023, '')}
+
+
+def _poly(coefs, var, suffix):
+    # Horner scheme.
+    code = "%r%s" % (coefs[-1], suffix)
+    for c in reversed(coefs[:-1]):
+        code = "%r%s + %s * (%s)" % (c, suffix, var, code)
+    return code
+
+
+def _c_support_code():
+    code = """
+#ifndef THEANO_FAST_APPROX
+#define THEANO_FAST_APPROX
+"""
+    for dtype, (ctype, itype, mbits, bias, f) in sorted(_c_types.items()):
+        min_x, max_x = ["%r%s" % (v, f) for v in _exp_range[dtype]]
+        if dtype == 'float32':
+            ln2_hi, ln2_lo = "0.693359375f", "-2.12194440e-4f"
+            min_normal = "1.17549435e-38f"
+            round_shift = "12582912.0f"
+        else:
+            ln2_hi, ln2_lo = "0.693145751953125", "1.42860682030941723212e-6"
+            min_normal = "2.2250738585072014e-308"
+            round_shift = "6755399441055744.0"
+        exp_poly = _poly(_exp_coefs[dtype], "r", f)
+        log_poly = _poly([1. / (2 * k + 1) for k in range(_log_terms[dtype])],
+                         "s2", f)
+        code += """
+// exp(x) = 2**n * (1 + q), with n = round(x / log(2)), r = x - n * log(2)
+// and q = exp(r) - 1 = r * P(r).
+// Adding and removing 1.5 * 2**mbits rounds to the nearest integer, where
+// floor() would be a call to libm.
+static inline %(ctype)s theano_fast_round_%(dtype)s(%(ctype)s x)
+{
+    return (x + %(round_shift)s) - %(round_shift)s;
+}
+
+static inline %(ctype)s theano_fast_expq_%(dtype)s(%(ctype)s x, %(ctype)s n)
+{
+    %(ctype)s r = x - n * %(ln2_hi)s - n * %(ln2_lo)s;
+    return r * (%(exp_poly)s);
+}
+
+// 2**n, for n in the range of the normal numbers.
+static inline %(ctype)s theano_fast_pow2_%(dtype)s(%(itype)s n)
+{
+    %(itype)s bits = (n + %(bias)s) << %(mbits)s;
+    %(ctype)s r;
+    memcpy(&r, &bits, sizeof(r));
+    return r;
+}
+
+static inline %(ctype)s theano_fast_exp_%(dtype)s(%(ctype)s x)
+{
+    %(ctype)s xc = x < %(min_x)s ? %(min_x)s : (x > %(max_x)s ? %(max_x)s : x);
+    %(ctype)s n = theano_fast_round_%(dtype)s(xc * 1.4426950408889634%(f)s);
+    %(ctype)s q = theano_fast_expq_%(dtype)s(xc, n);
+    // 2**n is split in two factors, so that the subnormal results and the
+    // largest results do not overflow the exponent.
+    %(itype)s n1 = ((%(itype)s)n) >> 1;
+    %(ctype)s r = (1 + q) * theano_fast_pow2_%(dtype)s(n1) *
+        theano_fast_pow2_%(dtype)s((%(itype)s)n - n1);
+    // Multiplied rather than selected, for the same reason as in log.
+    return r * (x < %(min_x)s ? 0 : (x > %(max_x)s ? (%(ctype)s)HUGE_VAL : 1));
+}
+
+// For |x| <= 40 only: exp(x) - 1 = 2**n * q + (2**n - 1) is exact
+// when n = 0.
+static inline %(ctype)s theano_fast_expm1_%(dtype)s(%(ctype)s x)
+{
+    %(ctype)s n = theano_fast_round_%(dtype)s(x * 1.4426950408889634%(f)s);
+    %(ctype)s q = theano_fast_expq_%(dtype)s(x, n);
+    %(ctype)s s = theano_fast_pow2_%(dtype)s((%(itype)s)n);
+    return s * q + (s - 1);
+}
+
+// log(x) = e * log(2) + log(m), with m in [sqrt(0.5), sqrt(2)[, for the
+// positive normal numbers.
+static inline %(ctype)s theano_fast_lognormal_%(dtype)s(%(ctype)s x)
+{
+    %(itype)s bits;
+    memcpy(&bits, &x, sizeof(bits));
+    %(itype)s e = (bits >> %(mbits)s) - %(bias)s;
+    bits = (bits & ((((%(itype)s)1) << %(mbits)s) - 1)) | (((%(itype)s)%(bias)s) << %(mbits)s);
+    %(ctype)s m;
+    memcpy(&m, &bits, sizeof(m));
+    int big = m > 1.4142135623730951%(f)s;
+    m = m * (big ? 0.5%(f)s : 1);
+    %(ctype)s s = (m - 1) / (m + 1);
+    %(ctype)s s2 = s * s;
+    return (%(ctype)s)(e + big) * 0.6931471805599453%(f)s + 2 * s * (%(log_poly)s);
+}
+
+static inline %(ctype)s theano_fast_log_%(dtype)s(%(ctype)s x)
+{
+    // The special values are added at the end rather than selected, so
+    // that gcc keeps the loop free of branches and vectorizes it.
+    %(ctype)s special = x == 0 ? (%(ctype)s)-HUGE_VAL : 0;
+    special = x == (%(ctype)s)HUGE_VAL ? x : special;
+    special = x >= 0 ? special : (%(ctype)s)NAN;
+    // Scale the subnormal numbers to normal ones.
+    int subnormal = x < %(min_normal)s;
+    %(ctype)s r = theano_fast_lognormal_%(dtype)s(
+        x * (subnormal ? (%(ctype)s)(1LL << %(mbits)s) : 1));
+    return r - (subnormal ? %(mbits)s * 0.6931471805599453%(f)s : 0) + special;
+}
+
+// tanh(x) = expm1(2x) / (expm1(2x) + 2), and tanh(x) = 1 for x > 20.
+static inline %(ctype)s theano_fast_tanh_%(dtype)s(%(ctype)s x)
+{
+    %(ctype)s xc = x < -20 ? -20 : (x > 20 ? 20 : x);
+    %(ctype)s e = theano_fast_expm1_%(dtype)s(2 * xc);
+    return e / (e + 2);
+}
+
+// Abramowitz and Stegun, formula 7.1.26, and the Taylor series for
+// |x| < 0.1. |x| is clamped to 6, where erf(x) rounds to 1, so that
+// exp(-x * x) is never a subnormal number (they are slow).
+static inline %(ctype)s theano_fast_erf_%(dtype)s(%(ctype)s x)
+{
+    %(ctype)s a = x < 0 ? -x : x;
+    a = a > 6 ? 6 : a;
+    %(ctype)s t = 1 / (1 + 0.3275911%(f)s * a);
+    %(ctype)s p = t * (0.254829592%(f)s + t * (-0.284496736%(f)s + t * (
+        1.421413741%(f)s + t * (-1.453152027%(f)s + t * 1.061405429%(f)s))));
+    %(ctype)s r = 1 - p * theano_fast_exp_%(dtype)s(-a * a);
+    r = x < 0 ? -r : r;
+    %(ctype)s x2 = x * x;
+    %(ctype)s taylor = 1.1283791670955126%(f)s * x * (1 + x2 * (
+        -0.3333333333333333%(f)s + x2 * (0.1%(f)s + x2 * -0.023809523809523808%(f)s)));
+    return a < 0.1%(f)s ? taylor : r;
+}
+
+// softplus(x) = max(x, 0) + log1p(exp(-|x|)), with
+// log1p(y) = log(u) + (y - (u - 1)) / u and u = 1 + y.
+static inline %(ctype)s theano_fast_softplus_%(dtype)s(%(ctype)s x)
+{
+    %(ctype)s a = x < 0 ? -x : x;
+    %(ctype)s y = theano_fast_exp_%(dtype)s(-a);
+    %(ctype)s u = 1 + y;
+    %(ctype)s l = theano_fast_lognormal_%(dtype)s(u) + (y - (u - 1)) / u;
+    return (x > 0 ? x : 0) + l;
+}
+""" % locals()
+    code += """
+#endif
+"""
+    return code
+
+_support_code = _c_support_code()
+
+
+def _np_exp_parts(x):
+    # n and q = exp(r) - 1, as in the C code.
+    dtype = x.dtype
+    n = numpy.rint(x * numpy.asarray(1.4426950408889634, dtype))
+    r = x - n * numpy.log(numpy.asarray(2, dtype))
+    p = numpy.asarray(_exp_coefs[str(dtype)][-1], dtype)
+    for c in reversed(_exp_coefs[str(dtype)][:-1]):
+        p = numpy.asarray(c, dtype) + r * p
+    return numpy.nan_to_num(n).astype('int32'), (r * p).astype(dtype)
+
+
+def _np_expm1(x):
+    # For |x| <= 40 only.
+    n, q = _np_exp_parts(x)
+    s = numpy.ldexp(numpy.ones_like(q), n)
+    return (s * q + (s - 1)).astype(x.dtype)
+
+
+def _np_exp(x):
+    # The same computation as the C code.
+    dtype = x.dtype
+    min_x, max_x = _exp_range[str(dtype)]
+    n, q = _np_exp_parts(numpy.clip(x, min_x, max_x).astype(dtype))
+    with numpy.errstate(over='ignore', under='ignore', invalid='ignore'):
+        r = numpy.ldexp(1 + q, n)
+        r = numpy.where(x < min_x, 0, r)
+        r = numpy.where(x > max_x, numpy.inf, r)
+        return numpy.where(numpy.isnan(x), x, r).astype(dtype)
+
+
+class FastApproxScalarOp(UnaryScalarOp):
+    """
+    Base class of the ops of this module.
+
+    Only float32 and float64 have C code.
+
+    """
+    c_name = None
+
+    def c_code(self, node, name, inp, out, sub):
+        x, = inp
+        z, = out
+        dtype = node.outputs[0].type.dtype
+        if dtype not in ('float32', 'float64'):
+            raise NotImplementedError('only float32 and float64 are '
+                                      'implemented')
+        ctype = node.outputs[0].type.dtype_specs()[1]
+        return "%(z)s = theano_fast_%(c_name)s_%(dtype)s((%(ctype)s)%(x)s);" % dict(
+            locals(), c_name=self.c_name)
+
+    def c_support_code(self):
+        return _support_code
+
+    def c_headers(self):
+        return ['<math.h>', '<string.h>']
+
+    def c_code_cache_version(self):
+        return (1,)
+
+    def impl(self, x):
+        x = numpy.asarray(x)
+        out_type, = self.output_types([get_scalar_type(str(x.dtype))])
+        return self.np_impl(x.astype(out_type.dtype))
+
+
+class FastExp(FastApproxScalarOp):
+    """
+    Approximation of exp.
+
+    The relative error is below 2e-7 in float32 and 1.5e-15 in float64,
+    except for the subnormal results.
+
+    """
+    c_name = 'exp'
+
+    def np_impl(self, x):
+        return _np_exp(x)[()]
+fast_exp = FastExp(upgrade_to_float, name='fast_exp')
+
+
+class FastLog(FastApproxScalarOp):
+    """
+    Approximation of log.
+
+    The relative error is below 3e-7 in float32 and 1.5e-15 in float64.
+
+    """
+    c_name = 'log'
+
+    def np_impl(self, x):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            m, e = numpy.frexp(x)
+            # frexp gives m in [0.5, 1[.
+            big = m > numpy.sqrt(0.5)
+            m = numpy.where(big, m, m * 2).astype(x.dtype)
+            e = numpy.where(big, e, e - 1)
+            s = (m - 1) / (m + 1)
+            s2 = s * s
+            p = numpy.zeros_like(s)
+            for k in reversed(range(_log_terms[str(x.dtype)])):
+                p = numpy.asarray(1. / (2 * k + 1), x.dtype) + s2 * p
+            r = e * numpy.asarray(numpy.log(2), x.dtype) + 2 * s * p
+            r = numpy.where(x == 0, -numpy.inf, r)
+            r = numpy.where(x == numpy.inf, numpy.inf, r)
+            r = numpy.where(x < 0, numpy.nan, r)
+        return r.astype(x.dtype)[()]
+fast_log = FastLog(upgrade_to_float, name='fast_log')
+
+
+class FastTanh(FastApproxScalarOp):
+    """
+    Approximation of tanh.
+
+    The absolute error is below 2e-7 in float32 and 1e-15 in float64.
+
+    """
+    c_name = 'tanh'
+
+    def np_impl(self, x):
+        e = _np_expm1(2 * numpy.clip(x, -20, 20).astype(x.dtype))
+        return (e / (e + 2)).astype(x.dtype)[()]
+fast_tanh = FastTanh(upgrade_to_float, name='fast_tanh')
+
+
+class FastErf(FastApproxScalarOp):
+    """
+    Approximation of erf.
+
+    The absolute error is below 5e-7 in float32 and 1.5e-7 in float64.
+
+    """
+    c_name = 'erf'
+
+    def np_impl(self, x):
+        a = numpy.minimum(numpy.abs(x), 6)
+        t = 1 / (1 + numpy.asarray(0.3275911, x.dtype) * a)
+        p = t * (0.254829592 + t * (-0.284496736 + t * (
+            1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+        r = 1 - p.astype(x.dtype) * _np_exp(-a * a)
+        r = numpy.where(x < 0, -r, r)
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            x2 = x * x
+            taylor = 1.1283791670955126 * x * (1 + x2 * (
+                -1. / 3 + x2 * (0.1 + x2 * (-1. / 42))))
+        return numpy.where(a < 0.1, taylor, r).astype(x.dtype)[()]
+fast_erf = FastErf(upgrade_to_float, name='fast_erf')
+
+
+class FastSoftplus(FastApproxScalarOp):
+    """
+    Approximation of softplus, log(1 + exp(x)).
+
+    The relative error is below 4e-7 in float32 and 2e-15 in float64.
+
+    """
+    c_name = 'softplus'
+
+    def np_impl(self, x):
+        y = _np_exp(-numpy.abs(x))
+        u = numpy.asarray(1 + y, x.dtype)
+        l = fast_log.np_impl(u) + (y - (u - 1)) / u
+        return (numpy.maximum(x, 0) + l).astype(x.dtype)[()]
+fast_softplus = FastSoftplus(upgrade_to_float, name='fast_softplus')
+
+
+# Exact scalar op class -> class of its approximation.
+# Other modules can add their ops (e.g. nnet adds softplus).
+approximations = {
+    Exp: FastExp,
+    Log: FastLog,
+    Tanh: FastTanh,
+    Erf: FastErf,
+}
+
+
+def approximate(scalar_op):
+    """
+    Return the approximation of `scalar_op`, or None if it has none.
+
+    The approximation keeps the output types of `scalar_op`.
+
+    """
+    cls = approximations.get(type(scalar_op))
+    if cls is None:
+        return None
+    return cls(scalar_op.output_types_preference, name='fast_' + cls.c_name)
@@ -3375,18 +3375,32 @@ class Composite(ScalarOp):
                 self.inner_float16 = True
 
         _c_code = "{\n"
+        toposort = self.fgraph.toposort()
         self.nodenames = ["%(nodename)s_" + ('subnode%i' % j)
-                          for j, n in enumerate(self.fgraph.toposort())]
-
+                          for j, n in enumerate(toposort)]
+
+        # Simple register allocation: once the last node that reads a
+        # temporary is done, the temporary is reused for the outputs of
+        # the next nodes of the same C type.
+        last_use = {}
+        for j, node in enumerate(toposort):
+            for input in node.inputs:
+                last_use[input] = j
+        temps = set()
+        free = {}  # C type -> free temporaries
         i = 0
-        for j, node in enumerate(self.fgraph.toposort()):
+        for j, node in enumerate(toposort):
             for output in node.outputs:
                 if output not in subd:
-                    i += 1
-                    name = "V%%(id)s_tmp%i" % i
+                    ctype = output.type.dtype_specs()[1]
+                    if free.get(ctype):
+                        name = free[ctype].pop()
+                    else:
+                        i += 1
+                        name = "V%%(id)s_tmp%i" % i
+                        _c_code += "%s %s;\n" % (ctype, name)
                     subd[output] = name
-                    _c_code += "%s %s;\n" % (
-                        output.type.dtype_specs()[1], name)
+                    temps.add(output)
             s = node.op.c_code(
                 node,
                 self.nodenames[j],
@@ -3395,6 +3409,12 @@ class Composite(ScalarOp):
                 dict(fail="%(fail)s", id="%%(id)s_%i" % j))
             _c_code += s
             _c_code += "\n"
+            # The outputs of this node are never its inputs, as some
+            # c_code write their output before reading all their inputs.
+            for var in set(node.inputs + node.outputs):
+                if var in temps and last_use.get(var, j) == j:
+                    free.setdefault(var.type.dtype_specs()[1], []).append(
+                        subd[var])
         _c_code += "}\n"
         self._c_code = _c_code
 
@@ -3458,13 +3478,58 @@ class Composite(ScalarOp):
         # the fgraph to be set to the variable as we need to pickle
         # them for the cache of c module to work.
         fgraph = FunctionGraph(self.inputs, self.outputs)
-        gof.MergeOptimizer().optimize(fgraph)
         for node in fgraph.apply_nodes:
             if not isinstance(node.op, ScalarOp):
                 raise ValueError("The fgraph to Composite must be exclusively"
                                  " composed of ScalarOp instances.")
+        # Fusion inlines the same subexpressions from several consumers.
+        self.canonicalize_commutative(fgraph)
+        gof.MergeOptimizer().optimize(fgraph)
         self.fgraph = fgraph
 
+    @staticmethod
+    def canonicalize_commutative(fgraph):
+        """
+        Swap the inputs of the commutative binary nodes that compute the
+        same value as an earlier node, but with their inputs the other way
+        around (e.g. y * x after x * y), so that MergeOptimizer merges them.
+
+        The nodes are numbered by value: two variables get the same number
+        when they are computed by the same op from inputs of the same
+        numbers.
+
+        """
+        numbers = {}  # variable -> number of its value
+        values = {}  # key of a value -> its number
+        first_order = {}  # key of a value -> numbers of the first inputs
+
+        def number(var, key):
+            numbers[var] = values.setdefault(key, len(values))
+
+        for i, var in enumerate(fgraph.inputs):
+            number(var, ('input', i))
+        for node in fgraph.toposort():
+            for var in node.inputs:
+                if var not in numbers:
+                    # An orphan. init_c_code only accepts Constant.
+                    if isinstance(var, Constant):
+                        number(var, ('constant',) + var.signature())
+                    else:
+                        number(var, ('orphan', id(var)))
+            in_numbers = tuple(numbers[var] for var in node.inputs)
+            if len(node.inputs) == 2 and getattr(node.op, 'commutative',
+                                                 False):
+                key = (node.op, tuple(sorted(in_numbers)))
+                first = first_order.setdefault(key, in_numbers)
+                if first != in_numbers:
+                    x, y = node.inputs
+                    fgraph.change_input(node, 0, y)
+                    fgraph.change_input(node, 1, x)
+            else:
+                key = (node.op, in_numbers)
+            for i, var in enumerate(node.outputs):
+                number(var, key + (i,))
+
     def __init__(self, inputs, outputs):
         # We need to clone the graph as sometimes its nodes already
         # contain a reference to an fgraph. As we want the Composite
@@ -3570,7 +3635,7 @@ class Composite(ScalarOp):
         return self._c_code % d
 
     def c_code_cache_version(self):
-        rval = [3]
+        rval = [4]
         for x in self.fgraph.toposort():
             xv = x.op.c_code_cache_version()
             if xv:
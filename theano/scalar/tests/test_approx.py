@@ -0,0 +1,55 @@
+import numpy
+
+import theano
+from theano.scalar import approx
+from theano.tensor.elemwise import Elemwise
+
+try:
+    import scipy.special
+    imported_scipy_special = True
+except ImportError:
+    imported_scipy_special = False
+
+
+def test_fast_approx():
+    # Compare the C code and the Python code of each approximation with
+    # the exact function, within the error bounds of its docstring.
+    exact = {'exp': numpy.exp, 'log': numpy.log, 'tanh': numpy.tanh,
+             'softplus': lambda x: numpy.logaddexp(0, x)}
+    if imported_scipy_special:
+        exact['erf'] = scipy.special.erf
+    ranges = {'exp': (-80, 80), 'log': (1e-30, 1e30), 'tanh': (-12, 12),
+              'erf': (-6, 6), 'softplus': (-30, 30)}
+    # (relative, absolute) tolerances.
+    tols = {'float32': {'exp': (2e-7, 0), 'log': (3e-7, 0),
+                        'tanh': (0, 2e-7), 'erf': (0, 5e-7),
+                        'softplus': (4e-7, 0)},
+            'float64': {'exp': (1.5e-15, 0), 'log': (1.5e-15, 0),
+                        'tanh': (0, 1e-15), 'erf': (0, 1.5e-7),
+                        'softplus': (2e-15, 0)}}
+    mode = theano.compile.Mode(linker='c', optimizer=None)
+    py_mode = theano.compile.Mode(linker='py', optimizer=None)
+    for dtype in ('float32', 'float64'):
+        x = theano.tensor.vector(dtype=dtype)
+        for name, fn in exact.items():
+            lo, hi = ranges[name]
+            if name == 'log':
+                val = numpy.exp(numpy.linspace(numpy.log(lo), numpy.log(hi),
+                                               10001))
+            else:
+                val = numpy.linspace(lo, hi, 10001)
+            val = val.astype(dtype)
+            out = Elemwise(getattr(approx, 'fast_' + name))(x)
+            f = theano.function([x], out, mode=mode)
+            f_py = theano.function([x], out, mode=py_mode)
+            ref = fn(val.astype('float64'))
+            rtol, atol = tols[dtype][name]
+            assert numpy.all(abs(f(val) - ref) <=
+                             atol + rtol * abs(ref)), (dtype, name)
+            assert numpy.allclose(f_py(val), f(val)), (dtype, name)
+
+            special = numpy.asarray([numpy.inf, -numpy.inf, numpy.nan],
+                                    dtype=dtype)
+            with numpy.errstate(invalid='ignore'):
+                assert numpy.allclose(f(special), fn(special),
+                                      equal_nan=True), (dtype, name)
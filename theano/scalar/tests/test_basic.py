@@ -110,6 +110,24 @@ class test_composite(unittest.TestCase):
         fn = gof.DualLinker().accept(g).make_function()
         assert fn(1.0, 2.0, 3.0) == [6.0, 7.0, 0.5]
 
+    def test_merge_commuted(self):
+        # The copies of a subexpression, even commuted, are computed once.
+        x, y, z = inputs()
+        e0 = exp(exp(x * y)) + z
+        e1 = z * exp(exp(y * x))
+        C = Composite([x, y, z], [e0, e1])
+        topo = C.fgraph.toposort()
+        assert len(topo) == 5, topo
+        assert C._c_code.count("exp(") == 2
+        # The temporary of x * y is reused for the second exp.
+        assert "_tmp3" not in C._c_code
+
+        c = C.make_node(x, y, z)
+        g = FunctionGraph([x, y, z], c.outputs)
+        fn = gof.DualLinker().accept(g).make_function()
+        out = fn(1.0, 2.0, 3.0)
+        utt.assert_allclose(out, [np.exp(np.exp(2)) + 3, 3 * np.exp(np.exp(2))])
+
     def test_composite_printing(self):
         x, y, z = floats('xyz')
         e0 = x + y + z
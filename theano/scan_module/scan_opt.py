@@ -2272,6 +2272,42 @@ class PushOutDot1(gof.Optimizer):
                             old_new, remove=[node], reason='scan_pushout_dot1')
 
 
+@gof.local_optimizer([scan_op.Scan])
+def scan_batched_dot(node):
+    """
+    Replace a scan that only computes dot(x[t], y[t]) by batched_dot(x, y),
+    that uses the BatchedGemm op.
+
+    This is the form of the older batched_dot.
+
+    """
+    op = node.op
+    if not isinstance(op, scan_op.Scan):
+        return False
+    info = op.info
+    if (info['n_seqs'] != 2 or info['n_nit_sot'] != 1 or
+            info['n_mit_mot'] or info['n_mit_sot'] or info['n_sit_sot'] or
+            info['n_shared_outs'] or info['as_while'] or
+            len(node.inputs) != 4):
+        return False
+    out, = op.outputs
+    inner_seqs = op.inner_seqs(op.inputs)
+    if not (out.owner and isinstance(out.owner.op, tensor.Dot) and
+            set(out.owner.inputs) == set(inner_seqs) and
+            len(set(inner_seqs)) == 2):
+        return False
+    n_steps = node.inputs[0]
+    outer = dict(zip(inner_seqs, op.outer_seqs(node.inputs)))
+    x, y = [outer[inp][:n_steps] for inp in out.owner.inputs]
+    if x.ndim not in (2, 3) or y.ndim not in (2, 3):
+        return False
+    new_out = tensor.batched_dot(x, y)
+    if new_out.type != node.outputs[0].type:
+        new_out = tensor.patternbroadcast(
+            new_out, node.outputs[0].broadcastable)
+    return [new_out]
+
+
 # I've added an equilibrium because later scan optimization in the sequence
 # can make it such that earlier optimizations should apply. However, in
 # general I do not expect the sequence to run more then once
@@ -2304,6 +2340,13 @@ scan_seqopt1.register('scanOp_remove_constants_and_unused_inputs0',
                       'scan')
 
 
+scan_seqopt1.register('scan_batched_dot',
+                      opt.in2out(scan_batched_dot, ignore_newtrees=True),
+                      1.5,
+                      'fast_run',
+                      'scan')
+
+
 scan_seqopt1.register('scanOp_pushout_nonseqs_ops',
                       PushOutNonSeqScan(),
                       2,
@@ -13,6 +13,7 @@ from theano import gof
 from theano.gof import Apply, Constant, Op, Variable
 
 from theano.tensor import elemwise
+from theano.tensor import elemwise_openmp
 from theano.tensor.var import (AsTensorError, TensorVariable,
                                TensorConstant,
                                _tensor_py_operators)
@@ -1274,9 +1275,17 @@ def cast(x, dtype):
 ##########################
 
 
-class MaxAndArgmax(Op):
+class MaxAndArgmax(gof.OpenMPOp):
     """
-    Calculate the max and argmax over a given axis or over all axes.
+    Calculate the max and argmax over a given axis, a set of axes or over
+    all axes.
+
+    Over several axes, the argmax is the index in the flattened reduced
+    dimensions, taken in increasing axis order, like numpy.argmax after
+    moving them to the end and reshaping them into one.
+
+    The C code computes both in one pass over the input, without copying
+    it, and with OpenMP over the elements of the outputs.
 
     """
     nin = 2  # tensor, axis
@@ -1287,20 +1296,22 @@ class MaxAndArgmax(Op):
     def make_node(self, x, axis=None):
         x = _as_tensor_variable(x)
 
+        if isinstance(axis, TensorConstant) and axis.ndim == 1:
+            axis = list(axis.data)
         if isinstance(axis, (tuple, list)):
             axis = [int(a) for a in axis]
             if len(axis) != 1:
-                axis = list(axis)
                 for idx in xrange(len(axis)):
                     if axis[idx] < 0:
                         axis[idx] += x.type.ndim
-                axis.sort()
-                if axis == list(range(-x.type.ndim, 0, 1)):
-                    axis = list(range(x.type.ndim))
-                assert axis == list(range(x.type.ndim)), (
-                    "MaxAndArgmax does not support multiple"
-                    " axes. the max fct supports it. Got %s" % axis)
-                axis = None
+                axis = sorted(set(axis))
+                for a in axis:
+                    if a < 0 or a >= x.type.ndim:
+                        raise ValueError(
+                            'Invalid axis: %s (the number of dimensions of '
+                            'the input is: %s)' % (a, x.type.ndim))
+                if axis == list(range(x.type.ndim)):
+                    axis = None
             else:
                 axis = axis[0]
 
@@ -1320,26 +1331,29 @@ class MaxAndArgmax(Op):
                 axis = int(axis.data)
         # we make the axis all positive to make the infer_shape work
         # with negative axis
-        if x.type.ndim > 0 and axis is not None:
+        if x.type.ndim > 0 and isinstance(axis, int):
             if axis < 0:
                 if -axis > x.type.ndim:
                     raise ValueError('axis out of range')
                 axis = x.type.ndim + axis
         # Verify that the axis is valid.
-        all_axes = set()
-        if axis is not None:
+        if isinstance(axis, int):
             if axis < 0 or axis >= x.type.ndim:
                 raise ValueError(
                     'Invalid axis: %s (the number of dimensions of the '
                     'input is: %s)' % (axis, x.type.ndim))
-            all_axes.add(axis)
-        else:
+            all_axes = [axis]
+        elif axis is None:
             all_axes = list(range(x.ndim))
+        else:
+            all_axes = axis
         if axis is None:
             axis = NoneConst.clone()
-        else:
+        elif isinstance(axis, int):
             axis = _as_tensor_variable(axis)
             assert axis.ndim == 0
+        else:
+            axis = constant(axis, dtype='int64')
         inputs = [x, axis]
         # We keep the original broadcastable flags for dimensions on which
         # we do not perform the max / argmax.
@@ -1349,81 +1363,199 @@ class MaxAndArgmax(Op):
                    tensor('int64', broadcastable, name='argmax')]
         return Apply(self, inputs, outputs)
 
+    @staticmethod
+    def reduced_axes(x, axis):
+        """
+        Return the sorted list of the axes of `x` reduced by the axis input
+        `axis` of a MaxAndArgmax node.
+
+        """
+        if NoneConst.equals(axis):
+            return list(range(x.ndim))
+        return [int(a) for a in numpy.atleast_1d(axis.data)]
+
     def perform(self, node, inp, outs):
         x, axis = inp
         max, max_idx = outs
-        max[0] = theano._asarray(numpy.max(x, axis),
-                                 dtype=node.outputs[0].dtype)
-        max_idx[0] = theano._asarray(numpy.argmax(x, axis), dtype='int64')
+        axes = self.reduced_axes(*node.inputs)
+        if len(axes) > 1 and len(axes) < x.ndim:
+            # numpy.argmax only takes one axis.
+            kept = [i for i in xrange(x.ndim) if i not in axes]
+            x_max = numpy.max(x, tuple(axes))
+            x = x.transpose(kept + axes)
+            x = x.reshape(x.shape[:len(kept)] + (-1,))
+            x_argmax = numpy.argmax(x, -1)
+        else:
+            x_max = numpy.max(x, axis)
+            x_argmax = numpy.argmax(x, axis)
+        max[0] = theano._asarray(x_max, dtype=node.outputs[0].dtype)
+        max_idx[0] = theano._asarray(x_argmax, dtype='int64')
+
+    def openmp_minsize(self, node):
+        """
+        Return the minimum input size for which `node` uses OpenMP.
+
+        This is the threshold of a CAReduce maximum, see
+        `theano.tensor.elemwise_openmp`.
+
+        """
+        return elemwise_openmp.openmp_minsize(scal.maximum,
+                                              node.inputs[0].dtype)
 
     def c_code(self, node, name, inp, out, sub):
+        if node.inputs[0].type.dtype.startswith('complex'):
+            raise NotImplementedError()
         x, axis = inp
         max, argmax = out
         fail = sub["fail"]
-
-        if NoneConst.equals(node.inputs[1]):
-            axis_code = "axis = NPY_MAXDIMS;"
+        ndim = node.inputs[0].ndim
+        axes = self.reduced_axes(*node.inputs)
+        kept = [i for i in xrange(ndim) if i not in axes]
+        dtype = node.inputs[0].type.dtype_specs()[1]
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        n_kept = len(kept)
+
+        out_dims = "\n".join(
+            "out_dims[%d] = x_dims[%d];" % (j, i) for j, i in enumerate(kept))
+        n_red = " * ".join(["x_dims[%d]" % i for i in axes] + ["1"])
+        # Go from the index of an output element to its first input
+        # element, the last kept axis varying fastest.
+        unravel = "\n".join(
+            """
+            x_base += (rem %% x_dims[%(i)d]) * x_strides[%(i)d];
+            rem /= x_dims[%(i)d];
+            """ % dict(i=i) for i in reversed(kept))
+        # Nested loops over the reduced axes in increasing axis order, so
+        # that r is the index in the flattened reduced dimensions.
+        loops = ""
+        ptr = "x_base"
+        for i in axes[:-1]:
+            loops += """
+            for (npy_intp i%(i)d = 0; i%(i)d < x_dims[%(i)d]; ++i%(i)d)
+            {
+                const char* p%(i)d = %(ptr)s + i%(i)d * x_strides[%(i)d];
+            """ % dict(i=i, ptr=ptr)
+            ptr = "p%d" % i
+        if axes:
+            loops += """
+            {
+                const char* row = %(ptr)s;
+                for (npy_intp j = 0; j < n_in; ++j)
+                {
+                    const %(dtype)s v = *(const %(dtype)s*)(row + j * s_in);
+                    // NaN is the max, and the first NaN its argmax, as in
+                    // numpy.
+                    if (v > best || (v != v && best == best))
+                    {
+                        best = v;
+                        best_idx = r + j;
+                    }
+                }
+                r += n_in;
+            }
+            """ % dict(ptr=ptr, dtype=dtype)
+        loops += "}" * (len(axes) - 1)
+        if axes:
+            inner = """
+            const npy_intp n_in = x_dims[%(last)d];
+            const npy_intp s_in = x_strides[%(last)d];
+            """ % dict(last=axes[-1])
         else:
-            assert node.inputs[1].ndim == 0
-            axis_code = """
-            axis = ((dtype_%(axis)s*)PyArray_DATA(%(axis)s))[0];
-            if(axis > PyArray_NDIM(%(x)s)-1 || axis < -PyArray_NDIM(%(x)s)){
-                PyErr_SetString(PyExc_ValueError, "MaxAndArgmax, bad axis argument");
-                %(fail)s
+            inner = ""
+        # The argmax of numpy is vectorized, and faster than the loop above
+        # when it can be used on the whole input.
+        last_axis_only = int(axes == [ndim - 1])
+
+        omp = ""
+        if self.openmp:
+            minsize = self.openmp_minsize(node)
+            omp = ("#pragma omp parallel for schedule(static)"
+                   " if(n_out * n_red >= %d)" % minsize)
+
+        return """
+        {
+            const npy_intp* x_dims = PyArray_DIMS(%(x)s);
+            const npy_intp* x_strides = PyArray_STRIDES(%(x)s);
+            npy_intp out_dims[%(n_kept)s + 1];
+            %(out_dims)s
+            const npy_intp n_red = %(n_red)s;
+            if (!(%(max)s && PyArray_IS_C_CONTIGUOUS(%(max)s) &&
+                  PyArray_CompareLists(PyArray_DIMS(%(max)s), out_dims,
+                                       %(n_kept)s)))
+            {
+                Py_XDECREF(%(max)s);
+                %(max)s = (PyArrayObject*)PyArray_EMPTY(
+                    %(n_kept)s, out_dims, %(typenum)s, 0);
+                if (!%(max)s)
+                    %(fail)s
             }
-            """ % locals()
-        ret = """
-        int axis;
-
-        Py_CLEAR(%(max)s);
-        Py_CLEAR(%(argmax)s);//todo pass them as out parameter.
-        %(axis_code)s
-        %(max)s = (PyArrayObject*)PyArray_Max(%(x)s, axis, NULL);
-        if(%(max)s == NULL){
-            PyErr_SetString(PyExc_ValueError,
-                         "MaxAndArgmax, max failed");
-            %(fail)s;
-        }
-        if(!PyArray_CheckExact(%(max)s)){
-            %(max)s = (PyArrayObject*)PyArray_FromAny((PyObject*)%(max)s, NULL, 0, 0, NPY_ARRAY_ENSUREARRAY, NULL);
-            if(%(max)s == NULL){
-                %(fail)s;
+            if (!(%(argmax)s && PyArray_IS_C_CONTIGUOUS(%(argmax)s) &&
+                  PyArray_CompareLists(PyArray_DIMS(%(argmax)s), out_dims,
+                                       %(n_kept)s)))
+            {
+                Py_XDECREF(%(argmax)s);
+                %(argmax)s = (PyArrayObject*)PyArray_EMPTY(
+                    %(n_kept)s, out_dims, NPY_INT64, 0);
+                if (!%(argmax)s)
+                    %(fail)s
             }
-        }
-
-        %(argmax)s = (PyArrayObject*)PyArray_ArgMax(%(x)s, axis, NULL);
-        if(%(argmax)s == NULL){
-            PyErr_SetString(PyExc_ValueError, "MaxAndArgmax, argmax failed");
-            Py_CLEAR(%(max)s);
-            %(fail)s;
-        }
-        if(!PyArray_CheckExact(%(argmax)s)){
-            %(argmax)s = (PyArrayObject*)PyArray_FromAny((PyObject*)%(argmax)s, NULL, 0, 0, NPY_ARRAY_ENSUREARRAY, NULL);
-            if(%(argmax)s == NULL){
-                %(fail)s;
+            const npy_intp n_out = PyArray_SIZE(%(max)s);
+            if (n_red == 0 && n_out > 0)
+            {
+                PyErr_SetString(PyExc_ValueError,
+                                "MaxAndArgmax of an empty sequence");
+                %(fail)s
             }
-        }
-        if(PyArray_TYPE(%(argmax)s) != NPY_INT64){
-            PyObject * tmp = PyArray_Cast(%(argmax)s, NPY_INT64);
-            if (NULL == tmp){
-                %(fail)s;
+            const char* x_data = PyArray_BYTES(%(x)s);
+            %(dtype)s* max_data = (%(dtype)s*)PyArray_DATA(%(max)s);
+            npy_int64* argmax_data = (npy_int64*)PyArray_DATA(%(argmax)s);
+            if (%(last_axis_only)s && n_out > 0 &&
+                PyArray_IS_C_CONTIGUOUS(%(x)s))
+            {
+                PyArrayObject* idx = (PyArrayObject*)PyArray_ArgMax(
+                    %(x)s, %(ndim)s - 1, NULL);
+                if (!idx)
+                    %(fail)s
+                const npy_intp* idx_data = (const npy_intp*)PyArray_DATA(idx);
+                const %(dtype)s* rows = (const %(dtype)s*)x_data;
+                for (npy_intp o = 0; o < n_out; ++o)
+                {
+                    argmax_data[o] = idx_data[o];
+                    max_data[o] = rows[o * n_red + idx_data[o]];
+                }
+                Py_DECREF(idx);
+            }
+            else
+            {
+                %(inner)s
+                %(omp)s
+                for (npy_intp o = 0; o < n_out; ++o)
+                {
+                    const char* x_base = x_data;
+                    npy_intp rem = o;
+                    %(unravel)s
+                    %(dtype)s best = *(const %(dtype)s*)x_base;
+                    npy_int64 best_idx = 0;
+                    npy_int64 r = 0;
+                    %(loops)s
+                    max_data[o] = best;
+                    argmax_data[o] = best_idx;
+                }
             }
-            Py_DECREF(%(argmax)s);
-            %(argmax)s = (PyArrayObject*)tmp;
         }
-        """
-        return ret % locals()
+        """ % locals()
 
-    def c_code_cache_version(self):
-        return (3,)
+    def c_code_cache_version_apply(self, node):
+        version = [4, ('openmp', self.openmp)]
+        if self.openmp:
+            version.append(('openmp_minsize', self.openmp_minsize(node)))
+        return tuple(version)
 
     def infer_shape(self, node, shapes):
         ishape, axis_shape = shapes
-        axis = node.inputs[1]
-        if node.inputs[1].data is None:
-            return [(), ()]
-        rval = tuple([ishape[i] for (i, b) in enumerate(
-            node.inputs[0].type.broadcastable) if i != axis.data])
+        axes = self.reduced_axes(*node.inputs)
+        rval = tuple([ishape[i] for i in xrange(node.inputs[0].ndim)
+                      if i not in axes])
         return [rval, rval]
 
     def R_op(self, inputs, eval_points):
@@ -1432,6 +1564,9 @@ class MaxAndArgmax(Op):
         if not isinstance(inputs[1], theano.Constant):
             raise ValueError(('R_op supported for arg_max only for '
                               'constant axis!'))
+        if not isinstance(inputs[1], TensorConstant) or inputs[1].ndim != 0:
+            raise ValueError(('R_op supported for arg_max only for '
+                              'one axis!'))
         if inputs[1].data > 1:
             raise ValueError(('R_op supported for arg_max only when '
                               ' axis is 0 or 1'))
@@ -1479,20 +1614,14 @@ class MaxAndArgmax(Op):
         # the gradient on its inputs is zero
         if g_max_disconnected:
             return [x.zeros_like(), axis_grad]
-        if NoneConst.equals(axis):
-            axis_ = list(range(x.ndim))
-        else:
-            axis_ = axis
-        xmax = max(x, axis_)
+        axes = self.reduced_axes(x, axis)
+        xmax = max(x, axes)
 
         # Raise the g_max and xmax to the same number of dim as the input.
         pattern = []
         out_dim = 0
-        if NoneConst.equals(axis):
-            # We are taking the max/argmax over all dimensions.
-            axis = None
         for i in xrange(x.ndim):
-            if axis is None or i == axis.data:
+            if i in axes:
                 pattern.append('x')
             else:
                 pattern.append(out_dim)
@@ -3321,7 +3450,10 @@ def transpose(x, axes=None):
 def batched_dot(x, y):
     """
     This function computes the dot product between the two tensors, by
-    iterating over the first dimension using scan.
+    iterating over the first dimension.
+
+    Batches of matrices and of vectors use the BatchedGemm op, the other
+    numbers of dimensions use scan.
 
     Parameters
     ----------
@@ -3348,6 +3480,25 @@ def batched_dot(x, y):
     >>> result = batched_dot(first, second)
 
     """
+    x = as_tensor_variable(x)
+    y = as_tensor_variable(y)
+    if x.ndim in (2, 3) and y.ndim in (2, 3):
+        dtype = scal.upcast(x.dtype, y.dtype)
+        x3 = cast(x, dtype)
+        y3 = cast(y, dtype)
+        if x.ndim == 2:
+            x3 = x3.dimshuffle(0, 'x', 1)
+        if y.ndim == 2:
+            y3 = y3.dimshuffle(0, 1, 'x')
+        result = theano.tensor.blas.batched_gemm(x3, y3)
+        if x.ndim == 2 and y.ndim == 2:
+            return result.dimshuffle(0)
+        if x.ndim == 2:
+            return result.dimshuffle(0, 2)
+        if y.ndim == 2:
+            return result.dimshuffle(0, 1)
+        return result
+
     result, updates = theano.scan(
         fn=lambda x_mat, y_mat:
         theano.tensor.dot(x_mat, y_mat),
@@ -3363,7 +3514,7 @@ def batched_tensordot(x, y, axes=2):
 
     A hybrid of batch_dot and tensordot, this function computes the
     tensordot product between the two tensors, by iterating over the
-    first dimension using scan to perform a sequence of tensordots.
+    first dimension to perform a sequence of tensordots.
 
     Parameters
     ----------
@@ -3426,6 +3577,13 @@ class Split(Op):
 
     def __init__(self, len_splits):
         self.len_splits = int(len_splits)
+        # The outputs are views of x, so splitting copies nothing.
+        self.view_map = dict((i, [0]) for i in xrange(self.len_splits))
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        # Older pickles copied the outputs and had no view_map.
+        self.view_map = dict((i, [0]) for i in xrange(self.len_splits))
 
     def __str__(self):
         return self.__class__.__name__ + "{%s}" % self.len_splits
@@ -3486,7 +3644,7 @@ class Split(Op):
         for i in xrange(self.len_splits):
             upper_idx = lower_idx + splits[i]
             general_key[axis] = slice(lower_idx, upper_idx, None)
-            outputs[i][0] = x.__getitem__(tuple(general_key)).copy()
+            outputs[i][0] = x.__getitem__(tuple(general_key))
             lower_idx = upper_idx
 
     def infer_shape(self, node, in_shapes):
@@ -3760,15 +3918,120 @@ class Join(Op):
         out, = out_
         axis, tensors = axis_and_tensors[0], axis_and_tensors[1:]
         ndim = tensors[0].ndim
-        if axis < -ndim:
+        if axis < -ndim or axis >= ndim:
             raise IndexError("Join axis %d out of bounds [0, %d)" %
                              (axis, ndim))
+        axis = int(axis) % ndim
+        shape = list(tensors[0].shape)
+        shape[axis] = 0
+        for t in tensors:
+            if (t.shape[:axis] != tuple(shape[:axis]) or
+                    t.shape[axis + 1:] != tuple(shape[axis + 1:])):
+                raise ValueError("all the input array dimensions except for"
+                                 " the concatenation axis must match exactly")
+            shape[axis] += t.shape[axis]
+
+        # Reuse the output when it has the right shape. The inputs that
+        # already are in place, see `input_views`, are not copied.
+        z = out[0]
+        in_place = [False] * len(tensors)
+        if (z is not None and z.shape == tuple(shape) and
+                z.flags.c_contiguous):
+            for i, (t, dst) in enumerate(izip(tensors,
+                                              self._slices(z, axis, tensors))):
+                in_place[i] = (t.dtype == z.dtype and
+                               t.__array_interface__['data'][0] ==
+                               dst.__array_interface__['data'][0] and
+                               python_all(d <= 1 or ts == zs for d, ts, zs in
+                                          izip(t.shape, t.strides, z.strides)))
+                if not in_place[i] and numpy.may_share_memory(t, z):
+                    z = None
+                    break
+        else:
+            z = None
+        if z is None:
+            z = numpy.empty(shape, dtype=node.outputs[0].type.dtype)
+            in_place = [False] * len(tensors)
+        for t, dst, done in izip(tensors, self._slices(z, axis, tensors),
+                                 in_place):
+            if not done:
+                dst[...] = t
+        out[0] = z
+
+    @staticmethod
+    def _slices(z, axis, tensors):
+        """Return the views of `z` that receive each of `tensors`."""
+        start = 0
+        for t in tensors:
+            stop = start + t.shape[axis]
+            yield z[(slice(None),) * axis + (slice(start, stop),)]
+            start = stop
+
+    def input_views(self, node, inputs, outputs):
+        axis, tensors = inputs[0], inputs[1:]
+        z = outputs[0]
+        if not isinstance(z, numpy.ndarray) or not z.flags.c_contiguous:
+            return [None] * len(inputs)
+        axis = int(axis) % z.ndim
+        views = [None]
+        for t, dst in izip(tensors, self._slices(z, axis, tensors)):
+            # Many Ops only reuse a C-contiguous output storage.
+            if (t.dtype == z.dtype and t.shape == dst.shape and
+                    dst.flags.c_contiguous):
+                views.append(dst)
+            else:
+                views.append(None)
+        return views
+
+    def c_support_code(self):
+        return """
+        #ifndef THEANO_JOIN_HELPERS
+        #define THEANO_JOIN_HELPERS
+        // Is x already stored at dst, with the strides of z?
+        static int theano_join_in_place(PyArrayObject* x, PyArrayObject* z,
+                                        char* dst)
+        {
+            if (PyArray_BYTES(x) != dst
+                || !PyArray_EquivTypes(PyArray_DESCR(x), PyArray_DESCR(z)))
+                return 0;
+            for (int d = 0; d < PyArray_NDIM(x); ++d)
+                if (PyArray_DIMS(x)[d] > 1
+                    && PyArray_STRIDES(x)[d] != PyArray_STRIDES(z)[d])
+                    return 0;
+            return 1;
+        }
 
-        out[0] = theano._asarray(numpy.concatenate(tensors, axis=axis),
-                                 dtype=node.outputs[0].type.dtype)
+        static void theano_join_extent(PyArrayObject* x, char** low,
+                                       char** high)
+        {
+            *low = *high = PyArray_BYTES(x);
+            for (int d = 0; d < PyArray_NDIM(x); ++d)
+            {
+                npy_intp span = (PyArray_DIMS(x)[d] - 1)
+                    * PyArray_STRIDES(x)[d];
+                if (span < 0)
+                    *low += span;
+                else
+                    *high += span;
+            }
+            *high += PyArray_ITEMSIZE(x);
+        }
+
+        // Can x and z share memory? Only looks at their bounds.
+        static int theano_join_overlap(PyArrayObject* x, PyArrayObject* z)
+        {
+            char *x_low, *x_high, *z_low, *z_high;
+            if (PyArray_SIZE(x) == 0 || PyArray_SIZE(z) == 0)
+                return 0;
+            theano_join_extent(x, &x_low, &x_high);
+            theano_join_extent(z, &z_low, &z_high);
+            return x_low < z_high && z_low < x_high;
+        }
+        #endif
+        """
 
     def c_code_cache_version(self):
-        return (3,)
+        return (4,)
 
     def c_code(self, node, name, inputs, outputs, sub):
         axis, tensors = inputs[0], inputs[1:]
@@ -3777,33 +4040,96 @@ class Join(Op):
         out, = outputs
         fail = sub['fail']
         adtype = node.inputs[0].type.dtype_specs()[1]
-        code = """
-        PyObject* list = PyList_New(%(l)s);
-        """ % locals()
-        for i, inp in enumerate(tensors):
-            code += """
-            Py_INCREF(%(inp)s);
-            PyList_SetItem(list, %(i)s, (PyObject*)%(inp)s);
-            """ % locals()
-        code += """
-        //PyObject* PyArray_Concatenate(PyObject* obj, int axis)
-        int axis = ((%(adtype)s *)PyArray_DATA(%(axis)s))[0];
-        int ndim = PyArray_NDIM(%(input_1)s);
-        if( axis < -ndim ){
-            PyErr_Format(PyExc_IndexError,
-                         "Join axis %%d out of bounds [0, %%d)", axis, ndim);
-            %(fail)s
-        }
+        out_typenum = node.outputs[0].type.dtype_specs()[2]
+        tensors_list = ", ".join(tensors)
+        return """
+        {
+            PyArrayObject* tensors[] = {%(tensors_list)s};
+            int in_place[%(l)s];
+            int axis = ((%(adtype)s *)PyArray_DATA(%(axis)s))[0];
+            int ndim = PyArray_NDIM(%(input_1)s);
+            if (axis < -ndim || axis >= ndim)
+            {
+                PyErr_Format(PyExc_IndexError,
+                             "Join axis %%d out of bounds [0, %%d)", axis, ndim);
+                %(fail)s
+            }
+            if (axis < 0)
+                axis += ndim;
+            npy_intp dims[NPY_MAXDIMS];
+            for (int d = 0; d < ndim; ++d)
+                dims[d] = PyArray_DIMS(%(input_1)s)[d];
+            dims[axis] = 0;
+            for (int i = 0; i < %(l)s; ++i)
+            {
+                for (int d = 0; d < ndim; ++d)
+                {
+                    if (d != axis && PyArray_DIMS(tensors[i])[d] != dims[d])
+                    {
+                        PyErr_SetString(PyExc_ValueError,
+                            "all the input array dimensions except for the"
+                            " concatenation axis must match exactly");
+                        %(fail)s
+                    }
+                }
+                dims[axis] += PyArray_DIMS(tensors[i])[axis];
+            }
 
-        Py_XDECREF(%(out)s);
-        %(out)s = (PyArrayObject *)PyArray_Concatenate(list, axis);
+            // Reuse the output when it has the right shape. The inputs that
+            // already are in place, see `input_views`, are not copied.
+            int reuse = (%(out)s && PyArray_NDIM(%(out)s) == ndim
+                         && PyArray_CompareLists(PyArray_DIMS(%(out)s), dims,
+                                                 ndim)
+                         && PyArray_IS_C_CONTIGUOUS(%(out)s));
+            npy_intp start = 0;
+            for (int i = 0; i < %(l)s && reuse; ++i)
+            {
+                char* dst = PyArray_BYTES(%(out)s)
+                    + start * PyArray_STRIDES(%(out)s)[axis];
+                in_place[i] = theano_join_in_place(tensors[i], %(out)s, dst);
+                if (!in_place[i] && theano_join_overlap(tensors[i], %(out)s))
+                    reuse = 0;
+                start += PyArray_DIMS(tensors[i])[axis];
+            }
+            if (!reuse)
+            {
+                Py_XDECREF(%(out)s);
+                %(out)s = (PyArrayObject*)PyArray_EMPTY(ndim, dims,
+                                                        %(out_typenum)s, 0);
+                if (!%(out)s)
+                    %(fail)s
+                for (int i = 0; i < %(l)s; ++i)
+                    in_place[i] = 0;
+            }
 
-        Py_DECREF(list);
-        if(!%(out)s){
-            %(fail)s
+            start = 0;
+            for (int i = 0; i < %(l)s; ++i)
+            {
+                const npy_intp len = PyArray_DIMS(tensors[i])[axis];
+                if (!in_place[i] && PyArray_SIZE(tensors[i]) > 0)
+                {
+                    npy_intp view_dims[NPY_MAXDIMS];
+                    for (int d = 0; d < ndim; ++d)
+                        view_dims[d] = dims[d];
+                    view_dims[axis] = len;
+                    Py_INCREF(PyArray_DESCR(%(out)s));
+                    PyArrayObject* view = (PyArrayObject*)PyArray_NewFromDescr(
+                        &PyArray_Type, PyArray_DESCR(%(out)s), ndim, view_dims,
+                        PyArray_STRIDES(%(out)s),
+                        PyArray_BYTES(%(out)s)
+                            + start * PyArray_STRIDES(%(out)s)[axis],
+                        NPY_ARRAY_WRITEABLE, NULL);
+                    if (!view)
+                        %(fail)s
+                    int err = PyArray_CopyInto(view, tensors[i]);
+                    Py_DECREF(view);
+                    if (err)
+                        %(fail)s
+                }
+                start += len;
+            }
         }
         """ % locals()
-        return code
 
     def R_op(self, inputs, eval_points):
         if None in eval_points[1:]:
@@ -40,6 +40,10 @@ Dot22Scalar is a GEMM where b=0 and Z is allocated every time.
 
 Gemm is a GEMM in all its generality.
 
+When no dimension is larger than ``config.blas.small_gemm``, the C code
+of these Ops uses unrolled loops instead of calling BLAS, as the call
+and the stride checks cost more than the arithmetic.
+
 In the future we can refactor the GemmRelated, Gemm, Dot22 and
 Dot22Scalar Ops into a single Op.  That new Op (Gemm2) is basically a
 normal Gemm, but with an additional configuration variable that says
@@ -48,6 +52,11 @@ would make Gemm2 equivalent to the current Dot22 and Dot22Scalar.
 This would make the file a lot easier to read, and save a few hundred
 lines of library, to say nothing of testing and documentation.
 
+GemmEpilogue is a Dot22Scalar followed by an elementwise scalar Op on
+its result and on matrices, rows or columns (e.g. a bias and an
+activation). It calls GEMM on blocks of rows and applies the scalar Op
+to each block while it is still in the cache.
+
 
 GEMV: Gemv
 ----------
@@ -123,6 +132,15 @@ Specialize Gemm to Gemv
 If arguments to GEMM are dimshuffled vectors, then we can use GEMV
 instead. This optimization is `local_gemm_to_gemv`.
 
+Fuse Elemwise epilogues into Dot22
+----------------------------------
+
+After the elemwise fusion, a Dot22 or Dot22Scalar whose only client is
+an Elemwise becomes a GemmEpilogue. This covers the forward pass of a
+dense layer (activation of the product plus a bias) and its gradient
+(the product times the derivative of the activation). This
+optimization is `local_gemm_epilogue`.
+
 """
 from __future__ import print_function
 import copy
@@ -139,14 +157,14 @@ try:
 except ImportError:
     pass
 
-from theano.configparser import config, AddConfigVar, StrParam
+from theano.configparser import config, AddConfigVar, IntParam, StrParam
 from six import iteritems
 from six.moves import reduce, xrange
-from theano.gof import (utils, Op, view_roots,
+from theano.gof import (utils, Op, OpenMPOp, view_roots,
                         local_optimizer, Optimizer,
                         InconsistencyError, toolbox, SequenceDB,
                         EquilibriumOptimizer, Apply,
-                        ReplacementDidntRemovedError)
+                        ReplacementDidntRemovedError, shapes_nbytes)
 from theano.gof.cmodule import GCC_compiler
 from theano.printing import pprint, FunctionPrinter, debugprint
 from theano.compile.mode import optdb
@@ -154,7 +172,9 @@ import theano.scalar
 from theano.tensor import basic as T
 from theano.tensor.blas_headers import blas_header_text
 from theano.tensor.blas_headers import blas_header_version
-from theano.tensor.opt import in2out, local_dimshuffle_lift
+from theano.tensor.elemwise import scalar_op_flops
+from theano.tensor.opt import (in2out, local_dimshuffle_lift,
+                               inplace_assignment_optimizer)
 
 _logger = logging.getLogger('theano.tensor.blas')
 
@@ -323,6 +343,14 @@ AddConfigVar('blas.ldflags',
              "lib[s] to include for [Fortran] level-3 blas implementation",
              StrParam(default_blas_ldflags))
 
+AddConfigVar('blas.small_gemm',
+             "Dot22, Dot22Scalar and Gemm use unrolled C loops instead of "
+             "a BLAS call when no dimension of the product is larger than "
+             "this. 0 disables them.",
+             IntParam(4, lambda i: 0 <= i <= 128),
+             # Only in the C code version of the ops that use it.
+             in_c_key=False)
+
 
 try:
     import scipy.linalg.blas
@@ -635,7 +663,94 @@ class GemmRelated(Op):
             return (double) tv.tv_sec + (double) tv.tv_usec / 1000000.0;
         }
         """
-        return blas_header_text() + mod_str
+        return blas_header_text() + mod_str + self.small_gemm_support_code()
+
+    def small_gemm_support_code(self):
+        """
+        Return the C++ loops used instead of BLAS for small matrices.
+
+        The number of columns of the output is a template parameter, so
+        that the compiler unrolls the innermost loop and keeps a row of
+        the output in registers. There is one instance for each number
+        of columns up to ``config.blas.small_gemm``.
+
+        """
+        size = config.blas.small_gemm
+        if not size:
+            return ""
+        cases = "".join("""
+                case %(n)d: theano_small_gemm_cols<T, %(n)d>(
+                    M, N, K, a, x, sx0, sx1, y, sy0, sy1, b, z, sz0, sz1);
+                    break;""" % dict(n=n) for n in xrange(1, size + 1))
+        return """
+        #ifndef THEANO_SMALL_GEMM
+        #define THEANO_SMALL_GEMM
+        // z <- a x y + b z, with the strides in elements. z is not read
+        // when b is 0, like in BLAS. NC is N when it is known at compile
+        // time and 0 otherwise.
+        template<typename T, int NC>
+        static void theano_small_gemm_cols(
+            int M, int N, int K, T a,
+            const T* x, npy_intp sx0, npy_intp sx1,
+            const T* y, npy_intp sy0, npy_intp sy1,
+            T b, T* z, npy_intp sz0, npy_intp sz1)
+        {
+            const int n = NC ? NC : N;
+            T acc[%(size)d];
+            for (int i = 0; i < M; ++i)
+            {
+                const T* xi = x + i * sx0;
+                for (int j = 0; j < n; ++j)
+                    acc[j] = 0;
+                if (sy1 == 1)
+                {
+                    for (int k = 0; k < K; ++k)
+                    {
+                        const T xik = xi[k * sx1];
+                        const T* yk = y + k * sy0;
+                        for (int j = 0; j < n; ++j)
+                            acc[j] += xik * yk[j];
+                    }
+                }
+                else
+                {
+                    for (int k = 0; k < K; ++k)
+                    {
+                        const T xik = xi[k * sx1];
+                        const T* yk = y + k * sy0;
+                        for (int j = 0; j < n; ++j)
+                            acc[j] += xik * yk[j * sy1];
+                    }
+                }
+                T* zi = z + i * sz0;
+                if (b == 0)
+                {
+                    for (int j = 0; j < n; ++j)
+                        zi[j * sz1] = a * acc[j];
+                }
+                else
+                {
+                    for (int j = 0; j < n; ++j)
+                        zi[j * sz1] = a * acc[j] + b * zi[j * sz1];
+                }
+            }
+        }
+
+        template<typename T>
+        static void theano_small_gemm(
+            int M, int N, int K, T a,
+            const T* x, npy_intp sx0, npy_intp sx1,
+            const T* y, npy_intp sy0, npy_intp sy1,
+            T b, T* z, npy_intp sz0, npy_intp sz1)
+        {
+            switch (N)
+            {%(cases)s
+                default: theano_small_gemm_cols<T, 0>(
+                    M, N, K, a, x, sx0, sx1, y, sy0, sy1, b, z, sz0, sz1);
+            }
+        }
+        #endif
+        """ % dict(size=size, cases=cases)
 
     def c_headers(self):
         # std.cout doesn't require the '%' symbol to print stuff...
@@ -659,6 +774,7 @@ class GemmRelated(Op):
 
     declare_NS = """
         int unit = 0;
+        int small_gemm = 0;
 
         int type_num = PyArray_DESCR(%(_x)s)->type_num;
         int type_size = PyArray_DESCR(%(_x)s)->elsize; // in bytes
@@ -790,6 +906,40 @@ class GemmRelated(Op):
         }
         """
 
+    # Small matrices skip the stride checks and the copies: the loops of
+    # small_gemm_support_code take any stride that is a whole number of
+    # elements.
+    check_small_gemm = """
+        small_gemm = (Nz[0] <= %(small_gemm)s && Nz[1] <= %(small_gemm)s
+                      && Nx[1] <= %(small_gemm)s
+                      && !(Sx[0] MOD type_size) && !(Sx[1] MOD type_size)
+                      && !(Sy[0] MOD type_size) && !(Sy[1] MOD type_size)
+                      && !(Sz[0] MOD type_size) && !(Sz[1] MOD type_size));
+        if (!small_gemm)
+        {
+        """
+
+    end_check_small_gemm = """
+        }
+        """
+
+    # REAL is defined by the case that includes it.
+    small_gemm_call = """
+                if (small_gemm)
+                {
+                    theano_small_gemm<REAL>(
+                        Nz[0], Nz[1], Nx[1], a,
+                        (REAL*)PyArray_DATA(%(_x)s),
+                        Sx[0] / type_size, Sx[1] / type_size,
+                        (REAL*)PyArray_DATA(%(_y)s),
+                        Sy[0] / type_size, Sy[1] / type_size,
+                        b, (REAL*)PyArray_DATA(%(_zout)s),
+                        Sz[0] / type_size, Sz[1] / type_size);
+                }
+                else
+                {
+        """
+
     encode_strides_in_unit = """
         /*
         encode the stride structure of _x,_y,_zout into a single integer
@@ -908,6 +1058,18 @@ class GemmRelated(Op):
         """
 
     def build_gemm_call(self):
+        if config.blas.small_gemm:
+            small = self.check_small_gemm % dict(
+                small_gemm=config.blas.small_gemm)
+            end_small = self.end_check_small_gemm
+            small_float = ("#define REAL float" + self.small_gemm_call +
+                           "#undef REAL\n")
+            small_double = ("#define REAL double" + self.small_gemm_call +
+                            "#undef REAL\n")
+            end_small_call = "}"
+        else:
+            small = end_small = small_float = small_double = ""
+            end_small_call = ""
 
         return reduce(str.__add__, (
             self.declare_NS,
@@ -916,20 +1078,26 @@ class GemmRelated(Op):
             self.check_xyz_double_or_float,
             self.check_ab_double_or_float,
             self.check_dims,
+            small,
             self.check_strides,
+            end_small,
             self.encode_strides_in_unit,
             self.compute_strides,
             self.begin_switch_typenum,
             self.case_float,
             self.case_float_ab_constants,
+            small_float,
             self.case_float_gemm,
+            end_small_call,
             self.case_double,
             self.case_double_ab_constants,
+            small_double,
             self.case_double_gemm,
+            end_small_call,
             self.end_switch_typenum), '')
 
     def build_gemm_version(self):
-        return (13, blas_header_version())
+        return (14, blas_header_version(), config.blas.small_gemm)
 
 
 class Gemm(GemmRelated):
@@ -1040,6 +1208,15 @@ class Gemm(GemmRelated):
         output = z.type()
         return Apply(self, inputs, [output])
 
+    def cost(self, node, input_shapes, output_shapes):
+        zshp, ashp, xshp, yshp, bshp = input_shapes
+        # 2 flops per multiply-add of the product, then scale the
+        # product, scale z and add them.
+        flops = 2 * xshp[0] * xshp[1] * yshp[1] + 3 * zshp[0] * zshp[1]
+        return (flops,
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
     def perform(self, node, inp, out):
         z, a, x, y, b = inp
         zout, = out
@@ -1682,6 +1859,13 @@ class Dot22(GemmRelated):
         outputs = [T.tensor(x.type.dtype, bz)]
         return Apply(self, [x, y], outputs)
 
+    def cost(self, node, input_shapes, output_shapes):
+        xshp, yshp = input_shapes
+        flops = 2 * xshp[0] * xshp[1] * yshp[1]
+        return (flops,
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
     def perform(self, node, inp, out):
         x, y = inp
         z, = out
@@ -1920,6 +2104,8 @@ blas_opt_inplace = in2out(local_inplace_gemm,
 optdb.register('InplaceBlasOpt',
                blas_opt_inplace,
                70.0, 'fast_run', 'inplace', 'blas_opt_inplace')
+for _lopt in (local_inplace_gemm, local_inplace_gemv, local_inplace_ger):
+    inplace_assignment_optimizer.add_local_optimizer(_lopt)
 
 
 class Dot22Scalar(GemmRelated):
@@ -1953,6 +2139,14 @@ class Dot22Scalar(GemmRelated):
         outputs = [T.tensor(x.type.dtype, bz)]
         return Apply(self, [x, y, a], outputs)
 
+    def cost(self, node, input_shapes, output_shapes):
+        xshp, yshp, ashp = input_shapes
+        flops = (2 * xshp[0] * xshp[1] * yshp[1] +
+                 xshp[0] * yshp[1])
+        return (flops,
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
     def perform(self, node, inp, out):
         x, y, scalar = inp
         z, = out
@@ -2134,6 +2328,689 @@ blas_optdb.register('local_dot22_to_dot22scalar',
                     11, 'fast_run')
 
 
+# How to pass a rows x cols matrix, with the strides s0 and s1 in elements,
+# to the Fortran gemm that sees it transposed: 'N' if its rows are
+# contiguous, 'T' if its columns are. It returns 0 if it must be copied
+# first.
+gemm_layout_code = """
+#ifndef THEANO_GEMM_LAYOUT
+#define THEANO_GEMM_LAYOUT
+static int theano_gemm_layout(npy_intp rows, npy_intp cols,
+                              npy_intp s0, npy_intp s1,
+                              char* trans, int* ld)
+{
+    if ((cols == 1 || s1 == 1) &&
+        (rows == 1 || (s0 >= cols && s0 <= INT_MAX)))
+    {
+        *trans = 'N';
+        *ld = rows == 1 ? (cols > 1 ? cols : 1) : s0;
+        return 1;
+    }
+    if ((rows == 1 || s0 == 1) &&
+        (cols == 1 || (s1 >= rows && s1 <= INT_MAX)))
+    {
+        *trans = 'T';
+        *ld = cols == 1 ? (rows > 1 ? rows : 1) : s1;
+        return 1;
+    }
+    return 0;
+}
+#endif
+"""
+
+
+class BatchedGemm(OpenMPOp):
+    """
+    Compute the batched matrix product z[i] = dot(x[i], y[i]).
+
+    x is a (batch, m, k) and y a (batch, k, n) tensor. A batch dimension
+    that is broadcastable is broadcast to the batch size of the other
+    input.
+
+    The C code calls BLAS gemm once per batch entry, without going back to
+    Python. With OpenMP, the batch entries of small products are computed
+    in parallel; the larger ones leave the threads to BLAS.
+
+    """
+
+    __props__ = ()
+
+    # Above this m * n * k, the batch loop is not run in parallel.
+    openmp_max_size = 64 ** 3
+
+    def make_node(self, x, y):
+        x = T.as_tensor_variable(x)
+        y = T.as_tensor_variable(y)
+        if x.type.ndim != 3:
+            raise TypeError('BatchedGemm needs a 3d x', x)
+        if y.type.ndim != 3:
+            raise TypeError('BatchedGemm needs a 3d y', y)
+        if y.type.dtype != x.type.dtype:
+            raise TypeError('dtype mismatch to BatchedGemm')
+        bz = (x.type.broadcastable[0] and y.type.broadcastable[0],
+              x.type.broadcastable[1], y.type.broadcastable[2])
+        return Apply(self, [x, y], [T.tensor(x.type.dtype, bz)])
+
+    def perform(self, node, inp, out):
+        x, y = inp
+        z, = out
+        batch = self._batch_size(node, x.shape[0], y.shape[0])
+        rval = numpy.empty((batch, x.shape[1], y.shape[2]), dtype=x.dtype)
+        for i in xrange(batch):
+            try:
+                rval[i] = numpy.dot(x[i % x.shape[0]], y[i % y.shape[0]])
+            except ValueError as e:
+                e.args = e.args + (x.shape, y.shape)
+                raise
+        z[0] = rval
+
+    @staticmethod
+    def _batch_size(node, x_batch, y_batch):
+        if x_batch == y_batch:
+            return x_batch
+        if x_batch == 1 and node.inputs[0].type.broadcastable[0]:
+            return y_batch
+        if y_batch == 1 and node.inputs[1].type.broadcastable[0]:
+            return x_batch
+        raise ValueError('BatchedGemm: the batch sizes %d and %d differ' %
+                         (x_batch, y_batch))
+
+    def infer_shape(self, node, shapes):
+        xshp, yshp = shapes
+        if node.inputs[0].type.broadcastable[0]:
+            batch = yshp[0]
+        else:
+            batch = xshp[0]
+        return [(batch, xshp[1], yshp[2])]
+
+    def cost(self, node, input_shapes, output_shapes):
+        xshp, yshp = input_shapes
+        zshp, = output_shapes
+        flops = 2 * zshp[0] * xshp[1] * xshp[2] * yshp[2]
+        return (flops,
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
+    def grad(self, inp, grads):
+        x, y = inp
+        gz, = grads
+        xgrad = batched_gemm(gz, y.dimshuffle(0, 2, 1))
+        ygrad = batched_gemm(x.dimshuffle(0, 2, 1), gz)
+        # Sum the gradient over a broadcasted batch dimension.
+        if x.type.broadcastable[0] and not xgrad.type.broadcastable[0]:
+            xgrad = xgrad.sum(axis=0, keepdims=True)
+        if y.type.broadcastable[0] and not ygrad.type.broadcastable[0]:
+            ygrad = ygrad.sum(axis=0, keepdims=True)
+        return [T.patternbroadcast(xgrad, x.type.broadcastable),
+                T.patternbroadcast(ygrad, y.type.broadcastable)]
+
+    def c_support_code(self):
+        return blas_header_text() + gemm_layout_code
+
+    def c_headers(self):
+        return super(BatchedGemm, self).c_headers() + ['<limits.h>']
+
+    def c_libraries(self):
+        return ldflags()
+
+    def c_compile_args(self):
+        return (super(BatchedGemm, self).c_compile_args() +
+                ldflags(libs=False, flags=True))
+
+    def c_lib_dirs(self):
+        return ldflags(libs=False, libs_dir=True)
+
+    def c_header_dirs(self):
+        return ldflags(libs=False, include_dir=True)
+
+    def c_code(self, node, name, inp, out, sub):
+        x, y = inp
+        z, = out
+        fail = sub['fail']
+        dtype = node.inputs[0].type.dtype
+        if dtype not in ('float32', 'float64') or not self.c_libraries():
+            raise utils.MethodNotDefined('%s.c_code'
+                                         % self.__class__.__name__)
+        ctype, gemm = {'float32': ('float', 'sgemm_'),
+                       'float64': ('double', 'dgemm_')}[dtype]
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        x_bcast = int(node.inputs[0].type.broadcastable[0])
+        y_bcast = int(node.inputs[1].type.broadcastable[0])
+        openmp_max_size = self.openmp_max_size
+        return """
+        {
+        npy_intp batch;
+        npy_intp x_batch = PyArray_DIMS(%(x)s)[0];
+        npy_intp y_batch = PyArray_DIMS(%(y)s)[0];
+        npy_intp M = PyArray_DIMS(%(x)s)[1];
+        npy_intp K = PyArray_DIMS(%(x)s)[2];
+        npy_intp N = PyArray_DIMS(%(y)s)[2];
+        if (x_batch == y_batch)
+            batch = x_batch;
+        else if (%(x_bcast)s && x_batch == 1)
+            batch = y_batch;
+        else if (%(y_bcast)s && y_batch == 1)
+            batch = x_batch;
+        else
+        {
+            PyErr_Format(PyExc_ValueError,
+                         "BatchedGemm: the batch sizes %%lld and %%lld differ",
+                         (long long)x_batch, (long long)y_batch);
+            %(fail)s
+        }
+        if (PyArray_DIMS(%(y)s)[1] != K)
+        {
+            PyErr_Format(PyExc_ValueError,
+                         "BatchedGemm: shape mismatch, x has %%lld columns"
+                         " and y %%lld rows",
+                         (long long)K, (long long)PyArray_DIMS(%(y)s)[1]);
+            %(fail)s
+        }
+        if (M > INT_MAX || N > INT_MAX || K > INT_MAX)
+        {
+            PyErr_SetString(PyExc_ValueError,
+                            "BatchedGemm: the matrices are too large for BLAS");
+            %(fail)s
+        }
+
+        if (NULL == %(z)s
+            || !PyArray_IS_C_CONTIGUOUS(%(z)s)
+            || PyArray_DIMS(%(z)s)[0] != batch
+            || PyArray_DIMS(%(z)s)[1] != M
+            || PyArray_DIMS(%(z)s)[2] != N)
+        {
+            npy_intp dims[3] = {batch, M, N};
+            Py_XDECREF(%(z)s);
+            %(z)s = (PyArrayObject*)PyArray_EMPTY(3, dims, %(typenum)s, 0);
+            if (NULL == %(z)s)
+            {
+                PyErr_SetString(PyExc_MemoryError,
+                                "failed to alloc BatchedGemm output");
+                %(fail)s
+            }
+        }
+
+        if (batch > 0 && M > 0 && N > 0 && K == 0)
+        {
+            memset(PyArray_DATA(%(z)s), 0, PyArray_NBYTES(%(z)s));
+        }
+        else if (batch > 0 && M > 0 && N > 0)
+        {
+            // A copy for the inputs whose matrices BLAS can't read.
+            PyArrayObject* xc = %(x)s;
+            PyArrayObject* yc = %(y)s;
+            char trans_x, trans_y;
+            int ld_x, ld_y;
+            const npy_intp es = sizeof(%(ctype)s);
+            if (PyArray_STRIDES(%(x)s)[1] %% es || PyArray_STRIDES(%(x)s)[2] %% es
+                || !theano_gemm_layout(M, K, PyArray_STRIDES(%(x)s)[1] / es,
+                                       PyArray_STRIDES(%(x)s)[2] / es,
+                                       &trans_x, &ld_x))
+            {
+                xc = (PyArrayObject*)PyArray_NewCopy(%(x)s, NPY_CORDER);
+                if (NULL == xc)
+                    %(fail)s
+                theano_gemm_layout(M, K, K, 1, &trans_x, &ld_x);
+            }
+            if (PyArray_STRIDES(%(y)s)[1] %% es || PyArray_STRIDES(%(y)s)[2] %% es
+                || !theano_gemm_layout(K, N, PyArray_STRIDES(%(y)s)[1] / es,
+                                       PyArray_STRIDES(%(y)s)[2] / es,
+                                       &trans_y, &ld_y))
+            {
+                yc = (PyArrayObject*)PyArray_NewCopy(%(y)s, NPY_CORDER);
+                if (NULL == yc)
+                {
+                    if (xc != %(x)s)
+                        Py_DECREF(xc);
+                    %(fail)s
+                }
+                theano_gemm_layout(K, N, N, 1, &trans_y, &ld_y);
+            }
+
+            const char* x_data = (const char*)PyArray_DATA(xc);
+            const char* y_data = (const char*)PyArray_DATA(yc);
+            char* z_data = (char*)PyArray_DATA(%(z)s);
+            npy_intp x_step = x_batch == 1 ? 0 : PyArray_STRIDES(xc)[0];
+            npy_intp y_step = y_batch == 1 ? 0 : PyArray_STRIDES(yc)[0];
+            npy_intp z_step = PyArray_STRIDES(%(z)s)[0];
+            int m = N, n = M, k = K, ld_z = N;
+            %(ctype)s one = 1, zero = 0;
+            // Row-major z = x y is the column-major z^T = y^T x^T.
+            #pragma omp parallel for schedule(static) if (batch > 1 && M * N * K <= %(openmp_max_size)s)
+            for (npy_intp i = 0; i < batch; ++i)
+            {
+                %(gemm)s(&trans_y, &trans_x, &m, &n, &k, &one,
+                         (const %(ctype)s*)(y_data + i * y_step), &ld_y,
+                         (const %(ctype)s*)(x_data + i * x_step), &ld_x,
+                         &zero, (%(ctype)s*)(z_data + i * z_step), &ld_z);
+            }
+            if (xc != %(x)s)
+                Py_DECREF(xc);
+            if (yc != %(y)s)
+                Py_DECREF(yc);
+        }
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (2, self.openmp, blas_header_version())
+
+batched_gemm = BatchedGemm()
+
+
+class GemmEpilogue(Op):
+    """
+    Compute scalar_op(a * dot(x, y), *extras) with one pass over the output.
+
+    x and y are matrices and a is a scalar. `scalar_op` is applied
+    elementwise to the product, which is its first input, and to the
+    extra inputs. These are matrices that may be broadcastable, like the
+    bias row of a dense layer. The op fuses the bias and the activation
+    of a dense layer, or in the backward pass the product with the
+    derivative of the activation, into the BLAS call.
+
+    The C code computes the output by blocks of rows. It calls gemm on a
+    block, then applies `scalar_op` to it while it is still in the cache.
+
+    """
+
+    __props__ = ('scalar_op',)
+
+    # The size in bytes of the blocks of output rows.
+    block_nbytes = 1 << 20
+    # The minimum number of rows of a block, so that gemm stays efficient.
+    block_min_rows = 32
+
+    def __init__(self, scalar_op):
+        self.scalar_op = scalar_op
+
+    def __str__(self):
+        return '%s{%s}' % (self.__class__.__name__, self.scalar_op)
+
+    def make_node(self, x, y, a, *extras):
+        x = T.as_tensor_variable(x)
+        y = T.as_tensor_variable(y)
+        a = T.as_tensor_variable(a)
+        extras = [T.as_tensor_variable(e) for e in extras]
+        if x.type.ndim != 2:
+            raise TypeError(Gemm.E_rank, x)
+        if y.type.ndim != 2:
+            raise TypeError(Gemm.E_rank, y)
+        if a.type.ndim != 0:
+            raise TypeError(Gemm.E_scalar, a)
+        for e in extras:
+            if e.type.ndim != 2:
+                raise TypeError('GemmEpilogue needs matrix extra inputs', e)
+        dtype = x.type.dtype
+        if dtype not in ('float32', 'float64') or y.type.dtype != dtype:
+            raise TypeError('GemmEpilogue requires matching float dtypes',
+                            (x.type.dtype, y.type.dtype))
+        if self.scalar_op.nin not in (-1, len(extras) + 1):
+            raise TypeError('Wrong number of inputs for %s.make_node '
+                            '(got %i extra inputs, expected %i)' %
+                            (self, len(extras), self.scalar_op.nin - 1))
+        shadow = self.scalar_op.make_node(
+            *[theano.scalar.get_scalar_type(dtype=i.type.dtype)()
+              for i in [x] + extras])
+        if (shadow.nout != 1 or
+                shadow.outputs[0].type.dtype != dtype):
+            raise TypeError('GemmEpilogue needs a scalar op with one output'
+                            ' of dtype %s' % dtype, self.scalar_op)
+        bz = (x.type.broadcastable[0], y.type.broadcastable[1])
+        for e in extras:
+            for bd, be in zip(bz, e.type.broadcastable):
+                if bd and not be:
+                    raise TypeError('GemmEpilogue can not broadcast the'
+                                    ' product to the extra inputs', e)
+        return Apply(self, [x, y, a] + extras, [T.tensor(dtype, bz)])
+
+    def _scalar_node(self, node):
+        return Apply(self.scalar_op,
+                     [theano.scalar.get_scalar_type(dtype=i.type.dtype)()
+                      for i in node.outputs + node.inputs[3:]],
+                     [theano.scalar.get_scalar_type(dtype=o.type.dtype)()
+                      for o in node.outputs])
+
+    def perform(self, node, inp, out):
+        x, y, a = inp[:3]
+        extras = inp[3:]
+        z, = out
+        try:
+            rval = a * numpy.dot(x, y)
+        except ValueError as e:
+            e.args = e.args + (x.shape, y.shape)
+            raise
+        for e, var in zip(extras, node.inputs[3:]):
+            for d in xrange(2):
+                if (not var.type.broadcastable[d] and
+                        e.shape[d] != rval.shape[d]):
+                    raise ValueError('GemmEpilogue: shape mismatch, the'
+                                     ' product has shape %s and an extra'
+                                     ' input %s' % (rval.shape, e.shape))
+        ufunc = numpy.frompyfunc(self.scalar_op.impl, len(extras) + 1, 1)
+        z[0] = numpy.asarray(ufunc(rval, *extras),
+                             dtype=node.outputs[0].type.dtype)
+
+    def infer_shape(self, node, shapes):
+        return [(shapes[0][0], shapes[1][1])]
+
+    def cost(self, node, input_shapes, output_shapes):
+        xshp, yshp = input_shapes[:2]
+        flops = (2 * xshp[0] * xshp[1] * yshp[1] +
+                 xshp[0] * yshp[1] * scalar_op_flops(self.scalar_op))
+        return (flops,
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
+    def c_support_code(self):
+        try:
+            scalar_support_code = self.scalar_op.c_support_code()
+        except utils.MethodNotDefined:
+            scalar_support_code = ''
+        return blas_header_text() + gemm_layout_code + scalar_support_code
+
+    def c_support_code_apply(self, node, name):
+        try:
+            return self.scalar_op.c_support_code_apply(
+                self._scalar_node(node), name + '_scalar_')
+        except utils.MethodNotDefined:
+            return ''
+
+    def c_headers(self):
+        return ['<limits.h>'] + self.scalar_op.c_headers()
+
+    def c_libraries(self):
+        return ldflags()
+
+    def c_compile_args(self):
+        return ldflags(libs=False, flags=True)
+
+    def c_lib_dirs(self):
+        return ldflags(libs=False, libs_dir=True)
+
+    def c_header_dirs(self):
+        return ldflags(libs=False, include_dir=True)
+
+    def c_code(self, node, name, inp, out, sub):
+        x, y, a = inp[:3]
+        extras = inp[3:]
+        z, = out
+        fail = sub['fail']
+        dtype = node.outputs[0].type.dtype
+        if not self.c_libraries():
+            raise utils.MethodNotDefined('%s.c_code'
+                                         % self.__class__.__name__)
+        ctype, gemm = {'float32': ('float', 'sgemm_'),
+                       'float64': ('double', 'dgemm_')}[dtype]
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        block_nbytes = self.block_nbytes
+        block_min_rows = self.block_min_rows
+        task_code = self.scalar_op.c_code(
+            self._scalar_node(node), name + '_scalar_',
+            ['%s_i' % z] + ['%s_i' % e for e in extras], ['%s_o' % z], sub)
+
+        # The extra inputs are read through their row pointer and their
+        # stride between columns, which is 0 on a broadcastable dimension.
+        check_extras = []
+        setup_extras = []
+        row_extras = []
+        contiguous = ['1']
+        for k, (e, var) in enumerate(zip(extras, node.inputs[3:])):
+            b0, b1 = var.type.broadcastable
+            for d, dim in enumerate(('M', 'N')):
+                if not var.type.broadcastable[d]:
+                    check_extras.append("""
+        if (PyArray_DIMS(%(e)s)[%(d)s] != %(dim)s)
+        {
+            PyErr_Format(PyExc_ValueError,
+                         "GemmEpilogue: shape mismatch, the product has"
+                         " shape (%%lld, %%lld) and the extra input %(k)s"
+                         " has %%lld elements on dimension %(d)s",
+                         (long long)M, (long long)N,
+                         (long long)PyArray_DIMS(%(e)s)[%(d)s]);
+            %(fail)s
+        }
+                    """ % locals())
+            setup_extras.append("""
+            const char* %(e)s_data = PyArray_BYTES(%(e)s);
+            const npy_intp %(e)s_s0 = %(b0)s ? 0 : PyArray_STRIDES(%(e)s)[0];
+            const npy_intp %(e)s_s1 = %(b1)s ? 0 : PyArray_STRIDES(%(e)s)[1];
+            """ % dict(e=e, b0=int(b0), b1=int(b1)))
+            row_extras.append(
+                "const char* %(e)s_row = %(e)s_data + i * %(e)s_s0;" %
+                dict(e=e))
+            if not b1:
+                contiguous.append(
+                    "%(e)s_s1 == sizeof(dtype_%(e)s)" % dict(e=e))
+
+        def epilogue_loop(contiguous):
+            loads = []
+            for e, var in zip(extras, node.inputs[3:]):
+                if var.type.broadcastable[1]:
+                    index = '0'
+                elif contiguous:
+                    index = 'j'
+                else:
+                    loads.append(
+                        "dtype_%(e)s %(e)s_i = *(const dtype_%(e)s*)"
+                        "(%(e)s_row + j * %(e)s_s1);" % dict(e=e))
+                    continue
+                loads.append(
+                    "dtype_%(e)s %(e)s_i = ((const dtype_%(e)s*)%(e)s_row)"
+                    "[%(index)s];" % dict(e=e, index=index))
+            return """
+                for (npy_intp i = r0; i < r1; ++i)
+                {
+                    %(ctype)s* z_row = (%(ctype)s*)z_data + i * N;
+                    %(row_extras)s
+                    for (npy_intp j = 0; j < N; ++j)
+                    {
+                        %(ctype)s %(z)s_i = z_row[j];
+                        %(loads)s
+                        %(ctype)s %(z)s_o;
+                        {
+                        %(task_code)s
+                        }
+                        z_row[j] = %(z)s_o;
+                    }
+                }
+            """ % dict(ctype=ctype, z=z, task_code=task_code,
+                       row_extras='\n'.join(row_extras),
+                       loads='\n'.join(loads))
+
+        check_extras = '\n'.join(check_extras)
+        setup_extras = '\n'.join(setup_extras)
+        contiguous = ' && '.join(contiguous)
+        contiguous_loop = epilogue_loop(True)
+        strided_loop = epilogue_loop(False)
+        return """
+        {
+        npy_intp M = PyArray_DIMS(%(x)s)[0];
+        npy_intp K = PyArray_DIMS(%(x)s)[1];
+        npy_intp N = PyArray_DIMS(%(y)s)[1];
+        if (PyArray_DIMS(%(y)s)[0] != K)
+        {
+            PyErr_Format(PyExc_ValueError,
+                         "GemmEpilogue: shape mismatch, x has %%lld columns"
+                         " and y %%lld rows",
+                         (long long)K, (long long)PyArray_DIMS(%(y)s)[0]);
+            %(fail)s
+        }
+        %(check_extras)s
+        if (M > INT_MAX || N > INT_MAX || K > INT_MAX)
+        {
+            PyErr_SetString(PyExc_ValueError,
+                            "GemmEpilogue: the matrices are too large for"
+                            " BLAS");
+            %(fail)s
+        }
+
+        if (NULL == %(z)s
+            || !PyArray_IS_C_CONTIGUOUS(%(z)s)
+            || PyArray_DIMS(%(z)s)[0] != M
+            || PyArray_DIMS(%(z)s)[1] != N)
+        {
+            npy_intp dims[2] = {M, N};
+            Py_XDECREF(%(z)s);
+            %(z)s = (PyArrayObject*)PyArray_EMPTY(2, dims, %(typenum)s, 0);
+            if (NULL == %(z)s)
+            {
+                PyErr_SetString(PyExc_MemoryError,
+                                "failed to alloc GemmEpilogue output");
+                %(fail)s
+            }
+        }
+
+        if (M > 0 && N > 0)
+        {
+            // A copy for the inputs whose matrices BLAS can't read.
+            PyArrayObject* xc = %(x)s;
+            PyArrayObject* yc = %(y)s;
+            char trans_x = 'N', trans_y = 'N';
+            int ld_x = 1, ld_y = 1;
+            const npy_intp es = sizeof(%(ctype)s);
+            if (K > 0 && (PyArray_STRIDES(%(x)s)[0] %% es
+                || PyArray_STRIDES(%(x)s)[1] %% es
+                || !theano_gemm_layout(M, K, PyArray_STRIDES(%(x)s)[0] / es,
+                                       PyArray_STRIDES(%(x)s)[1] / es,
+                                       &trans_x, &ld_x)))
+            {
+                xc = (PyArrayObject*)PyArray_NewCopy(%(x)s, NPY_CORDER);
+                if (NULL == xc)
+                    %(fail)s
+                theano_gemm_layout(M, K, K, 1, &trans_x, &ld_x);
+            }
+            if (K > 0 && (PyArray_STRIDES(%(y)s)[0] %% es
+                || PyArray_STRIDES(%(y)s)[1] %% es
+                || !theano_gemm_layout(K, N, PyArray_STRIDES(%(y)s)[0] / es,
+                                       PyArray_STRIDES(%(y)s)[1] / es,
+                                       &trans_y, &ld_y)))
+            {
+                yc = (PyArrayObject*)PyArray_NewCopy(%(y)s, NPY_CORDER);
+                if (NULL == yc)
+                {
+                    if (xc != %(x)s)
+                        Py_DECREF(xc);
+                    %(fail)s
+                }
+                theano_gemm_layout(K, N, N, 1, &trans_y, &ld_y);
+            }
+
+            const char* x_data = (const char*)PyArray_DATA(xc);
+            const char* y_data = (const char*)PyArray_DATA(yc);
+            const npy_intp x_s0 = PyArray_STRIDES(xc)[0];
+            char* z_data = (char*)PyArray_DATA(%(z)s);
+            %(ctype)s alpha = ((dtype_%(a)s*)PyArray_DATA(%(a)s))[0];
+            %(ctype)s zero = 0;
+            int m = N, k = K, ld_z = N;
+            %(setup_extras)s
+            const int contiguous = %(contiguous)s;
+
+            npy_intp block = %(block_nbytes)s / (N * es);
+            if (block < %(block_min_rows)s)
+                block = %(block_min_rows)s;
+            for (npy_intp r0 = 0; r0 < M; r0 += block)
+            {
+                npy_intp r1 = r0 + block < M ? r0 + block : M;
+                int n = r1 - r0;
+                %(ctype)s* z_block = (%(ctype)s*)z_data + r0 * N;
+                if (K == 0)
+                {
+                    memset(z_block, 0, n * N * es);
+                }
+                else
+                {
+                    // Row-major z = a x y is the column-major
+                    // z^T = a y^T x^T.
+                    %(gemm)s(&trans_y, &trans_x, &m, &n, &k, &alpha,
+                             (const %(ctype)s*)y_data, &ld_y,
+                             (const %(ctype)s*)(x_data + r0 * x_s0), &ld_x,
+                             &zero, z_block, &ld_z);
+                }
+                if (contiguous)
+                {
+                    %(contiguous_loop)s
+                }
+                else
+                {
+                    %(strided_loop)s
+                }
+            }
+            if (xc != %(x)s)
+                Py_DECREF(xc);
+            if (yc != %(y)s)
+                Py_DECREF(yc);
+        }
+        }
+        """ % locals()
+
+    def c_code_cache_version_apply(self, node):
+        version = [1, blas_header_version()]
+        scalar_node = self._scalar_node(node)
+        version.append(self.scalar_op.c_code_cache_version_apply(scalar_node))
+        for i in scalar_node.inputs + scalar_node.outputs:
+            version.append(i.type.c_code_cache_version())
+        if all(version):
+            return tuple(version)
+        else:
+            return ()
+
+
+@local_optimizer([T.Elemwise])
+def local_gemm_epilogue(node):
+    """
+    Elemwise(op)(Dot22(x, y), *extras) -> GemmEpilogue(op)(x, y, 1, *extras)
+
+    Also for Dot22Scalar, whose scalar becomes the a of GemmEpilogue. The
+    product must not be used elsewhere.
+
+    """
+    if (not isinstance(node.op, T.Elemwise) or node.op.inplace_pattern or
+            len(node.outputs) != 1 or not config.blas.ldflags):
+        return
+    out = node.outputs[0]
+    if out.type.ndim != 2 or out.type.dtype not in ('float32', 'float64'):
+        return
+    for i, z in enumerate(node.inputs):
+        if (z.owner and isinstance(z.owner.op, (Dot22, Dot22Scalar)) and
+                z.type.dtype == out.type.dtype and len(z.clients) == 1 and
+                z.type.broadcastable == out.type.broadcastable):
+            break
+    else:
+        return
+    x, y = z.owner.inputs[:2]
+    if isinstance(z.owner.op, Dot22Scalar):
+        a = z.owner.inputs[2]
+    else:
+        a = T.constant(numpy.asarray(1, dtype=out.type.dtype))
+    extras = node.inputs[:i] + node.inputs[i + 1:]
+
+    scalar_op = node.op.scalar_op
+    if i != 0 or scalar_op.nin == -1:
+        # Put the product first, and give variadic ops like add a fixed
+        # number of inputs.
+        s_inputs = [theano.scalar.get_scalar_type(dtype=v.type.dtype)()
+                    for v in node.inputs]
+        s_out = scalar_op(*s_inputs)
+        scalar_op = theano.scalar.Composite(
+            [s_inputs[i]] + s_inputs[:i] + s_inputs[i + 1:], [s_out])
+    s_node = scalar_op.make_node(
+        *[theano.scalar.get_scalar_type(dtype=v.type.dtype)()
+          for v in [z] + extras])
+    try:
+        scalar_op.c_code(s_node, 'test_presence_of_c_code',
+                         ['x' for _ in node.inputs], ['z'], {'fail': ''})
+    except (utils.MethodNotDefined, NotImplementedError):
+        return
+    return [GemmEpilogue(scalar_op)(x, y, a, *extras)]
+
+# After the elemwise fusion (49) has built the Composite of the epilogue,
+# and before the DestroyHandler (49.5).
+optdb.register('gemm_epilogue',
+               in2out(local_gemm_epilogue, name='gemm_epilogue'),
+               49.1, 'fast_run')
+
+
 # from opt import register_specialize, register_canonicalize
 # @register_specialize
 @local_optimizer([T.sub, T.add])
@@ -17,6 +17,7 @@ from theano.gradient import DisconnectedType
 from theano.gof.null_type import NullType
 from theano.gof.utils import hash_from_dict
 from theano.tensor import elemwise_cgen as cgen
+from theano.tensor import elemwise_openmp
 
 config = theano.config
 
@@ -49,6 +50,18 @@ def TensorConstant(*inputs, **kwargs):
                     "prevent using this here. import tensor before elemwise")
 
 
+def scalar_op_flops(scalar_op):
+    """
+    Return the number of scalar operations done by `scalar_op` per element.
+
+    A Composite counts each node of its inner graph.
+
+    """
+    if isinstance(scalar_op, scalar.Composite):
+        return max(len(scalar_op.fgraph.apply_nodes), 1)
+    return 1
+
+
 ##################
 #   DimShuffle   #
 ##################
@@ -934,6 +947,14 @@ class Elemwise(OpenMPOp):
             rval.append(tuple(oshp))
         return rval
 
+    def cost(self, node, input_shapes, output_shapes):
+        size = 1
+        for s in output_shapes[0]:
+            size *= int(s)
+        return (size * scalar_op_flops(self.scalar_op),
+                gof.shapes_nbytes(node.inputs, input_shapes),
+                gof.shapes_nbytes(node.outputs, output_shapes))
+
     def _c_all(self, node, nodename, inames, onames, sub):
         _inames = inames
         _onames = onames
@@ -1072,6 +1093,11 @@ class Elemwise(OpenMPOp):
 
         loop_orders = orders + [list(range(nnested))] * len(real_onames)
         dtypes = (idtypes + list(real_odtypes))
+        # Only look up the OpenMP threshold when the loops use it.
+        if self.openmp:
+            openmp_minsize = self.openmp_minsize(node)
+        else:
+            openmp_minsize = config.openmp_elemwise_minsize
         if all([o.ndim <= 1 for o in node.outputs] or
                # Use simpler code when output ndim == 0 or 1
                # or for broadcated scalar.
@@ -1113,14 +1139,16 @@ class Elemwise(OpenMPOp):
                     loop_orders=loop_orders,
                     dtypes=dtypes,
                     loop_tasks=all_code,
-                    sub=sub, openmp=self.openmp)
+                    sub=sub, openmp=self.openmp,
+                    openmp_minsize=openmp_minsize)
         else:
             loop = cgen.make_reordered_loop(
                 init_loop_orders=loop_orders,
                 olv_index=olv_index,
                 dtypes=dtypes,
                 inner_task=code,
-                sub=sub, openmp=self.openmp)
+                sub=sub, openmp=self.openmp,
+                openmp_minsize=openmp_minsize)
 
         # If all inputs and outputs are contiguous
         # and the scalar op define optimized code for that case
@@ -1149,25 +1177,40 @@ class Elemwise(OpenMPOp):
                     npy_intp n = PyArray_SIZE(%(z)s);
                     """ % locals()
                     index = ""
-                    for x, var in zip(inames + onames,
-                                      inputs + node.outputs):
+                    # There is one pointer per distinct array, so they
+                    # can be __restrict__. Inplace outputs use the pointer
+                    # of the input they overwrite.
+                    for x, var in zip(inames, inputs):
                         if not all(var.broadcastable):
                             contig += """
-            dtype_%(x)s * %(x)s_ptr = (dtype_%(x)s*) PyArray_DATA(%(x)s);
+            dtype_%(x)s * __restrict__ %(x)s_ptr = (dtype_%(x)s*) PyArray_DATA(%(x)s);
                             """ % locals()
                             index += """
             dtype_%(x)s& %(x)s_i = %(x)s_ptr[i];
                             """ % locals()
                         else:
+                            # Read broadcasted scalars once, out of the loop.
                             contig += """
-            dtype_%(x)s& %(x)s_i = ((dtype_%(x)s*) PyArray_DATA(%(x)s))[0];
+            const dtype_%(x)s %(x)s_i = ((dtype_%(x)s*) PyArray_DATA(%(x)s))[0];
                             """ % locals()
+                    for x, var in zip(onames, node.outputs):
+                        if var in dmap:
+                            # The _i name is already #defined to the input.
+                            continue
+                        contig += """
+            dtype_%(x)s * __restrict__ %(x)s_ptr = (dtype_%(x)s*) PyArray_DATA(%(x)s);
+                        """ % locals()
+                        index += """
+            dtype_%(x)s& %(x)s_i = %(x)s_ptr[i];
+                        """ % locals()
                     if self.openmp:
-                        contig += """#pragma omp parallel for if(n>=%d)""" % (config.openmp_elemwise_minsize)
+                        contig += """#pragma omp parallel for if(n>=%d)""" % (openmp_minsize)
                     contig += """
-                    for(int i=0; i<n; i++){
+                    for(npy_intp i=0; i<n; i++){
                         %(index)s
+                        %(defines)s
                         %(task_code)s;
+                        %(undefs)s
                     }
                     """ % locals()
             if contig is not None:
@@ -1187,6 +1230,16 @@ class Elemwise(OpenMPOp):
             """ % locals()
         return decl, checks, alloc, loop
 
+    def openmp_minsize(self, node):
+        """
+        Return the minimum output size for which `node` uses OpenMP.
+
+        See `theano.tensor.elemwise_openmp`.
+
+        """
+        return elemwise_openmp.openmp_minsize(self.scalar_op,
+                                              node.outputs[0].dtype)
+
     def c_code(self, node, nodename, inames, onames, sub):
         if (any(i.dtype == 'float16' for i in node.inputs) or
                 any(o.dtype == 'float16' for o in node.outputs) or
@@ -1209,7 +1262,7 @@ class Elemwise(OpenMPOp):
         return support_code
 
     def c_code_cache_version_apply(self, node):
-        version = [12]  # the version corresponding to the c code in this Op
+        version = [15]  # the version corresponding to the c code in this Op
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1222,6 +1275,8 @@ class Elemwise(OpenMPOp):
         for i in node.inputs + node.outputs:
             version.append(get_scalar_type(dtype=i.type.dtype).c_code_cache_version())
         version.append(('openmp', self.openmp))
+        if self.openmp:
+            version.append(('openmp_minsize', self.openmp_minsize(node)))
         if all(version):
             return tuple(version)
         else:
@@ -1249,7 +1304,12 @@ class Elemwise(OpenMPOp):
 #   CAReduce   #
 ################
 
-class CAReduce(Op):
+# Scalar ops that CAReduce reduces with the pairwise C functions.
+_pairwise_scalar_ops = (scalar.Add, scalar.Mul, scalar.Maximum,
+                        scalar.Minimum, scalar.AND, scalar.OR, scalar.XOR)
+
+
+class CAReduce(OpenMPOp):
     """
     CAReduce = Commutative Associative Reduce
     Reduces a scalar operation along the specified axis(es).
@@ -1289,9 +1349,14 @@ class CAReduce(Op):
     and associative (eg add, multiply, maximum, binary or/and/xor - but not
     subtract, divide or power).
 
+    When the reduced elements are contiguous in memory, the C code sums
+    them pairwise by blocks, which loses less precision than a plain loop
+    on floats, and uses OpenMP if `openmp` is True and the input has at
+    least `openmp_minsize` elements.
+
     """
 
-    def __init__(self, scalar_op, axis=None):
+    def __init__(self, scalar_op, axis=None, openmp=None):
         if scalar_op.nin not in [-1, 2] or scalar_op.nout != 1:
             raise NotImplementedError((
                 "CAReduce only supports binary functions with a single "
@@ -1313,6 +1378,7 @@ class CAReduce(Op):
             self.axis = tuple(self.axis)
 
         self.set_ufunc(scalar_op)
+        super(CAReduce, self).__init__(openmp=openmp)
 
     def set_ufunc(self, scalar_op):
         # This is probably a speed up of the implementation
@@ -1378,7 +1444,7 @@ class CAReduce(Op):
         return d
 
     def __setstate__(self, d):
-        self.__dict__.update(d)
+        super(CAReduce, self).__setstate__(d)
         self.set_ufunc(self.scalar_op)
 
     def __eq__(self, other):
@@ -1465,6 +1531,15 @@ class CAReduce(Op):
                 for (i, b) in enumerate(node.inputs[0].type.broadcastable)
                 if i not in axis],
 
+    def cost(self, node, input_shapes, output_shapes):
+        # One application of the scalar op for each input element.
+        size = 1
+        for s in input_shapes[0]:
+            size *= int(s)
+        return (size * scalar_op_flops(self.scalar_op),
+                gof.shapes_nbytes(node.inputs, input_shapes),
+                gof.shapes_nbytes(node.outputs, output_shapes))
+
     def _c_all(self, node, name, inames, onames, sub):
 
         input = node.inputs[0]
@@ -1548,24 +1623,12 @@ class CAReduce(Op):
                 [list(range(nnested)) + ['x'] * len(axis)],
                 [adtype], dict(sub, lv0=aname))
 
-        if hasattr(self.scalar_op, 'identity'):
-            identity = self.scalar_op.identity
-        elif self.scalar_op in [scalar.maximum, scalar.minimum]:
+        identity = self._c_identity(node)
+        if not hasattr(self.scalar_op, 'identity'):
             if self.scalar_op == scalar.maximum:
                 scal_name = 'maximum'
-                if input.type.dtype in ["float32", "float64"]:
-                    identity = "-__builtin_inf()"
-                elif input.type.dtype.startswith("uint"):
-                    # numpy1.5.1 don't define NPY_MIN_UINT*
-                    identity = "0"
-                else:
-                    identity = "NPY_MIN_" + str(input.type.dtype).upper()
-            if self.scalar_op == scalar.minimum:
+            else:
                 scal_name = 'minimum'
-                if input.type.dtype in ["float32", "float64"]:
-                    identity = "__builtin_inf()"
-                else:
-                    identity = "NPY_MAX_" + str(input.type.dtype).upper()
             fail = sub["fail"]
             pattern = [0] * len(node.inputs[0].broadcastable)
             axis = self.axis
@@ -1584,9 +1647,6 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
   }
 }
                    """ % locals()
-        else:
-            raise TypeError(
-                "The CAReduce.scalar_op must have an identity field.")
 
         task0_decl = ("%(dtype)s& %(name)s_i = *%(name)s_iter;\n"
                       "%(name)s_i = %(identity)s;"
@@ -1626,6 +1686,53 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
             [order, list(range(nnested)) + ['x'] * len(axis)],
             [idtype, adtype], all_code, sub)
 
+        layouts = self._c_contiguous_layouts(node)
+        if layouts:
+            # The reduced elements of each output element are contiguous:
+            # use the pairwise functions of c_support_code_apply.
+            contiguous = {
+                'C': "PyArray_IS_C_CONTIGUOUS(%s)",
+                'F': "PyArray_IS_F_CONTIGUOUS(%s)"}
+            cond = " || ".join(
+                "(%s && %s)" % (contiguous[l] % iname, contiguous[l] % aname)
+                for l in layouts)
+            fast = """
+            const %(idtype)s* careduce_in = (%(idtype)s*)PyArray_DATA(%(iname)s);
+            %(adtype)s* careduce_out = (%(adtype)s*)PyArray_DATA(%(aname)s);
+            npy_intp n_outer = PyArray_SIZE(%(aname)s);
+            npy_intp n_inner = n_outer ? PyArray_SIZE(%(iname)s) / n_outer : 0;
+            """ % locals()
+            if self.openmp:
+                minsize = self.openmp_minsize(node)
+                # Few long reductions: split each of them between threads.
+                fast += """
+            if (n_outer < 16 && n_inner >= %(minsize)s) {
+                for (npy_intp o = 0; o < n_outer; o++) {
+                    #pragma omp parallel
+                    #pragma omp single
+                    careduce_out[o] = %(name)s_preduce(
+                        careduce_in + o * n_inner, n_inner, 6);
+                }
+            }
+            else
+            """ % locals()
+                fast += """
+            #pragma omp parallel for schedule(static) if(n_outer * n_inner >= %(minsize)s)
+            """ % locals()
+            fast += """
+            for (npy_intp o = 0; o < n_outer; o++) {
+                careduce_out[o] = %(name)s_reduce(
+                    careduce_in + o * n_inner, n_inner);
+            }
+            """ % locals()
+            loop = """
+            if (%(cond)s) {
+                %(fast)s
+            }
+            else
+            %(loop)s
+            """ % locals()
+
         end = ""
         if adtype != odtype:
             end = """
@@ -1635,6 +1742,159 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
 
         return decl, checks, alloc, loop, end
 
+    def _c_identity(self, node):
+        """
+        Return the C expression of the identity of the scalar op.
+
+        """
+        dtype = node.inputs[0].type.dtype
+        if hasattr(self.scalar_op, 'identity'):
+            return self.scalar_op.identity
+        elif self.scalar_op == scalar.maximum:
+            if dtype in ["float32", "float64"]:
+                return "-__builtin_inf()"
+            elif dtype.startswith("uint"):
+                # numpy1.5.1 don't define NPY_MIN_UINT*
+                return "0"
+            else:
+                return "NPY_MIN_" + str(dtype).upper()
+        elif self.scalar_op == scalar.minimum:
+            if dtype in ["float32", "float64"]:
+                return "__builtin_inf()"
+            else:
+                return "NPY_MAX_" + str(dtype).upper()
+        raise TypeError(
+            "The CAReduce.scalar_op must have an identity field.")
+
+    def _c_contiguous_layouts(self, node):
+        """
+        Return the memory layouts ('C', 'F') of the input in which the
+        elements reduced together are contiguous.
+
+        The reduced axes must be the last ones for 'C' and the first ones
+        for 'F'. This is empty when the scalar op or the dtypes are not
+        supported by the pairwise C functions.
+
+        """
+        input = node.inputs[0]
+        if (not isinstance(self.scalar_op, _pairwise_scalar_ops) or
+                input.ndim == 0 or
+                'complex' in input.type.dtype or
+                'complex' in node.outputs[0].type.dtype or
+                getattr(self, 'acc_dtype', None) == 'float16'):
+            return []
+        axis = self.axis
+        if axis is None:
+            axis = list(range(input.ndim))
+        axis = sorted(axis)
+        layouts = []
+        if axis == list(range(input.ndim - len(axis), input.ndim)):
+            layouts.append('C')
+        if axis == list(range(len(axis))):
+            layouts.append('F')
+        return layouts
+
+    def _c_scalar_code(self, node, x, y, sub):
+        # C code that stores `x op y` in x.
+        return self.scalar_op.c_code(
+            Apply(self.scalar_op,
+                  [get_scalar_type(dtype=input.type.dtype).make_variable()
+                   for input in (node.inputs * 2)],
+                  [get_scalar_type(dtype=output.type.dtype).make_variable()
+                   for output in node.outputs]),
+            None, [x, y], [x], sub)
+
+    def openmp_minsize(self, node):
+        """
+        Return the minimum input size for which `node` uses OpenMP.
+
+        See `theano.tensor.elemwise_openmp`.
+
+        """
+        return elemwise_openmp.openmp_minsize(self.scalar_op,
+                                              node.inputs[0].dtype)
+
+    def c_support_code_apply(self, node, name):
+        if not self._c_contiguous_layouts(node):
+            return ""
+        idtype = node.inputs[0].type.dtype_specs()[1]
+        if getattr(self, 'acc_dtype', None) is not None:
+            adtype = TensorType(dtype=self.acc_dtype,
+                                broadcastable=()).dtype_specs()[1]
+        else:
+            adtype = node.outputs[0].type.dtype_specs()[1]
+        identity = self._c_identity(node)
+        sub = {}
+
+        # The compiler does not reorder float operations, so we use eight
+        # independent float accumulators in the blocks to let it vectorize
+        # the loop. It vectorizes the integer loop by itself.
+        if 'float' in adtype:
+            n_acc = 8
+        else:
+            n_acc = 1
+        init = "".join("%s r%d = %s;\n" % (adtype, k, identity)
+                       for k in range(n_acc))
+        unrolled = "".join(
+            "{ %s v = x[i + %d]; %s }\n" % (
+                adtype, k, self._c_scalar_code(node, "r%d" % k, "v", sub))
+            for k in range(n_acc))
+        tail = "{ %s v = x[i]; %s }" % (
+            adtype, self._c_scalar_code(node, "r0", "v", sub))
+        combine = ""
+        step = 1
+        while step < n_acc:
+            for k in range(0, n_acc, 2 * step):
+                combine += self._c_scalar_code(
+                    node, "r%d" % k, "r%d" % (k + step), sub) + "\n"
+            step *= 2
+        merge = self._c_scalar_code(node, "a", "b", sub)
+
+        code = """
+        // Reduce x[0:n] by blocks of 128 elements, summed pairwise.
+        static %(adtype)s %(name)s_reduce(const %(idtype)s* x, npy_intp n)
+        {
+            if (n <= 128) {
+                %(init)s
+                npy_intp i = 0;
+                for (; i + %(n_acc)s <= n; i += %(n_acc)s) {
+                    %(unrolled)s
+                }
+                for (; i < n; i++) {
+                    %(tail)s
+                }
+                %(combine)s
+                return r0;
+            }
+            npy_intp half = n / 2 - (n / 2) %% 8;
+            %(adtype)s a = %(name)s_reduce(x, half);
+            %(adtype)s b = %(name)s_reduce(x + half, n - half);
+            %(merge)s
+            return a;
+        }
+        """ % locals()
+        if self.openmp:
+            code += """
+        // Same result as %(name)s_reduce, with the first `depth` levels
+        // of the pairwise tree in OpenMP tasks.
+        static %(adtype)s %(name)s_preduce(const %(idtype)s* x, npy_intp n,
+                                          int depth)
+        {
+            if (depth == 0 || n <= 128) {
+                return %(name)s_reduce(x, n);
+            }
+            npy_intp half = n / 2 - (n / 2) %% 8;
+            %(adtype)s a, b;
+            #pragma omp task shared(a)
+            a = %(name)s_preduce(x, half, depth - 1);
+            b = %(name)s_preduce(x + half, n - half, depth - 1);
+            #pragma omp taskwait
+            %(merge)s
+            return a;
+        }
+        """ % locals()
+        return code
+
     def c_code(self, node, name, inames, onames, sub):
         code = "\n".join(self._c_all(node, name, inames, onames, sub))
         return code
@@ -1644,7 +1904,7 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
         return ['<vector>', '<algorithm>']
 
     def c_code_cache_version_apply(self, node):
-        version = (6,)  # the version corresponding to the c code in this Op
+        version = [7]  # the version corresponding to the c code in this Op
 
         # now we insert versions for the ops on which we depend...
         scalar_node = Apply(
@@ -1656,6 +1916,9 @@ for(int i=0;i<PyArray_NDIM(%(iname)s);i++){
         version.append(self.scalar_op.c_code_cache_version_apply(scalar_node))
         for i in node.inputs + node.outputs:
             version.append(get_scalar_type(dtype=i.type.dtype).c_code_cache_version())
+        version.append(('openmp', self.openmp))
+        if self.openmp:
+            version.append(('openmp_minsize', self.openmp_minsize(node)))
         if all(version):
             return tuple(version)
         else:
@@ -177,7 +177,8 @@ def make_alloc(loop_orders, dtype, sub, fortran='0'):
     """ % dict(locals(), **sub)
 
 
-def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None):
+def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None,
+              openmp_minsize=None):
     """
     Make a nested loop over several arrays and associate specific code
     to each level of nesting.
@@ -200,8 +201,14 @@ def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None):
     sub : dictionary
         Maps 'lv#' to a suitable variable name.
         The 'lvi' variable corresponds to the ith element of loop_orders.
+    openmp_minsize : int
+        Minimum size of a loop to run it in parallel. Defaults to
+        config.openmp_elemwise_minsize.
 
     """
+    if openmp_minsize is None:
+        openmp_minsize = theano.config.openmp_elemwise_minsize
+
     def loop_over(preloop, code, indices, i):
         iterv = 'ITER_%i' % i
         update = ""
@@ -213,8 +220,8 @@ def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None):
             if index != 'x':
                 suitable_n = "%(var)s_n%(index)s" % locals()
         if openmp:
-            openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
-            forloop = """#pragma omp parallel for if( %(suitable_n)s >=%(openmp_elemwise_minsize)s)\n""" % locals()
+            forloop = """#pragma omp parallel for if( %s >=%s)\n""" % (
+                suitable_n, openmp_minsize)
         else:
             forloop = ""
         forloop += """for (int %(iterv)s = 0; %(iterv)s<%(suitable_n)s; %(iterv)s++)""" % locals()
@@ -246,8 +253,17 @@ def make_loop(loop_orders, dtypes, loop_tasks, sub, openmp=None):
     return "{%s}" % s
 
 
+# Size of the blocks, in elements along each of the two inner-most loops,
+# over which make_reordered_loop iterates for mixed strides.
+TILE_SIZE = 32
+# Tiles are only used for rows longer than this. Shorter rows of a strided
+# variable touch few enough cache lines to stay in the cache between two
+# rows of the output, and tiles would only add loop overhead.
+TILE_MIN_ROW = 4096
+
+
 def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
-                        openmp=None):
+                        openmp=None, openmp_minsize=None):
     """A bit like make_loop, but when only the inner-most loop executes code.
 
     All the loops will be reordered so that the loops over the output tensor
@@ -257,7 +273,13 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
 
     The output tensor's index among the loop variables is indicated by olv_index.
 
+    If another variable is not accessed contiguously in that order (e.g. a
+    transposed input), the two inner-most loops go over tiles of
+    TILE_SIZE x TILE_SIZE elements instead.
+
     """
+    if openmp_minsize is None:
+        openmp_minsize = theano.config.openmp_elemwise_minsize
 
     # Number of variables
     nvars = len(init_loop_orders)
@@ -395,28 +417,69 @@ def make_reordered_loop(init_loop_orders, olv_index, dtypes, inner_task, sub,
             pointer_update += "+%(var)s_stride_l%(i)i*%(iterv)s" % locals()
         pointer_update += ");\n"
 
-    loop = inner_task
-    for i in reversed(range(nnested)):
-        iterv = 'ITER_%i' % i
-        total = 'TOTAL_%i' % i
-        update = ''
-        forloop = ''
-        # The pointers are defined only in the most inner loop
-        if i == nnested - 1:
-            update = pointer_update
-        if i == 0:
-            if openmp:
-                openmp_elemwise_minsize = theano.config.openmp_elemwise_minsize
-                forloop += """#pragma omp parallel for if( %(total)s >=%(openmp_elemwise_minsize)s)\n""" % locals()
-        forloop += "for(int %(iterv)s = 0; %(iterv)s<%(total)s; %(iterv)s++)" % locals()
+    def make_loops(tiled):
+        # If tiled, the two inner-most loops go over blocks of
+        # TILE_SIZE x TILE_SIZE elements.
+        loop = inner_task
+        for i in reversed(range(nnested)):
+            iterv = 'ITER_%i' % i
+            total = 'TOTAL_%i' % i
+            update = ''
+            # The pointers are defined only in the most inner loop
+            if i == nnested - 1:
+                update = pointer_update
+            if tiled and i >= nnested - 2:
+                forloop = ("for(int %(iterv)s = TILE_%(i)i; "
+                           "%(iterv)s<TILE_END_%(i)i; %(iterv)s++)" % locals())
+            else:
+                forloop = "for(int %(iterv)s = 0; %(iterv)s<%(total)s; %(iterv)s++)" % locals()
+            loop = """
+            %(forloop)s
+            { // begin loop %(i)i
+                %(update)s
+                %(loop)s
+            } // end loop %(i)i
+            """ % locals()
 
+            if tiled and i == nnested - 2:
+                for j in (nnested - 1, nnested - 2):
+                    loop = """
+                    for(int TILE_%(j)i = 0; TILE_%(j)i<TOTAL_%(j)i; TILE_%(j)i += %(tile)i)
+                    { // begin tile loop %(j)i
+                        int TILE_END_%(j)i = std::min(TILE_%(j)i + %(tile)i, TOTAL_%(j)i);
+                        %(loop)s
+                    } // end tile loop %(j)i
+                    """ % dict(j=j, loop=loop, tile=TILE_SIZE)
+
+            if i == 0 and openmp:
+                loop = """#pragma omp parallel for if( %s >=%s)\n""" % (
+                    total, openmp_minsize) + loop
+        return loop
+
+    loop = make_loops(tiled=False)
+    if nnested >= 2:
+        # When the inner-most loop has a larger stride than the next one
+        # for one of the variables (e.g. a transposed input), going over
+        # the rows of the output reads that variable with cache-hostile
+        # strides. Going over tiles reads all the variables by blocks.
+        # A variable broadcasted along one of these loops (stride 0), like
+        # a row added to a matrix, is read from the cache in both orders,
+        # so it does not ask for tiles.
+        inner = nnested - 1
+        cond = " || ".join(
+            "(%(var)s_stride_l%(inner)i && %(var)s_stride_l%(outer)i && "
+            "abs(%(var)s_stride_l%(inner)i) > abs(%(var)s_stride_l%(outer)i))"
+            % dict(var=sub["lv%i" % i], inner=inner, outer=inner - 1)
+            for i in xrange(nvars))
         loop = """
-        %(forloop)s
-        { // begin loop %(i)i
-            %(update)s
+        if ((%(cond)s) && TOTAL_%(inner)i > %(min_row)i && TOTAL_%(outer)i > %(tile)i) {
+            %(tiled)s
+        } else {
             %(loop)s
-        } // end loop %(i)i
-        """ % locals()
+        }
+        """ % dict(cond=cond, inner=inner, outer=inner - 1, tile=TILE_SIZE,
+                   min_row=TILE_MIN_ROW,
+                   tiled=make_loops(tiled=True), loop=loop)
 
     return '\n'.join(['{',
                       order_loops,
@@ -0,0 +1,215 @@
+"""
+Per-machine OpenMP thresholds for Elemwise.
+
+`Elemwise` only runs its loop in parallel for outputs of at least
+`openmp_minsize` elements. `calibrate_all` measures this size on this
+machine, once per cost class of the scalar op and per dtype, and keeps it in
+the compiledir. When `config.openmp_elemwise_autotune` is True, the sizes
+kept in the compiledir are used. Otherwise, or for the sizes that were not
+measured, `config.openmp_elemwise_minsize` is used.
+
+The measure compiles and runs Theano functions, so it is never done while
+the C code of a node is generated.
+
+"""
+from __future__ import print_function
+import logging
+import os
+import time
+
+import numpy
+import six.moves.cPickle as pickle
+
+import theano
+from theano import config
+from theano import scalar
+from theano.gof import compilelock
+
+_logger = logging.getLogger('theano.tensor.elemwise_openmp')
+
+# Scalar ops that cost a few cycles per element. Threading pays off later
+# for them than for the ops that call libm (exp, tanh, ...).
+CHEAP_SCALAR_OPS = (
+    scalar.LogicalComparison, scalar.FixedLogicalComparison,
+    scalar.UnaryBitOp, scalar.BinaryBitOp, scalar.Switch,
+    scalar.Maximum, scalar.Minimum, scalar.Add, scalar.Mul, scalar.Sub,
+    scalar.TrueDiv, scalar.IntDiv, scalar.Mod, scalar.Clip, scalar.Second,
+    scalar.Identity, scalar.Cast, scalar.Abs, scalar.Sgn, scalar.Ceil,
+    scalar.Floor, scalar.Trunc, scalar.RoundHalfToEven,
+    scalar.RoundHalfAwayFromZero, scalar.Neg, scalar.Inv, scalar.Sqr,
+    scalar.Deg2Rad, scalar.Rad2Deg)
+
+# Other dtypes (complex) always use config.openmp_elemwise_minsize.
+CALIBRATED_DTYPES = ('int8', 'int16', 'int32', 'int64',
+                     'uint8', 'uint16', 'uint32', 'uint64',
+                     'float32', 'float64')
+
+# Sizes at which the serial and the parallel loops are compared.
+CALIBRATION_SIZES = [2 ** i for i in range(10, 23, 2)]
+
+# While calibrating, all the Elemwise get this threshold.
+_forced_minsize = None
+
+# (cost class, dtype) -> threshold, as loaded from the compiledir.
+_thresholds = None
+
+
+def scalar_op_cost_class(scalar_op):
+    """
+    Return 'cheap' or 'costly', the cost class of `scalar_op`.
+
+    A Composite is costly as soon as one of its nodes is costly.
+
+    """
+    if isinstance(scalar_op, scalar.Composite):
+        if all(scalar_op_cost_class(node.op) == 'cheap'
+               for node in scalar_op.fgraph.toposort()):
+            return 'cheap'
+        return 'costly'
+    if isinstance(scalar_op, CHEAP_SCALAR_OPS):
+        return 'cheap'
+    return 'costly'
+
+
+def thresholds_file():
+    return os.path.join(config.compiledir, 'elemwise_openmp_minsize.pkl')
+
+
+def _load_thresholds():
+    try:
+        with open(thresholds_file(), 'rb') as f:
+            return pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def _save_thresholds(thresholds):
+    # Other processes can calibrate other keys at the same time.
+    compilelock.get_lock()
+    try:
+        on_disk = _load_thresholds()
+        on_disk.update(thresholds)
+        tmp = thresholds_file() + '.tmp%d' % os.getpid()
+        with open(tmp, 'wb') as f:
+            pickle.dump(on_disk, f, protocol=2)
+        os.rename(tmp, thresholds_file())
+    finally:
+        compilelock.release_lock()
+    return on_disk
+
+
+def openmp_minsize(scalar_op, dtype):
+    """
+    Return the minimum output size for which an Elemwise uses OpenMP.
+
+    This only reads the thresholds measured by `calibrate_all`.
+
+    Parameters
+    ----------
+    scalar_op
+        The scalar op of the Elemwise.
+    dtype : str
+        The dtype of its outputs.
+
+    """
+    global _thresholds
+    if _forced_minsize is not None:
+        return _forced_minsize
+    if (not config.openmp_elemwise_autotune or
+            dtype not in CALIBRATED_DTYPES):
+        return config.openmp_elemwise_minsize
+    key = (scalar_op_cost_class(scalar_op), dtype)
+    if _thresholds is None:
+        _thresholds = _load_thresholds()
+    return _thresholds.get(key, config.openmp_elemwise_minsize)
+
+
+def _best_time(fn, value, n_runs=5):
+    best = float('inf')
+    for i in range(n_runs):
+        t0 = time.time()
+        fn(value)
+        best = min(best, time.time() - t0)
+    return best
+
+
+def calibrate(cost_class, dtype, sizes=None):
+    """
+    Measure the size from which the parallel loop is faster.
+
+    This compiles an Elemwise with and without OpenMP, `add` for the cheap
+    class and `tanh` for the costly one, and times them on vectors of
+    each size.
+
+    Returns
+    -------
+    int
+        The smallest size from which the parallel loop is faster at all the
+        sizes measured. Twice the largest size if it is never faster.
+
+    """
+    global _forced_minsize
+    from theano.tensor.elemwise import Elemwise
+
+    if sizes is None:
+        sizes = CALIBRATION_SIZES
+    x = theano.tensor.vector('x', dtype=dtype)
+    if cost_class == 'cheap':
+        scalar_op, inputs = scalar.add, [x, x]
+    else:
+        scalar_op, inputs = scalar.tanh, [x]
+    mode = theano.compile.Mode(linker='c', optimizer=None)
+
+    _forced_minsize = 0
+    try:
+        serial, parallel = [
+            theano.function([x], Elemwise(scalar_op, openmp=openmp)(*inputs),
+                            mode=mode)
+            for openmp in (False, True)]
+    finally:
+        _forced_minsize = None
+
+    minsize = sizes[-1] * 2
+    for n in reversed(sizes):
+        value = (numpy.random.rand(n) * 10).astype(dtype)
+        if _best_time(parallel, value) < _best_time(serial, value):
+            minsize = n
+        else:
+            break
+    return minsize
+
+
+def calibrate_all(dtypes=CALIBRATED_DTYPES, sizes=None, force=False):
+    """
+    Measure and keep in the compiledir the thresholds of `openmp_minsize`.
+
+    Parameters
+    ----------
+    dtypes
+        The dtypes to measure.
+    sizes
+        The sizes passed to `calibrate`.
+    force : bool
+        If True, also measure again the thresholds already kept.
+
+    Returns
+    -------
+    dict
+        (cost class, dtype) -> threshold, for all the thresholds kept.
+
+    """
+    global _thresholds
+    thresholds = _load_thresholds()
+    new = {}
+    for dtype in dtypes:
+        for cost_class in ('cheap', 'costly'):
+            key = (cost_class, dtype)
+            if key in thresholds and not force:
+                continue
+            new[key] = calibrate(cost_class, dtype, sizes=sizes)
+            _logger.info("OpenMP threshold for %s Elemwise of %s: %d",
+                         cost_class, dtype, new[key])
+    if new:
+        thresholds = _save_thresholds(new)
+    _thresholds = thresholds
+    return thresholds
@@ -5,12 +5,207 @@ from six.moves import xrange
 
 import theano
 from theano.tensor import basic
+from theano.tensor import elemwise_openmp
 from theano.tensor import nlinalg  # noqa
+from theano.tensor import opt
 from theano import gof, scalar
+from theano.compile import optdb
 from theano.gradient import DisconnectedType
 tensor = basic
 
 
+def _c_dtype(var):
+    """
+    Return the C type of the elements of `var`, for the C loops below.
+
+    Raise NotImplementedError, so that the op falls back to its perform,
+    for the dtypes that have no C arithmetic.
+
+    """
+    if var.dtype.startswith('complex') or var.dtype == 'float16':
+        raise NotImplementedError()
+    return var.type.dtype_specs()[1]
+
+
+def _c_element_strides(var, name, ndim):
+    """
+    Return C code declaring `name`, the strides of `var` in elements.
+
+    """
+    return """
+    npy_intp %(name)s[%(size)d];
+    for (int d = 0; d < %(ndim)d; ++d)
+        %(name)s[d] = PyArray_STRIDES(%(var)s)[d] / PyArray_ITEMSIZE(%(var)s);
+    """ % dict(name=name, var=var, ndim=ndim, size=max(ndim, 1))
+
+
+def _c_axis_loops(ndim, axis, dtype, body, minsize=None):
+    """
+    Return C code running `body` along `axis`, for all the other positions.
+
+    The positions are grouped in blocks of up to 256 consecutive indices of
+    the last axis (when it is not `axis`), so that `body` goes along `axis`
+    while reading contiguous memory from C-contiguous arrays. The blocks
+    are independent, and run in parallel with OpenMP when `minsize` is
+    given and the input has at least `minsize` elements.
+
+    The surrounding code declares the input and output data, `x_data` and
+    `z_data`, the input shape `x_dims`, and the strides `xs` and `zs` in
+    elements. The output has the shape of the input, except along `axis`.
+    In `body`, `xp` and `zp` point to the start of the block, `sxa` and
+    `sza` are the strides along `axis`, and the block is `j0 <= j < j1`
+    with the strides `sxj` and `szj`.
+
+    """
+    kept = [d for d in xrange(ndim) if d != axis]
+    if kept and kept[-1] > axis:
+        inner = kept.pop()
+        n_in = "x_dims[%d]" % inner
+        sxj = "xs[%d]" % inner
+        szj = "zs[%d]" % inner
+    else:
+        n_in, sxj, szj = "1", "0", "0"
+    n_outer = " * ".join(["x_dims[%d]" % d for d in kept] + ["1"])
+    unravel = "\n".join("""
+        xp += (o %% x_dims[%(d)d]) * xs[%(d)d];
+        zp += (o %% x_dims[%(d)d]) * zs[%(d)d];
+        o /= x_dims[%(d)d];
+        """ % dict(d=d) for d in reversed(kept))
+    omp = ""
+    if minsize is not None:
+        omp = ("#pragma omp parallel for schedule(static)"
+               " if(n_tasks > 1 && n_work >= %d)" % minsize)
+    return """
+    {
+        const npy_intp n_in = %(n_in)s;
+        const npy_intp sxj = %(sxj)s;
+        const npy_intp szj = %(szj)s;
+        const npy_intp sxa = xs[%(axis)d];
+        const npy_intp sza = zs[%(axis)d];
+        const npy_intp n_blocks = (n_in + 255) / 256;
+        const npy_intp n_tasks = %(n_outer)s * n_blocks;
+        const npy_intp n_work = n_tasks * x_dims[%(axis)d] * 256;
+        %(omp)s
+        for (npy_intp t = 0; t < n_tasks; ++t)
+        {
+            npy_intp o = t / n_blocks;
+            const npy_intp j0 = (t %% n_blocks) * 256;
+            const npy_intp j1 = j0 + 256 < n_in ? j0 + 256 : n_in;
+            const %(dtype)s* xp = x_data;
+            %(dtype)s* zp = z_data;
+            %(unravel)s
+            %(body)s
+        }
+    }
+    """ % locals()
+
+
+def _cum_c_code(op, node, inames, onames, sub, binop, scalar_op):
+    """
+    Return the C code of CumsumOp and CumprodOp.
+
+    """
+    x, = inames
+    z, = onames
+    fail = sub['fail']
+    dtype = _c_dtype(node.inputs[0])
+    typenum = node.outputs[0].type.dtype_specs()[2]
+    ndim = node.inputs[0].ndim
+    axis = op.axis
+    if axis is None and ndim == 1:
+        axis = 0
+
+    if axis is None:
+        # Go over the flattened input, in C order.
+        return """
+        {
+            const npy_intp n = PyArray_SIZE(%(x)s);
+            if (!(%(z)s && PyArray_DIMS(%(z)s)[0] == n))
+            {
+                Py_XDECREF(%(z)s);
+                %(z)s = (PyArrayObject*)PyArray_EMPTY(1, &n, %(typenum)s, 0);
+                if (!%(z)s)
+                    %(fail)s
+            }
+            PyArrayObject* xc = PyArray_GETCONTIGUOUS(%(x)s);
+            if (!xc)
+                %(fail)s
+            const %(dtype)s* xp = (const %(dtype)s*)PyArray_DATA(xc);
+            %(dtype)s* zp = (%(dtype)s*)PyArray_DATA(%(z)s);
+            const npy_intp sz = PyArray_STRIDES(%(z)s)[0] / sizeof(%(dtype)s);
+            if (n > 0)
+                zp[0] = xp[0];
+            for (npy_intp i = 1; i < n; ++i)
+                zp[i * sz] = zp[(i - 1) * sz] %(binop)s xp[i];
+            Py_DECREF(xc);
+        }
+        """ % locals()
+
+    axis %= ndim
+    if op.inplace:
+        alloc = """
+        Py_XDECREF(%(z)s);
+        %(z)s = %(x)s;
+        Py_INCREF(%(z)s);
+        """ % locals()
+    else:
+        alloc = """
+        if (!(%(z)s && PyArray_CompareLists(PyArray_DIMS(%(z)s),
+                                            PyArray_DIMS(%(x)s), %(ndim)s)))
+        {
+            Py_XDECREF(%(z)s);
+            %(z)s = (PyArrayObject*)PyArray_EMPTY(
+                %(ndim)s, PyArray_DIMS(%(x)s), %(typenum)s, 0);
+            if (!%(z)s)
+                %(fail)s
+        }
+        """ % locals()
+    body = """
+    if (x_dims[%(axis)d] > 0)
+    {
+        for (npy_intp j = j0; j < j1; ++j)
+            zp[j * szj] = xp[j * sxj];
+        for (npy_intp i = 1; i < x_dims[%(axis)d]; ++i)
+        {
+            const %(dtype)s* xi = xp + i * sxa;
+            %(dtype)s* zi = zp + i * sza;
+            for (npy_intp j = j0; j < j1; ++j)
+                zi[j * szj] = zi[j * szj - sza] %(binop)s xi[j * sxj];
+        }
+    }
+    """ % locals()
+    minsize = None
+    if op.openmp:
+        minsize = elemwise_openmp.openmp_minsize(scalar_op,
+                                                 node.inputs[0].dtype)
+    loops = _c_axis_loops(ndim, axis, dtype, body, minsize)
+    x_strides = _c_element_strides(x, 'xs', ndim)
+    z_strides = _c_element_strides(z, 'zs', ndim)
+    return """
+    {
+        %(alloc)s
+        const npy_intp* x_dims = PyArray_DIMS(%(x)s);
+        %(x_strides)s
+        %(z_strides)s
+        const %(dtype)s* x_data = (const %(dtype)s*)PyArray_DATA(%(x)s);
+        %(dtype)s* z_data = (%(dtype)s*)PyArray_DATA(%(z)s);
+        %(loops)s
+    }
+    """ % locals()
+
+
+def _openmp_cache_version(op, node, version, scalar_op):
+    """
+    Return the C code cache version of an op using `_c_axis_loops`.
+
+    """
+    version = [version, ('openmp', op.openmp)]
+    if op.openmp:
+        version.append(('openmp_minsize', elemwise_openmp.openmp_minsize(
+            scalar_op, node.inputs[0].dtype)))
+    return tuple(version)
+
+
 class CpuContiguous(theano.Op):
     """
     Check to see if the input is c-contiguous,
@@ -64,13 +259,23 @@ class CpuContiguous(theano.Op):
 cpu_contiguous = CpuContiguous()
 
 
-class CumsumOp(theano.Op):
+class CumsumOp(gof.OpenMPOp):
     # See function cumsum for docstring
 
-    __props__ = ("axis",)
+    __props__ = ("axis", "inplace")
 
-    def __init__(self, axis=None):
+    def __init__(self, axis=None, inplace=False, openmp=None):
+        super(CumsumOp, self).__init__(openmp=openmp)
         self.axis = axis
+        self.inplace = inplace
+        if self.inplace:
+            self.destroy_map = {0: [0]}
+
+    def __setstate__(self, d):
+        super(CumsumOp, self).__setstate__(d)
+        # Older pickles have no inplace.
+        if not hasattr(self, 'inplace'):
+            self.inplace = False
 
     def make_node(self, x):
         x = basic.as_tensor_variable(x)
@@ -86,7 +291,10 @@ class CumsumOp(theano.Op):
     def perform(self, node, inputs, output_storage):
         x = inputs[0]
         z = output_storage[0]
-        z[0] = np.cumsum(x, axis=self.axis)
+        if self.inplace:
+            z[0] = np.cumsum(x, axis=self.axis, out=x)
+        else:
+            z[0] = np.cumsum(x, axis=self.axis)
 
     def grad(self, inputs, output_gradients):
         [gi] = output_gradients
@@ -108,62 +316,15 @@ class CumsumOp(theano.Op):
         return shapes
 
     def c_code(self, node, name, inames, onames, sub):
-        x, = inames
-        z, = onames
-        axis = self.axis
-        fail = sub['fail']
+        return _cum_c_code(self, node, inames, onames, sub, '+',
+                           scalar.add)
 
-        if self.axis is None or (self.axis == 0 and node.inputs[0].ndim == 1):
-            code = """
-                npy_intp shape[1] = { PyArray_SIZE(%(x)s) };
-                if(!(%(z)s && PyArray_DIMS(%(z)s)[0] == shape[0]))
-                {
-                    Py_XDECREF(%(z)s);
-                    %(z)s = (PyArrayObject*) PyArray_SimpleNew(1, shape, PyArray_TYPE((PyArrayObject*) py_%(x)s));
-                }
-
-                if (!%(z)s)
-                    %(fail)s;
-                {
-                    PyObject * t = PyArray_CumSum(
-                        %(x)s, NPY_MAXDIMS,
-                        PyArray_TYPE((PyArrayObject*) py_%(x)s), %(z)s);
-                    if (!t){
-                       %(fail)s;
-                    }
-                    // Because PyArray_CumSum returns a newly created reference on t.
-                    Py_XDECREF(t);
-                }
-            """ % locals()
-        else:
-            code = """
-                if(!(%(z)s && PyArray_CompareLists(PyArray_DIMS(%(z)s), PyArray_DIMS(%(x)s), PyArray_NDIM(%(x)s))))
-                {
-                    Py_XDECREF(%(z)s);
-                    %(z)s = (PyArrayObject*) PyArray_SimpleNew(PyArray_NDIM(%(x)s), PyArray_DIMS(%(x)s), PyArray_TYPE((PyArrayObject*) py_%(x)s));
-                }
-
-                if (!%(z)s)
-                    %(fail)s;
-                {
-
-                    PyObject * t = PyArray_CumSum(
-                        %(x)s, %(axis)s,
-                        PyArray_TYPE((PyArrayObject*) py_%(x)s), %(z)s);
-                    if (!t){
-                       %(fail)s;
-                    }
-                    // Because PyArray_CumSum returns a newly created reference on t.
-                    Py_XDECREF(t);
-                }
-            """ % locals()
-
-        return code
-
-    def c_code_cache_version(self):
-        return (6,)
+    def c_code_cache_version_apply(self, node):
+        return _openmp_cache_version(self, node, 7, scalar.add)
 
     def __str__(self):
+        if self.inplace:
+            return "%s{%s, inplace}" % (self.__class__.__name__, self.axis)
         return "%s{%s}" % (self.__class__.__name__, self.axis)
 
 
@@ -186,13 +347,23 @@ def cumsum(x, axis=None):
     return CumsumOp(axis=axis)(x)
 
 
-class CumprodOp(theano.Op):
+class CumprodOp(gof.OpenMPOp):
     # See function cumprod for docstring
 
-    __props__ = ("axis",)
+    __props__ = ("axis", "inplace")
 
-    def __init__(self, axis=None):
+    def __init__(self, axis=None, inplace=False, openmp=None):
+        super(CumprodOp, self).__init__(openmp=openmp)
         self.axis = axis
+        self.inplace = inplace
+        if self.inplace:
+            self.destroy_map = {0: [0]}
+
+    def __setstate__(self, d):
+        super(CumprodOp, self).__setstate__(d)
+        # Older pickles have no inplace.
+        if not hasattr(self, 'inplace'):
+            self.inplace = False
 
     def make_node(self, x):
         x = basic.as_tensor_variable(x)
@@ -208,7 +379,10 @@ class CumprodOp(theano.Op):
     def perform(self, node, inputs, output_storage):
         x = inputs[0]
         z = output_storage[0]
-        z[0] = np.cumprod(x, axis=self.axis)
+        if self.inplace:
+            z[0] = np.cumprod(x, axis=self.axis, out=x)
+        else:
+            z[0] = np.cumprod(x, axis=self.axis)
 
     def grad(self, inputs, output_gradients):
         x, = inputs
@@ -233,61 +407,15 @@ class CumprodOp(theano.Op):
         return shapes
 
     def c_code(self, node, name, inames, onames, sub):
-        x, = inames
-        z, = onames
-        axis = self.axis
-        fail = sub['fail']
-
-        if self.axis is None or (self.axis == 0 and node.inputs[0].ndim == 1):
-            code = """
-                npy_intp shape[1] = { PyArray_SIZE(%(x)s) };
-                if(!(%(z)s && PyArray_DIMS(%(z)s)[0] == shape[0]))
-                {
-                    Py_XDECREF(%(z)s);
-                    %(z)s = (PyArrayObject*) PyArray_SimpleNew(1, shape, PyArray_TYPE((PyArrayObject*) py_%(x)s));
-                }
-
-                if (!%(z)s)
-                    %(fail)s;
-                {
-                    PyObject * t = PyArray_CumProd(
-                        %(x)s, NPY_MAXDIMS,
-                        PyArray_TYPE((PyArrayObject*) py_%(x)s), %(z)s);
-                    if (!t){
-                       %(fail)s;
-                    }
-                    // Because PyArray_CumSum returns a newly created reference on t.
-                    Py_XDECREF(t);
-                }
-            """ % locals()
-        else:
-            code = """
-                if(!(%(z)s && PyArray_CompareLists(PyArray_DIMS(%(z)s), PyArray_DIMS(%(x)s), PyArray_NDIM(%(x)s)) ))
-                {
-                    Py_XDECREF(%(z)s);
-                    %(z)s = (PyArrayObject*) PyArray_SimpleNew(PyArray_NDIM(%(x)s), PyArray_DIMS(%(x)s), PyArray_TYPE((PyArrayObject*) py_%(x)s));
-                }
-
-                if (!%(z)s)
-                    %(fail)s;
-                {
-                    PyObject * t = PyArray_CumProd(
-                        %(x)s, %(axis)s,
-                        PyArray_TYPE((PyArrayObject*) py_%(x)s), %(z)s);
-                    if (!t){
-                       %(fail)s;
-                    }
-                    // Because PyArray_CumSum returns a newly created reference on t.
-                    Py_XDECREF(t);
-                }
-            """ % locals()
-
-        return code
+        return _cum_c_code(self, node, inames, onames, sub, '*',
+                           scalar.mul)
 
-    def c_code_cache_version(self):
-        return (4,)
+    def c_code_cache_version_apply(self, node):
+        return _openmp_cache_version(self, node, 5, scalar.mul)
 
     def __str__(self):
+        if self.inplace:
+            return "%s{%s, inplace}" % (self.__class__.__name__, self.axis)
         return "%s{%s}" % (self.__class__.__name__, self.axis)
 
 
@@ -311,12 +439,34 @@ def cumprod(x, axis=None):
     return CumprodOp(axis=axis)(x)
 
 
-class DiffOp(theano.Op):
+@gof.local_optimizer([CumsumOp, CumprodOp], inplace=True)
+def local_inplace_cumop(node):
+    """
+    Compute cumsum and cumprod in place, when they keep the input shape.
+
+    """
+    op = node.op
+    if (type(op) in (CumsumOp, CumprodOp) and not op.inplace and
+            (op.axis is not None or node.inputs[0].ndim == 1)):
+        new_op = type(op)(axis=op.axis, inplace=True, openmp=op.openmp)
+        return [new_op(*node.inputs)]
+    return False
+optdb.register('local_inplace_cumop',
+               opt.in2out(local_inplace_cumop, ignore_newtrees=True),
+               60, 'fast_run', 'inplace')
+opt.inplace_assignment_optimizer.add_local_optimizer(local_inplace_cumop)
+
+
+class DiffOp(gof.OpenMPOp):
     # See function diff for docstring
 
     __props__ = ("n", "axis")
 
-    def __init__(self, n=1, axis=-1):
+    # The C code unrolls the n differences for each output element.
+    c_max_n = 16
+
+    def __init__(self, n=1, axis=-1, openmp=None):
+        super(DiffOp, self).__init__(openmp=openmp)
         self.n = n
         self.axis = axis
         # numpy return a view in that case.
@@ -357,6 +507,94 @@ class DiffOp(theano.Op):
         out_shape[self.axis] = out_shape[self.axis] - self.n
         return [out_shape]
 
+    def c_code(self, node, name, inames, onames, sub):
+        x, = inames
+        z, = onames
+        fail = sub['fail']
+        n = self.n
+        ndim = node.inputs[0].ndim
+        if (not -ndim <= self.axis < ndim) or n > self.c_max_n:
+            raise NotImplementedError()
+        dtype = _c_dtype(node.inputs[0])
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        if n == 0:
+            return """
+            Py_XDECREF(%(z)s);
+            %(z)s = %(x)s;
+            Py_INCREF(%(z)s);
+            """ % locals()
+        axis = self.axis % ndim
+        if n == 1:
+            body = """
+            for (npy_intp i = 0; i < z_dims[%(axis)d]; ++i)
+            {
+                const %(dtype)s* xi = xp + i * sxa;
+                %(dtype)s* zi = zp + i * sza;
+                if (sxj == 1 && szj == 1)
+                {
+                    for (npy_intp j = j0; j < j1; ++j)
+                        zi[j] = xi[j + sxa] - xi[j];
+                }
+                else
+                {
+                    for (npy_intp j = j0; j < j1; ++j)
+                        zi[j * szj] = xi[j * sxj + sxa] - xi[j * sxj];
+                }
+            }
+            """ % locals()
+        else:
+            # As numpy, difference the n + 1 inputs n times, so that the
+            # results are the same for floats.
+            body = """
+            for (npy_intp i = 0; i < z_dims[%(axis)d]; ++i)
+            {
+                for (npy_intp j = j0; j < j1; ++j)
+                {
+                    %(dtype)s t[%(n)d + 1];
+                    for (int k = 0; k <= %(n)d; ++k)
+                        t[k] = xp[(i + k) * sxa + j * sxj];
+                    for (int m = %(n)d; m > 0; --m)
+                        for (int k = 0; k < m; ++k)
+                            t[k] = t[k + 1] - t[k];
+                    zp[i * sza + j * szj] = t[0];
+                }
+            }
+            """ % locals()
+        minsize = None
+        if self.openmp:
+            minsize = elemwise_openmp.openmp_minsize(scalar.sub,
+                                                     node.inputs[0].dtype)
+        loops = _c_axis_loops(ndim, axis, dtype, body, minsize)
+        z_strides = _c_element_strides(z, 'zs', ndim)
+        x_strides = _c_element_strides(x, 'xs', ndim)
+        return """
+        {
+            const npy_intp* x_dims = PyArray_DIMS(%(x)s);
+            npy_intp z_dims[%(ndim)s];
+            for (int d = 0; d < %(ndim)s; ++d)
+                z_dims[d] = x_dims[d];
+            z_dims[%(axis)s] = x_dims[%(axis)s] > %(n)s ?
+                               x_dims[%(axis)s] - %(n)s : 0;
+            if (!(%(z)s && PyArray_CompareLists(PyArray_DIMS(%(z)s), z_dims,
+                                                %(ndim)s)))
+            {
+                Py_XDECREF(%(z)s);
+                %(z)s = (PyArrayObject*)PyArray_EMPTY(
+                    %(ndim)s, z_dims, %(typenum)s, 0);
+                if (!%(z)s)
+                    %(fail)s
+            }
+            %(x_strides)s
+            %(z_strides)s
+            const %(dtype)s* x_data = (const %(dtype)s*)PyArray_DATA(%(x)s);
+            %(dtype)s* z_data = (%(dtype)s*)PyArray_DATA(%(z)s);
+            %(loops)s
+        }
+        """ % locals()
+
+    def c_code_cache_version_apply(self, node):
+        return _openmp_cache_version(self, node, 1, scalar.sub)
+
 
 def diff(x, n=1, axis=-1):
     """Calculate the n-th order discrete difference along given axis.
@@ -478,6 +716,75 @@ class BinCountOp(theano.Op):
             m = basic.maximum(m, self.minlength)
         return [[m]]
 
+    def c_code(self, node, name, inames, onames, sub):
+        x, weights = inames
+        z, = onames
+        fail = sub['fail']
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        dtype_z = node.outputs[0].type.dtype_specs()[1]
+        minlength = self.minlength or 0
+        if isinstance(node.inputs[1].type, gof.Generic):
+            check_weights = ""
+            add = "1"
+        else:
+            if node.inputs[1].dtype.startswith('complex'):
+                raise NotImplementedError()
+            check_weights = """
+            if (PyArray_DIMS(%(weights)s)[0] != n)
+            {
+                PyErr_SetString(PyExc_TypeError,
+                                "All inputs must have the same shape.");
+                %(fail)s
+            }
+            const char* w_data = PyArray_BYTES(%(weights)s);
+            const npy_intp sw = PyArray_STRIDES(%(weights)s)[0];
+            """ % locals()
+            add = "*(const dtype_%(weights)s*)(w_data + i * sw)" % locals()
+        # The bins are dense: one pass for their number, and one to count.
+        return """
+        {
+            const npy_intp n = PyArray_DIMS(%(x)s)[0];
+            %(check_weights)s
+            const char* x_data = PyArray_BYTES(%(x)s);
+            const npy_intp sx = PyArray_STRIDES(%(x)s)[0];
+            npy_intp n_bins = %(minlength)s;
+            for (npy_intp i = 0; i < n; ++i)
+            {
+                const dtype_%(x)s v = *(const dtype_%(x)s*)(x_data + i * sx);
+                if (v < 0)
+                {
+                    PyErr_SetString(PyExc_ValueError,
+                        "bincount: the input must have no negative elements");
+                    %(fail)s
+                }
+                if ((npy_intp)v >= n_bins)
+                    n_bins = (npy_intp)v + 1;
+            }
+            if (%(z)s && PyArray_DIMS(%(z)s)[0] == n_bins &&
+                PyArray_IS_C_CONTIGUOUS(%(z)s))
+            {
+                memset(PyArray_DATA(%(z)s), 0, n_bins * sizeof(%(dtype_z)s));
+            }
+            else
+            {
+                Py_XDECREF(%(z)s);
+                %(z)s = (PyArrayObject*)PyArray_ZEROS(1, &n_bins,
+                                                      %(typenum)s, 0);
+                if (!%(z)s)
+                    %(fail)s
+            }
+            %(dtype_z)s* z_data = (%(dtype_z)s*)PyArray_DATA(%(z)s);
+            for (npy_intp i = 0; i < n; ++i)
+            {
+                const dtype_%(x)s v = *(const dtype_%(x)s*)(x_data + i * sx);
+                z_data[(npy_intp)v] += %(add)s;
+            }
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
+
 
 def bincount(x, weights=None, minlength=None, assert_nonneg=False):
     """Count number of occurrences of each value in array of ints.
@@ -701,6 +1008,121 @@ class RepeatOp(theano.Op):
                 out_shape[self.axis] = theano.tensor.sum(repeats, dtype=dtype)
         return [out_shape]
 
+    def c_code(self, node, name, inames, onames, sub):
+        x, repeats = inames
+        z, = onames
+        fail = sub['fail']
+        ndim = node.inputs[0].ndim
+        if self.axis is not None and not -ndim <= self.axis < ndim:
+            raise NotImplementedError()
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        if self.axis is None:
+            # Repeat the elements of the flattened input.
+            out_ndim = 1
+            axis = 0
+            x_shape = "npy_intp x_dims[1] = {PyArray_SIZE(xc)};"
+        else:
+            out_ndim = ndim
+            axis = self.axis % ndim
+            x_shape = "const npy_intp* x_dims = PyArray_DIMS(xc);"
+        if node.inputs[1].ndim == 0:
+            n_reps = "1"
+        else:
+            n_reps = "PyArray_DIMS(%s)[0]" % repeats
+        # As numpy, copy each slice of the input along axis, the block of
+        # its later axes, as many times as repeated.
+        return """
+        {
+            PyArrayObject* xc = PyArray_GETCONTIGUOUS(%(x)s);
+            if (!xc)
+                %(fail)s
+            %(x_shape)s
+            const npy_intp n_ax = x_dims[%(axis)s];
+            npy_intp n_outer = 1;
+            npy_intp block = PyArray_ITEMSIZE(xc);
+            for (int d = 0; d < %(out_ndim)s; ++d)
+            {
+                if (d < %(axis)s)
+                    n_outer *= x_dims[d];
+                else if (d > %(axis)s)
+                    block *= x_dims[d];
+            }
+            const npy_intp n_reps = %(n_reps)s;
+            const char* r_data = PyArray_BYTES(%(repeats)s);
+            const npy_intp sr =
+                n_reps == 1 ? 0 : PyArray_STRIDES(%(repeats)s)[0];
+            if (n_reps != 1 && n_reps != n_ax)
+            {
+                PyErr_Format(PyExc_ValueError,
+                             "RepeatOp: %%lld repeats for %%lld elements",
+                             (long long)n_reps, (long long)n_ax);
+                Py_DECREF(xc);
+                %(fail)s
+            }
+            npy_intp total = 0;
+            for (npy_intp i = 0; i < n_ax; ++i)
+            {
+                const dtype_%(repeats)s r =
+                    *(const dtype_%(repeats)s*)(r_data + i * sr);
+                if (r < 0)
+                {
+                    PyErr_SetString(PyExc_ValueError,
+                                    "RepeatOp: negative repeats");
+                    Py_DECREF(xc);
+                    %(fail)s
+                }
+                total += r;
+            }
+            npy_intp z_dims[%(out_ndim)s];
+            for (int d = 0; d < %(out_ndim)s; ++d)
+                z_dims[d] = x_dims[d];
+            z_dims[%(axis)s] = total;
+            if (!(%(z)s && PyArray_IS_C_CONTIGUOUS(%(z)s) &&
+                  PyArray_CompareLists(PyArray_DIMS(%(z)s), z_dims,
+                                       %(out_ndim)s)))
+            {
+                Py_XDECREF(%(z)s);
+                %(z)s = (PyArrayObject*)PyArray_EMPTY(%(out_ndim)s, z_dims,
+                                                      %(typenum)s, 0);
+                if (!%(z)s)
+                {
+                    Py_DECREF(xc);
+                    %(fail)s
+                }
+            }
+            const char* src = PyArray_BYTES(xc);
+            char* dst = PyArray_BYTES(%(z)s);
+            for (npy_intp o = 0; o < n_outer; ++o)
+            {
+                for (npy_intp i = 0; i < n_ax; ++i)
+                {
+                    const npy_intp r =
+                        *(const dtype_%(repeats)s*)(r_data + i * sr);
+                    if (block == sizeof(dtype_%(x)s))
+                    {
+                        const dtype_%(x)s v = *(const dtype_%(x)s*)src;
+                        for (npy_intp k = 0; k < r; ++k)
+                            ((dtype_%(x)s*)dst)[k] = v;
+                        dst += r * block;
+                    }
+                    else
+                    {
+                        for (npy_intp k = 0; k < r; ++k)
+                        {
+                            memcpy(dst, src, block);
+                            dst += block;
+                        }
+                    }
+                    src += block;
+                }
+            }
+            Py_DECREF(xc);
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
+
 
 def repeat(x, repeats, axis=None):
     """Repeat elements of an array.
@@ -831,7 +1253,23 @@ def bartlett(M):
 
 class FillDiagonal(gof.Op):
     # See function fill_diagonal for docstring
-    __props__ = ()
+    __props__ = ("inplace",)
+
+    def __init__(self, inplace=False):
+        self.inplace = inplace
+        if self.inplace:
+            self.destroy_map = {0: [0]}
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        # Older pickles have no inplace.
+        if not hasattr(self, 'inplace'):
+            self.inplace = False
+
+    def __str__(self):
+        if self.inplace:
+            return "%s{inplace}" % self.__class__.__name__
+        return self.__class__.__name__
 
     def infer_shape(self, node, in_shapes):
         return [in_shapes[0]]
@@ -852,7 +1290,9 @@ class FillDiagonal(gof.Op):
         return gof.Apply(self, [a, val], [a.type()])
 
     def perform(self, node, inputs, output_storage):
-        a = inputs[0].copy()
+        a = inputs[0]
+        if not self.inplace:
+            a = a.copy()
         val = inputs[1]
         if a.ndim == 2:
             # numpy.fill_diagonal up to date(including 1.6.2) have a
@@ -867,6 +1307,62 @@ class FillDiagonal(gof.Op):
 
         output_storage[0][0] = a
 
+    def c_code(self, node, name, inames, onames, sub):
+        a, val = inames
+        z, = onames
+        fail = sub['fail']
+        ndim = node.inputs[0].ndim
+        if self.inplace:
+            copy = """
+            Py_XDECREF(%(z)s);
+            %(z)s = %(a)s;
+            Py_INCREF(%(z)s);
+            """ % locals()
+        else:
+            copy = """
+            if (%(z)s && PyArray_CompareLists(PyArray_DIMS(%(z)s),
+                                              PyArray_DIMS(%(a)s), %(ndim)s))
+            {
+                if (PyArray_CopyInto(%(z)s, %(a)s))
+                    %(fail)s
+            }
+            else
+            {
+                Py_XDECREF(%(z)s);
+                %(z)s = (PyArrayObject*)PyArray_NewCopy(%(a)s, NPY_ANYORDER);
+                if (!%(z)s)
+                    %(fail)s
+            }
+            """ % locals()
+        return """
+        {
+            const npy_intp* dims = PyArray_DIMS(%(a)s);
+            // For matrices, the diagonal of the top square; as
+            // numpy.fill_diagonal, the other tensors must be hypercubes.
+            npy_intp n = dims[0] < dims[1] ? dims[0] : dims[1];
+            for (int d = 2; d < %(ndim)s; ++d)
+            {
+                if (dims[d] != dims[0] || dims[1] != dims[0])
+                {
+                    PyErr_SetString(PyExc_ValueError,
+                        "All dimensions of input must be of equal length");
+                    %(fail)s
+                }
+            }
+            %(copy)s
+            npy_intp step = 0;
+            for (int d = 0; d < %(ndim)s; ++d)
+                step += PyArray_STRIDES(%(z)s)[d];
+            const dtype_%(z)s v = ((dtype_%(val)s*)PyArray_DATA(%(val)s))[0];
+            char* z_data = PyArray_BYTES(%(z)s);
+            for (npy_intp i = 0; i < n; ++i)
+                *(dtype_%(z)s*)(z_data + i * step) = v;
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
+
     def grad(self, inp, cost_grad):
         """
         Notes
@@ -889,6 +1385,22 @@ class FillDiagonal(gof.Op):
 fill_diagonal_ = FillDiagonal()
 
 
+@gof.local_optimizer([FillDiagonal], inplace=True)
+def local_inplace_fill_diagonal(node):
+    """
+    Fill the diagonal in place.
+
+    """
+    if isinstance(node.op, FillDiagonal) and not node.op.inplace:
+        new_op = FillDiagonal(inplace=True)
+        return [new_op(*node.inputs)]
+    return False
+optdb.register('local_inplace_fill_diagonal',
+               opt.in2out(local_inplace_fill_diagonal, ignore_newtrees=True),
+               60, 'fast_run', 'inplace')
+opt.inplace_assignment_optimizer.add_local_optimizer(local_inplace_fill_diagonal)
+
+
 # I create a function only to have the doc show well.
 def fill_diagonal(a, val):
     """
@@ -1161,3 +1673,262 @@ class Unique(theano.Op):
             ret[1] = shape
             return ret
         return ret
+
+    def c_headers(self):
+        return ['<algorithm>', '<vector>', '<utility>']
+
+    def c_support_code(self):
+        return """
+        #ifndef THEANO_UNIQUE_HELPERS
+        #define THEANO_UNIQUE_HELPERS
+        // Group the n elements of x by value, in a hash table with open
+        // addressing. Fill, for each group in order of first occurrence,
+        // the index of that occurrence and the number of elements, and the
+        // group of each element if group is not NULL. +0. and -0. are in
+        // the same group, and so are all the NaNs, as in numpy. Return the
+        // group of the NaNs, or -1.
+        // If probe > 0 and more than a quarter of the first probe elements
+        // are distinct, stop and return -2: sorting x is then faster.
+        template<typename T>
+        static npy_intp theano_unique_groups(const T* x, npy_intp n,
+                                             std::vector<npy_intp>& first,
+                                             std::vector<npy_intp>& counts,
+                                             npy_intp* group, npy_intp probe)
+        {
+            // The table grows with the number of groups, at most half
+            // full. The values are kept in it, to compare them without
+            // another memory access.
+            int bits = 10;
+            npy_uint64 mask = ((npy_uint64)1 << bits) - 1;
+            std::vector<std::pair<T, npy_intp> > table(
+                mask + 1, std::make_pair(T(0), (npy_intp)-1));
+            npy_intp nan_group = -1;
+            for (npy_intp i = 0; i < n; ++i)
+            {
+                if (i == probe && (npy_intp)first.size() > probe / 4)
+                    return -2;
+                const T v = x[i];
+                npy_intp g;
+                if (v != v)
+                {
+                    if (nan_group < 0)
+                    {
+                        nan_group = first.size();
+                        first.push_back(i);
+                        counts.push_back(0);
+                    }
+                    g = nan_group;
+                }
+                else
+                {
+                    npy_uint64 key = 0;
+                    if (v != 0)
+                        memcpy(&key, &v, sizeof(T));
+                    // Fibonacci hashing: the top bits of key times 2**64
+                    // over the golden ratio.
+                    const npy_uint64 hash = key * 11400714819323198485ull;
+                    npy_uint64 h = hash >> (64 - bits);
+                    while (true)
+                    {
+                        g = table[h].second;
+                        if (g < 0 || table[h].first == v)
+                            break;
+                        h = (h + 1) & mask;
+                    }
+                    if (g < 0)
+                    {
+                        g = first.size();
+                        first.push_back(i);
+                        counts.push_back(0);
+                        table[h] = std::make_pair(v, g);
+                        if (2 * first.size() > mask)
+                        {
+                            ++bits;
+                            mask = ((npy_uint64)1 << bits) - 1;
+                            std::vector<std::pair<T, npy_intp> > old(
+                                mask + 1, std::make_pair(T(0), (npy_intp)-1));
+                            old.swap(table);
+                            for (size_t o = 0; o < old.size(); ++o)
+                            {
+                                if (old[o].second < 0)
+                                    continue;
+                                npy_uint64 k = 0;
+                                if (old[o].first != 0)
+                                    memcpy(&k, &old[o].first, sizeof(T));
+                                npy_uint64 r = (k * 11400714819323198485ull)
+                                               >> (64 - bits);
+                                while (table[r].second >= 0)
+                                    r = (r + 1) & mask;
+                                table[r] = old[o];
+                            }
+                        }
+                    }
+                }
+                ++counts[g];
+                if (group)
+                    group[i] = g;
+            }
+            return nan_group;
+        }
+
+        template<typename T>
+        static bool theano_unique_less(const std::pair<T, npy_intp>& a,
+                                       const std::pair<T, npy_intp>& b)
+        {
+            return a.first < b.first;
+        }
+
+        template<typename T>
+        static bool theano_unique_not_nan(const T& v)
+        {
+            return v == v;
+        }
+
+        // The sorted distinct values of x, with NaN last, by sorting x.
+        template<typename T>
+        static void theano_unique_sort(const T* x, npy_intp n,
+                                       std::vector<T>& values)
+        {
+            values.assign(x, x + n);
+            typename std::vector<T>::iterator end = std::partition(
+                values.begin(), values.end(), theano_unique_not_nan<T>);
+            const bool has_nan = end != values.end();
+            const T nan = has_nan ? *end : T(0);
+            std::sort(values.begin(), end);
+            values.erase(std::unique(values.begin(), end), values.end());
+            if (has_nan)
+                values.push_back(nan);
+        }
+        #endif
+        """
+
+    def c_code(self, node, name, inames, onames, sub):
+        x, = inames
+        fail = sub['fail']
+        dtype = _c_dtype(node.inputs[0])
+        outputs = list(onames)
+        uniq = outputs.pop(0)
+        index = inverse = counts = None
+        if self.return_index:
+            index = outputs.pop(0)
+        if self.return_inverse:
+            inverse = outputs.pop(0)
+        if self.return_counts:
+            counts = outputs.pop(0)
+        typenum = node.outputs[0].type.dtype_specs()[2]
+
+        def alloc(out, size, typenum):
+            return """
+            if (!(%(out)s && PyArray_DIMS(%(out)s)[0] == %(size)s &&
+                  PyArray_IS_C_CONTIGUOUS(%(out)s)))
+            {
+                Py_XDECREF(%(out)s);
+                npy_intp dims[1] = {%(size)s};
+                %(out)s = (PyArrayObject*)PyArray_EMPTY(1, dims,
+                                                        %(typenum)s, 0);
+                if (!%(out)s)
+                {
+                    Py_DECREF(xc);
+                    %(fail)s
+                }
+            }
+            """ % dict(out=out, size=size, typenum=typenum, fail=fail)
+
+        fill = alloc(uniq, "k", typenum) + """
+        {
+            %(dtype)s* u = (%(dtype)s*)PyArray_DATA(%(uniq)s);
+            for (npy_intp r = 0; r < k; ++r)
+                u[r] = order[r].first;
+        }
+        """ % locals()
+        if index:
+            fill += alloc(index, "k", "NPY_INT64") + """
+            {
+                npy_int64* idx = (npy_int64*)PyArray_DATA(%(index)s);
+                for (npy_intp r = 0; r < k; ++r)
+                    idx[r] = first[order[r].second];
+            }
+            """ % locals()
+        if inverse:
+            fill += alloc(inverse, "n", "NPY_INT64") + """
+            {
+                std::vector<npy_intp> rank(k);
+                for (npy_intp r = 0; r < k; ++r)
+                    rank[order[r].second] = r;
+                npy_int64* inv = (npy_int64*)PyArray_DATA(%(inverse)s);
+                for (npy_intp i = 0; i < n; ++i)
+                    inv[i] = rank[group[i]];
+            }
+            """ % locals()
+        if counts:
+            fill += alloc(counts, "k", "NPY_INT64") + """
+            {
+                npy_int64* cnt = (npy_int64*)PyArray_DATA(%(counts)s);
+                for (npy_intp r = 0; r < k; ++r)
+                    cnt[r] = n_in_group[order[r].second];
+            }
+            """ % locals()
+        return_inverse = int(self.return_inverse)
+
+        if not (index or inverse or counts):
+            # Only the values are needed: sort them alone, or sort the
+            # input if most of it is distinct.
+            probe = "n >= 65536 ? n / 8 : 0"
+            sort = """
+            std::vector<%(dtype)s> order;
+            if (nan_group == -2)
+            {
+                theano_unique_sort(x_data, n, order);
+            }
+            else
+            {
+                order.reserve(first.size());
+                for (size_t g = 0; g < first.size(); ++g)
+                    if ((npy_intp)g != nan_group)
+                        order.push_back(x_data[first[g]]);
+                std::sort(order.begin(), order.end());
+                // NaN comes last.
+                if (nan_group >= 0)
+                    order.push_back(x_data[first[nan_group]]);
+            }
+            const npy_intp k = order.size();
+            """ % locals()
+            fill = fill.replace("order[r].first", "order[r]")
+        else:
+            probe = "0"
+            sort = """
+            const npy_intp k = first.size();
+            std::vector<std::pair<%(dtype)s, npy_intp> > order;
+            order.reserve(k);
+            for (npy_intp g = 0; g < k; ++g)
+                if (g != nan_group)
+                    order.push_back(std::make_pair(x_data[first[g]], g));
+            std::sort(order.begin(), order.end(),
+                      theano_unique_less<%(dtype)s>);
+            // NaN comes last.
+            if (nan_group >= 0)
+                order.push_back(std::make_pair(x_data[first[nan_group]],
+                                               nan_group));
+            """ % locals()
+
+        # Only the distinct values are sorted, not the whole input.
+        return """
+        {
+            PyArrayObject* xc = PyArray_GETCONTIGUOUS(%(x)s);
+            if (!xc)
+                %(fail)s
+            const npy_intp n = PyArray_SIZE(xc);
+            const %(dtype)s* x_data = (const %(dtype)s*)PyArray_DATA(xc);
+            std::vector<npy_intp> first, n_in_group;
+            std::vector<npy_intp> group(%(return_inverse)s ? n : 0);
+            const npy_intp nan_group = theano_unique_groups(
+                x_data, n, first, n_in_group,
+                %(return_inverse)s && n ? &group[0] : NULL, %(probe)s);
+            %(sort)s
+            %(fill)s
+            Py_DECREF(xc);
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
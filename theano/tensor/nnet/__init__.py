@@ -1,5 +1,8 @@
 from .nnet import *
 from .conv import conv2d, ConvOp
+from .corr import CorrMM, CorrMM_gradWeights, CorrMM_gradInputs
+from .fftconv import FFTConv, conv2d_fft
+from . import conv_autotune
 from .Conv3D import *
 from .ConvGrad3D import *
 from .ConvTransp3D import *
@@ -19,7 +19,7 @@ import theano
 from theano import OpenMPOp
 from theano.tensor import (as_tensor_variable, blas, get_scalar_constant_value,
                            patternbroadcast, NotScalarConstantError)
-from theano.gof import Apply
+from theano.gof import Apply, shapes_nbytes
 
 try:
     # TODO: move these back out to global scope when they no longer
@@ -620,6 +620,11 @@ class ConvOp(OpenMPOp):
                      images[2] * images[3] * 2)
         return flops
 
+    def cost(self, node, input_shapes, output_shapes):
+        return (self.flops(input_shapes, output_shapes),
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
     def make_node(self, inputs, kerns):
         # TODO: find a way to make ConvOp work for N-D (after NIPS09)
         """
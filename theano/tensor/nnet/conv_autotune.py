@@ -0,0 +1,219 @@
+"""
+Per-machine choice of the CPU implementation of conv2d.
+
+When the optimizer tag ``conv_meta`` is included, each `ConvOp` whose input
+shapes are known (from the shapes given to conv2d or from test values) is
+replaced by the fastest of its implementations on this machine: the
+`ConvOp` C code with a few unrollings of its loops, `CorrMM` and
+`FFTConv`. They are compiled and timed the first time a configuration
+(image shape, filter shape, subsampling, border mode and dtype) is seen.
+The winner is kept in the compiledir, so the later compilations of the same
+configuration reuse it without timing anything.
+
+This replaces the speed table of `ConvOp`, which was measured once on
+another machine, for the graphs that enable it.
+
+"""
+from __future__ import absolute_import, print_function
+import logging
+import os
+
+import numpy
+import six.moves.cPickle as pickle
+
+import theano
+from theano import config
+from theano.gof import compilelock, opt
+from theano.tensor.opt import in2out
+from theano.tensor.nnet.conv import ConvOp
+from theano.tensor.nnet.corr import local_conv2d_gemm
+from theano.tensor.nnet.fftconv import local_conv2d_fft
+
+_logger = logging.getLogger('theano.tensor.nnet.conv_autotune')
+
+# (unroll_batch, unroll_kern) of the ConvOp variants that are timed.
+UNROLL_CHOICES = ((1, 1), (2, 2), (4, 4))
+
+# configuration key -> name of the fastest optimizer, as loaded from the
+# compiledir.
+_choices = None
+
+
+def choices_file():
+    return os.path.join(config.compiledir, 'conv_autotune.pkl')
+
+
+def _load_choices():
+    try:
+        with open(choices_file(), 'rb') as f:
+            return pickle.load(f)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return {}
+
+
+def _save_choices(choices):
+    # Other processes can tune other configurations at the same time.
+    compilelock.get_lock()
+    try:
+        on_disk = _load_choices()
+        on_disk.update(choices)
+        tmp = choices_file() + '.tmp%d' % os.getpid()
+        with open(tmp, 'wb') as f:
+            pickle.dump(on_disk, f, protocol=2)
+        os.rename(tmp, choices_file())
+    finally:
+        compilelock.release_lock()
+    return on_disk
+
+
+class ConvOpVariant(opt.LocalOptimizer):
+    """
+    Rebuild a `ConvOp` with a given unrolling of its C loops.
+
+    Parameters
+    ----------
+    unroll_batch, unroll_kern : int
+        The unrolling over the images and the filters. They are only
+        applicable to the `ConvOp` that know all their shapes, and that
+        have a batch size and a number of filters multiple of them.
+    unroll_patch : bool
+        If True, use the loop over the output pixels instead. This is the
+        only version that uses OpenMP.
+
+    """
+
+    def __init__(self, unroll_batch=None, unroll_kern=None,
+                 unroll_patch=False):
+        self.unroll_batch = unroll_batch
+        self.unroll_kern = unroll_kern
+        self.unroll_patch = unroll_patch
+
+    def tracks(self):
+        return [ConvOp]
+
+    def transform(self, node):
+        op = node.op
+        if not isinstance(op, ConvOp):
+            return
+        if self.unroll_patch:
+            unroll = dict(unroll_patch=True)
+        else:
+            if (not op.has_all_shape(op.imshp, op.kshp, op.nkern, op.bsize) or
+                    op.bsize % self.unroll_batch or
+                    op.nkern % self.unroll_kern):
+                return
+            unroll = dict(unroll_batch=self.unroll_batch,
+                          unroll_kern=self.unroll_kern,
+                          unroll_patch=False, openmp=False)
+        new_op = ConvOp(imshp=op.imshp, kshp=op.kshp, nkern=op.nkern,
+                        bsize=op.bsize, dx=op.dx, dy=op.dy,
+                        output_mode=op.out_mode,
+                        imshp_logical=op.imshp_logical,
+                        kshp_logical=op.kshp_logical,
+                        kshp_logical_top_aligned=op.kshp_logical_top_aligned,
+                        version=op.version if op.fft_opt else 'no_fft',
+                        direction_hint=op.direction_hint,
+                        **unroll)
+        return [new_op(*node.inputs)]
+
+    def __str__(self):
+        if self.unroll_patch:
+            return 'conv_unroll_patch'
+        return 'conv_unroll_%d_%d' % (self.unroll_batch, self.unroll_kern)
+
+
+class ConvMetaOptimizer(opt.LocalMetaOptimizer):
+    """
+    Replace a `ConvOp` by its fastest implementation for its shapes.
+
+    The choice is looked up in, or added to, the file returned by
+    `choices_file`.
+
+    """
+
+    def __init__(self, optimizers):
+        super(ConvMetaOptimizer, self).__init__([ConvOp], optimizers)
+
+    def provide_inputs(self, node, inputs):
+        # ConvOp often knows its shapes.
+        result = {}
+        op = node.op
+        shapes = ((op.bsize,) + op.imshp,
+                  (op.nkern, op.imshp[0]) + op.kshp)
+        for var, shape in zip(node.inputs, shapes):
+            if var in inputs and None not in shape:
+                result[var] = theano.shared(
+                    numpy.asarray(numpy.random.rand(*shape), dtype=var.dtype),
+                    var.name,
+                    broadcastable=var.broadcastable,
+                    borrow=True)
+        return result
+
+    def compile(self, outputs, givens):
+        # The optimizations must not replace the candidates, nor time them
+        # recursively.
+        mode = theano.compile.get_default_mode().excluding(
+            'conv_meta', 'conv_gemm', 'conv_fft')
+        return theano.function([], outputs, givens=givens,
+                               on_unused_input='ignore', mode=mode)
+
+    def config_key(self, node, givens):
+        op = node.op
+        shapes = []
+        for var in node.inputs:
+            value = givens.get(var, var)
+            shapes.append(value.get_value(borrow=True,
+                                          return_internal_type=True).shape)
+        if (op.imshp_logical, op.kshp_logical) == (op.imshp, op.kshp):
+            logical = None
+        else:
+            logical = (op.imshp_logical, op.kshp_logical,
+                       op.kshp_logical_top_aligned)
+        return (tuple(shapes[0]), tuple(shapes[1]), (op.dx, op.dy),
+                op.out_mode, node.outputs[0].dtype, logical)
+
+    def transform(self, node):
+        global _choices
+        if not isinstance(node.op, ConvOp):
+            return
+        givens = self.get_givens(node)
+        if givens is None:
+            return
+        key = self.config_key(node, givens)
+        if _choices is None:
+            _choices = _load_choices()
+        choice = _choices.get(key)
+        outputs = None
+        if choice is not None:
+            for optimizer in self.optimizers:
+                if str(optimizer) == choice:
+                    outputs = optimizer.transform(node)
+                    break
+        if not outputs:
+            timings = self.benchmark(node, givens)
+            if not timings:
+                return
+            outputs = timings[0][1]
+            _logger.info("Fastest convolution for %s: %s",
+                         key, timings[0][2])
+            _choices = _save_choices({key: str(timings[0][2])})
+        if isinstance(outputs[0].owner.op, ConvOp):
+            # local_conv2d_gemm keeps the ConvOp that won.
+            if outputs[0].owner.op == node.op:
+                node.outputs[0].tag.conv_autotuned = True
+                return
+            outputs[0].tag.conv_autotuned = True
+        return outputs
+
+
+conv_metaopt = ConvMetaOptimizer(
+    [ConvOpVariant(unroll_patch=True)] +
+    [ConvOpVariant(unroll_batch=b, unroll_kern=k) for b, k in UNROLL_CHOICES] +
+    [local_conv2d_gemm, local_conv2d_fft])
+
+# Before local_conv2d_gemm, in specialize_device, and after the GPU
+# optimizations, that move the ConvOp to the GPU.
+theano.compile.optdb.register('cpu_conv_meta',
+                              in2out(conv_metaopt, name='cpu_conv_meta',
+                                     ignore_newtrees=True),
+                              48.55, 'conv_meta')
@@ -0,0 +1,666 @@
+"""
+Ops that compute the correlation of a mini-batch of images with a set of
+filters on the CPU, by unrolling the image patches into a matrix (im2col)
+and multiplying it with the filters with the BLAS gemm.
+
+They are the CPU counterparts of `GpuCorrMM`, `GpuCorrMM_gradWeights` and
+`GpuCorrMM_gradInputs` of theano.sandbox.cuda.blas. By default,
+`local_conv2d_gemm` replaces the `ConvOp` of conv2d and of its gradient
+with them; exclude the ``conv_gemm`` optimization to keep the `ConvOp`.
+
+"""
+from __future__ import absolute_import
+
+import os
+
+import theano
+from theano import Apply, gof
+from theano.gof import local_optimizer, shapes_nbytes
+from theano.gradient import DisconnectedType
+from theano.tensor import (as_tensor_variable, blas, patternbroadcast,
+                           TensorType)
+from theano.tensor.opt import register_specialize_device
+from theano.tensor.nnet.conv import ConvOp
+
+
+class BaseCorrMM(gof.OpenMPOp):
+    """
+    Base class for `CorrMM`, `CorrMM_gradWeights` and
+    `CorrMM_gradInputs`. Cannot be used directly.
+
+    Parameters
+    ----------
+    border_mode : {'valid', 'full', 'half'}
+        Additionally, the padding size could be directly specified by an
+        integer or a pair of integers.
+    subsample
+        Perform subsampling of the output (default: (1, 1)).
+    openmp
+        If True, im2col and col2im use several threads. The gemm uses the
+        threads of the BLAS library in all cases.
+
+    """
+
+    __props__ = ('border_mode', 'subsample')
+
+    def __init__(self, border_mode="valid", subsample=(1, 1), openmp=None):
+        super(BaseCorrMM, self).__init__(openmp=openmp)
+        if isinstance(border_mode, int):
+            border_mode = (border_mode, border_mode)
+        if isinstance(border_mode, tuple):
+            pad_h, pad_w = map(int, border_mode)
+            border_mode = (pad_h, pad_w)
+        if not ((isinstance(border_mode, tuple) and min(border_mode) >= 0) or
+                border_mode in ('valid', 'full', 'half')):
+            raise ValueError(
+                'invalid border_mode {}, which must be either '
+                '"valid", "full", "half", an integer or a pair of'
+                ' integers'.format(border_mode))
+        self.border_mode = border_mode
+        if len(subsample) != 2:
+            raise ValueError("subsample must have two elements")
+        self.subsample = tuple(subsample)
+
+    @property
+    def pad(self):
+        if self.border_mode != 'valid':
+            return self.border_mode
+        return (0, 0)
+
+    def __str__(self):
+        return '%s{%s, %s}' % (
+            self.__class__.__name__,
+            self.border_mode,
+            str(self.subsample))
+
+    def _check_inputs(self, a, b, names):
+        for x, name in zip((a, b), names):
+            if x.type.ndim != 4:
+                raise TypeError('%s must be 4D tensor' % name)
+        if a.type.dtype != b.type.dtype:
+            raise TypeError('%s and %s must have the same dtype, got %s '
+                            'and %s' % (names + (a.type.dtype,
+                                                 b.type.dtype)))
+        if a.type.dtype not in ('float32', 'float64'):
+            raise TypeError('%s only supports float32 and float64, got %s' %
+                            (self.__class__.__name__, a.type.dtype))
+
+    def _pads(self, kshp):
+        """
+        The symbolic or integer padding for the filter shape `kshp`.
+
+        """
+        if self.border_mode == 'half':
+            return [k // 2 for k in kshp]
+        elif self.border_mode == 'full':
+            return [k - 1 for k in kshp]
+        elif self.border_mode == 'valid':
+            return [0, 0]
+        return list(self.border_mode)
+
+    def c_support_code(self):
+        # REMEMBER TO RAISE c_code_cache_version when changing corr_gemm.c
+        code = open(os.path.join(os.path.split(__file__)[0],
+                                 'corr_gemm.c')).read()
+        return blas.blas_header_text() + code
+
+    def c_headers(self):
+        return super(BaseCorrMM, self).c_headers() + ['<limits.h>',
+                                                      '<string.h>']
+
+    def c_libraries(self):
+        return blas.ldflags()
+
+    def c_compile_args(self):
+        return (super(BaseCorrMM, self).c_compile_args() +
+                blas.ldflags(libs=False, flags=True))
+
+    def c_lib_dirs(self):
+        return blas.ldflags(libs=False, libs_dir=True)
+
+    def c_header_dirs(self):
+        return blas.ldflags(libs=False, include_dir=True)
+
+    def c_code_cache_version(self):
+        # raise this whenever modifying corr_gemm.c
+        return (1, self.openmp, blas.blas_header_version())
+
+    def c_code_helper(self, node, bottom, weights, top, direction, sub,
+                      height=None, width=None):
+        """
+        This generates the C code for CorrMM (direction="forward"),
+        CorrMM_gradWeights (direction="backprop weights"), and
+        CorrMM_gradInputs (direction="backprop inputs").
+        Depending on the direction, one of bottom, weights, top will
+        receive the output, while the other two serve as inputs.
+
+        Parameters
+        ----------
+        node
+            The Apply node, for the dtype.
+        bottom
+            Variable name of the input images in the forward pass,
+            or the gradient of the input images in backprop wrt. inputs
+        weights
+            Variable name of the filters in the forward pass,
+            or the gradient of the filters in backprop wrt. weights
+        top
+            Variable name of the output images / feature maps in the
+            forward pass, or the gradient of the outputs in the backprop
+            passes
+        direction : {'forward', 'backprop weights', 'backprop inputs'}
+            "forward" to correlate bottom with weights and store results in
+            top, "backprop weights" to do a valid convolution of bottom with
+            top (swapping the first two dimensions) and store results in
+            weights, and "backprop inputs" to do a full convolution of top
+            with weights (swapping the first two dimensions) and store
+            results in bottom.
+        sub
+            Dictionary of substitutions useable to help generating the C
+            code.
+        height
+            If self.subsample[0] != 1, a variable giving the height of the
+            filters for direction="backprop weights" or the height of the
+            input images for direction="backprop inputs".
+            If self.border_mode == 'half', a variable giving the height of
+            the filters for direction="backprop weights".
+            Ignored otherwise.
+        width
+            As height, for the width.
+
+        """
+        if not blas.ldflags():
+            raise NotImplementedError("C code for CorrMM* classes need a "
+                                      "blas library.")
+        dtype = node.outputs[0].type.dtype
+        ctype = {'float32': 'float', 'float64': 'double'}[dtype]
+        typenum = node.outputs[0].type.dtype_specs()[2]
+        parallel = int(bool(self.openmp))
+        dH, dW = self.subsample
+        if self.border_mode == "half":
+            padH = padW = -1
+        elif self.border_mode == "full":
+            padH = padW = -2
+        elif isinstance(self.border_mode, tuple):
+            padH, padW = self.border_mode
+        else:
+            assert self.border_mode == "valid"
+            padH = padW = 0
+        if direction == "forward":
+            direction = 0
+            out = top
+        elif direction == "backprop weights":
+            direction = 1
+            out = weights
+        elif direction == "backprop inputs":
+            direction = 2
+            out = bottom
+        else:
+            raise ValueError("direction must be one of 'forward', "
+                             "'backprop weights', 'backprop inputs'")
+        # When subsampling, we cannot unambiguously infer the height and
+        # width of bottom and weights from top, so we require them to be
+        # given. Similarly, when pad="half", we cannot infer the weight size.
+        if ((direction != 0) and (dH != 1)) or ((direction == 1) and
+                                                (padH == -1)):
+            if not height:
+                raise ValueError("height must be given for backprop with "
+                                 "vertical sampling or pad='half'")
+            height = '(*(npy_int64 *)(PyArray_DATA(%s)))' % height
+        else:
+            height = '-1'
+        if ((direction != 0) and (dW != 1)) or ((direction == 1) and
+                                                (padW == -1)):
+            if not width:
+                raise ValueError("width must be given for backprop with "
+                                 "horizontal sampling or pad='half'")
+            width = '(*(npy_int64 *)(PyArray_DATA(%s)))' % width
+        else:
+            width = '-1'
+        sub = sub.copy()
+        sub.update(locals())
+
+        return """
+    {
+    // Mandatory args
+    int direction = %(direction)s;  // forward, bprop weights, bprop inputs
+
+    // Optional args
+    int dH = %(dH)s;
+    int dW = %(dW)s;
+    int padH = %(padH)s;
+    int padW = %(padW)s;
+
+    // The two inputs, made C-contiguous
+    PyArrayObject * bottom = NULL;
+    PyArrayObject * weights = NULL;
+    PyArrayObject * top = NULL;
+    if (direction != 2)
+        bottom = PyArray_GETCONTIGUOUS(%(bottom)s);
+    if (direction != 1)
+        weights = PyArray_GETCONTIGUOUS(%(weights)s);
+    if (direction != 0)
+        top = PyArray_GETCONTIGUOUS(%(top)s);
+    PyArrayObject * in1 = (direction == 2) ? weights : bottom;
+    PyArrayObject * in2 = (direction == 0) ? weights : top;
+    if (NULL == in1 || NULL == in2) {
+        Py_XDECREF(in1);
+        Py_XDECREF(in2);
+        %(fail)s
+    }
+
+    // Obtain or infer kernel width and height
+    // (we need to know it early to be able to handle auto-padding)
+    npy_intp kH, kW;
+    if (direction != 1) {
+        // weight is an input variable, we can just read its shape
+        kH = PyArray_DIMS(weights)[2];
+        kW = PyArray_DIMS(weights)[3];
+    }
+    else {
+        if ((dH != 1) || (padH == -1)) {
+            // vertical subsampling or half padding, kernel height is specified
+            kH = %(height)s;
+        }
+        else if (padH == -2) {
+            // vertical full padding, we can infer the kernel height
+            kH = 2 - PyArray_DIMS(bottom)[2] + (PyArray_DIMS(top)[2] - 1) * dH;
+        }
+        else {
+            // explicit padding, we can infer the kernel height
+            kH = PyArray_DIMS(bottom)[2] + 2*padH - (PyArray_DIMS(top)[2] - 1) * dH;
+        }
+        if ((dW != 1) || (padW == -1)) {
+            kW = %(width)s;
+        }
+        else if (padW == -2) {
+            kW = 2 - PyArray_DIMS(bottom)[3] + (PyArray_DIMS(top)[3] - 1) * dW;
+        }
+        else {
+            kW = PyArray_DIMS(bottom)[3] + 2*padW - (PyArray_DIMS(top)[3] - 1) * dW;
+        }
+    }
+
+    // Auto-padding if requested
+    if (padH == -1) {  // vertical half padding
+        padH = kH / 2;
+    }
+    else if (padH == -2) {  // vertical full padding
+        padH = kH - 1;
+    }
+    if (padW == -1) {  // horizontal half padding
+        padW = kW / 2;
+    }
+    else if (padW == -2) {  // horizontal full padding
+        padW = kW - 1;
+    }
+
+    // Infer output shape
+    npy_intp out_dim[4];
+    switch(direction) {
+    case 0:  // forward pass
+        // output is top: (batchsize, num_filters, height, width)
+        // height and width: top = (bottom + 2*pad - weight) / sample + 1
+        out_dim[0] = PyArray_DIMS(bottom)[0];
+        out_dim[1] = PyArray_DIMS(weights)[0];
+        out_dim[2] = (PyArray_DIMS(bottom)[2] + 2*padH - PyArray_DIMS(weights)[2]) / dH + 1;
+        out_dim[3] = (PyArray_DIMS(bottom)[3] + 2*padW - PyArray_DIMS(weights)[3]) / dW + 1;
+        break;
+    case 1:  // backprop wrt. weights
+        // output is weights: (num_filters, num_channels, height, width)
+        // height and width: weights = bottom + 2*pad - (top - 1) * sample
+        out_dim[0] = PyArray_DIMS(top)[1];
+        out_dim[1] = PyArray_DIMS(bottom)[1];
+        out_dim[2] = kH;  // already inferred further above
+        out_dim[3] = kW;  // how convenient
+        break;
+    case 2:  // backprop wrt. inputs
+        // output is bottom: (batchsize, num_channels, height, width)
+        // height and width: bottom = (top - 1) * sample + weights - 2*pad
+        out_dim[0] = PyArray_DIMS(top)[0];
+        out_dim[1] = PyArray_DIMS(weights)[1];
+        out_dim[2] = (dH != 1) ? %(height)s : (PyArray_DIMS(top)[2] - 1) * dH + PyArray_DIMS(weights)[2] - 2*padH;
+        out_dim[3] = (dW != 1) ? %(width)s : (PyArray_DIMS(top)[3] - 1) * dW + PyArray_DIMS(weights)[3] - 2*padW;
+        break;
+    }
+    if (out_dim[0] < 0 || out_dim[1] < 0 || out_dim[2] <= 0 || out_dim[3] <= 0) {
+        PyErr_Format(PyExc_ValueError,
+                     "CorrMM: impossible output shape %%lld x %%lld x %%lld x %%lld",
+                     (long long)out_dim[0], (long long)out_dim[1],
+                     (long long)out_dim[2], (long long)out_dim[3]);
+        Py_DECREF(in1);
+        Py_DECREF(in2);
+        %(fail)s
+    }
+
+    // Prepare output array
+    if ( !(%(out)s
+           && PyArray_NDIM(%(out)s)==4
+           && PyArray_IS_C_CONTIGUOUS(%(out)s)
+           && PyArray_DIMS(%(out)s)[0]==out_dim[0]
+           && PyArray_DIMS(%(out)s)[1]==out_dim[1]
+           && PyArray_DIMS(%(out)s)[2]==out_dim[2]
+           && PyArray_DIMS(%(out)s)[3]==out_dim[3]))
+    {
+        Py_XDECREF(%(out)s);
+        %(out)s = (PyArrayObject*)PyArray_EMPTY(4, out_dim, %(typenum)s, 0);
+        if (NULL == %(out)s)
+        {
+            PyErr_Format(PyExc_MemoryError,
+                    "CorrMM: Failed to allocate output of %%lld x %%lld x %%lld x %%lld",
+                    (long long)out_dim[0], (long long)out_dim[1],
+                    (long long)out_dim[2], (long long)out_dim[3]);
+            Py_DECREF(in1);
+            Py_DECREF(in2);
+            %(fail)s
+        }
+    }
+    switch(direction) {
+    case 0: top = %(out)s; break;
+    case 1: weights = %(out)s; break;
+    case 2: bottom = %(out)s; break;
+    }
+
+    // Call the im2col + gemm code
+    int err = corrMM<%(ctype)s>(bottom, weights, top, direction,
+                                dH, dW, padH, padW, %(parallel)s);
+    Py_DECREF(in1);
+    Py_DECREF(in2);
+    if (err) {
+        %(fail)s
+    }
+    }
+""" % sub
+
+
+class CorrMM(BaseCorrMM):
+    """
+    CPU correlation implementation using Matrix Multiplication.
+
+    Parameters
+    ----------
+    border_mode
+        The width of a border of implicit zeros to pad the
+        input with. Must be a tuple with 2 elements giving the numbers of
+        rows and columns to pad on each side, or a single integer to pad the
+        same on all sides, or a string shortcut setting the padding at
+        runtime: ``'valid'`` for ``(0, 0)`` (valid convolution, no padding),
+        ``'full'`` for ``(kernel_rows - 1, kernel_columns - 1)`` (full
+        convolution), ``'half'`` for ``(kernel_rows // 2,
+        kernel_columns // 2)`` (same convolution for odd-sized kernels).
+        Note that the two widths are each applied twice, once per side
+        (left and right, top and bottom).
+    subsample
+        The subsample operation applied to each output image.
+        Should be a tuple with 2 elements.
+        `(sv, sh)` is equivalent to `CorrMM(...)(...)[:,:,::sv, ::sh]`,
+        but faster.
+        Set to `(1, 1)` to disable subsampling.
+
+    Notes
+    -----
+    The C code needs a BLAS library (``blas.ldflags``).
+
+    This computes a correlation: for a convolution like
+    :func:`conv2d <theano.tensor.nnet.conv.conv2d>`, flip the filters as
+    `filters[:,:,::-1,::-1]`. The optimization ``conv_gemm``, enabled by
+    default, does it when it replaces the `ConvOp` of conv2d.
+
+    """
+
+    def make_node(self, img, kern):
+        img = as_tensor_variable(img)
+        kern = as_tensor_variable(kern)
+        self._check_inputs(img, kern, ('img', 'kern'))
+
+        broadcastable = [img.type.broadcastable[0], kern.type.broadcastable[0],
+                         False, False]
+        return Apply(self, [img, kern],
+                     [TensorType(img.type.dtype, broadcastable)()])
+
+    def infer_shape(self, node, input_shapes):
+        imshp, kshp = input_shapes
+        dH, dW = self.subsample
+        padH, padW = self._pads(kshp[2:])
+        return [(imshp[0], kshp[0],
+                 (imshp[2] + 2 * padH - kshp[2]) // dH + 1,
+                 (imshp[3] + 2 * padW - kshp[3]) // dW + 1)]
+
+    def flops(self, inp, outp):
+        """
+        Useful with the hack in profilemode to print the MFlops.
+
+        """
+        # if the output shape is correct, then this gives the correct
+        # flops for any direction, sampling, padding, and border mode
+        inputs, filters = inp
+        outputs, = outp
+        assert inputs[1] == filters[1]
+        # nb mul and add by output pixel
+        flops = filters[2] * filters[3] * 2
+        # nb flops by output image
+        flops *= outputs[2] * outputs[3]
+        # nb patch multiplied
+        flops *= inputs[1] * filters[0] * inputs[0]
+        return flops
+
+    def cost(self, node, input_shapes, output_shapes):
+        return (self.flops(input_shapes, output_shapes),
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
+    def c_code(self, node, nodename, inp, out_, sub):
+        bottom, weights = inp
+        top, = out_
+        direction = "forward"
+        return super(CorrMM, self).c_code_helper(node, bottom, weights, top,
+                                                 direction, sub)
+
+    def grad(self, inp, grads):
+        bottom, weights = inp
+        top, = grads
+        d_bottom = CorrMM_gradInputs(self.border_mode, self.subsample)(
+            weights, top, bottom.shape[-2:])
+        d_weights = CorrMM_gradWeights(self.border_mode, self.subsample)(
+            bottom, top, weights.shape[-2:])
+        return d_bottom, d_weights
+
+
+class CorrMM_gradWeights(BaseCorrMM):
+    """
+    Gradient wrt. filters for `CorrMM`.
+
+    Notes
+    -----
+    You will not want to use this directly, but rely on Theano's automatic
+    differentiation or graph optimization to use it as needed.
+
+    """
+
+    def make_node(self, img, topgrad, shape=None):
+        img = as_tensor_variable(img)
+        topgrad = as_tensor_variable(topgrad)
+        self._check_inputs(img, topgrad, ('img', 'topgrad'))
+        if self.subsample != (1, 1) or self.border_mode == "half":
+            if shape is None:
+                raise ValueError('shape must be given if subsample != (1, 1)'
+                                 ' or border_mode == "half"')
+            height_width = [as_tensor_variable(shape[0]).astype('int64'),
+                            as_tensor_variable(shape[1]).astype('int64')]
+        else:
+            height_width = []
+
+        broadcastable = [topgrad.type.broadcastable[1],
+                         img.type.broadcastable[1], False, False]
+        return Apply(self, [img, topgrad] + height_width,
+                     [TensorType(img.type.dtype, broadcastable)()])
+
+    def infer_shape(self, node, input_shapes):
+        imshp, topshp = input_shapes[:2]
+        dH, dW = self.subsample
+        if len(node.inputs) == 4:
+            kH, kW = node.inputs[2], node.inputs[3]
+        elif self.border_mode == 'full':
+            kH = 2 - imshp[2] + (topshp[2] - 1) * dH
+            kW = 2 - imshp[3] + (topshp[3] - 1) * dW
+        else:
+            padH, padW = self._pads((None, None))
+            kH = imshp[2] + 2 * padH - (topshp[2] - 1) * dH
+            kW = imshp[3] + 2 * padW - (topshp[3] - 1) * dW
+        return [(topshp[1], imshp[1], kH, kW)]
+
+    def c_code(self, node, nodename, inp, out_, sub):
+        bottom, top = inp[:2]
+        height, width = inp[2:] or (None, None)
+        weights, = out_
+        direction = "backprop weights"
+        return super(CorrMM_gradWeights, self).c_code_helper(
+            node, bottom, weights, top, direction, sub, height, width)
+
+    def grad(self, inp, grads):
+        bottom, top = inp[:2]
+        weights, = grads
+        d_bottom = CorrMM_gradInputs(self.border_mode, self.subsample)(
+            weights, top, bottom.shape[-2:])
+        d_top = CorrMM(self.border_mode, self.subsample)(bottom, weights)
+        d_height_width = ((DisconnectedType()(),) * 2
+                          if len(inp) == 4 else ())
+        return (d_bottom, d_top) + d_height_width
+
+    def connection_pattern(self, node):
+        if node.nin == 2:
+            return [[1], [1]]
+        else:
+            return [[1], [1], [0], [0]]  # no connection to height, width
+
+
+class CorrMM_gradInputs(BaseCorrMM):
+    """
+    Gradient wrt. inputs for `CorrMM`.
+
+    Notes
+    -----
+    You will not want to use this directly, but rely on Theano's automatic
+    differentiation or graph optimization to use it as needed.
+
+    """
+
+    def make_node(self, kern, topgrad, shape=None):
+        kern = as_tensor_variable(kern)
+        topgrad = as_tensor_variable(topgrad)
+        self._check_inputs(kern, topgrad, ('kern', 'topgrad'))
+        if self.subsample != (1, 1) and shape is None:
+            raise ValueError('shape must be given if subsample != (1, 1)')
+        if self.subsample != (1, 1):
+            height_width = [as_tensor_variable(shape[0]).astype('int64'),
+                            as_tensor_variable(shape[1]).astype('int64')]
+        else:
+            height_width = []
+
+        broadcastable = [topgrad.type.broadcastable[0],
+                         kern.type.broadcastable[1], False, False]
+        return Apply(self, [kern, topgrad] + height_width,
+                     [TensorType(kern.type.dtype, broadcastable)()])
+
+    def infer_shape(self, node, input_shapes):
+        kshp, topshp = input_shapes[:2]
+        dH, dW = self.subsample
+        padH, padW = self._pads(kshp[2:])
+        if dH != 1:
+            height = node.inputs[2]
+        else:
+            height = (topshp[2] - 1) * dH + kshp[2] - 2 * padH
+        if dW != 1:
+            width = node.inputs[3]
+        else:
+            width = (topshp[3] - 1) * dW + kshp[3] - 2 * padW
+        return [(topshp[0], kshp[1], height, width)]
+
+    def c_code(self, node, nodename, inp, out_, sub):
+        weights, top = inp[:2]
+        height, width = inp[2:] or (None, None)
+        bottom, = out_
+        direction = "backprop inputs"
+        return super(CorrMM_gradInputs, self).c_code_helper(
+            node, bottom, weights, top, direction, sub, height, width)
+
+    def grad(self, inp, grads):
+        weights, top = inp[:2]
+        bottom, = grads
+        d_weights = CorrMM_gradWeights(self.border_mode, self.subsample)(
+            bottom, top, weights.shape[-2:])
+        d_top = CorrMM(self.border_mode, self.subsample)(bottom, weights)
+        d_height_width = ((DisconnectedType()(),) * 2
+                          if len(inp) == 4 else ())
+        return (d_weights, d_top) + d_height_width
+
+    def connection_pattern(self, node):
+        if node.nin == 2:
+            return [[1], [1]]
+        else:
+            return [[1], [1], [0], [0]]  # no connection to height, width
+
+
+@local_optimizer([ConvOp])
+def local_conv2d_gemm(node):
+    """
+    Replace the `ConvOp` of conv2d and of its gradient by `CorrMM` or one of
+    its gradients.
+
+    The `ConvOp` that insert zeros in their inputs (logical shapes that
+    differ from the physical ones, in the gradient of a subsampled
+    convolution) are kept, as are those chosen by the ``conv_meta``
+    optimizer.
+
+    """
+    op = node.op
+    if (not isinstance(op, ConvOp) or
+            getattr(node.outputs[0].tag, 'conv_autotuned', False)):
+        return
+    img, kern = node.inputs
+    if (img.type.dtype not in ('float32', 'float64') or
+            img.type.dtype != kern.type.dtype or
+            not theano.config.cxx or not blas.ldflags()):
+        return
+    if (op.imshp != op.imshp_logical or op.kshp != op.kshp_logical or
+            op.out_mode not in ('valid', 'full')):
+        return
+    border_mode = op.out_mode
+    subsample = (op.dx, op.dy)
+    if border_mode == 'valid' or subsample != (1, 1):
+        # need to flip the kernel for valid convolution
+        kern = kern[:, :, ::-1, ::-1]
+        # By default use CorrMM
+        rval = CorrMM(border_mode, subsample)(img, kern)
+
+        # call CorrMM_gradWeights if good
+        # (the latter is faster if batchsize * kernelHeight * kernelWidth
+        # is larger than inputChannels * outputHeight * outputWidth.
+        # ConvOp does not always store information on the batchsize and
+        # channels, though, so we only use what information we have.)
+        if (border_mode == 'valid' and subsample == (1, 1) and
+                None not in op.imshp[-2:] and None not in op.kshp):
+            # we know the kernel and output size
+            prod1 = op.kshp[0] * op.kshp[1]
+            prod2 = ((op.imshp[-2] - op.kshp[0] + 1) *
+                     (op.imshp[-1] - op.kshp[1] + 1))
+            if op.bsize is not None and op.imshp[0] is not None:
+                # we also know batchsize and input channels
+                prod1 *= op.bsize
+                prod2 *= op.imshp[0]
+            # compare to decide
+            if prod1 > prod2:
+                rval = CorrMM_gradWeights(border_mode, subsample)(
+                    img.dimshuffle(1, 0, 2, 3),
+                    kern.dimshuffle(1, 0, 2, 3)).dimshuffle(1, 0, 2, 3)
+    else:
+        # need to dimshuffle the kernel for full convolution
+        kern = kern.dimshuffle(1, 0, 2, 3)
+        # call CorrMM_gradInputs
+        rval = CorrMM_gradInputs('valid', subsample)(kern, img)
+    if node.outputs[0].broadcastable != rval.broadcastable:
+        # ConvOp may know that the output rows or columns are broadcastable.
+        rval = patternbroadcast(rval, node.outputs[0].broadcastable)
+    return [rval]
+
+register_specialize_device(local_conv2d_gemm, 'conv_gemm')
@@ -0,0 +1,292 @@
+// This uses a lot of code from Caffe (http://caffe.berkeleyvision.org/);
+// sources are clearly marked. Below we reproduce the original license of
+// the Caffe software.
+/*
+Copyright (c) 2014, The Regents of the University of California (Regents)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+*/
+
+// The BLAS gemm for each of the two dtypes, with the arguments by value.
+inline void corr_gemm(char transa, char transb, int m, int n, int k,
+                      float alpha, const float* a, int lda,
+                      const float* b, int ldb,
+                      float beta, float* c, int ldc)
+{
+    sgemm_(&transa, &transb, &m, &n, &k, &alpha, a, &lda, b, &ldb,
+           &beta, c, &ldc);
+}
+
+inline void corr_gemm(char transa, char transb, int m, int n, int k,
+                      double alpha, const double* a, int lda,
+                      const double* b, int ldb,
+                      double beta, double* c, int ldc)
+{
+    dgemm_(&transa, &transb, &m, &n, &k, &alpha, a, &lda, b, &ldb,
+           &beta, c, &ldc);
+}
+
+// The range [*start, *end) of the output columns w for which the input
+// column w * stride - pad + offset falls inside [0, width).
+inline void corr_col_range(const int width, const int width_col,
+                           const int pad, const int stride, const int offset,
+                           int* start, int* end)
+{
+    int lo = pad - offset;
+    int hi = width + pad - offset;
+    *start = lo <= 0 ? 0 : (lo + stride - 1) / stride;
+    *end = hi <= 0 ? 0 : (hi + stride - 1) / stride;
+    if (*start > width_col)
+        *start = width_col;
+    if (*end > width_col)
+        *end = width_col;
+    if (*end < *start)
+        *end = *start;
+}
+
+// (borrowed from Caffe: https://github.com/BVLC/caffe/blob/master/src/caffe/util/im2col.cpp)
+// Unfold the patches of an image of shape (channels, height, width) into
+// the columns of data_col, of shape
+// (channels * kernel_h * kernel_w, height_col * width_col).
+// The padding of the rows and columns is handled once per row instead of
+// for each element, and the rows are copied with memcpy when stride_w is 1.
+template<typename T>
+void corr_im2col(const T* data_im, const int channels,
+                 const int height, const int width,
+                 const int kernel_h, const int kernel_w,
+                 const int pad_h, const int pad_w,
+                 const int stride_h, const int stride_w,
+                 T* data_col, const bool parallel)
+{
+    const int height_col = (height + 2 * pad_h - kernel_h) / stride_h + 1;
+    const int width_col = (width + 2 * pad_w - kernel_w) / stride_w + 1;
+    const int channels_col = channels * kernel_h * kernel_w;
+    #pragma omp parallel for schedule(static) if (parallel)
+    for (int c = 0; c < channels_col; ++c) {
+        const int w_offset = c % kernel_w;
+        const int h_offset = (c / kernel_w) % kernel_h;
+        const int c_im = c / kernel_h / kernel_w;
+        int w_start, w_end;
+        corr_col_range(width, width_col, pad_w, stride_w, w_offset,
+                       &w_start, &w_end);
+        for (int h = 0; h < height_col; ++h) {
+            const int h_pad = h * stride_h - pad_h + h_offset;
+            T* col = data_col + ((npy_intp)c * height_col + h) * width_col;
+            if (h_pad < 0 || h_pad >= height) {
+                memset(col, 0, width_col * sizeof(T));
+                continue;
+            }
+            const T* im = data_im + ((npy_intp)c_im * height + h_pad) * width
+                          - pad_w + w_offset;
+            for (int w = 0; w < w_start; ++w)
+                col[w] = 0;
+            if (stride_w == 1) {
+                memcpy(col + w_start, im + w_start,
+                       (w_end - w_start) * sizeof(T));
+            }
+            else {
+                for (int w = w_start; w < w_end; ++w)
+                    col[w] = im[w * stride_w];
+            }
+            for (int w = w_end; w < width_col; ++w)
+                col[w] = 0;
+        }
+    }
+}
+
+// (borrowed from Caffe: https://github.com/BVLC/caffe/blob/master/src/caffe/util/im2col.cpp)
+// The reverse of corr_im2col: sum the columns of data_col into the
+// image data_im. Each channel of the image is written by one thread.
+template<typename T>
+void corr_col2im(const T* data_col, const int channels,
+                 const int height, const int width,
+                 const int patch_h, const int patch_w,
+                 const int pad_h, const int pad_w,
+                 const int stride_h, const int stride_w,
+                 T* data_im, const bool parallel)
+{
+    const int height_col = (height + 2 * pad_h - patch_h) / stride_h + 1;
+    const int width_col = (width + 2 * pad_w - patch_w) / stride_w + 1;
+    #pragma omp parallel for schedule(static) if (parallel)
+    for (int c_im = 0; c_im < channels; ++c_im) {
+        memset(data_im + (npy_intp)c_im * height * width, 0,
+               (npy_intp)height * width * sizeof(T));
+        for (int h_offset = 0; h_offset < patch_h; ++h_offset) {
+            for (int w_offset = 0; w_offset < patch_w; ++w_offset) {
+                const int c = (c_im * patch_h + h_offset) * patch_w + w_offset;
+                int w_start, w_end;
+                corr_col_range(width, width_col, pad_w, stride_w, w_offset,
+                               &w_start, &w_end);
+                for (int h = 0; h < height_col; ++h) {
+                    const int h_pad = h * stride_h - pad_h + h_offset;
+                    if (h_pad < 0 || h_pad >= height)
+                        continue;
+                    const T* col = data_col
+                                   + ((npy_intp)c * height_col + h) * width_col;
+                    T* im = data_im + ((npy_intp)c_im * height + h_pad) * width
+                            - pad_w + w_offset;
+                    for (int w = w_start; w < w_end; ++w)
+                        im[w * stride_w] += col[w];
+                }
+            }
+        }
+    }
+}
+
+
+// Theano op code
+// Reference code: https://github.com/BVLC/caffe/blob/master/src/caffe/layers/conv_layer.cpp
+//   and the GPU version in theano/sandbox/cuda/corr_gemm.cu
+// bottom, weight and top must be C-contiguous arrays of the dtype T.
+// Depending on the direction, top, weight or bottom is the output.
+// Return 0, or -1 with a Python error set.
+template<typename T>
+int corrMM(PyArrayObject* bottom, PyArrayObject* weight, PyArrayObject* top,
+           const int direction, const int dH, const int dW,
+           const int padH, const int padW, const bool parallel)
+{
+    // Extract some shape information for later and check shape consistency
+    // bottom: (batchSize, nChannels, bottomHeight, bottomWidth)
+    const npy_intp batchSize = PyArray_DIMS(bottom)[0];
+    const npy_intp nChannels = PyArray_DIMS(bottom)[1];
+    const npy_intp bottomHeight = PyArray_DIMS(bottom)[2];
+    const npy_intp bottomWidth = PyArray_DIMS(bottom)[3];
+    // weights: (nFilters, nChannels, rows, columns)
+    const npy_intp nFilters = PyArray_DIMS(weight)[0];
+    const npy_intp kH = PyArray_DIMS(weight)[2];
+    const npy_intp kW = PyArray_DIMS(weight)[3];
+    if (nChannels != PyArray_DIMS(weight)[1]) {
+        PyErr_SetString(PyExc_ValueError,
+                "CorrMM images and kernel must have the same stack size\n");
+        return -1;
+    }
+    // top: (batchSize, nFilters, topHeight, topWidth)
+    const npy_intp topHeight = (bottomHeight + 2*padH - kH) / dH + 1;
+    const npy_intp topWidth  = (bottomWidth + 2*padW - kW) / dW + 1;
+    if (batchSize != PyArray_DIMS(top)[0] ||
+            nFilters != PyArray_DIMS(top)[1] ||
+            topHeight != PyArray_DIMS(top)[2] ||
+            topWidth != PyArray_DIMS(top)[3] ||
+            topHeight <= 0 || topWidth <= 0) {
+        PyErr_Format(PyExc_ValueError,
+                "CorrMM shape inconsistency:\n"
+                "  bottom shape: %lld %lld %lld %lld\n"
+                "  weight shape: %lld %lld %lld %lld\n"
+                "  top shape: %lld %lld %lld %lld (expected %lld %lld %lld %lld)\n",
+                (long long)batchSize, (long long)nChannels,
+                (long long)bottomHeight, (long long)bottomWidth,
+                (long long)nFilters, (long long)nChannels,
+                (long long)kH, (long long)kW,
+                (long long)PyArray_DIMS(top)[0], (long long)PyArray_DIMS(top)[1],
+                (long long)PyArray_DIMS(top)[2], (long long)PyArray_DIMS(top)[3],
+                (long long)batchSize, (long long)nFilters,
+                (long long)topHeight, (long long)topWidth);
+        return -1;
+    }
+
+    // Define some useful variables
+    // The unrolled patches of one image are a K_ x N_ matrix, the filters a
+    // M_ x K_ one and the output of one image a M_ x N_ one.
+    const npy_intp K_ = nChannels * kH * kW;
+    const npy_intp N_ = topHeight * topWidth;
+    const npy_intp M_ = nFilters;
+    if (K_ > INT_MAX || N_ > INT_MAX || M_ > INT_MAX ||
+            bottomHeight > INT_MAX / (bottomWidth ? bottomWidth : 1)) {
+        PyErr_SetString(PyExc_ValueError,
+                        "CorrMM: the images are too large for BLAS");
+        return -1;
+    }
+    PyArrayObject* output = (direction == 0) ? top :
+                            (direction == 1) ? weight : bottom;
+    if (batchSize == 0 || K_ == 0 || M_ == 0) {
+        memset(PyArray_DATA(output), 0, PyArray_NBYTES(output));
+        return 0;
+    }
+
+    // Create temporary columns
+    npy_intp col_dim[2];
+    col_dim[0] = K_;
+    col_dim[1] = N_;
+    PyArrayObject* col = (PyArrayObject*)PyArray_EMPTY(
+        2, col_dim, PyArray_TYPE(bottom), 0);
+    if (NULL == col) {
+        PyErr_Format(PyExc_MemoryError,
+                "CorrMM failed to allocate working memory of %lld x %lld\n",
+                (long long)col_dim[0], (long long)col_dim[1]);
+        return -1;
+    }
+    T* col_data = (T*)PyArray_DATA(col);
+    T* bottom_data = (T*)PyArray_DATA(bottom);
+    T* weight_data = (T*)PyArray_DATA(weight);
+    T* top_data = (T*)PyArray_DATA(top);
+    const npy_intp bottom_stride = nChannels * bottomHeight * bottomWidth;
+    const npy_intp top_stride = M_ * N_;
+
+    if (direction == 0) {  // forward pass
+        // valid correlation: im2col, then gemm
+        // Iterate over batch
+        for (npy_intp n = 0; n < batchSize; n++) {
+            // First, im2col
+            corr_im2col(bottom_data + n * bottom_stride, nChannels,
+                        bottomHeight, bottomWidth, kH, kW, padH, padW, dH, dW,
+                        col_data, parallel);
+            // Second, gemm: top[n] = weight x col, in row-major order.
+            corr_gemm('N', 'N', N_, M_, K_, (T)1,
+                      col_data, N_, weight_data, K_,
+                      (T)0, top_data + n * top_stride, N_);
+        }
+    }
+    else if (direction == 1) {  // backprop wrt. weights
+        // valid convolution: im2col, then gemm
+        // Iterate over batch
+        for (npy_intp n = 0; n < batchSize; n++) {
+            // First, im2col
+            corr_im2col(bottom_data + n * bottom_stride, nChannels,
+                        bottomHeight, bottomWidth, kH, kW, padH, padW, dH, dW,
+                        col_data, parallel);
+            // Second, gemm: weight += top[n] x col^T.
+            // Note that we accumulate into weight. We do so by setting
+            // beta = 0 for the first iteration and beta = 1 for subsequent
+            // ones. (This is faster than setting weight to all zeros before
+            // the loop.)
+            corr_gemm('T', 'N', K_, M_, N_, (T)1,
+                      col_data, N_, top_data + n * top_stride, N_,
+                      (n == 0) ? (T)0 : (T)1, weight_data, K_);
+        }
+    }
+    else if (direction == 2) {  // backprop wrt. inputs
+        // full convolution: gemm, then col2im
+        // Iterate over batch
+        for (npy_intp n = 0; n < batchSize; n++) {
+            // gemm into columns: col = weight^T x top[n].
+            corr_gemm('N', 'T', N_, K_, M_, (T)1,
+                      top_data + n * top_stride, N_, weight_data, K_,
+                      (T)0, col_data, N_);
+            // col2im back to the data
+            corr_col2im(col_data, nChannels, bottomHeight, bottomWidth,
+                        kH, kW, padH, padW, dH, dW,
+                        bottom_data + n * bottom_stride, parallel);
+        }
+    }
+    Py_DECREF(col);
+    return 0;
+}
@@ -0,0 +1,260 @@
+"""
+Convolution of a mini-batch of images with a set of filters on the CPU,
+through the FFT of numpy.
+
+The cost of the direct convolution, and of `CorrMM`, grows with the product
+of the image and filter sizes, while that of the FFT one mostly grows with
+the image size. By default, `local_conv2d_fft_cheaper` replaces the
+`ConvOp` of conv2d by `FFTConv` when its shapes are known and a cost model
+says the FFT is cheaper, which happens for large filters, e.g. the long 1-D
+filters of audio. Include the ``conv_fft`` optimization to use it for all
+the convolutions without subsampling, exclude it to never use it.
+
+"""
+from __future__ import absolute_import
+
+import math
+
+import numpy
+
+from theano import Apply, gof
+from theano.compile import optdb
+from theano.gof import local_optimizer, shapes_nbytes
+from theano.tensor import as_tensor_variable, patternbroadcast, TensorType
+from theano.tensor.opt import in2out
+from theano.tensor.nnet.conv import ConvOp
+
+# How many flops of the direct convolution one flop of the FFT convolution
+# costs. The FFT of numpy is single-threaded and slower per flop than the
+# BLAS gemm of CorrMM; FFTConv starts to be faster than CorrMM around 12 to
+# 16.
+FFT_FLOP_COST = 16.
+
+
+def fft_size(n):
+    """
+    Return the smallest integer not smaller than `n` with no prime factor
+    other than 2, 3 and 5, for which the FFT is fast.
+
+    """
+    best = 2 ** int(math.ceil(math.log(n, 2)))
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            size = p35
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def fft_flops(image_shape, filter_shape):
+    """
+    Estimate the flops of `FFTConv` for these shapes.
+
+    """
+    b, c, h, w = image_shape
+    k, _, kh, kw = filter_shape
+    fh, fw = fft_size(h + kh - 1), fft_size(w + kw - 1)
+    n = fh * fw
+    # the spectra of the images, of the filters and of the outputs
+    flops = (b * c + k * c + b * k) * 2.5 * n * math.log(max(n, 2), 2)
+    # one complex multiply-add per frequency, image, filter and channel
+    flops += 8 * b * k * c * fh * (fw // 2 + 1)
+    return flops
+
+
+def fft_cheaper(image_shape, filter_shape, border_mode='valid'):
+    """
+    Return True if `FFTConv` should be faster than the direct convolution
+    for these shapes.
+
+    """
+    b, c, h, w = image_shape
+    k, _, kh, kw = filter_shape
+    out_shp = ConvOp.getOutputShape((h, w), (kh, kw), (1, 1), border_mode)
+    direct = 2 * b * k * c * out_shp[0] * out_shp[1] * kh * kw
+    return FFT_FLOP_COST * fft_flops(image_shape, filter_shape) < direct
+
+
+class FFTConv(gof.Op):
+    """
+    Convolution of a mini-batch of images with a set of filters, computed
+    with the FFT.
+
+    Like :func:`conv2d <theano.tensor.nnet.conv.conv2d>`, this flips the
+    filters. The spectrum of each filter is computed once per call and used
+    for all the images of the batch, and the sum over the input channels is
+    one product of matrices per frequency.
+
+    Parameters
+    ----------
+    border_mode : {'valid', 'full'}
+
+    Notes
+    -----
+    The inputs are (batch size, channels, rows, columns) images and (number
+    of filters, channels, rows, columns) filters. For 1-D signals, use one
+    row.
+
+    """
+
+    __props__ = ('border_mode',)
+
+    def __init__(self, border_mode='valid'):
+        if border_mode not in ('valid', 'full'):
+            raise ValueError('invalid border_mode {}, which must be either '
+                             '"valid" or "full"'.format(border_mode))
+        self.border_mode = border_mode
+
+    def make_node(self, img, kern):
+        img = as_tensor_variable(img)
+        kern = as_tensor_variable(kern)
+        if img.type.ndim != 4:
+            raise TypeError('img must be 4D tensor')
+        if kern.type.ndim != 4:
+            raise TypeError('kern must be 4D tensor')
+        if (img.type.dtype not in ('float32', 'float64') or
+                img.type.dtype != kern.type.dtype):
+            raise TypeError('FFTConv needs img and kern of the same float '
+                            'dtype', img.type.dtype, kern.type.dtype)
+        broadcastable = [img.type.broadcastable[0], kern.type.broadcastable[0],
+                         False, False]
+        return Apply(self, [img, kern],
+                     [TensorType(img.type.dtype, broadcastable)()])
+
+    def infer_shape(self, node, input_shapes):
+        imshp, kshp = input_shapes
+        if self.border_mode == 'valid':
+            return [(imshp[0], kshp[0],
+                     imshp[2] - kshp[2] + 1, imshp[3] - kshp[3] + 1)]
+        return [(imshp[0], kshp[0],
+                 imshp[2] + kshp[2] - 1, imshp[3] + kshp[3] - 1)]
+
+    def flops(self, inp, outp):
+        """
+        Useful with the hack in profilemode to print the MFlops.
+
+        """
+        return fft_flops(*inp)
+
+    def cost(self, node, input_shapes, output_shapes):
+        return (self.flops(input_shapes, output_shapes),
+                shapes_nbytes(node.inputs, input_shapes),
+                shapes_nbytes(node.outputs, output_shapes))
+
+    def perform(self, node, inp, out_):
+        img, kern = inp
+        out, = out_
+        if img.shape[1] != kern.shape[1]:
+            raise ValueError('FFTConv: img and kern have a different number '
+                             'of channels', img.shape, kern.shape)
+        h, w = img.shape[2:]
+        kh, kw = kern.shape[2:]
+        if self.border_mode == 'valid' and (kh > h or kw > w):
+            raise ValueError('FFTConv: kern larger than img in valid mode',
+                             img.shape, kern.shape)
+        full_shp = (h + kh - 1, w + kw - 1)
+        fft_shp = tuple(fft_size(s) for s in full_shp)
+        # One spectrum per filter, used for all the images.
+        kern_f = numpy.fft.rfft2(kern, fft_shp)
+        img_f = numpy.fft.rfft2(img, fft_shp)
+        # (rows, columns, batch, channels) x (rows, columns, channels, kern)
+        out_f = numpy.matmul(img_f.transpose(2, 3, 0, 1),
+                             kern_f.transpose(2, 3, 1, 0))
+        full = numpy.fft.irfft2(out_f.transpose(2, 3, 0, 1), fft_shp)
+        if self.border_mode == 'valid':
+            full = full[:, :, kh - 1:h, kw - 1:w]
+        else:
+            full = full[:, :, :full_shp[0], :full_shp[1]]
+        out[0] = numpy.ascontiguousarray(full,
+                                         dtype=node.outputs[0].type.dtype)
+
+    def grad(self, inp, grads):
+        img, kern = inp
+        top, = grads
+        flipped_img = img[:, :, ::-1, ::-1]
+        flipped_kern = kern[:, :, ::-1, ::-1].dimshuffle(1, 0, 2, 3)
+        if self.border_mode == 'valid':
+            d_img = FFTConv('full')(top, flipped_kern)
+            d_kern = FFTConv('valid')(
+                flipped_img.dimshuffle(1, 0, 2, 3),
+                top.dimshuffle(1, 0, 2, 3)).dimshuffle(1, 0, 2, 3)
+        else:
+            d_img = FFTConv('valid')(top, flipped_kern)
+            d_kern = FFTConv('valid')(top.dimshuffle(1, 0, 2, 3),
+                                      flipped_img.dimshuffle(1, 0, 2, 3))
+        d_img = patternbroadcast(d_img, img.broadcastable)
+        d_kern = patternbroadcast(d_kern, kern.broadcastable)
+        return d_img, d_kern
+
+
+def conv2d_fft(input, filters, border_mode='valid'):
+    """
+    Convolve `input` with `filters` through the FFT, like
+    :func:`conv2d <theano.tensor.nnet.conv.conv2d>` without subsampling.
+
+    Parameters
+    ----------
+    input
+        (batch size, channels, rows, columns).
+    filters
+        (number of filters, channels, rows, columns).
+    border_mode : {'valid', 'full'}
+
+    """
+    return FFTConv(border_mode)(input, filters)
+
+
+@local_optimizer([ConvOp])
+def local_conv2d_fft(node):
+    """
+    Replace the `ConvOp` of conv2d and of its gradient by `FFTConv`.
+
+    The `ConvOp` with subsampling, that insert zeros in their inputs, that
+    were created with ``version='no_fft'`` or chosen by the ``conv_meta``
+    optimizer are kept.
+
+    """
+    op = node.op
+    if (not isinstance(op, ConvOp) or not op.fft_opt or
+            getattr(node.outputs[0].tag, 'conv_autotuned', False)):
+        return
+    img, kern = node.inputs
+    if (img.type.dtype not in ('float32', 'float64') or
+            img.type.dtype != kern.type.dtype):
+        return
+    if (op.imshp != op.imshp_logical or op.kshp != op.kshp_logical or
+            (op.dx, op.dy) != (1, 1)):
+        return
+    rval = FFTConv(op.out_mode)(img, kern)
+    if node.outputs[0].broadcastable != rval.broadcastable:
+        rval = patternbroadcast(rval, node.outputs[0].broadcastable)
+    return [rval]
+
+
+@local_optimizer([ConvOp])
+def local_conv2d_fft_cheaper(node):
+    """
+    Replace a `ConvOp` by `FFTConv` if its shapes are known and
+    `fft_cheaper` says so.
+
+    """
+    op = node.op
+    if (not isinstance(op, ConvOp) or
+            not op.has_all_shape(op.imshp, op.kshp, op.nkern, op.bsize) or
+            not fft_cheaper((op.bsize,) + op.imshp,
+                            (op.nkern, op.imshp[0]) + op.kshp,
+                            op.out_mode)):
+        return
+    return local_conv2d_fft.transform(node)
+
+# After conv_meta (48.55), and before local_conv2d_gemm in specialize_device
+# (48.6).
+optdb.register('local_conv2d_fft', in2out(local_conv2d_fft), 48.57,
+               'conv_fft')
+optdb.register('local_conv2d_fft_cheaper', in2out(local_conv2d_fft_cheaper),
+               48.58, 'fast_run', 'conv_fft')
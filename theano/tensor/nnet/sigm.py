@@ -16,6 +16,7 @@ from theano import config, gof, printing, scalar
 from theano.compat import imap
 from theano.configparser import AddConfigVar, BoolParam
 from theano.printing import pprint
+from theano.scalar import approx
 from theano.tensor import basic as tensor
 from theano.tensor import elemwise, opt, NotScalarConstantError
 
@@ -364,6 +365,7 @@ class ScalarSoftplus(scalar.UnaryScalarOp):
 scalar_softplus = ScalarSoftplus(scalar.upgrade_to_float,
                                  name='scalar_softplus')
 softplus = elemwise.Elemwise(scalar_softplus, name='softplus')
+approx.approximations[ScalarSoftplus] = approx.FastSoftplus
 
 pprint.assign(softplus, printing.FunctionPrinter('softplus'))
 
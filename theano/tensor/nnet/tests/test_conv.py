@@ -13,7 +13,10 @@ from theano.tensor.basic import _allclose, NotScalarConstantError
 
 
 class TestConv2D(utt.InferShapeTester):
-    mode = None
+    # Test ConvOp itself, not the CorrMM or FFTConv that replace it by
+    # default.
+    mode = theano.compile.get_default_mode().excluding('conv_gemm',
+                                                       'conv_fft')
     dtype = theano.config.floatX
 
     def setUp(self):
@@ -455,21 +458,25 @@ class TestConv2D(utt.InferShapeTester):
 
         im = T.ftensor4()
         out = theano.function([im],
-                              T.nnet.conv2d(im, k, image_shape=(1, 1, 10, 10)))
+                              T.nnet.conv2d(im, k, image_shape=(1, 1, 10, 10)),
+                              mode=self.mode)
         self.assertRaises(ValueError, out, numpy.ones((1, 1, 20, 10),
                                                       dtype='float32'))
         out = theano.function([im],
-                              T.nnet.conv2d(im, k, filter_shape=(1, 1, 3, 2)))
+                              T.nnet.conv2d(im, k, filter_shape=(1, 1, 3, 2)),
+                              mode=self.mode)
         self.assertRaises(ValueError, out, numpy.ones((1, 1, 10, 10),
                                                       dtype='float32'))
         out = theano.function([im],
                               T.nnet.conv2d(im, k, filter_shape=(2, None,
-                                                                 None, None)))
+                                                                 None, None)),
+                              mode=self.mode)
         self.assertRaises(ValueError, out, numpy.ones((1, 1, 10, 10),
                                                       dtype='float32'))
         out = theano.function([im],
                               T.nnet.conv2d(im, k, image_shape=(1, None,
-                                                                None, None)))
+                                                                None, None)),
+                              mode=self.mode)
         self.assertRaises(ValueError, out, numpy.ones((2, 1, 10, 10),
                                                       dtype='float32'))
 
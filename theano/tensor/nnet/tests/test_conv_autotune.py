@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from nose.plugins.skip import SkipTest
+
+import theano
+import theano.tensor as T
+from theano.tests import unittest_tools as utt
+from theano.tensor.nnet import conv, conv_autotune, corr
+
+
+class TestConvAutotune(unittest.TestCase):
+    image_shape = (2, 3, 9, 8)
+    filter_shape = (4, 3, 3, 2)
+
+    def setUp(self):
+        if not theano.config.cxx:
+            raise SkipTest("Needs a c++ compiler")
+        if theano.config.mode == "FAST_COMPILE":
+            raise SkipTest("The conv_meta optimization is not run in "
+                           "FAST_COMPILE")
+        utt.seed_rng()
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_choices_file = conv_autotune.choices_file
+        conv_autotune.choices_file = lambda: os.path.join(self.tmpdir,
+                                                          'choices.pkl')
+        conv_autotune._choices = None
+        self.mode = theano.compile.get_default_mode().including('conv_meta')
+        self.image = T.tensor4('image')
+        self.filters = T.tensor4('filters')
+        self.image_data = numpy.random.random(
+            self.image_shape).astype(theano.config.floatX)
+        self.filter_data = numpy.random.random(
+            self.filter_shape).astype(theano.config.floatX)
+
+    def tearDown(self):
+        conv_autotune.choices_file = self.orig_choices_file
+        conv_autotune._choices = None
+        shutil.rmtree(self.tmpdir)
+
+    def conv2d(self, border_mode='valid'):
+        return conv.conv2d(self.image, self.filters,
+                           image_shape=self.image_shape,
+                           filter_shape=self.filter_shape,
+                           border_mode=border_mode)
+
+    def check(self, out, f):
+        ref = theano.function(
+            [self.image, self.filters], out,
+            mode=self.mode.excluding('conv_meta', 'conv_gemm'))
+        utt.assert_allclose(ref(self.image_data, self.filter_data),
+                            f(self.image_data, self.filter_data))
+
+    def key(self, border_mode):
+        return (self.image_shape, self.filter_shape, (1, 1), border_mode,
+                theano.config.floatX, None)
+
+    def test_tune(self):
+        for border_mode in ['valid', 'full']:
+            out = self.conv2d(border_mode)
+            f = theano.function([self.image, self.filters], out,
+                                mode=self.mode)
+            self.check(out, f)
+            choices = conv_autotune._load_choices()
+            names = [str(o) for o in conv_autotune.conv_metaopt.optimizers]
+            assert choices[self.key(border_mode)] in names
+
+    def test_cached_choice(self):
+        # The choice in the file is used without timing the candidates.
+        def benchmark(node, givens):
+            raise AssertionError("The candidates were timed")
+        conv_autotune.conv_metaopt.benchmark = benchmark
+        try:
+            for choice, op_type in [('local_conv2d_gemm', corr.BaseCorrMM),
+                                    ('conv_unroll_2_2', conv.ConvOp)]:
+                conv_autotune._save_choices({self.key('valid'): choice})
+                conv_autotune._choices = None
+                out = self.conv2d()
+                f = theano.function([self.image, self.filters], out,
+                                    mode=self.mode)
+                ops = [node.op for node in f.maker.fgraph.toposort()
+                       if isinstance(node.op, (conv.ConvOp, corr.BaseCorrMM))]
+                assert len(ops) == 1 and isinstance(ops[0], op_type), ops
+                if op_type is conv.ConvOp:
+                    assert ops[0].unroll_batch == 2
+                    assert ops[0].unroll_kern == 2
+                self.check(out, f)
+        finally:
+            del conv_autotune.conv_metaopt.benchmark
+
+    def test_unknown_shapes(self):
+        # Without shapes, nothing is tuned.
+        out = conv.conv2d(self.image, self.filters)
+        f = theano.function([self.image, self.filters], out, mode=self.mode)
+        self.check(out, f)
+        assert conv_autotune._load_choices() == {}
@@ -0,0 +1,171 @@
+from nose.plugins.skip import SkipTest
+import numpy
+
+import theano
+import theano.tensor as T
+from theano.tests import unittest_tools as utt
+from theano.tensor.nnet import conv, corr
+
+
+class TestCorr2D(utt.InferShapeTester):
+    mode = None
+    dtype = theano.config.floatX
+
+    def setUp(self):
+        super(TestCorr2D, self).setUp()
+        self.input = T.tensor4('input', dtype=self.dtype)
+        self.filters = T.tensor4('filters', dtype=self.dtype)
+        if not theano.config.cxx or not theano.tensor.blas.ldflags():
+            raise SkipTest("CorrMM needs a c++ compiler and a BLAS library")
+
+    def validate(self, image_shape, filter_shape,
+                 border_mode='valid', subsample=(1, 1), verify_grad=True):
+        """
+        Compare CorrMM to a correlation computed with numpy.
+
+        """
+        image_data = numpy.random.random(image_shape).astype(self.dtype)
+        filter_data = numpy.random.random(filter_shape).astype(self.dtype)
+
+        op = corr.CorrMM(border_mode, subsample)
+        f = theano.function([self.input, self.filters],
+                            op(self.input, self.filters), mode=self.mode)
+        out = f(image_data, filter_data)
+
+        pad_h, pad_w = op._pads(filter_shape[2:])
+        padded = numpy.zeros((image_shape[0], image_shape[1],
+                              image_shape[2] + 2 * pad_h,
+                              image_shape[3] + 2 * pad_w), dtype=self.dtype)
+        padded[:, :, pad_h:pad_h + image_shape[2],
+               pad_w:pad_w + image_shape[3]] = image_data
+        ref = numpy.zeros((image_shape[0], filter_shape[0],
+                           padded.shape[2] - filter_shape[2] + 1,
+                           padded.shape[3] - filter_shape[3] + 1))
+        for i in range(ref.shape[2]):
+            for j in range(ref.shape[3]):
+                patch = padded[:, :, i:i + filter_shape[2],
+                               j:j + filter_shape[3]]
+                ref[:, :, i, j] = numpy.tensordot(
+                    patch, filter_data, axes=([1, 2, 3], [1, 2, 3]))
+        ref = ref[:, :, ::subsample[0], ::subsample[1]]
+        utt.assert_allclose(ref, out)
+
+        if verify_grad:
+            utt.verify_grad(corr.CorrMM(border_mode, subsample),
+                            [image_data, filter_data], mode=self.mode)
+
+    def test_basic(self):
+        self.validate((3, 2, 8, 8), (4, 2, 5, 5), 'valid')
+        self.validate((3, 2, 7, 5), (5, 2, 2, 3), 'valid')
+        self.validate((3, 2, 7, 5), (5, 2, 3, 2), 'full')
+        self.validate((1, 1, 6, 6), (1, 1, 6, 6), 'valid')
+
+    def test_border_mode(self):
+        self.validate((2, 3, 7, 6), (4, 3, 3, 3), 'half')
+        self.validate((2, 3, 7, 6), (4, 3, 3, 3), (1, 2))
+        self.validate((2, 3, 7, 6), (4, 3, 2, 2), 3)
+        self.assertRaises(ValueError, corr.CorrMM, 'same')
+        self.assertRaises(ValueError, corr.CorrMM, (-1, 0))
+
+    def test_subsample(self):
+        self.validate((3, 2, 7, 5), (5, 2, 2, 3), 'valid', (2, 2))
+        self.validate((3, 2, 7, 5), (5, 2, 2, 3), 'full', (3, 2))
+        self.validate((3, 2, 7, 5), (5, 2, 3, 3), 'half', (1, 3))
+        self.validate((3, 2, 7, 5), (5, 2, 2, 2), (1, 1), (2, 3))
+
+    def test_gradweights_gradinputs(self):
+        image_data = numpy.random.random((3, 2, 7, 6)).astype(self.dtype)
+        filter_data = numpy.random.random((4, 2, 3, 2)).astype(self.dtype)
+        for border_mode in ['valid', 'full', 'half', (1, 2)]:
+            for subsample in [(1, 1), (2, 2)]:
+                op = corr.CorrMM(border_mode, subsample)
+                top_data = theano.function(
+                    [self.input, self.filters],
+                    op(self.input, self.filters))(image_data, filter_data)
+
+                def grad_weights(img, top):
+                    return corr.CorrMM_gradWeights(border_mode, subsample)(
+                        img, top, filter_data.shape[-2:])
+
+                def grad_inputs(kern, top):
+                    return corr.CorrMM_gradInputs(border_mode, subsample)(
+                        kern, top, image_data.shape[-2:])
+                utt.verify_grad(grad_weights, [image_data, top_data],
+                                mode=self.mode)
+                utt.verify_grad(grad_inputs, [filter_data, top_data],
+                                mode=self.mode)
+
+    def test_non_contiguous(self):
+        image_data = numpy.random.random((3, 2, 8, 7)).astype(self.dtype)
+        filter_data = numpy.random.random((4, 2, 3, 3)).astype(self.dtype)
+        op = corr.CorrMM('valid')
+        f = theano.function([self.input, self.filters],
+                            op(self.input[:, :, ::2, ::-1],
+                               self.filters.dimshuffle(0, 1, 3, 2)),
+                            mode=self.mode)
+        g = theano.function([self.input, self.filters],
+                            op(self.input, self.filters), mode=self.mode)
+        utt.assert_allclose(
+            g(numpy.ascontiguousarray(image_data[:, :, ::2, ::-1]),
+              numpy.ascontiguousarray(filter_data.transpose(0, 1, 3, 2))),
+            f(image_data, filter_data))
+
+    def test_shape_mismatch(self):
+        op = corr.CorrMM('valid')
+        f = theano.function([self.input, self.filters],
+                            op(self.input, self.filters), mode=self.mode)
+        image_data = numpy.random.random((3, 2, 4, 4)).astype(self.dtype)
+        self.assertRaises(ValueError, f, image_data,
+                          numpy.random.random((4, 3, 2, 2)).astype(self.dtype))
+        self.assertRaises(ValueError, f, image_data,
+                          numpy.random.random((4, 2, 5, 2)).astype(self.dtype))
+
+    def test_infer_shape(self):
+        image_data = numpy.random.random((3, 2, 8, 7)).astype(self.dtype)
+        filter_data = numpy.random.random((4, 2, 3, 2)).astype(self.dtype)
+        for border_mode in ['valid', 'full', 'half', (1, 2)]:
+            for subsample in [(1, 1), (2, 3)]:
+                op = corr.CorrMM(border_mode, subsample)
+                top = op(self.input, self.filters)
+                self._compile_and_check([self.input, self.filters], [top],
+                                        [image_data, filter_data],
+                                        corr.CorrMM)
+                top_data = theano.function(
+                    [self.input, self.filters], top)(image_data, filter_data)
+                out = T.tensor4(dtype=self.dtype)
+                self._compile_and_check(
+                    [self.input, out],
+                    [corr.CorrMM_gradWeights(border_mode, subsample)(
+                        self.input, out, filter_data.shape[-2:])],
+                    [image_data, top_data], corr.CorrMM_gradWeights)
+                self._compile_and_check(
+                    [self.filters, out],
+                    [corr.CorrMM_gradInputs(border_mode, subsample)(
+                        self.filters, out, image_data.shape[-2:])],
+                    [filter_data, top_data], corr.CorrMM_gradInputs)
+
+    def test_conv2d_opt(self):
+        # conv2d and its gradient use CorrMM by default.
+        if theano.config.mode == "FAST_COMPILE":
+            raise SkipTest("The conv_gemm optimization is not in FAST_COMPILE")
+        mode = theano.compile.get_default_mode().including('conv_gemm')
+        image_data = numpy.random.random((3, 2, 8, 7)).astype(self.dtype)
+        filter_data = numpy.random.random((4, 2, 3, 2)).astype(self.dtype)
+        for border_mode in ['valid', 'full']:
+            for subsample in [(1, 1), (2, 2)]:
+                out = conv.conv2d(self.input, self.filters,
+                                  border_mode=border_mode,
+                                  subsample=subsample)
+                outs = [out]
+                if subsample == (1, 1):
+                    outs += T.grad(out.sum(), [self.input, self.filters])
+                f = theano.function([self.input, self.filters], outs,
+                                    mode=mode)
+                ops = [node.op for node in f.maker.fgraph.toposort()]
+                assert not any(isinstance(op, conv.ConvOp) for op in ops)
+                assert any(isinstance(op, corr.BaseCorrMM) for op in ops)
+                g = theano.function([self.input, self.filters], outs,
+                                    mode=mode.excluding('conv_gemm'))
+                for a, b in zip(f(image_data, filter_data),
+                                g(image_data, filter_data)):
+                    utt.assert_allclose(a, b)
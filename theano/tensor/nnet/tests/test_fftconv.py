@@ -0,0 +1,110 @@
+import numpy
+from nose.plugins.skip import SkipTest
+
+import theano
+import theano.tensor as T
+from theano.tests import unittest_tools as utt
+from theano.tensor.nnet import conv, fftconv
+
+
+class TestFFTConv(utt.InferShapeTester):
+    mode = None
+    dtype = theano.config.floatX
+
+    def setUp(self):
+        super(TestFFTConv, self).setUp()
+        self.input = T.tensor4('input', dtype=self.dtype)
+        self.filters = T.tensor4('filters', dtype=self.dtype)
+
+    def validate(self, image_shape, filter_shape, border_mode='valid'):
+        """
+        Compare FFTConv and its gradient to the ConvOp of conv2d.
+
+        """
+        image_data = numpy.random.random(image_shape).astype(self.dtype)
+        filter_data = numpy.random.random(filter_shape).astype(self.dtype)
+        ref_mode = theano.compile.get_default_mode().excluding('conv_gemm',
+                                                               'conv_fft')
+        ref = theano.function([self.input, self.filters],
+                              conv.conv2d(self.input, self.filters,
+                                          border_mode=border_mode),
+                              mode=ref_mode)
+        f = theano.function([self.input, self.filters],
+                            fftconv.conv2d_fft(self.input, self.filters,
+                                               border_mode),
+                            mode=self.mode)
+        utt.assert_allclose(ref(image_data, filter_data),
+                            f(image_data, filter_data))
+        utt.verify_grad(fftconv.FFTConv(border_mode),
+                        [image_data, filter_data], mode=self.mode)
+
+    def test_basic(self):
+        self.validate((3, 2, 8, 8), (4, 2, 5, 5), 'valid')
+        self.validate((3, 2, 7, 5), (5, 2, 2, 3), 'valid')
+        self.validate((3, 2, 7, 5), (5, 2, 3, 2), 'full')
+        self.validate((1, 1, 6, 6), (1, 1, 6, 6), 'valid')
+        self.assertRaises(ValueError, fftconv.FFTConv, 'half')
+
+    def test_1d(self):
+        self.validate((2, 3, 1, 37), (4, 3, 1, 11), 'valid')
+        self.validate((2, 3, 1, 37), (4, 3, 1, 11), 'full')
+
+    def test_shape_mismatch(self):
+        f = theano.function([self.input, self.filters],
+                            fftconv.conv2d_fft(self.input, self.filters),
+                            mode=self.mode)
+        image_data = numpy.random.random((3, 2, 4, 4)).astype(self.dtype)
+        self.assertRaises(ValueError, f, image_data,
+                          numpy.random.random((4, 3, 2, 2)).astype(self.dtype))
+        self.assertRaises(ValueError, f, image_data,
+                          numpy.random.random((4, 2, 5, 2)).astype(self.dtype))
+
+    def test_infer_shape(self):
+        image_data = numpy.random.random((3, 2, 8, 7)).astype(self.dtype)
+        filter_data = numpy.random.random((4, 2, 3, 2)).astype(self.dtype)
+        for border_mode in ['valid', 'full']:
+            self._compile_and_check(
+                [self.input, self.filters],
+                [fftconv.FFTConv(border_mode)(self.input, self.filters)],
+                [image_data, filter_data], fftconv.FFTConv)
+
+    def test_fft_size(self):
+        for n, size in [(1, 1), (7, 8), (11, 12), (13, 15), (17, 18),
+                        (97, 100), (1000, 1000)]:
+            assert fftconv.fft_size(n) == size, (n, fftconv.fft_size(n))
+
+    def test_conv2d_opt(self):
+        if theano.config.mode == "FAST_COMPILE":
+            raise SkipTest("The conv_fft optimization is not in FAST_COMPILE")
+        mode = theano.compile.get_default_mode()
+        image_data = numpy.random.random((4, 2, 1, 3000)).astype(self.dtype)
+        filter_data = numpy.random.random((3, 2, 1, 1001)).astype(self.dtype)
+
+        def fft_ops(f):
+            return [node for node in f.maker.fgraph.toposort()
+                    if isinstance(node.op, fftconv.FFTConv)]
+
+        # Large filters use the FFT by default.
+        out = conv.conv2d(self.input, self.filters,
+                          image_shape=image_data.shape,
+                          filter_shape=filter_data.shape)
+        outs = [out] + T.grad(out.sum(), [self.input, self.filters])
+        f = theano.function([self.input, self.filters], outs, mode=mode)
+        assert fft_ops(f)
+        assert not any(isinstance(node.op, conv.ConvOp)
+                       for node in f.maker.fgraph.toposort())
+        g = theano.function([self.input, self.filters], outs,
+                            mode=mode.excluding('conv_fft'))
+        assert not fft_ops(g)
+        for a, b in zip(f(image_data, filter_data),
+                        g(image_data, filter_data)):
+            utt.assert_allclose(a, b)
+
+        # Small ones only if it is asked.
+        out = conv.conv2d(self.input, self.filters,
+                          image_shape=(2, 2, 8, 8), filter_shape=(3, 2, 3, 3))
+        f = theano.function([self.input, self.filters], out, mode=mode)
+        assert not fft_ops(f)
+        f = theano.function([self.input, self.filters], out,
+                            mode=mode.including('conv_fft'))
+        assert fft_ops(f)
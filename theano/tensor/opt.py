@@ -19,7 +19,7 @@ from six.moves import xrange
 
 import theano
 from theano import gof
-from theano.compat import izip
+from theano.compat import izip, OrderedDict
 from six import integer_types, iteritems
 from six.moves import reduce
 from theano.gof import opt, InconsistencyError, TopoOptimizer, graph
@@ -240,6 +240,25 @@ theano.configparser.AddConfigVar(
     in_c_key=False)
 
 
+def elemwise_inplace_op(OP, node, inplace_pattern):
+    """
+    Return the `OP` instance that computes `node` with `inplace_pattern`.
+
+    """
+    op = node.op
+    if hasattr(op.scalar_op, "make_new_inplace"):
+        new_scal = op.scalar_op.make_new_inplace(
+            scalar.transfer_type(
+                *[inplace_pattern.get(i, o.dtype)
+                  for i, o in enumerate(node.outputs)]))
+    else:
+        new_scal = op.scalar_op.__class__(
+            scalar.transfer_type(
+                *[inplace_pattern.get(i, None)
+                  for i in xrange(len(node.outputs))]))
+    return OP(new_scal, inplace_pattern)
+
+
 def inplace_elemwise_optimizer_op(OP):
     """
     We parametrise it to make it work for Elemwise and GpuElemwise op.
@@ -335,17 +354,8 @@ def inplace_elemwise_optimizer_op(OP):
                     inplace_pattern = dict(baseline)
                     inplace_pattern[candidate_output] = candidate_input
                     try:
-                        if hasattr(op.scalar_op, "make_new_inplace"):
-                            new_scal = op.scalar_op.make_new_inplace(
-                                scalar.transfer_type(
-                                    *[inplace_pattern.get(i, o.dtype)
-                                      for i, o in enumerate(node.outputs)]))
-                        else:
-                            new_scal = op.scalar_op.__class__(
-                                scalar.transfer_type(
-                                    *[inplace_pattern.get(i, None)
-                                      for i in xrange(len(node.outputs))]))
-                        new_outputs = OP(new_scal, inplace_pattern)(
+                        new_op = elemwise_inplace_op(OP, node, inplace_pattern)
+                        new_outputs = new_op(
                             *node.inputs, **dict(return_list=True))
                         new_node = new_outputs[0].owner
 
@@ -389,6 +399,241 @@ compile.optdb.register('inplace_elemwise_opt', inplace_elemwise_optimizer, 75,
                        'fast_run', 'inplace')
 
 
+def inplace_buffer_size(fgraph, var):
+    """
+    Estimate the size in bytes of `var`, to rank the inplace candidates.
+
+    Dimensions that are not known at compile time count as
+    `unknown_dim_size` elements.
+
+    """
+    unknown_dim_size = 1024
+    shape_of = getattr(getattr(fgraph, 'shape_feature', None),
+                       'shape_of', {})
+    shape = shape_of.get(var)
+    size = numpy.dtype(var.type.dtype).itemsize
+    for i, b in enumerate(var.type.broadcastable):
+        if b:
+            continue
+        dim = unknown_dim_size
+        if shape is not None:
+            try:
+                dim = int(get_scalar_constant_value(shape[i]))
+            except NotScalarConstantError:
+                pass
+        size *= dim
+    return size
+
+
+class InplaceAssignmentOptimizer(Optimizer):
+    """
+    Make nodes destructive by looking at the whole graph at once.
+
+    The candidates are every (output, input) pair of the `OP` nodes, as
+    tried by `inplace_elemwise_optimizer_op`, and the nodes that one of
+    the `local_optimizers` can replace by a destructive version. They are
+    tried from the largest destroyed buffer to the smallest, at most one
+    per node and per destroyed variable at a time. The candidates of a node
+    are only searched once, so the local optimizers see each node once.
+
+    The replacements are validated in batches. When a batch is invalid,
+    it is reverted and each half is tried again, so the number of
+    validations grows with the number of rejected candidates, not with
+    the number of candidates.
+
+    Parameters
+    ----------
+    OP
+        The Elemwise class whose nodes we make inplace.
+    local_optimizers
+        Local optimizers created with `inplace=True` that return the
+        destructive version of a node.
+
+    """
+    def __init__(self, OP, local_optimizers=()):
+        Optimizer.__init__(self)
+        self.OP = OP
+        self.local_optimizers = list(local_optimizers)
+
+    def add_local_optimizer(self, lopt):
+        self.local_optimizers.append(lopt)
+
+    def add_requirements(self, fgraph):
+        fgraph.attach_feature(gof.DestroyHandler())
+
+    def candidates(self, node):
+        """
+        Return a list of (index of the destroyed input, maker) for `node`.
+
+        maker(node) returns the outputs that replace node.outputs, or
+        None if the replacement is not possible anymore.
+
+        """
+        rval = []
+        if type(node.op) == self.OP:
+            baseline = node.op.inplace_pattern
+            for o, out in enumerate(node.outputs):
+                if o in baseline:
+                    continue
+                for i, inp in enumerate(node.inputs):
+                    if i in baseline.values() or inp.type != out.type:
+                        continue
+                    pattern = dict(baseline)
+                    pattern[o] = i
+                    rval.append((i, self._elemwise_maker(pattern)))
+            return rval
+
+        for lopt in self.local_optimizers:
+            new_outputs = lopt.transform(node)
+            if not new_outputs:
+                continue
+            new_node = new_outputs[0].owner
+            destroy_map = getattr(getattr(new_node, 'op', None),
+                                  'destroy_map', {})
+            if destroy_map:
+                rval.append((list(destroy_map.values())[0][0],
+                             lopt.transform))
+        return rval
+
+    def _elemwise_maker(self, inplace_pattern):
+        OP = self.OP
+
+        def maker(node):
+            new_op = elemwise_inplace_op(OP, node, inplace_pattern)
+            return new_op(*node.inputs, **dict(return_list=True))
+        return maker
+
+    def apply(self, fgraph):
+        protected = set(fgraph.outputs)
+        for f in fgraph._features:
+            if isinstance(f, theano.compile.function_module.Supervisor):
+                protected.update(f.protected)
+
+        # The candidates of each node are computed once, when it is in the
+        # graph at the start or imported by a replacement. They name the
+        # destroyed input by its index, so they stay valid when the inputs
+        # change. A new node takes the position in the toposort of the node
+        # it replaces, to break the ties.
+        order = fgraph.toposort()
+        position = dict((node, idx) for idx, node in enumerate(order))
+        candidates = OrderedDict((node, self.candidates(node))
+                                 for node in order)
+        imported = []
+        current = [0]
+
+        def importer(node):
+            position.setdefault(node, current[0])
+            imported.append(node)
+
+        updater = opt.Updater(importer, None, None)
+        fgraph.attach_feature(updater)
+
+        nb_iter = 0
+        nb_replacement = 0
+        nb_rejected = 0
+        nb_validate = [0]
+        tried = set()
+        try:
+            while True:
+                nb_iter += 1
+                for node in imported:
+                    if node not in candidates:
+                        candidates[node] = self.candidates(node)
+                del imported[:]
+                ranked = []
+                for node, node_candidates in iteritems(candidates):
+                    if node not in fgraph.apply_nodes:
+                        continue
+                    for i, maker in node_candidates:
+                        var = node.inputs[i]
+                        if ((node, var) in tried or
+                                var in protected or
+                                isinstance(var, Constant) or
+                                fgraph.destroyers(var)):
+                            continue
+                        ranked.append((-inplace_buffer_size(fgraph, var),
+                                       position[node], node, var, maker))
+                ranked.sort(key=lambda c: c[:2])
+
+                # Multiple candidates for the same node or the same
+                # destroyed variable would conflict. Keep them for the next
+                # iteration.
+                batch = []
+                seen = set()
+                for _, _, node, var, maker in ranked:
+                    if node in seen or var in seen:
+                        continue
+                    seen.add(node)
+                    seen.add(var)
+                    tried.add((node, var))
+                    batch.append((node, maker))
+                if not batch:
+                    break
+                nb_done = self._apply_batch(fgraph, batch, nb_validate,
+                                            position, current)
+                nb_replacement += nb_done
+                nb_rejected += len(batch) - nb_done
+        finally:
+            fgraph.remove_feature(updater)
+
+        return (self, nb_iter, nb_replacement, nb_rejected, nb_validate[0])
+
+    def _apply_batch(self, fgraph, batch, nb_validate, position, current):
+        """
+        Apply and validate the replacements in `batch`.
+
+        `current[0]` is set to the position of each replaced node in
+        `position`, for the nodes that replace it.
+
+        Returns
+        -------
+        int
+            The number of replacements that were kept.
+
+        """
+        chk = fgraph.checkpoint()
+        try:
+            for node, maker in batch:
+                if node not in fgraph.apply_nodes:
+                    continue
+                current[0] = position[node]
+                new_outputs = maker(node)
+                if not new_outputs:
+                    continue
+                for r, new_r in zip(node.outputs, new_outputs):
+                    fgraph.replace(r, new_r,
+                                   reason="inplace_assignment_optimizer")
+            nb_validate[0] += 1
+            fgraph.validate()
+            return len(batch)
+        except (ValueError, InconsistencyError):
+            fgraph.revert(chk)
+            if len(batch) == 1:
+                return 0
+            half = len(batch) // 2
+            return (self._apply_batch(fgraph, batch[:half], nb_validate,
+                                      position, current) +
+                    self._apply_batch(fgraph, batch[half:], nb_validate,
+                                      position, current))
+
+    @staticmethod
+    def print_profile(stream, prof, level=0):
+        blanc = ('    ' * level)
+        print(blanc, "InplaceAssignmentOptimizer", file=stream)
+        print(blanc, " nb_iter", prof[1], file=stream)
+        print(blanc, " nb_replacement", prof[2], file=stream)
+        print(blanc, " nb_rejected", prof[3], file=stream)
+        print(blanc, " nb_validate", prof[4], file=stream)
+
+
+inplace_assignment_optimizer = InplaceAssignmentOptimizer(T.Elemwise)
+# After the views are introduced (60) and before the destructive local
+# optimizations (70 and up). They only see what this pass could not
+# make inplace.
+compile.optdb.register('inplace_assignment', inplace_assignment_optimizer,
+                       60.5, 'fast_run', 'inplace')
+
+
 def register_canonicalize(lopt, *tags, **kwargs):
     if type(lopt) == str:
         def register(inner_lopt):
@@ -2899,6 +3144,7 @@ compile.optdb.register('local_inplace_setsubtensor',
                            local_inplace_setsubtensor,
                            failure_callback=TopoOptimizer.warn_inplace),
                        60, 'fast_run', 'inplace')  # DEBUG
+inplace_assignment_optimizer.add_local_optimizer(local_inplace_setsubtensor)
 
 
 @gof.local_optimizer([AdvancedIncSubtensor1], inplace=True)
@@ -2917,6 +3163,23 @@ compile.optdb.register('local_inplace_incsubtensor1',
                            local_inplace_incsubtensor1,
                            failure_callback=TopoOptimizer.warn_inplace),
                        60, 'fast_run', 'inplace')  # DEBUG
+inplace_assignment_optimizer.add_local_optimizer(local_inplace_incsubtensor1)
+
+
+@gof.local_optimizer([AdvancedIncSubtensor], inplace=True)
+def local_inplace_advanced_incsubtensor(node):
+    if isinstance(node.op, AdvancedIncSubtensor) and not node.op.inplace:
+        new_op = node.op.clone_inplace()
+        new_node = new_op(*node.inputs)
+        return [new_node]
+    return False
+compile.optdb.register('local_inplace_advanced_incsubtensor',
+                       TopoOptimizer(
+                           local_inplace_advanced_incsubtensor,
+                           failure_callback=TopoOptimizer.warn_inplace),
+                       60, 'fast_run', 'inplace')
+inplace_assignment_optimizer.add_local_optimizer(
+    local_inplace_advanced_incsubtensor)
 
 
 # Register old name
@@ -34,14 +34,15 @@ supposed to be canonical.
 # TODO: 0*x -> 0
 import logging
 
-from theano import gof
-from theano.tensor.elemwise import CAReduce
+from theano import compile, gof
+from theano.tensor.elemwise import CAReduce, Elemwise
 from theano.tensor import basic as T
 
 from theano.tensor.basic import (get_scalar_constant_value,
                                  NotScalarConstantError)
 from theano.tensor.opt import register_uncanonicalize
 from theano import scalar as scal
+from theano.scalar import approx
 
 _logger = logging.getLogger('theano.tensor.opt')
 
@@ -58,6 +59,8 @@ def local_max_and_argmax(node):
             # but CAReduce support only constant axis.
             if node.inputs[1].data is None:
                 axis = None
+            elif node.inputs[1].ndim == 1:
+                axis = tuple(node.inputs[1].data)
             else:
                 try:
                     axis = get_scalar_constant_value(node.inputs[1])
@@ -93,3 +96,69 @@ def local_max_to_min(node):
                                  max.owner.op.axis)(neg.owner.inputs[0])]
 
     return False
+
+
+def _approximate_composite(composite):
+    """
+    Return a Composite whose inner graph uses the approximations of the ops
+    of `composite` that have float32 and float64 outputs, or None if none
+    of its ops has one.
+
+    """
+    givens = {}
+    changed = False
+    for node in composite.fgraph.toposort():
+        inputs = [givens.get(i, i) for i in node.inputs]
+        op = None
+        if all(out.type.dtype in ('float32', 'float64')
+               for out in node.outputs):
+            op = approx.approximate(node.op)
+        if op is None:
+            op = node.op
+        else:
+            changed = True
+        givens.update(zip(node.outputs, op.make_node(*inputs).outputs))
+    if not changed:
+        return None
+    return scal.Composite(composite.fgraph.inputs,
+                          [givens.get(out, out)
+                           for out in composite.fgraph.outputs])
+
+
+@gof.local_optimizer([T.Elemwise])
+def local_fast_approx(node):
+    """
+    When enabled, replace exp, log, tanh, erf and softplus by the fast
+    approximations of theano.scalar.approx.
+
+    For example do mode.including('fast_approx') or use the Theano flag
+    optimizer_including=fast_approx.
+
+    Only the ops with float32 and float64 outputs are changed, also inside
+    a Composite. This is done after the stabilization and specialize
+    phases, so that they see the exact ops.
+
+    """
+    if not isinstance(node.op, Elemwise):
+        return False
+    if isinstance(node.op.scalar_op, scal.Composite):
+        scalar_op = _approximate_composite(node.op.scalar_op)
+    elif any(out.dtype not in ('float32', 'float64') for out in node.outputs):
+        return False
+    else:
+        scalar_op = approx.approximate(node.op.scalar_op)
+    if scalar_op is None:
+        return False
+    out = Elemwise(scalar_op)(*node.inputs)
+
+    def values_eq_approx_fast_approx(a, b):
+        # The float32 tolerances are larger than the errors already. In
+        # float64, erf has the largest error, 1.5e-7.
+        if str(node.outputs[0].dtype) == 'float64':
+            return T.TensorType.values_eq_approx(a, b, rtol=1e-6, atol=1e-6)
+        return T.TensorType.values_eq_approx(a, b)
+    # Let DebugMode know that this opt approximates the values.
+    out.values_eq_approx = values_eq_approx_fast_approx
+    return [out]
+compile.optdb['uncanonicalize'].register('local_fast_approx',
+                                         local_fast_approx, 'fast_approx')
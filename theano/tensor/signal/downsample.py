@@ -116,6 +116,21 @@ def max_pool_2d(input, ds, ignore_border=None, st=None, padding=(0, 0),
     return tensor.reshape(output, outshp, ndim=input.ndim)
 
 
+def _pool_cost(node, ds, pooled_shape, input_shapes, output_shapes):
+    """
+    Return the (flops, bytes_read, bytes_written) of a pooling node.
+
+    Each pooled element visits one ds[0] x ds[1] patch.
+
+    """
+    size = 1
+    for s in pooled_shape:
+        size *= int(s)
+    return (size * ds[0] * ds[1],
+            gof.shapes_nbytes(node.inputs, input_shapes),
+            gof.shapes_nbytes(node.outputs, output_shapes))
+
+
 class DownsampleFactorMax(Op):
     """
     For N-dimensional tensors, consider that the last two dimensions span
@@ -318,6 +333,10 @@ class DownsampleFactorMax(Op):
                              self.ignore_border, self.st, self.padding)
         return [shp]
 
+    def cost(self, node, input_shapes, output_shapes):
+        return _pool_cost(node, self.ds, output_shapes[0],
+                          input_shapes, output_shapes)
+
     def grad(self, inp, grads):
         x, = inp
         gz, = grads
@@ -615,6 +634,11 @@ class PoolGrad(Op):
     def infer_shape(self, node, in_shapes):
         return [in_shapes[0]]
 
+    def cost(self, node, input_shapes, output_shapes):
+        # The last input is the gradient wrt the pooled output.
+        return _pool_cost(node, self.ds, input_shapes[-1],
+                          input_shapes, output_shapes)
+
 
 class MaxPoolGrad(PoolGrad):
 
@@ -1047,6 +1071,11 @@ class DownsampleFactorMaxGradGrad(Op):
     def infer_shape(self, node, in_shapes):
         return [in_shapes[0]]
 
+    def cost(self, node, input_shapes, output_shapes):
+        # maxout has the pooled shape.
+        return _pool_cost(node, self.ds, input_shapes[1],
+                          input_shapes, output_shapes)
+
     def c_code(self, node, name, inp, out, sub):
         if self.mode != 'max':
             raise theano.gof.utils.MethodNotDefined()
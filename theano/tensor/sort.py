@@ -1,21 +1,54 @@
 import numpy as np
 import theano
-from theano.tensor.basic import mul, arange
+from theano import gof
+from theano.compile import optdb
+from theano.gradient import DisconnectedType
+from theano.tensor import opt
+from theano.tensor.basic import mul, arange, abs_, cast, discrete_dtypes
+from theano.tensor.subtensor import inc_subtensor
+from theano.tensor.type import TensorType
+
+
+# The numpy sort kinds that the C code can pass to PyArray_Sort.
+_c_sort_kinds = {'quicksort': 'NPY_QUICKSORT',
+                 'mergesort': 'NPY_MERGESORT',
+                 'heapsort': 'NPY_HEAPSORT'}
 
 
 class SortOp(theano.Op):
     """
     This class is a wrapper for numpy sort function.
 
+    Parameters
+    ----------
+    kind : {'quicksort', 'mergesort', 'heapsort'}
+        Sorting algorithm.
+    order : list, optional
+        The fields to compare first for structured arrays.
+    inplace : bool
+        If True, sort the input in place and return it.
+
     """
 
-    __props__ = ("kind", "order")
+    __props__ = ("kind", "order", "inplace")
 
-    def __init__(self, kind, order=None):
+    def __init__(self, kind, order=None, inplace=False):
         self.kind = kind
         self.order = order
+        self.inplace = inplace
+        if self.inplace:
+            self.destroy_map = {0: [0]}
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        # Older pickles have no inplace.
+        if not hasattr(self, 'inplace'):
+            self.inplace = False
 
     def __str__(self):
+        if self.inplace:
+            return self.__class__.__name__ + "{%s, %s, inplace}" % (
+                self.kind, str(self.order))
         return self.__class__.__name__ + "{%s, %s}" % (self.kind,
                                                        str(self.order))
 
@@ -29,7 +62,64 @@ class SortOp(theano.Op):
         a = inputs[0]
         axis = inputs[1]
         z = output_storage[0]
-        z[0] = np.sort(a, axis, self.kind, self.order)
+        if self.inplace:
+            a.sort(axis, self.kind, self.order)
+            z[0] = a
+        else:
+            z[0] = np.sort(a, axis, self.kind, self.order)
+
+    def c_code_cache_version(self):
+        return (1,)
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        if self.order or self.kind not in _c_sort_kinds:
+            raise NotImplementedError()
+        if not isinstance(node.inputs[1].type, TensorType):
+            raise NotImplementedError()
+        x, axis = inputs
+        z, = outputs
+        fail = sub['fail']
+        axis_dtype = node.inputs[1].type.dtype_specs()[1]
+        kind = _c_sort_kinds[self.kind]
+        if self.inplace:
+            alloc = """
+            Py_XDECREF(%(z)s);
+            %(z)s = %(x)s;
+            Py_INCREF(%(z)s);
+            """ % locals()
+        else:
+            alloc = """
+            if (%(z)s && PyArray_SAMESHAPE(%(z)s, %(x)s))
+            {
+                if (PyArray_CopyInto(%(z)s, %(x)s))
+                    %(fail)s
+            }
+            else
+            {
+                Py_XDECREF(%(z)s);
+                %(z)s = (PyArrayObject*)PyArray_NewCopy(%(x)s, NPY_CORDER);
+                if (!%(z)s)
+                    %(fail)s
+            }
+            """ % locals()
+        return """
+        {
+            int axis = ((%(axis_dtype)s*)PyArray_DATA(%(axis)s))[0];
+            int ndim = PyArray_NDIM(%(x)s);
+            if (axis < -ndim || axis >= ndim)
+            {
+                PyErr_Format(PyExc_IndexError,
+                             "Sort axis %%d out of bounds [0, %%d)",
+                             axis, ndim);
+                %(fail)s
+            }
+            if (axis < 0)
+                axis += ndim;
+            %(alloc)s
+            if (PyArray_Sort(%(z)s, axis, %(kind)s))
+                %(fail)s
+        }
+        """ % locals()
 
     def infer_shape(self, node, inputs_shapes):
         if (isinstance(node.inputs[1], theano.Constant) and
@@ -160,6 +250,45 @@ class ArgSortOp(theano.Op):
         z[0] = theano._asarray(np.argsort(a, axis, self.kind, self.order),
                                dtype=node.outputs[0].dtype)
 
+    def c_code_cache_version(self):
+        return (1,)
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        if self.order or self.kind not in _c_sort_kinds:
+            raise NotImplementedError()
+        if not isinstance(node.inputs[1].type, TensorType):
+            raise NotImplementedError()
+        x, axis = inputs
+        z, = outputs
+        fail = sub['fail']
+        axis_dtype = node.inputs[1].type.dtype_specs()[1]
+        kind = _c_sort_kinds[self.kind]
+        return """
+        {
+            int axis = ((%(axis_dtype)s*)PyArray_DATA(%(axis)s))[0];
+            int ndim = PyArray_NDIM(%(x)s);
+            if (axis < -ndim || axis >= ndim)
+            {
+                PyErr_Format(PyExc_IndexError,
+                             "ArgSort axis %%d out of bounds [0, %%d)",
+                             axis, ndim);
+                %(fail)s
+            }
+            Py_XDECREF(%(z)s);
+            %(z)s = (PyArrayObject*)PyArray_ArgSort(%(x)s, axis, %(kind)s);
+            if (!%(z)s)
+                %(fail)s
+            if (PyArray_TYPE(%(z)s) != NPY_INT64)
+            {
+                PyArrayObject* idx = %(z)s;
+                %(z)s = (PyArrayObject*)PyArray_Cast(idx, NPY_INT64);
+                Py_DECREF(idx);
+                if (!%(z)s)
+                    %(fail)s
+            }
+        }
+        """ % locals()
+
     def infer_shape(self, node, inputs_shapes):
         if (isinstance(node.inputs[1], theano.Constant) and
                 node.inputs[1].data is None):
@@ -209,3 +338,384 @@ def argsort(a, axis=-1, kind='quicksort', order=None):
         a = a.flatten()
         axis = 0
     return ArgSortOp(kind, order)(a, axis)
+
+
+@gof.local_optimizer([SortOp], inplace=True)
+def local_inplace_sort(node):
+    """
+    Sort in place.
+
+    """
+    if isinstance(node.op, SortOp) and not node.op.inplace:
+        new_op = SortOp(node.op.kind, node.op.order, inplace=True)
+        return [new_op(*node.inputs)]
+    return False
+optdb.register('local_inplace_sort',
+               opt.in2out(local_inplace_sort, ignore_newtrees=True),
+               60, 'fast_run', 'inplace')
+opt.inplace_assignment_optimizer.add_local_optimizer(local_inplace_sort)
+
+
+def _take_along_axis(a, indices, axis):
+    """Return a[..., indices, ...] taking one element per index."""
+    index = list(np.ix_(*[np.arange(s) for s in indices.shape]))
+    index[axis] = indices
+    return a[tuple(index)]
+
+
+class TopKOp(theano.Op):
+    """
+    The k largest or smallest values along an axis, and their indices.
+
+    The first input is the tensor, the second the integer scalar k. A
+    positive k selects the k largest values, a negative k the -k smallest.
+    In the C code, the selection is partial: only the k values are sorted,
+    after a linear time selection, so this costs O(n + k log k) per row
+    instead of the O(n log n) of a full sort. NaN is larger than any other
+    value, as in numpy.sort, and equal values are taken in the order of
+    their indices.
+
+    Parameters
+    ----------
+    axis : int
+        The axis along which to select.
+    sorted : bool
+        If True, the values are sorted, the largest first for a positive k
+        and the smallest first for a negative k. Otherwise their order is
+        unspecified.
+    idx_dtype : str
+        The integer dtype of the indices.
+
+    """
+
+    __props__ = ("axis", "sorted", "idx_dtype")
+
+    def __init__(self, axis=-1, sorted=True, idx_dtype='int64'):
+        if idx_dtype not in discrete_dtypes:
+            raise TypeError("idx_dtype must be an integer dtype, got %s" %
+                            idx_dtype)
+        self.axis = axis
+        self.sorted = sorted
+        self.idx_dtype = idx_dtype
+
+    def __str__(self):
+        return self.__class__.__name__ + "{axis=%s, sorted=%s}" % (
+            self.axis, self.sorted)
+
+    def make_node(self, x, k):
+        x = theano.tensor.as_tensor_variable(x)
+        k = theano.tensor.as_tensor_variable(k)
+        if not -x.ndim <= self.axis < x.ndim:
+            raise ValueError("TopK axis %d out of bounds for a %d-d tensor" %
+                             (self.axis, x.ndim))
+        if k.ndim != 0 or k.dtype not in discrete_dtypes:
+            raise TypeError("k must be an integer scalar", k)
+        bcast = list(x.broadcastable)
+        bcast[self.axis] = False
+        return theano.Apply(self, [x, k], [
+            TensorType(dtype=x.dtype, broadcastable=bcast)(),
+            TensorType(dtype=self.idx_dtype, broadcastable=bcast)()])
+
+    def perform(self, node, inputs, output_storage):
+        x, k = inputs
+        axis = self.axis % x.ndim
+        k = int(k)
+        n = x.shape[axis]
+        if abs(k) > n:
+            raise ValueError("TopK k=%d is larger than the size %d of axis"
+                             " %d" % (k, n, axis))
+        # Order like the C code: by value, NaN being the largest, then by
+        # index for the ties, so that both select the same elements.
+        shape = [1] * x.ndim
+        shape[axis] = n
+        pos = np.zeros(x.shape, dtype='int64') + np.arange(n).reshape(shape)
+        if k > 0:
+            # The reverse of the increasing values with decreasing indices.
+            idx = np.lexsort((-pos, x), axis=axis)
+            idx = idx[(slice(None),) * axis + (slice(None, None, -1),)]
+        else:
+            idx = np.lexsort((pos, x), axis=axis)
+        idx = idx[(slice(None),) * axis + (slice(0, abs(k)),)]
+        output_storage[0][0] = _take_along_axis(x, idx, axis)
+        output_storage[1][0] = theano._asarray(idx, dtype=self.idx_dtype)
+
+    def infer_shape(self, node, inputs_shapes):
+        shape = list(inputs_shapes[0])
+        shape[self.axis] = cast(abs_(node.inputs[1]), 'int64')
+        return [shape, shape]
+
+    def grad(self, inputs, output_grads):
+        x, k = inputs
+        gz = output_grads[0]
+        k_grad = theano.gradient.grad_undefined(
+            self, 1, k,
+            "topk is not defined for non-integer k")
+        if isinstance(gz.type, DisconnectedType):
+            return [x.zeros_like(), k_grad]
+        # Scatter the gradient of the values back to where they come from.
+        axis = self.axis % x.ndim
+        idx = self(x, k)[1]
+        index = []
+        for i in range(x.ndim):
+            if i == axis:
+                index.append(idx)
+            else:
+                shape = [1] * x.ndim
+                shape[i] = x.shape[i]
+                index.append(arange(x.shape[i]).reshape(shape, ndim=x.ndim))
+        x_grad = inc_subtensor(x.zeros_like()[tuple(index)], gz)
+        return [x_grad, k_grad]
+
+    def c_headers(self):
+        return ['<algorithm>', '<vector>']
+
+    def c_support_code(self):
+        return """
+        #ifndef THEANO_TOPK_HELPERS
+        #define THEANO_TOPK_HELPERS
+        // A value of a row and its index in the row.
+        template<typename T>
+        struct theano_topk_item
+        {
+            T v;
+            npy_intp i;
+        };
+
+        // Orders the items, the largest values first. NaN is the largest
+        // value and ties keep the index order, so that the result does not
+        // depend on the selection algorithm.
+        template<typename T>
+        struct theano_topk_greater
+        {
+            bool operator()(const theano_topk_item<T>& a,
+                            const theano_topk_item<T>& b) const
+            {
+                if (a.v != a.v)
+                    return b.v == b.v || a.i < b.i;
+                if (b.v != b.v)
+                    return false;
+                if (a.v != b.v)
+                    return a.v > b.v;
+                return a.i < b.i;
+            }
+        };
+
+        // The same, the smallest values first and NaN last.
+        template<typename T>
+        struct theano_topk_less
+        {
+            bool operator()(const theano_topk_item<T>& a,
+                            const theano_topk_item<T>& b) const
+            {
+                if (a.v != a.v)
+                    return b.v != b.v && a.i < b.i;
+                if (b.v != b.v)
+                    return true;
+                if (a.v != b.v)
+                    return a.v < b.v;
+                return a.i < b.i;
+            }
+        };
+
+        // Put in buf[0:k] the k first items of the strided row x[0:n] in
+        // the order of cmp, sorted if asked. buf has room for n items.
+        template<typename T, typename Compare>
+        static void theano_topk_select(const char* x, npy_intp xs,
+                                       npy_intp n, npy_intp k, bool sorted,
+                                       theano_topk_item<T>* buf, Compare cmp)
+        {
+            if (k * 16 <= n)
+            {
+                // For a small k, keep the k first items seen in a heap
+                // whose top is the last of them. Most values are rejected
+                // after one comparison with the top.
+                for (npy_intp i = 0; i < k; ++i)
+                {
+                    buf[i].v = *(const T*)(x + i * xs);
+                    buf[i].i = i;
+                }
+                std::make_heap(buf, buf + k, cmp);
+                for (npy_intp i = k; i < n; ++i)
+                {
+                    theano_topk_item<T> item;
+                    item.v = *(const T*)(x + i * xs);
+                    item.i = i;
+                    if (cmp(item, buf[0]))
+                    {
+                        std::pop_heap(buf, buf + k, cmp);
+                        buf[k - 1] = item;
+                        std::push_heap(buf, buf + k, cmp);
+                    }
+                }
+                if (sorted)
+                    std::sort_heap(buf, buf + k, cmp);
+                return;
+            }
+            for (npy_intp i = 0; i < n; ++i)
+            {
+                buf[i].v = *(const T*)(x + i * xs);
+                buf[i].i = i;
+            }
+            if (k < n)
+                std::nth_element(buf, buf + k, buf + n, cmp);
+            if (sorted)
+                std::sort(buf, buf + k, cmp);
+        }
+        #endif
+        """
+
+    def c_code_cache_version(self):
+        return (1,)
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        if node.inputs[0].type.dtype.startswith('complex'):
+            raise NotImplementedError()
+        x, k = inputs
+        values, indices = outputs
+        fail = sub['fail']
+        axis = self.axis % node.inputs[0].ndim
+        sorted = int(self.sorted)
+        dtype = node.inputs[0].type.dtype_specs()[1]
+        k_dtype = node.inputs[1].type.dtype_specs()[1]
+        idx_dtype = node.outputs[1].type.dtype_specs()[1]
+        idx_typenum = node.outputs[1].type.dtype_specs()[2]
+        return """
+        {
+            const int axis = %(axis)s;
+            const int ndim = PyArray_NDIM(%(x)s);
+            const npy_intp n = PyArray_DIMS(%(x)s)[axis];
+            npy_intp k = ((%(k_dtype)s*)PyArray_DATA(%(k)s))[0];
+            const bool largest = k > 0;
+            if (k < 0)
+                k = -k;
+            if (k > n)
+            {
+                PyErr_Format(PyExc_ValueError,
+                             "TopK k=%%ld is larger than the size %%ld of"
+                             " axis %%d", (long)(largest ? k : -k), (long)n,
+                             axis);
+                %(fail)s
+            }
+            npy_intp dims[NPY_MAXDIMS];
+            for (int d = 0; d < ndim; ++d)
+                dims[d] = PyArray_DIMS(%(x)s)[d];
+            dims[axis] = k;
+            if (!%(values)s || !PyArray_CompareLists(PyArray_DIMS(%(values)s),
+                                                     dims, ndim))
+            {
+                Py_XDECREF(%(values)s);
+                %(values)s = (PyArrayObject*)PyArray_EMPTY(
+                    ndim, dims, PyArray_TYPE(%(x)s), 0);
+                if (!%(values)s)
+                    %(fail)s
+            }
+            if (!%(indices)s || !PyArray_CompareLists(
+                    PyArray_DIMS(%(indices)s), dims, ndim))
+            {
+                Py_XDECREF(%(indices)s);
+                %(indices)s = (PyArrayObject*)PyArray_EMPTY(
+                    ndim, dims, %(idx_typenum)s, 0);
+                if (!%(indices)s)
+                    %(fail)s
+            }
+            if (k > 0 && PyArray_SIZE(%(values)s) > 0)
+            {
+                int it_axis = axis;
+                PyArrayIterObject* x_it = (PyArrayIterObject*)
+                    PyArray_IterAllButAxis((PyObject*)%(x)s, &it_axis);
+                PyArrayIterObject* v_it = (PyArrayIterObject*)
+                    PyArray_IterAllButAxis((PyObject*)%(values)s, &it_axis);
+                PyArrayIterObject* i_it = (PyArrayIterObject*)
+                    PyArray_IterAllButAxis((PyObject*)%(indices)s, &it_axis);
+                if (!x_it || !v_it || !i_it)
+                {
+                    Py_XDECREF(x_it);
+                    Py_XDECREF(v_it);
+                    Py_XDECREF(i_it);
+                    %(fail)s
+                }
+                const npy_intp xs = PyArray_STRIDES(%(x)s)[axis];
+                const npy_intp vs = PyArray_STRIDES(%(values)s)[axis];
+                const npy_intp is = PyArray_STRIDES(%(indices)s)[axis];
+                std::vector<theano_topk_item<%(dtype)s> > buf(n);
+                while (x_it->index < x_it->size)
+                {
+                    const char* row = (const char*)x_it->dataptr;
+                    if (largest)
+                        theano_topk_select(
+                            row, xs, n, k, %(sorted)s, &buf[0],
+                            theano_topk_greater<%(dtype)s>());
+                    else
+                        theano_topk_select(
+                            row, xs, n, k, %(sorted)s, &buf[0],
+                            theano_topk_less<%(dtype)s>());
+                    char* v = (char*)v_it->dataptr;
+                    char* i = (char*)i_it->dataptr;
+                    for (npy_intp j = 0; j < k; ++j)
+                    {
+                        *(%(dtype)s*)(v + j * vs) = buf[j].v;
+                        *(%(idx_dtype)s*)(i + j * is) = buf[j].i;
+                    }
+                    PyArray_ITER_NEXT(x_it);
+                    PyArray_ITER_NEXT(v_it);
+                    PyArray_ITER_NEXT(i_it);
+                }
+                Py_DECREF(x_it);
+                Py_DECREF(v_it);
+                Py_DECREF(i_it);
+            }
+        }
+        """ % locals()
+
+
+def topk_and_argtopk(x, k, axis=-1, sorted=True, idx_dtype='int64'):
+    """
+    Returns the k largest values of a tensor along an axis, and their
+    indices.
+
+    Parameters
+    ----------
+    x : Tensor
+        The tensor to select from.
+    k : integer scalar
+        The number of values. If negative, select the -k smallest values
+        instead.
+    axis : int
+        Axis along which to select. If None, the tensor is flattened first.
+    sorted : bool
+        If True, the values are sorted, the largest first (the smallest
+        first if k is negative).
+    idx_dtype : str
+        The dtype of the indices.
+
+    Returns
+    -------
+    tuple of two tensors
+        The values and their indices along `axis`. Their shape is the
+        shape of `x`, with abs(k) for `axis`.
+
+    """
+    if axis is None:
+        x = theano.tensor.flatten(x)
+        axis = 0
+    return tuple(TopKOp(axis, sorted, idx_dtype)(x, k))
+
+
+def topk(x, k, axis=-1, sorted=True):
+    """
+    Returns the k largest values of a tensor along an axis.
+
+    See `topk_and_argtopk`.
+
+    """
+    return topk_and_argtopk(x, k, axis, sorted)[0]
+
+
+def argtopk(x, k, axis=-1, sorted=True, idx_dtype='int64'):
+    """
+    Returns the indices of the k largest values of a tensor along an axis.
+
+    See `topk_and_argtopk`.
+
+    """
+    return topk_and_argtopk(x, k, axis, sorted, idx_dtype)[1]
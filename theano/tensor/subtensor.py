@@ -12,13 +12,15 @@ from theano.compat import izip
 from six import integer_types
 from theano.gradient import DisconnectedType
 from theano import gof
-from theano.gof import Apply, Constant, hashtype, Op, Type, MethodNotDefined
+from theano.gof import (Apply, Constant, hashtype, Op, OpenMPOp, Type,
+                        MethodNotDefined)
 from theano.printing import pprint
 from theano import scalar as scal
 from theano.tensor.basic import alloc
 from theano.tensor.basic import (addbroadcast, clip, get_scalar_constant_value,
                                  ARange, TensorType, NotScalarConstantError)
 from theano.tensor.elemwise import DimShuffle
+from theano.tensor import elemwise_openmp
 from theano.tensor.type_other import NoneConst, SliceType, make_slice
 from theano import config
 
@@ -1855,15 +1857,30 @@ class AdvancedSubtensor1(Op):
 advanced_subtensor1 = AdvancedSubtensor1()
 
 
-class AdvancedIncSubtensor1(Op):
+class AdvancedIncSubtensor1(OpenMPOp):
     """
     Increments a subtensor using advanced slicing (list of index).
 
+    The C code works on the rows of a C-contiguous output. It groups the
+    positions of the list by row, with a counting sort when the rows are
+    few compared with the list and a comparison sort otherwise, unless the
+    list is already sorted. Each row is then read and written once: all
+    its increments are added while it is in the cache, or the last value
+    is set. The rows are disjoint, so with OpenMP they are updated in
+    parallel. Short lists are scattered directly, in the order of the
+    list. The increments of a row are added in the order of the list
+    either way, so the result does not depend on the path.
+
     """
 
     __props__ = ('inplace', 'set_instead_of_inc')
 
-    def __init__(self, inplace=False, set_instead_of_inc=False):
+    # Below this number of indices, the list is scattered without sorting
+    # when OpenMP is not used.
+    sort_min_size = 1024
+
+    def __init__(self, inplace=False, set_instead_of_inc=False, openmp=None):
+        OpenMPOp.__init__(self, openmp=openmp)
         self.inplace = inplace
         self.set_instead_of_inc = set_instead_of_inc
         if inplace:
@@ -1872,7 +1889,8 @@ class AdvancedIncSubtensor1(Op):
     def clone_inplace(self):
         return self.__class__(
             inplace=True,
-            set_instead_of_inc=self.set_instead_of_inc)
+            set_instead_of_inc=self.set_instead_of_inc,
+            openmp=self.openmp)
 
     def __str__(self):
         if self.inplace:
@@ -1936,9 +1954,68 @@ class AdvancedIncSubtensor1(Op):
         return """(PyArrayObject*)PyArray_FromAny(py_%(x)s, NULL, 0, 0,
                 NPY_ARRAY_ENSURECOPY, NULL)""" % locals()
 
+    def c_headers(self):
+        return super(AdvancedIncSubtensor1, self).c_headers() + [
+            '<algorithm>', '<vector>']
+
     def c_support_code(self):
         from theano.gof.cutils import compile_cutils_code
-        return compile_cutils_code()
+        return compile_cutils_code() + """
+        #ifndef THEANO_ADV_INC_SEGMENTS
+        #define THEANO_ADV_INC_SEGMENTS
+        struct theano_adv_inc_row_less
+        {
+            const npy_intp* rows;
+            bool operator()(npy_intp a, npy_intp b) const
+            {
+                return rows[a] < rows[b] || (rows[a] == rows[b] && a < b);
+            }
+        };
+
+        // Put in `order` the positions 0..n-1 of `rows` sorted by row, the
+        // positions of a row in increasing order, and in `starts` the
+        // first position in `order` of each distinct row, followed by n.
+        static void theano_adv_inc_segments(
+            npy_intp n, const npy_intp* rows, npy_intp nb_rows,
+            std::vector<npy_intp>& order, std::vector<npy_intp>& starts)
+        {
+            order.resize(n);
+            bool sorted = true;
+            for (npy_intp i = 1; i < n && sorted; ++i)
+                sorted = rows[i - 1] <= rows[i];
+            if (sorted)
+            {
+                for (npy_intp i = 0; i < n; ++i)
+                    order[i] = i;
+            }
+            else if (nb_rows <= 4 * n)
+            {
+                // Counting sort, which keeps the order of the duplicates.
+                std::vector<npy_intp> count(nb_rows + 1, 0);
+                for (npy_intp i = 0; i < n; ++i)
+                    ++count[rows[i] + 1];
+                for (npy_intp r = 0; r < nb_rows; ++r)
+                    count[r + 1] += count[r];
+                for (npy_intp i = 0; i < n; ++i)
+                    order[count[rows[i]]++] = i;
+            }
+            else
+            {
+                for (npy_intp i = 0; i < n; ++i)
+                    order[i] = i;
+                theano_adv_inc_row_less less = {rows};
+                std::sort(order.begin(), order.end(), less);
+            }
+            starts.clear();
+            for (npy_intp k = 0; k < n; ++k)
+            {
+                if (k == 0 || rows[order[k]] != rows[order[k - 1]])
+                    starts.push_back(k);
+            }
+            starts.push_back(n);
+        }
+        #endif
+        """
 
     def c_code(self, node, name, input_names, output_names, sub):
         numpy_ver = [int(n) for n in numpy.__version__.split('.')[:2]]
@@ -1953,6 +2030,52 @@ class AdvancedIncSubtensor1(Op):
         else:
             inplace = 0
         copy_of_x = self.copy_of_x(x)
+        sort_min_size = self.sort_min_size
+        if self.openmp:
+            minsize = elemwise_openmp.openmp_minsize(
+                scal.add, node.outputs[0].dtype)
+            parallel = """
+                #pragma omp parallel for schedule(dynamic, 16) if(n_seg * row_size >= %(minsize)s)
+            """ % locals()
+            use_sort = "n >= %s || n * row_size >= %s" % (sort_min_size,
+                                                          minsize)
+        else:
+            parallel = ""
+            use_sort = "n >= %s" % sort_min_size
+        if node.outputs[0].dtype.startswith('complex'):
+            # The rows are not updated in C for these dtypes.
+            rows_ok = "0"
+        else:
+            rows_ok = "PyArray_IS_C_CONTIGUOUS(%(out)s)" % locals()
+        if self.set_instead_of_inc:
+            update_seg = """
+                    // The last value of the row is kept.
+                    npy_intp j = order[starts[s + 1] - 1];
+                    memcpy(x_row, y_data + (y_rows == 1 ? 0 : j) * row_size,
+                           row_size * sizeof(dtype_%(out)s));
+            """ % locals()
+            update_one = """
+                    memcpy(x_data + rows[j] * row_size,
+                           y_data + (y_rows == 1 ? 0 : j) * row_size,
+                           row_size * sizeof(dtype_%(out)s));
+            """ % locals()
+        else:
+            update_seg = """
+                    for (npy_intp k = starts[s]; k < starts[s + 1]; ++k)
+                    {
+                        const dtype_%(out)s* y_row = y_data
+                            + (y_rows == 1 ? 0 : order[k]) * row_size;
+                        for (npy_intp d = 0; d < row_size; ++d)
+                            x_row[d] += y_row[d];
+                    }
+            """ % locals()
+            update_one = """
+                    dtype_%(out)s* x_row = x_data + rows[j] * row_size;
+                    const dtype_%(out)s* y_row = y_data
+                        + (y_rows == 1 ? 0 : j) * row_size;
+                    for (npy_intp d = 0; d < row_size; ++d)
+                        x_row[d] += y_row[d];
+            """ % locals()
 
         return """
         if (%(inplace)s)
@@ -1968,14 +2091,126 @@ class AdvancedIncSubtensor1(Op):
         {
             Py_XDECREF(%(out)s);
             %(out)s = %(copy_of_x)s;
+            if (!%(out)s)
+                %(fail)s
+        }
+        if (!(%(rows_ok)s))
+        {
+            PyObject *arglist = Py_BuildValue("OOOi",%(out)s, %(idx)s, %(y)s, %(inc_or_set)d);
+            PyObject *ret = inplace_increment(NULL, arglist);
+            Py_XDECREF(arglist);
+            if (!ret)
+                %(fail)s
+            Py_DECREF(ret);
+        }
+        else
+        {
+            const int x_nd = PyArray_NDIM(%(out)s);
+            const npy_intp nb_rows = PyArray_DIMS(%(out)s)[0];
+            const npy_intp n = PyArray_DIMS(%(idx)s)[0];
+            npy_intp row_size = 1;
+            for (int d = 1; d < x_nd; ++d)
+                row_size *= PyArray_DIMS(%(out)s)[d];
+
+            // y as a C-contiguous (y_rows, row_size) matrix of the dtype
+            // of x, with y_rows 1 when it is broadcast over the list.
+            npy_intp y_rows = 1;
+            if (PyArray_NDIM(%(y)s) == x_nd)
+            {
+                y_rows = PyArray_DIMS(%(y)s)[0];
+                if (y_rows != n && y_rows != 1)
+                {
+                    PyErr_Format(PyExc_ValueError,
+                        "shape mismatch: y has %%ld rows but the list has"
+                        " %%ld indices", (long)y_rows, (long)n);
+                    %(fail)s
+                }
+            }
+            PyArrayObject* y_c = %(y)s;
+            int y_ok = (PyArray_NDIM(%(y)s) == x_nd
+                        && PyArray_TYPE(%(y)s) == PyArray_TYPE(%(out)s)
+                        && PyArray_IS_C_CONTIGUOUS(%(y)s));
+            for (int d = 1; d < x_nd && y_ok; ++d)
+                y_ok = PyArray_DIMS(%(y)s)[d] == PyArray_DIMS(%(out)s)[d];
+            if (y_ok)
+            {
+                Py_INCREF(y_c);
+            }
+            else
+            {
+                std::vector<npy_intp> y_dims(PyArray_DIMS(%(out)s),
+                                             PyArray_DIMS(%(out)s) + x_nd);
+                y_dims[0] = y_rows;
+                y_c = (PyArrayObject*)PyArray_EMPTY(
+                    x_nd, &y_dims[0], PyArray_TYPE(%(out)s), 0);
+                if (!y_c)
+                    %(fail)s
+                if (PyArray_CopyInto(y_c, %(y)s))
+                {
+                    Py_DECREF(y_c);
+                    %(fail)s
+                }
+            }
+
+            std::vector<npy_intp> rows(n);
+            int bad = 0;
+            for (npy_intp j = 0; j < n; ++j)
+            {
+                npy_intp r = ((dtype_%(idx)s*)PyArray_GETPTR1(%(idx)s, j))[0];
+                if (r < 0)
+                    r += nb_rows;
+                if (r < 0 || r >= nb_rows)
+                {
+                    PyErr_Format(PyExc_IndexError,
+                        "index %%ld out of bounds for axis 0 with size %%ld",
+                        (long)((dtype_%(idx)s*)PyArray_GETPTR1(%(idx)s, j))[0],
+                        (long)nb_rows);
+                    bad = 1;
+                    break;
+                }
+                rows[j] = r;
+            }
+            if (bad)
+            {
+                Py_DECREF(y_c);
+                %(fail)s
+            }
+
+            dtype_%(out)s* x_data = (dtype_%(out)s*)PyArray_DATA(%(out)s);
+            const dtype_%(out)s* y_data = (dtype_%(out)s*)PyArray_DATA(y_c);
+            if (row_size > 0 && (%(use_sort)s))
+            {
+                std::vector<npy_intp> order, starts;
+                theano_adv_inc_segments(n, n ? &rows[0] : NULL, nb_rows,
+                                        order, starts);
+                const npy_intp n_seg = starts.size() - 1;
+                %(parallel)s
+                for (npy_intp s = 0; s < n_seg; ++s)
+                {
+                    dtype_%(out)s* x_row = x_data
+                        + rows[order[starts[s]]] * row_size;
+                    %(update_seg)s
+                }
+            }
+            else if (row_size > 0)
+            {
+                for (npy_intp j = 0; j < n; ++j)
+                {
+                    %(update_one)s
+                }
+            }
+            Py_DECREF(y_c);
         }
-        PyObject *arglist = Py_BuildValue("OOOi",%(out)s, %(idx)s, %(y)s, %(inc_or_set)d);
-        inplace_increment(NULL, arglist);
-        Py_XDECREF(arglist);
         """ % locals()
 
-    def c_code_cache_version(self):
-        return (1,)
+    def c_code_cache_version_apply(self, node):
+        # The thresholds are in the C code.
+        version = [3, ('openmp', self.openmp),
+                   ('sort_min_size', self.sort_min_size)]
+        if self.openmp:
+            version.append(('openmp_minsize', elemwise_openmp.openmp_minsize(
+                scal.add, node.outputs[0].dtype)))
+        return tuple(version)
 
     def perform(self, node, inp, out_):
         # TODO opt to make this inplace
@@ -2110,6 +2345,328 @@ def adv_index_broadcastable_pattern(a, idx):
     return tuple([dim == 1 for dim in retshape])
 
 
+def adv_index_c_support_code():
+    """
+    Return the C++ code shared by AdvancedSubtensor and AdvancedIncSubtensor.
+
+    `theano_adv_index_init` describes where x[idx] is in x, when idx mixes
+    integer arrays and slices. The index arrays are broadcast against each
+    other through their strides, so they are never copied to a common
+    shape. `theano_adv_index_loop` then calls a functor on the runs of the
+    last sliced axis, with the matching run of another array that has the
+    shape of the result.
+
+    """
+    return """
+    #ifndef THEANO_ADV_INDEX
+    #define THEANO_ADV_INDEX
+    #if PY_MAJOR_VERSION >= 3
+    #define THEANO_SLICE_CAST(x) (x)
+    #else
+    #define THEANO_SLICE_CAST(x) ((PySliceObject*)(x))
+    #endif
+
+    struct theano_adv_index
+    {
+        // The index arrays, as npy_intp, and the axis of x of each one.
+        int n_arr;
+        PyArrayObject* arr[NPY_MAXDIMS];
+        int arr_axis[NPY_MAXDIMS];
+        // The strides of the index arrays over their broadcast shape,
+        // 0 where they are broadcast.
+        int bnd;
+        npy_intp bshape[NPY_MAXDIMS];
+        npy_intp arr_strides[NPY_MAXDIMS][NPY_MAXDIMS];
+        // The other axes of x, sliced.
+        int snd;
+        npy_intp sshape[NPY_MAXDIMS];
+        npy_intp sstrides[NPY_MAXDIMS];
+        npy_intp offset;
+        // The result has the sliced axes before bpos, the broadcast shape,
+        // then the other sliced axes.
+        int bpos;
+        int nd;
+    };
+
+    static void theano_adv_index_clear(theano_adv_index* ai)
+    {
+        for (int k = 0; k < ai->n_arr; ++k)
+            Py_DECREF(ai->arr[k]);
+        ai->n_arr = 0;
+    }
+
+    // Describe x[idx[0], ..., idx[n_idx - 1]], where each idx[i] is a
+    // slice or an integer array. Return -1 with an exception set on error.
+    static int theano_adv_index_init(theano_adv_index* ai, PyArrayObject* x,
+                                     PyObject** idx, int n_idx)
+    {
+        const int x_nd = PyArray_NDIM(x);
+        int first = -1, last = -1;
+        ai->n_arr = ai->bnd = ai->snd = ai->bpos = 0;
+        ai->offset = 0;
+        if (n_idx > x_nd)
+        {
+            PyErr_SetString(PyExc_IndexError, "too many indices for array");
+            return -1;
+        }
+        for (int i = 0; i < x_nd; ++i)
+        {
+            const npy_intp dim = PyArray_DIMS(x)[i];
+            const npy_intp stride = PyArray_STRIDES(x)[i];
+            if (i < n_idx && !PySlice_Check(idx[i]))
+            {
+                PyArrayObject* a = (PyArrayObject*)PyArray_FROM_OTF(
+                    idx[i], NPY_INTP, NPY_ARRAY_ALIGNED);
+                if (!a)
+                {
+                    theano_adv_index_clear(ai);
+                    return -1;
+                }
+                ai->arr[ai->n_arr] = a;
+                ai->arr_axis[ai->n_arr] = i;
+                ai->n_arr++;
+                ai->bnd = std::max(ai->bnd, PyArray_NDIM(a));
+                if (first < 0)
+                {
+                    first = i;
+                    ai->bpos = ai->snd;
+                }
+                last = i;
+            }
+            else
+            {
+                Py_ssize_t start = 0, stop = dim, step = 1, len = dim;
+                if (i < n_idx && PySlice_GetIndicesEx(
+                        THEANO_SLICE_CAST(idx[i]), dim,
+                        &start, &stop, &step, &len))
+                {
+                    theano_adv_index_clear(ai);
+                    return -1;
+                }
+                ai->sshape[ai->snd] = len;
+                ai->sstrides[ai->snd] = stride * step;
+                ai->offset += start * stride;
+                ai->snd++;
+            }
+        }
+        // Like numpy, the broadcast shape goes first when the index
+        // arrays are not next to each other.
+        if (ai->n_arr != last - first + 1)
+            ai->bpos = 0;
+        ai->nd = ai->snd + ai->bnd;
+
+        for (int d = 0; d < ai->bnd; ++d)
+            ai->bshape[d] = 1;
+        for (int k = 0; k < ai->n_arr; ++k)
+        {
+            PyArrayObject* a = ai->arr[k];
+            const int off = ai->bnd - PyArray_NDIM(a);
+            for (int d = 0; d < ai->bnd; ++d)
+            {
+                ai->arr_strides[k][d] = 0;
+                if (d < off || PyArray_DIMS(a)[d - off] == 1)
+                    continue;
+                const npy_intp dim = PyArray_DIMS(a)[d - off];
+                if (ai->bshape[d] == 1)
+                    ai->bshape[d] = dim;
+                else if (ai->bshape[d] != dim)
+                {
+                    PyErr_SetString(PyExc_IndexError,
+                        "shape mismatch: indexing arrays could not be"
+                        " broadcast together");
+                    theano_adv_index_clear(ai);
+                    return -1;
+                }
+                ai->arr_strides[k][d] = PyArray_STRIDES(a)[d - off];
+            }
+        }
+        return 0;
+    }
+
+    // The shape of x[idx].
+    static void theano_adv_index_shape(const theano_adv_index* ai,
+                                       npy_intp* dims)
+    {
+        for (int d = 0; d < ai->snd; ++d)
+            dims[d < ai->bpos ? d : d + ai->bnd] = ai->sshape[d];
+        for (int d = 0; d < ai->bnd; ++d)
+            dims[ai->bpos + d] = ai->bshape[d];
+    }
+
+    // The strides of y broadcast to the shape of x[idx]. Return -1 with an
+    // exception set if it does not broadcast.
+    static int theano_adv_index_broadcast(const theano_adv_index* ai,
+                                          PyArrayObject* y, npy_intp* strides)
+    {
+        npy_intp dims[NPY_MAXDIMS];
+        theano_adv_index_shape(ai, dims);
+        const int y_nd = PyArray_NDIM(y);
+        int ok = 1;
+        for (int d = 0; d < y_nd - ai->nd; ++d)
+            ok = ok && PyArray_DIMS(y)[d] == 1;
+        for (int d = 0; d < ai->nd; ++d)
+        {
+            const int yd = d - (ai->nd - y_nd);
+            strides[d] = 0;
+            if (yd < 0 || PyArray_DIMS(y)[yd] == 1)
+                continue;
+            ok = ok && PyArray_DIMS(y)[yd] == dims[d];
+            strides[d] = PyArray_STRIDES(y)[yd];
+        }
+        if (!ok)
+        {
+            PyErr_SetString(PyExc_ValueError,
+                "shape mismatch: value array could not be broadcast to the"
+                " shape of the indexing result");
+            return -1;
+        }
+        return 0;
+    }
+
+    // Call f(x_ptr, x_stride, o_ptr, o_stride, n) on all the runs of x[idx]
+    // along its last sliced axis, o being an array with the shape of
+    // x[idx] and the strides o_strides. The runs are visited in the order
+    // of the index arrays, so repeated indices are seen in order.
+    template<typename F>
+    static int theano_adv_index_loop(const theano_adv_index* ai,
+                                     PyArrayObject* x, char* o_data,
+                                     const npy_intp* o_strides, const F& f)
+    {
+        const int bnd = ai->bnd, snd = ai->snd;
+        npy_intp ob_strides[NPY_MAXDIMS], os_strides[NPY_MAXDIMS];
+        npy_intp b_idx[NPY_MAXDIMS], s_idx[NPY_MAXDIMS];
+        npy_intp bsize = 1, nb_runs = 1;
+        for (int d = 0; d < bnd; ++d)
+        {
+            ob_strides[d] = o_strides[ai->bpos + d];
+            b_idx[d] = 0;
+            bsize *= ai->bshape[d];
+        }
+        for (int d = 0; d < snd; ++d)
+        {
+            os_strides[d] = o_strides[d < ai->bpos ? d : d + bnd];
+            s_idx[d] = 0;
+            if (d < snd - 1)
+                nb_runs *= ai->sshape[d];
+        }
+        const npy_intp run = snd ? ai->sshape[snd - 1] : 1;
+        const npy_intp x_run_stride = snd ? ai->sstrides[snd - 1] : 0;
+        const npy_intp o_run_stride = snd ? os_strides[snd - 1] : 0;
+        if (run == 0)
+            nb_runs = 0;
+
+        for (npy_intp b = 0; b < bsize; ++b)
+        {
+            char* xp = PyArray_BYTES(x) + ai->offset;
+            char* op = o_data;
+            for (int d = 0; d < bnd; ++d)
+                op += b_idx[d] * ob_strides[d];
+            for (int k = 0; k < ai->n_arr; ++k)
+            {
+                const char* ap = PyArray_BYTES(ai->arr[k]);
+                for (int d = 0; d < bnd; ++d)
+                    ap += b_idx[d] * ai->arr_strides[k][d];
+                const int axis = ai->arr_axis[k];
+                const npy_intp dim = PyArray_DIMS(x)[axis];
+                npy_intp i = *(const npy_intp*)ap;
+                if (i < 0)
+                    i += dim;
+                if (i < 0 || i >= dim)
+                {
+                    PyErr_Format(PyExc_IndexError,
+                        "index %ld is out of bounds for axis %d with size %ld",
+                        (long)*(const npy_intp*)ap, axis, (long)dim);
+                    return -1;
+                }
+                xp += i * PyArray_STRIDES(x)[axis];
+            }
+            for (npy_intp r = 0; r < nb_runs; ++r)
+            {
+                char* xs = xp;
+                char* os = op;
+                for (int d = 0; d < snd - 1; ++d)
+                {
+                    xs += s_idx[d] * ai->sstrides[d];
+                    os += s_idx[d] * os_strides[d];
+                }
+                f(xs, x_run_stride, os, o_run_stride, run);
+                for (int d = snd - 2; d >= 0; --d)
+                {
+                    if (++s_idx[d] < ai->sshape[d])
+                        break;
+                    s_idx[d] = 0;
+                }
+            }
+            for (int d = bnd - 1; d >= 0; --d)
+            {
+                if (++b_idx[d] < ai->bshape[d])
+                    break;
+                b_idx[d] = 0;
+            }
+        }
+        return 0;
+    }
+
+    // o = x
+    template<typename T>
+    struct theano_adv_take
+    {
+        void operator()(char* x, npy_intp xs, char* o, npy_intp os,
+                        npy_intp n) const
+        {
+            if (xs == sizeof(T) && os == sizeof(T))
+                memcpy(o, x, n * sizeof(T));
+            else
+                for (npy_intp i = 0; i < n; ++i)
+                    *(T*)(o + i * os) = *(const T*)(x + i * xs);
+        }
+    };
+
+    // x = y
+    template<typename T, typename U>
+    struct theano_adv_set
+    {
+        void operator()(char* x, npy_intp xs, char* y, npy_intp ys,
+                        npy_intp n) const
+        {
+            for (npy_intp i = 0; i < n; ++i)
+                *(T*)(x + i * xs) = (T)*(const U*)(y + i * ys);
+        }
+    };
+
+    // x += y
+    template<typename T, typename U>
+    struct theano_adv_inc
+    {
+        void operator()(char* x, npy_intp xs, char* y, npy_intp ys,
+                        npy_intp n) const
+        {
+            for (npy_intp i = 0; i < n; ++i)
+                *(T*)(x + i * xs) += (T)*(const U*)(y + i * ys);
+        }
+    };
+    #endif
+    """
+
+
+def adv_index_c_code_cache_version():
+    return (1,)
+
+
+def adv_index_c_idx(variables, names):
+    """
+    Return the C initializer of the array of the index inputs.
+
+    Raise NotImplementedError if one of them is not an integer array or a
+    slice, such as numpy.newaxis.
+
+    """
+    for idx in variables:
+        if not isinstance(idx.type, (TensorType, SliceType)):
+            raise NotImplementedError()
+    return "{%s}" % ", ".join("(PyObject*)%s" % n for n in names)
+
+
 class AdvancedSubtensor(Op):
     """
     Return a subtensor copy, using advanced indexing.
@@ -2167,6 +2724,50 @@ class AdvancedSubtensor(Op):
                 'out[0] (%s), with shape %s, is not correctly filled.'
                 % (out[0], out[0].shape))
 
+    def c_headers(self):
+        return ['<algorithm>']
+
+    def c_support_code(self):
+        return adv_index_c_support_code()
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        x = inputs[0]
+        out, = outputs
+        fail = sub['fail']
+        idx = adv_index_c_idx(node.inputs[1:], inputs[1:])
+        n_idx = len(inputs) - 1
+        return """
+        {
+            PyObject* idx[] = %(idx)s;
+            theano_adv_index ai;
+            if (theano_adv_index_init(&ai, %(x)s, idx, %(n_idx)s))
+                %(fail)s
+            npy_intp dims[NPY_MAXDIMS];
+            theano_adv_index_shape(&ai, dims);
+            if (!%(out)s || PyArray_NDIM(%(out)s) != ai.nd
+                || !PyArray_CompareLists(PyArray_DIMS(%(out)s), dims, ai.nd))
+            {
+                Py_XDECREF(%(out)s);
+                %(out)s = (PyArrayObject*)PyArray_EMPTY(
+                    ai.nd, dims, PyArray_TYPE(%(x)s), 0);
+                if (!%(out)s)
+                {
+                    theano_adv_index_clear(&ai);
+                    %(fail)s
+                }
+            }
+            theano_adv_take<dtype_%(out)s> take;
+            int err = theano_adv_index_loop(&ai, %(x)s, PyArray_BYTES(%(out)s),
+                                            PyArray_STRIDES(%(out)s), take);
+            theano_adv_index_clear(&ai);
+            if (err)
+                %(fail)s
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,) + adv_index_c_code_cache_version()
+
     def connection_pattern(self, node):
 
         rval = [[True]]
@@ -2192,8 +2793,12 @@ class AdvancedIncSubtensor(Op):
 
     Notes
     -----
-    We need the numpy.inplace_increment() function currently
-    numpy's PR 326 to be able to make an inplace version of this op.
+    Without C code, we need the numpy.inplace_increment() function
+    currently numpy's PR 326 to increment.
+
+    The C code handles integer arrays and slices as indices. It walks the
+    index arrays without broadcasting them to a common shape and updates
+    x in place, in the order of the indices.
 
     """
 
@@ -2206,11 +2811,15 @@ class AdvancedIncSubtensor(Op):
         # something else that was not used.
         assert isinstance(inplace, bool)
         if self.inplace:
-            raise NotImplementedError('In place computation is not'
-                                      ' implemented')
+            self.destroy_map = {0: [0]}
 
         self.allow_legacy_perform = False
 
+    def clone_inplace(self):
+        return self.__class__(
+            inplace=True,
+            set_instead_of_inc=self.set_instead_of_inc)
+
     def __str__(self):
         return "%s{%s, %s}" % (self.__class__.__name__,
                                "inplace=" + str(self.inplace),
@@ -2300,6 +2909,73 @@ class AdvancedIncSubtensor(Op):
                 'out[0] (%s), with shape %s, is not correctly filled.'
                 % (out[0], out[0].shape))
 
+    def c_headers(self):
+        return ['<algorithm>']
+
+    def c_support_code(self):
+        return adv_index_c_support_code()
+
+    def c_code(self, node, name, inputs, outputs, sub):
+        x, y = inputs[:2]
+        out, = outputs
+        fail = sub['fail']
+        if (node.inputs[0].dtype.startswith('complex') or
+                node.inputs[1].dtype.startswith('complex')):
+            raise NotImplementedError()
+        idx = adv_index_c_idx(node.inputs[2:], inputs[2:])
+        n_idx = len(inputs) - 2
+        if self.set_instead_of_inc:
+            update = "theano_adv_set"
+        else:
+            update = "theano_adv_inc"
+        if self.inplace:
+            copy_of_x = """
+            if (%(out)s != %(x)s)
+            {
+                Py_XDECREF(%(out)s);
+                Py_INCREF(%(x)s);
+                %(out)s = %(x)s;
+            }
+            """ % locals()
+        else:
+            copy_of_x = """
+            if (!%(out)s || %(out)s == %(x)s
+                || !PyArray_SAMESHAPE(%(out)s, %(x)s))
+            {
+                Py_XDECREF(%(out)s);
+                %(out)s = (PyArrayObject*)PyArray_FromAny(
+                    (PyObject*)%(x)s, NULL, 0, 0, NPY_ARRAY_ENSURECOPY, NULL);
+                if (!%(out)s)
+                    %(fail)s
+            }
+            else if (PyArray_CopyInto(%(out)s, %(x)s))
+                %(fail)s
+            """ % locals()
+        return """
+        {
+            %(copy_of_x)s
+            PyObject* idx[] = %(idx)s;
+            theano_adv_index ai;
+            if (theano_adv_index_init(&ai, %(out)s, idx, %(n_idx)s))
+                %(fail)s
+            npy_intp y_strides[NPY_MAXDIMS];
+            if (theano_adv_index_broadcast(&ai, %(y)s, y_strides))
+            {
+                theano_adv_index_clear(&ai);
+                %(fail)s
+            }
+            %(update)s<dtype_%(out)s, dtype_%(y)s> update;
+            int err = theano_adv_index_loop(&ai, %(out)s, PyArray_BYTES(%(y)s),
+                                            y_strides, update);
+            theano_adv_index_clear(&ai);
+            if (err)
+                %(fail)s
+        }
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,) + adv_index_c_code_cache_version()
+
     def infer_shape(self, node, ishapes):
         return [ishapes[0]]
 
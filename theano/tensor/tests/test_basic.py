@@ -2869,6 +2869,41 @@ class T_max_and_argmax(unittest.TestCase):
             v = eval_outputs(max_and_argmax(n, axis)[0].shape)
             assert tuple(v) == numpy.max(data, np_axis).shape
 
+    def test_multiple_axes(self):
+        x = tensor4()
+        data = rand(3, 4, 5, 6)
+        for axis in [[0, 2], [1, 3], [0, 1, 3], [2, 3], [-1, 0], [1]]:
+            axes = sorted(a % 4 for a in axis)
+            kept = [a for a in range(4) if a not in axes]
+            f = function([x], max_and_argmax(x, axis))
+            # A non-contiguous input is not copied either.
+            for val in [data, data[:, ::-1, 1:4].transpose(0, 2, 1, 3)]:
+                v, i = f(val)
+                assert i.dtype == 'int64'
+                t = val.transpose(kept + axes)
+                t = t.reshape(t.shape[:len(kept)] + (-1,))
+                utt.assert_allclose(v, numpy.max(val, tuple(axes)))
+                assert numpy.all(i == numpy.argmax(t, -1))
+                v_shape = function([x], max_and_argmax(x, axis)[0].shape)(val)
+                assert tuple(v_shape) == v.shape
+
+    def test_nan(self):
+        x = matrix()
+        f = function([x], max_and_argmax(x, 1))
+        data = numpy.asarray([[1, numpy.nan, 3, numpy.nan],
+                              [4, 2, 1, 0]], dtype=config.floatX)
+        v, i = f(data)
+        assert numpy.isnan(v[0]) and v[1] == 4
+        assert numpy.all(i == [1, 0])
+
+    def test_empty(self):
+        x = matrix()
+        f = function([x], max_and_argmax(x, 1))
+        v, i = f(numpy.zeros((0, 3), dtype=config.floatX))
+        assert v.shape == (0,) and i.shape == (0,)
+        self.assertRaises(ValueError, f,
+                          numpy.zeros((3, 0), dtype=config.floatX))
+
     def test_arg_grad(self):
         """
         The test checks that the gradient of argmax(x).sum() is 0
@@ -2956,6 +2991,11 @@ class T_max_and_argmax(unittest.TestCase):
             safe_verify_grad(lambda v: max_and_argmax(v, axis=[i])[0], [data])
             safe_verify_grad(lambda v: max_and_argmax(v, axis=[i])[1], [data])
 
+        # Test several axes
+        for axis in [[0, 2], [1, 2, 3]]:
+            safe_verify_grad(lambda v: max_and_argmax(v, axis=axis)[0],
+                             [data])
+
     def test_preserve_broadcastable(self):
         """
         Ensure the original broadcastable flags are preserved by Max/Argmax.
@@ -4070,6 +4110,47 @@ class T_Join_and_Split(unittest.TestCase):
                     for node in f.maker.fgraph.toposort()])
         self.assertRaises(ValueError, f)
 
+    def test_split_view(self):
+        x = vector()
+        o = self.split_op_class(2)(x, 0, [2, 3])
+        f = function([x], [o[0] * 2, o[1] * 3], mode=self.mode)
+        xv = numpy.arange(5).astype(self.floatX)
+        o1, o2 = f(xv)
+        assert numpy.allclose(o1, xv[:2] * 2)
+        assert numpy.allclose(o2, xv[2:] * 3)
+
+    def test_join_in_place(self):
+        # Without gc, the inputs of Join are computed in its output.
+        if type(self.join_op) is not Join:
+            raise SkipTest("Only the CPU Join gives views of its output")
+        if not isinstance(self.mode.linker, theano.gof.vm.VM_Linker):
+            raise SkipTest("Only the VM linkers give the views to the Ops")
+        a = matrix()
+        b = matrix()
+        j = self.join_op(0, exp(a), b * 2)
+        mode = self.mode.clone(link_kwargs=dict(allow_gc=False))
+        f = function([a, b], j.sum(axis=1), mode=mode)
+        node = [n for n in f.maker.fgraph.toposort()
+                if isinstance(n.op, Join)][0]
+        rng = numpy.random.RandomState(seed=utt.fetch_seed())
+        for rows in [3, 3, 5, 5, 0, 2]:
+            av = rng.rand(rows, 4).astype(self.floatX)
+            bv = rng.rand(rows + 1, 4).astype(self.floatX)
+            utt.assert_allclose(
+                f(av, bv), numpy.concatenate([numpy.exp(av), bv * 2]).sum(1))
+        storage_map = f.fn.storage_map
+        z = storage_map[node.outputs[0]][0]
+        for inp in node.inputs[1:]:
+            assert numpy.may_share_memory(storage_map[inp][0], z)
+
+        # The profiler sees the C code of Join through the wrapper of its thunk.
+        if theano.config.cxx:
+            f = function([a, b], j.sum(axis=1), mode=mode, profile=True)
+            f(av, bv)
+            node = [n for n in f.maker.fgraph.toposort()
+                    if isinstance(n.op, Join)][0]
+            assert f.profile.apply_cimpl[node]
+
 
 class test_comparison(unittest.TestCase):
     """Test <, >, <=, >=, == and !=
@@ -9,6 +9,7 @@ from numpy import (arange, array, common_type, complex64, complex128, float32,
 from numpy.testing import assert_array_almost_equal
 
 from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
 from six.moves import xrange
 
 import theano
@@ -20,7 +21,8 @@ from theano.tensor.blas import (_dot22, _dot22scalar, res_is_a, _as_scalar,
                                 _is_real_matrix, _gemm_canonicalize,
                                 _factor_canonicalized, Gemm, Gemv,
                                 gemm_inplace, gemm_no_inplace,
-                                InconsistencyError, Ger, ger, ger_destructive)
+                                InconsistencyError, Ger, ger, ger_destructive,
+                                BatchedGemm, batched_gemm, GemmEpilogue)
 from theano.tests import unittest_tools
 from .test_basic import (as_tensor_variable, inplace_func,
                         compile, inplace)
@@ -790,7 +792,8 @@ def test_gemm_unrolled():
         nb_dot = sum([1 for node in unrolled_theano.maker.fgraph.toposort()
                       if isinstance(node.op, (theano.tensor.Dot,
                                               theano.tensor.blas.Dot22,
-                                              theano.tensor.blas.Gemm))])
+                                              theano.tensor.blas.Gemm,
+                                              GemmEpilogue))])
         # Each num_rounds add 3 dot, but one of them is always the same.
         # So the final graph should have 1 + 2* num_rounds dot varient op.
         assert nb_dot == num_rounds * 2 + 1, nb_dot
@@ -858,6 +861,298 @@ def test_dot22():
             cmp((0, 0), (0, 0))
 
 
+def test_dot22_gemm_cost():
+    x = T.fmatrix()
+    y = T.fmatrix()
+    z = T.fmatrix()
+    node = _dot22(x, y).owner
+    flops, read, written = theano.gof.apply_cost(node, [(3, 4), (4, 5)],
+                                                 [(3, 5)])
+    assert flops == 2 * 3 * 4 * 5
+    assert read == (3 * 4 + 4 * 5) * 4
+    assert written == 3 * 5 * 4
+
+    a = T.as_tensor_variable(numpy.asarray(1.0, dtype='float32'))
+    node = gemm_no_inplace(z, a, x, y, a).owner
+    flops, read, written = theano.gof.apply_cost(
+        node, [(3, 5), (), (3, 4), (4, 5), ()], [(3, 5)])
+    assert flops == 2 * 3 * 4 * 5 + 3 * 3 * 5
+    assert read == (3 * 5 + 1 + 3 * 4 + 4 * 5 + 1) * 4
+    assert written == 3 * 5 * 4
+
+
+def test_small_gemm():
+    # The loops used instead of BLAS for small matrices, with the strides
+    # that BLAS can't read and that would be copied.
+    if not config.blas.ldflags:
+        raise SkipTest('The small matrix loops are in the C BLAS code')
+    orig = config.blas.small_gemm
+    try:
+        config.blas.small_gemm = 8
+        x = T.matrix()
+        y = T.matrix()
+        z = T.matrix()
+        a = T.scalar()
+        b = T.scalar()
+        mode = theano.compile.Mode(linker='c', optimizer=None)
+        fns = [(theano.function([x, y, a, b, z], _dot22(x, y), mode=mode,
+                                on_unused_input='ignore'),
+                lambda xv, yv, av, bv, zv: numpy.dot(xv, yv)),
+               (theano.function([x, y, a, b, z], _dot22scalar(x, y, a),
+                                mode=mode, on_unused_input='ignore'),
+                lambda xv, yv, av, bv, zv: av * numpy.dot(xv, yv)),
+               (theano.function([x, y, a, b, z],
+                                gemm_no_inplace(z, a, x, y, b), mode=mode),
+                lambda xv, yv, av, bv, zv: av * numpy.dot(xv, yv) + bv * zv)]
+        rng = numpy.random.RandomState(unittest_tools.fetch_seed())
+
+        def rand(*shp):
+            return rng.rand(*shp).astype(config.floatX)
+        av = numpy.asarray(0.5, dtype=config.floatX)
+        for M, K, N in [(1, 1, 1), (3, 4, 5), (8, 8, 8), (2, 0, 3), (0, 3, 2),
+                        (9, 3, 4), (3, 4, 9)]:
+            for xv, yv in [(rand(M, K), rand(K, N)),
+                           (rand(K, M).T, rand(N, K).T),
+                           (rand(M, K)[::-1], rand(K, 2 * N)[:, ::2]),
+                           (rand(M, 2 * K)[:, 1::2], rand(K, N)[::-1, ::-1])]:
+                for bv in [0, 1.5]:
+                    bv = numpy.asarray(bv, dtype=config.floatX)
+                    zv = rand(M, N)
+                    for f, ref in fns:
+                        unittest_tools.assert_allclose(
+                            f(xv, yv, av, bv, zv),
+                            ref(xv, yv, av, bv, zv))
+    finally:
+        config.blas.small_gemm = orig
+
+
+class TestBatchedGemm(unittest_tools.InferShapeTester):
+    def setUp(self):
+        super(TestBatchedGemm, self).setUp()
+        self.rng = numpy.random.RandomState(unittest_tools.fetch_seed())
+
+    def ref(self, xv, yv):
+        batch = max(xv.shape[0], yv.shape[0])
+        rval = numpy.zeros((batch, xv.shape[1], yv.shape[2]), xv.dtype)
+        for i in range(batch):
+            rval[i] = numpy.dot(xv[i % xv.shape[0]], yv[i % yv.shape[0]])
+        return rval
+
+    def test_values(self):
+        for dtype in ['float32', 'float64', 'int32']:
+            x = T.tensor3(dtype=dtype)
+            y = T.tensor3(dtype=dtype)
+            # Transposed and strided inputs, for the layouts BLAS can
+            # read and the one it can't.
+            for x_expr, y_expr in [(x, y),
+                                   (x.dimshuffle(0, 2, 1), y),
+                                   (x, y.dimshuffle(0, 2, 1)),
+                                   (x[:, ::2], y[:, :, ::-1]),
+                                   (x[::-2], y[::2])]:
+                f = theano.function([x, y], batched_gemm(x_expr, y_expr),
+                                    mode=mode_not_fast_compile)
+                g = theano.function([x, y], [x_expr, y_expr],
+                                    mode=mode_not_fast_compile)
+                for shp in [(6, 4, 4), (6, 1, 1), (0, 4, 4), (6, 0, 4)]:
+                    xv = (self.rng.rand(*shp) * 10).astype(dtype)
+                    yv = (self.rng.rand(*shp) * 10).astype(dtype)
+                    xe, ye = g(xv, yv)
+                    if xe.shape[2] != ye.shape[1]:
+                        continue
+                    unittest_tools.assert_allclose(f(xv, yv),
+                                                   self.ref(xe, ye))
+
+    def test_broadcast(self):
+        x = T.TensorType(config.floatX, (True, False, False))()
+        y = T.tensor3()
+        f = theano.function([x, y], batched_gemm(x, y))
+        xv = self.rng.rand(1, 3, 4).astype(config.floatX)
+        yv = self.rng.rand(5, 4, 2).astype(config.floatX)
+        unittest_tools.assert_allclose(f(xv, yv), self.ref(xv, yv))
+        unittest_tools.assert_allclose(f(xv, yv[:1]), self.ref(xv, yv[:1]))
+
+        # Only the broadcastable batch dimensions are broadcast.
+        z = T.tensor3()
+        f = theano.function([y, z], batched_gemm(y, z))
+        self.assertRaises(ValueError, f, yv,
+                          self.rng.rand(1, 2, 3).astype(config.floatX))
+
+    def test_grad(self):
+        unittest_tools.verify_grad(batched_gemm, [self.rng.rand(5, 3, 4),
+                                                  self.rng.rand(5, 4, 2)])
+
+        def fn(x, y):
+            return batched_gemm(T.addbroadcast(x, 0), y)
+        unittest_tools.verify_grad(fn, [self.rng.rand(1, 3, 4),
+                                        self.rng.rand(5, 4, 2)])
+
+    def test_infer_shape(self):
+        x = T.tensor3()
+        y = T.tensor3()
+        self._compile_and_check(
+            [x, y], [batched_gemm(x, y)],
+            [self.rng.rand(5, 3, 4).astype(config.floatX),
+             self.rng.rand(5, 4, 2).astype(config.floatX)],
+            BatchedGemm)
+
+    def test_batched_dot(self):
+        # The matrix and vector forms of batched_dot, and the scan form of
+        # the former batched_dot, use BatchedGemm.
+        x = T.tensor3()
+        y = T.tensor3()
+        xv = self.rng.rand(5, 3, 4).astype(config.floatX)
+        yv = self.rng.rand(5, 4, 2).astype(config.floatX)
+        scan_out, _ = theano.scan(T.dot, sequences=[x, y])
+        for x_expr, y_expr, out in [
+                (x, y, T.batched_dot(x, y)),
+                (x[:, 0], y, T.batched_dot(x[:, 0], y)),
+                (x, y[:, :, 0], T.batched_dot(x, y[:, :, 0])),
+                (x[:, 0], y[:, :, 0], T.batched_dot(x[:, 0], y[:, :, 0])),
+                (x, y, scan_out)]:
+            f = theano.function([x, y], out, mode=mode_not_fast_compile)
+            topo = f.maker.fgraph.toposort()
+            assert any(isinstance(n.op, BatchedGemm) for n in topo)
+            assert not any(isinstance(n.op, theano.scan_module.scan_op.Scan)
+                           for n in topo)
+            xe, ye = theano.function([x, y], [x_expr, y_expr])(xv, yv)
+            unittest_tools.assert_allclose(
+                f(xv, yv), [numpy.dot(a, b) for a, b in zip(xe, ye)])
+
+
+class TestGemmEpilogue(unittest_tools.InferShapeTester):
+    def setUp(self):
+        super(TestGemmEpilogue, self).setUp()
+        self.rng = numpy.random.RandomState(unittest_tools.fetch_seed())
+        s = [theano.scalar.get_scalar_type(config.floatX)() for i in
+             range(3)]
+        self.op = GemmEpilogue(theano.scalar.Composite(
+            s, [theano.scalar.tanh(s[0] + s[1]) * s[2]]))
+
+    def test_values(self):
+        x = T.matrix()
+        y = T.matrix()
+        a = T.scalar()
+        row = T.row()
+        col = T.col()
+        full = T.matrix()
+        rfull = full[::-1]
+        # The last shape has several blocks of rows in float64.
+        for M, K, N in [(5, 4, 3), (0, 4, 3), (5, 0, 3), (131, 3, 2000)]:
+            xv = self.rng.rand(M, K).astype(config.floatX)
+            yv = self.rng.rand(K, N).astype(config.floatX)
+            av = numpy.asarray(0.5, dtype=config.floatX)
+            vals = {row: self.rng.rand(1, N).astype(config.floatX),
+                    col: self.rng.rand(M, 1).astype(config.floatX),
+                    full: self.rng.rand(M, N).astype(config.floatX)}
+            vals[rfull] = vals[full][::-1]
+            # Transposed and strided inputs, for the layouts BLAS can
+            # read and the one it can't.
+            for x_expr, y_expr, xin, yin in [
+                    (x, y, xv, yv),
+                    (x.T, y, xv.T.copy(), yv),
+                    (x, y.T, xv, yv.T.copy()),
+                    (x[:, ::2], y, numpy.repeat(xv, 2, 1), yv)]:
+                for e1, e2 in [(row, col), (full, row), (col, rfull)]:
+                    out = self.op(x_expr, y_expr, a, e1, e2)
+                    inputs = [i if i is not rfull else full for i in (e1, e2)]
+                    f = theano.function([x, y, a] + inputs, out,
+                                        mode=mode_not_fast_compile)
+                    ev = [vals[i] for i in inputs]
+                    e1v = vals[e1]
+                    e2v = vals[e2]
+                    unittest_tools.assert_allclose(
+                        f(xin, yin, av, *ev),
+                        numpy.tanh(av * numpy.dot(xv, yv) + e1v) * e2v)
+                    if M * K * N < 100:
+                        f_py = theano.function([x, y, a] + inputs, out,
+                                               mode=compile.Mode(
+                                                   linker='py',
+                                                   optimizer=None))
+                        unittest_tools.assert_allclose(f_py(xin, yin, av, *ev),
+                                                       f(xin, yin, av, *ev))
+
+    def test_opt(self):
+        # The forward and the backward pass of dense layers use
+        # GemmEpilogue.
+        x = T.matrix()
+        W1 = T.matrix()
+        W2 = T.matrix()
+        b = T.vector()
+        h = T.tanh(T.dot(x, W1) + b)
+        out = T.nnet.sigmoid(T.dot(h, W2))
+        cost = T.sqr(out).sum()
+        grads = T.grad(cost, [x, W1, W2, b])
+        vals = [self.rng.rand(6, 5).astype(config.floatX),
+                self.rng.rand(5, 4).astype(config.floatX),
+                self.rng.rand(4, 3).astype(config.floatX),
+                self.rng.rand(4).astype(config.floatX)]
+        if not config.blas.ldflags:
+            raise SkipTest('GemmEpilogue is only used with the C BLAS')
+        mode = theano.compile.get_mode(mode_not_fast_compile)
+
+        f = theano.function([x, W1, W2, b], h, mode=mode,
+                            on_unused_input='ignore')
+        topo = f.maker.fgraph.toposort()
+        assert isinstance(topo[-1].op, GemmEpilogue)
+        assert not any(isinstance(n.op, (T.Elemwise, T.blas.Dot22))
+                       for n in topo)
+
+        f = theano.function([x, W1, W2, b], grads, mode=mode)
+        f_ref = theano.function([x, W1, W2, b], grads,
+                                mode=mode.excluding('gemm_epilogue'))
+        nb = len([n for n in f.maker.fgraph.toposort()
+                  if isinstance(n.op, GemmEpilogue)])
+        # The two forward layers and the gradient of h.
+        assert nb >= 3, nb
+        for v, v_ref in zip(f(*vals), f_ref(*vals)):
+            unittest_tools.assert_allclose(v, v_ref)
+
+    def test_opt_dense(self):
+        # The product is the first input of a variadic add.
+        if not config.blas.ldflags:
+            raise SkipTest('GemmEpilogue is only used with the C BLAS')
+        mode = theano.compile.get_mode(mode_not_fast_compile)
+        x = T.matrix()
+        w = T.matrix()
+        b = T.vector()
+        xv = self.rng.rand(6, 5).astype(config.floatX)
+        wv = self.rng.rand(5, 4).astype(config.floatX)
+        bv = self.rng.rand(4).astype(config.floatX)
+        for out, ref in [(T.dot(x, w) + b, numpy.dot(xv, wv) + bv),
+                         (T.tanh(T.dot(x, w) + b),
+                          numpy.tanh(numpy.dot(xv, wv) + bv))]:
+            f = theano.function([x, w, b], out, mode=mode)
+            assert any(isinstance(n.op, GemmEpilogue)
+                       for n in f.maker.fgraph.toposort())
+            unittest_tools.assert_allclose(f(xv, wv, bv), ref)
+
+    def test_variadic_scalar_op(self):
+        x = T.matrix()
+        y = T.matrix()
+        row = T.row()
+        out = GemmEpilogue(theano.scalar.add)(x, y, 2, row)
+        xv = self.rng.rand(3, 2).astype(config.floatX)
+        yv = self.rng.rand(2, 4).astype(config.floatX)
+        rv = self.rng.rand(1, 4).astype(config.floatX)
+        f = theano.function([x, y, row], out,
+                            mode=compile.Mode(linker='py', optimizer=None))
+        unittest_tools.assert_allclose(f(xv, yv, rv),
+                                       2 * numpy.dot(xv, yv) + rv)
+
+    def test_infer_shape(self):
+        x = T.matrix()
+        y = T.matrix()
+        row = T.row()
+        z = T.matrix()
+        self._compile_and_check(
+            [x, y, row, z], [self.op(x, y, 2, row, z)],
+            [self.rng.rand(5, 3).astype(config.floatX),
+             self.rng.rand(3, 4).astype(config.floatX),
+             self.rng.rand(1, 4).astype(config.floatX),
+             self.rng.rand(5, 4).astype(config.floatX)],
+            GemmEpilogue)
+
+
 @attr('slow')
 def test_dot22scalar():
     # including does not seem to work for 'local_dot_to_dot22' and
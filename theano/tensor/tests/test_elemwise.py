@@ -302,6 +302,59 @@ class test_Broadcast(unittest.TestCase):
             zv = xv + yv
             assert (f(xv, yv) == zv).all()
 
+    def test_c_layouts(self):
+        # The C code has a flat loop when all arrays are C or F contiguous.
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        x = self.ctype('float64', [0, 0])('x')
+        y = self.ctype('float64', [0, 0])('y')
+        s = self.ctype('float64', [1, 1])('s')
+        e = self.cop(scalar.Add(scalar.transfer_type(0)), {0: 0})(x, y, s)
+        f = gof.CLinker().accept(FunctionGraph([x, y, s],
+                                               [e])).make_function()
+        for layout in [numpy.ascontiguousarray, numpy.asfortranarray,
+                       lambda v: v[::2]]:
+            xv = layout(self.rand_cval((6, 5)))
+            yv = layout(self.rand_cval((6, 5)))
+            sv = self.rand_cval((1, 1))
+            zv = xv + yv + sv
+            f(xv, yv, sv)
+            unittest_tools.assert_allclose(xv, zv)
+
+    def test_c_tiled(self):
+        # The C code goes over tiles when an input is transposed with
+        # respect to the output.
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        for xsh, perm in [((5000, 70), (1, 0)),
+                          ((2, 5000, 40), (0, 2, 1))]:
+            x = self.ctype('float64', [0] * len(xsh))('x')
+            y = self.ctype('float64', [0] * len(xsh))('y')
+            e = self.cop(scalar.add)(x, y)
+            f = gof.CLinker().accept(FunctionGraph([x, y],
+                                                   [e])).make_function()
+            xv = self.rand_cval(xsh).transpose(perm)
+            yv = self.rand_cval(xv.shape)
+            unittest_tools.assert_allclose(f(xv, yv), xv + yv)
+            unittest_tools.assert_allclose(f(yv, xv), xv + yv)
+
+    def test_c_tiled_broadcast(self):
+        # Broadcasted inputs have a stride of 0, which must not ask for
+        # tiles, but the loops must stay right when another input does.
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        x = self.ctype('float64', [0, 0])('x')
+        for ysh in [(1, 5000), (40, 1)]:
+            y = self.ctype('float64', [s == 1 for s in ysh])('y')
+            e = self.cop(scalar.add)(x, y)
+            f = gof.CLinker().accept(FunctionGraph([x, y],
+                                                   [e])).make_function()
+            yv = self.rand_cval(ysh)
+            # x C-contiguous, then transposed, which uses the tiles.
+            for xv in [self.rand_cval((40, 5000)),
+                       self.rand_cval((5000, 40)).T]:
+                unittest_tools.assert_allclose(f(xv, yv), xv + yv)
+
     def test_same_inputs(self):
         if not theano.config.cxx:
             raise SkipTest("G++ not available, so we need to skip this test.")
@@ -540,6 +593,41 @@ class test_CAReduce(unittest_tools.InferShapeTester):
             self.with_linker(gof.CLinker(), scalar.maximum, dtype=dtype,
                              test_nan=True)
 
+    def test_c_contiguous(self):
+        # The reduced elements are contiguous in C or F order: the C code
+        # reduces them pairwise, in parallel with openmp.
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        mode = theano.compile.Mode(linker='c', optimizer=None)
+        rng = numpy.random.RandomState(unittest_tools.fetch_seed())
+        for openmp in [False, True]:
+            for xsh, axis in [((1000,), None), ((7, 300), (1,)),
+                              ((300, 7), (0,)), ((3, 4, 50), (1, 2)),
+                              ((0, 5), (1,))]:
+                for scalar_op, ufunc in [(scalar.add, numpy.add),
+                                         (scalar.maximum, numpy.maximum)]:
+                    if scalar_op == scalar.maximum and 0 in xsh:
+                        continue
+                    x = TensorType('float64', [False] * len(xsh))()
+                    f = theano.function(
+                        [x], CAReduce(scalar_op, axis, openmp=openmp)(x),
+                        mode=mode)
+                    xv = rng.rand(*xsh)
+                    if axis is None:
+                        ref = ufunc.reduce(xv.flatten())
+                    else:
+                        ref = ufunc.reduce(xv, axis=axis[0])
+                        if len(axis) == 2:
+                            ref = ufunc.reduce(ref, axis=axis[0])
+                    for val in [xv, numpy.asfortranarray(xv)]:
+                        unittest_tools.assert_allclose(f(val), ref)
+
+        # The pairwise sum keeps the precision of float32.
+        x = tensor.fvector()
+        f = theano.function([x], CAReduce(scalar.add)(x), mode=mode)
+        assert abs(f(numpy.ones(10 ** 6, dtype='float32') * 0.1) -
+                   1e5) < 1e-1
+
     def test_infer_shape(self, dtype=None, pre_scalar_op=None):
         if dtype is None:
             dtype = theano.config.floatX
@@ -1173,6 +1261,74 @@ class TestElemwise(unittest_tools.InferShapeTester):
                              mode=theano.compile.Mode(linker='py'))
         g(*[numpy.zeros(2 ** 11, config.floatX) for i in xrange(6)])
 
+    def test_cost(self):
+        x = tensor.fmatrix()
+        y = tensor.fmatrix()
+        node = Elemwise(scalar.add)(x, y).owner
+        flops, read, written = gof.apply_cost(node, [(5, 6), (5, 6)],
+                                              [(5, 6)])
+        assert flops == 30
+        assert read == 2 * 30 * 4
+        assert written == 30 * 4
+
+        xs = scalar.float32()
+        comp = scalar.Composite([xs], [scalar.exp(xs) + xs])
+        node = Elemwise(comp)(x).owner
+        flops, read, written = gof.apply_cost(node, [(5, 6)], [(5, 6)])
+        assert flops == 2 * 30
+
+        node = CAReduce(scalar.add, axis=[1])(x).owner
+        flops, read, written = gof.apply_cost(node, [(5, 6)], [(5,)])
+        assert flops == 30
+        assert read == 30 * 4
+        assert written == 5 * 4
+
+    def test_openmp_minsize(self):
+        from theano.tensor import elemwise_openmp
+        assert elemwise_openmp.scalar_op_cost_class(scalar.add) == 'cheap'
+        assert elemwise_openmp.scalar_op_cost_class(scalar.tanh) == 'costly'
+        xs = scalar.float32()
+        comp = scalar.Composite([xs], [xs * xs + xs])
+        assert elemwise_openmp.scalar_op_cost_class(comp) == 'cheap'
+        comp = scalar.Composite([xs], [scalar.exp(xs) + xs])
+        assert elemwise_openmp.scalar_op_cost_class(comp) == 'costly'
+
+        x = tensor.fvector()
+        node = Elemwise(scalar.add, openmp=True)(x, x).owner
+        orig = config.openmp_elemwise_autotune
+        try:
+            config.openmp_elemwise_autotune = False
+            assert (node.op.openmp_minsize(node) ==
+                    config.openmp_elemwise_minsize)
+        finally:
+            config.openmp_elemwise_autotune = orig
+
+        # The code generation only reads the thresholds, it never measures
+        # the missing ones.
+        orig_thresholds = elemwise_openmp._thresholds
+        orig_calibrate = elemwise_openmp.calibrate
+
+        def calibrate(*args, **kwargs):
+            raise AssertionError("calibrate called by openmp_minsize")
+        try:
+            config.openmp_elemwise_autotune = True
+            elemwise_openmp.calibrate = calibrate
+            elemwise_openmp._thresholds = {}
+            assert (node.op.openmp_minsize(node) ==
+                    config.openmp_elemwise_minsize)
+            elemwise_openmp._thresholds = {('cheap', 'float32'): 12345}
+            assert node.op.openmp_minsize(node) == 12345
+        finally:
+            config.openmp_elemwise_autotune = orig
+            elemwise_openmp.calibrate = orig_calibrate
+            elemwise_openmp._thresholds = orig_thresholds
+
+        if not theano.config.cxx:
+            raise SkipTest("G++ not available, so we need to skip this test.")
+        minsize = elemwise_openmp.calibrate('cheap', 'float32',
+                                            sizes=[2 ** 10, 2 ** 12])
+        assert minsize in (2 ** 10, 2 ** 12, 2 ** 13)
+
 
 def test_gt_grad():
     """A user test that failed.
@@ -78,6 +78,22 @@ class TestCumsumOp(utt.InferShapeTester):
         for axis in range(-len(a.shape), len(a.shape)):
             utt.verify_grad(self.op_class(axis=axis), [a], eps=4e-4)
 
+    def test_inplace(self):
+        x = T.tensor3('x')
+        a = np.random.random((3, 50, 20)).astype(config.floatX)
+        for axis in range(-a.ndim, a.ndim):
+            f = theano.function([x], cumsum(x * 2, axis=axis))
+            assert any(isinstance(n.op, CumsumOp) and n.op.inplace
+                       for n in f.maker.fgraph.toposort())
+            for val in [a, a.transpose(2, 0, 1)]:
+                assert np.allclose(np.cumsum(val * 2, axis=axis), f(val))
+
+        x = T.lmatrix('x')
+        a = np.random.randint(-10, 10, (30, 40))
+        for axis in [None, 0, 1]:
+            f = theano.function([x], cumsum(x, axis=axis))
+            assert (np.cumsum(a, axis=axis) == f(a)).all()
+
 
 class TestCumprodOp(utt.InferShapeTester):
 
@@ -125,6 +141,16 @@ class TestCumprodOp(utt.InferShapeTester):
         for axis in range(-len(a.shape), len(a.shape)):
             utt.verify_grad(self.op_class(axis=axis), [a])
 
+    def test_inplace(self):
+        x = T.matrix('x')
+        a = np.random.random((30, 40)).astype(config.floatX)
+        for axis in [0, 1]:
+            f = theano.function([x], cumprod(x + 1, axis=axis))
+            assert any(isinstance(n.op, CumprodOp) and n.op.inplace
+                       for n in f.maker.fgraph.toposort())
+            for val in [a, a[::2, ::-3]]:
+                assert np.allclose(np.cumprod(val + 1, axis=axis), f(val))
+
 
 class TestBinCountOp(utt.InferShapeTester):
     def setUp(self):
@@ -251,6 +277,19 @@ class TestBinCountOp(utt.InferShapeTester):
                             50, size=(25,)).astype(dtype)],
                         self.op_class)
 
+    def test_negative(self):
+        x = T.lvector('x')
+        w = T.vector('w')
+        f = theano.function([x, w], [BinCountOp()(x, None),
+                                     BinCountOp(minlength=20)(x, w)])
+        a = np.random.randint(0, 10, 50)
+        weights = np.random.random((50,)).astype(config.floatX)
+        counts, weighted = f(a, weights)
+        assert (np.bincount(a) == counts).all()
+        assert np.allclose(np.bincount(a, weights, 20), weighted)
+        a[3] = -1
+        self.assertRaises(ValueError, f, a, weights)
+
 
 class TestDiffOp(utt.InferShapeTester):
     nb = 10  # Number of time iterating for n
@@ -299,6 +338,15 @@ class TestDiffOp(utt.InferShapeTester):
             theano.function([x], T.grad(T.sum(diff(x, n=k)), x))
             utt.verify_grad(DiffOp(n=k), [a], eps=7e-3)
 
+    def test_non_contiguous(self):
+        x = T.matrix('x')
+        a = np.random.random((30, 50)).astype(config.floatX)
+        for val in [a.T, a[::2, ::-3]]:
+            for axis in range(len(a.shape)):
+                for k in [1, 3]:
+                    f = theano.function([x], diff(x, n=k, axis=axis))
+                    assert np.allclose(np.diff(val, n=k, axis=axis), f(val))
+
 
 class SqueezeTester(utt.InferShapeTester):
     shape_list = [(1, 3),
@@ -498,6 +546,17 @@ class TestRepeatOp(utt.InferShapeTester):
         r = RepeatOp(axis=0)(x, 2)
         self.assertEqual(r.broadcastable, (False, True, False))
 
+    def test_non_contiguous(self):
+        x = T.matrix()
+        r_var = T.lvector()
+        a = np.random.random((10, 6)).astype(config.floatX)[::2, ::-1]
+        for axis in [None, 0, 1]:
+            f = theano.function([x, r_var], repeat(x, r_var, axis=axis))
+            size = a.size if axis is None else a.shape[axis]
+            r = np.random.randint(0, 4, size)
+            assert np.allclose(np.repeat(a, r, axis=axis), f(a, r))
+            self.assertRaises(ValueError, f, a, r[:-1])
+
 
 class TestBartlett(utt.InferShapeTester):
 
@@ -583,6 +642,26 @@ class TestFillDiagonal(utt.InferShapeTester):
                                 self.op_class,
                                 warn=False)
 
+    def test_inplace(self):
+        x = tensor.matrix()
+        y = tensor.scalar()
+        f = function([x, y], fill_diagonal(x * 2, y))
+        assert any(isinstance(n.op, FillDiagonal) and n.op.inplace
+                   for n in f.maker.fgraph.toposort())
+        for shp in [(8, 8), (5, 8), (8, 5)]:
+            a = numpy.random.rand(*shp).astype(config.floatX)
+            val = numpy.cast[config.floatX](numpy.random.rand())
+            out = f(a, val)
+            expected = a * 2
+            expected[numpy.arange(min(shp)), numpy.arange(min(shp))] = val
+            assert numpy.allclose(out, expected)
+
+        x = tensor.tensor3()
+        f = function([x, y], fill_diagonal(x, y))
+        self.assertRaises(ValueError, f,
+                          numpy.random.rand(3, 3, 4).astype(config.floatX),
+                          numpy.cast[config.floatX](1))
+
 
 class TestFillDiagonalOffset(utt.InferShapeTester):
 
@@ -774,3 +853,35 @@ class test_Unique(utt.InferShapeTester):
                                             dtype=config.floatX)],
                                 self.op_class)
 
+    def test_nan_and_zeros(self):
+        x = theano.tensor.vector()
+        inp = np.asarray([0., np.nan, -0., 2, np.nan, 1, 2, 0.],
+                         dtype=config.floatX)
+        for op in self.ops:
+            f = theano.function(inputs=[x], outputs=op(x, return_list=True))
+            outs = f(inp)
+            outs_expected = np.unique(inp, op.return_index,
+                                      op.return_inverse, op.return_counts)
+            if not isinstance(outs_expected, tuple):
+                outs_expected = [outs_expected]
+            for out, out_exp in zip(outs, outs_expected):
+                assert np.allclose(out, out_exp, equal_nan=True)
+
+    def test_large(self):
+        # Many distinct values, and few.
+        x = theano.tensor.vector()
+        for inp in [np.random.random(100000),
+                    np.random.randint(0, 100, 100000)]:
+            inp = inp.astype(config.floatX)
+            inp[7] = np.nan
+            for op in self.ops:
+                f = theano.function(inputs=[x],
+                                    outputs=op(x, return_list=True))
+                outs = f(inp)
+                outs_expected = np.unique(inp, op.return_index,
+                                          op.return_inverse,
+                                          op.return_counts)
+                if not isinstance(outs_expected, tuple):
+                    outs_expected = [outs_expected]
+                for out, out_exp in zip(outs, outs_expected):
+                    assert np.allclose(out, out_exp, equal_nan=True)
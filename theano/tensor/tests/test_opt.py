@@ -1626,6 +1626,51 @@ def test_local_useless_slice():
     assert not any(isinstance(idx, slice) for idx in subtens.idx_list)
 
 
+def test_inplace_assignment_optimizer():
+    x, y = dmatrices('xy')
+    a = x + y
+    b = tensor.exp(a)
+    c = b * x
+    fg = FunctionGraph([x, y], [c])
+    fg.attach_feature(theano.compile.function_module.Supervisor(fg.inputs))
+    prof = opt.inplace_assignment_optimizer.optimize(fg)
+    assert prof[2] == 2, prof
+    add, exp, mul = fg.toposort()
+    # The inputs are protected.
+    assert add.op.inplace_pattern == {}
+    assert exp.op.inplace_pattern == {0: 0}
+    assert mul.op.inplace_pattern == {0: 0}
+
+    # The registered local optimizers are also used.
+    z = dmatrix('z')
+    mode = mode_opt.excluding('InplaceBlasOpt', 'inplace_elemwise_opt')
+    f = function([x, y, z], tensor.dot(x, y) + tensor.exp(z), mode=mode)
+    assert any(n.op == tensor.blas.gemm_inplace
+               for n in f.maker.fgraph.toposort())
+    xv = numpy.random.rand(3, 4)
+    yv = numpy.random.rand(4, 5)
+    zv = numpy.random.rand(3, 5)
+    utt.assert_allclose(f(xv, yv, zv), numpy.dot(xv, yv) + numpy.exp(zv))
+
+    # The candidates of a node are only computed once, even when the
+    # conflicts between them need several iterations.
+    transformed = []
+
+    @gof.local_optimizer(None)
+    def record(node):
+        transformed.append(node)
+        return False
+    out = x
+    for i in range(10):
+        out = (out * y + x).T
+    fg = FunctionGraph([x, y], [out])
+    fg.attach_feature(theano.compile.function_module.Supervisor(fg.inputs))
+    prof = opt.InplaceAssignmentOptimizer(tensor.Elemwise,
+                                          [record]).optimize(fg)
+    assert prof[2] == 19, prof
+    assert len(transformed) == len(set(transformed)) == 10
+
+
 def test_local_useless_inc_subtensor():
     x = tensor.matrix('x')
     y = tensor.matrix('y')
@@ -5655,6 +5700,9 @@ def test_local_useless_split():
     graph_nonopt = f_nonopt.maker.fgraph.toposort()
 
     assert isinstance(graph_opt[-1].op, DeepCopyOp)
+    # The outputs of Split are views of x, so they are copied.
+    graph_nonopt = [node for node in graph_nonopt
+                    if not isinstance(node.op, DeepCopyOp)]
     assert len(graph_nonopt)==1
     assert isinstance(graph_nonopt[0].op, tensor.Split)
 
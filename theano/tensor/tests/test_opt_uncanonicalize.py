@@ -105,3 +105,63 @@ class T_min_max(unittest.TestCase):
             assert len(topo) == 1
             assert isinstance(topo[0].op, CAReduce)  # max
             f(data)
+
+
+def _scalar_ops(fgraph):
+    # The scalar ops of the Elemwise of fgraph, also inside the Composite.
+    scalar_ops = [node.op.scalar_op for node in fgraph.toposort()
+                  if isinstance(node.op, Elemwise)]
+    for s_op in scalar_ops:
+        if isinstance(s_op, scalar.Composite):
+            scalar_ops.extend(n.op for n in s_op.fgraph.toposort())
+    return scalar_ops
+
+
+def test_local_fast_approx():
+    x = tensor.vector()
+    out = tensor.exp(x) + tensor.tanh(x) + tensor.nnet.softplus(x)
+    mode = theano.compile.mode.get_default_mode().including('fast_approx')
+    f = function([x], out, mode=mode)
+    scalar_ops = _scalar_ops(f.maker.fgraph)
+    for cls in (scalar.approx.FastExp, scalar.approx.FastTanh,
+                scalar.approx.FastSoftplus):
+        assert any(isinstance(s_op, cls) for s_op in scalar_ops)
+    assert not any(isinstance(s_op, (scalar.Exp, scalar.Tanh))
+                   for s_op in scalar_ops)
+
+    val = numpy.linspace(-5, 5, 101).astype(config.floatX)
+    f_exact = function([x], out)
+    utt.assert_allclose(f(val), f_exact(val))
+
+    # The ops inside a Composite are changed too.
+    xs = scalar.float64()
+    comp = scalar.Composite([xs], [scalar.exp(xs) + scalar.tanh(xs)])
+    x = tensor.dvector()
+    out = Elemwise(comp)(x)
+    f = function([x], out, mode=mode)
+    scalar_ops = _scalar_ops(f.maker.fgraph)
+    assert any(isinstance(s_op, scalar.approx.FastExp) for s_op in scalar_ops)
+    assert any(isinstance(s_op, scalar.approx.FastTanh)
+               for s_op in scalar_ops)
+    assert not any(isinstance(s_op, (scalar.Exp, scalar.Tanh))
+                   for s_op in scalar_ops)
+    val = numpy.linspace(-5, 5, 101)
+    utt.assert_allclose(f(val), function([x], out)(val))
+
+    # The exp of an int32 has a float64 output, so it is changed even if
+    # its result is cast back to int32.
+    x = tensor.ivector()
+    f = function([x], tensor.exp(x).astype('int32'), mode=mode)
+    scalar_ops = _scalar_ops(f.maker.fgraph)
+    assert any(isinstance(s_op, scalar.approx.FastExp) for s_op in scalar_ops)
+    assert not any(isinstance(s_op, scalar.Exp) for s_op in scalar_ops)
+    val = numpy.arange(-5, 6, dtype='int32')
+    utt.assert_allclose(f(val), numpy.exp(val).astype('int32'))
+
+    # The complex outputs are not changed.
+    x = tensor.cvector()
+    f = function([x], tensor.exp(x), mode=mode)
+    scalar_ops = _scalar_ops(f.maker.fgraph)
+    assert any(isinstance(s_op, scalar.Exp) for s_op in scalar_ops)
+    assert not any(isinstance(s_op, scalar.approx.FastExp)
+                   for s_op in scalar_ops)
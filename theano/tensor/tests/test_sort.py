@@ -8,6 +8,7 @@ from theano import tensor
 
 from theano.tensor.sort import sort, SortOp
 from theano.tensor.sort import argsort, ArgSortOp
+from theano.tensor.sort import topk, argtopk, topk_and_argtopk, TopKOp
 
 
 class test_sort(unittest.TestCase):
@@ -133,6 +134,133 @@ class test_sort(unittest.TestCase):
         data = np.random.rand(2, 3, 4, 2).astype(theano.config.floatX)
         utt.verify_grad(lambda x: sort(x, 3), [data])
 
+    def test_inplace(self):
+        a = tensor.dtensor3()
+        axis = tensor.iscalar()
+        f = theano.function([a, axis], sort(a * 2, axis),
+                            mode=theano.compile.mode.get_default_mode())
+        if theano.config.mode != 'FAST_COMPILE':
+            assert any(isinstance(n.op, SortOp) and n.op.inplace
+                       for n in f.maker.fgraph.toposort())
+        val = self.rng.rand(3, 4, 5)
+        for axis_val in -3, -1, 0, 1, 2:
+            assert np.allclose(f(val, axis_val), np.sort(val * 2, axis_val))
+        self.assertRaises(IndexError, f, val, 3)
+        # The input of the function is not sorted in place.
+        g = theano.function([a], sort(a))
+        val_copy = val.copy()
+        g(val)
+        assert np.all(val == val_copy)
+
+
+class test_topk(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(seed=utt.fetch_seed())
+
+    def _check(self, val, ks, axis, sorted=True):
+        x = tensor.TensorType(str(val.dtype), (False,) * val.ndim)()
+        kv = tensor.iscalar()
+        values, indices = topk_and_argtopk(x, kv, axis, sorted)
+        f = theano.function([x, kv], [values, indices])
+        for k in ks:
+            v, i = f(val, k)
+            if axis is None:
+                flat, ax = val.flatten(), 0
+            else:
+                flat, ax = val, axis % val.ndim
+            # The indices give the values.
+            index = list(np.ix_(*[np.arange(s) for s in i.shape]))
+            index[ax] = i
+            assert np.all(flat[tuple(index)] == v)
+            ref = np.sort(flat, ax)
+            n = flat.shape[ax]
+            if k > 0:
+                ref = np.take(ref, np.arange(n - 1, n - k - 1, -1), ax)
+            else:
+                ref = np.take(ref, np.arange(-k), ax)
+            if not sorted:
+                v = np.sort(v, ax)
+                ref = np.sort(ref, ax)
+            utt.assert_allclose(v, ref)
+
+    def test_values_and_indices(self):
+        for dtype in ['float64', 'float32', 'int32', 'uint8']:
+            val = (self.rng.rand(4, 50, 3) * 100).astype(dtype)
+            for axis in [None, 0, 1, -1]:
+                n = val.size if axis is None else val.shape[axis]
+                for sorted in [True, False]:
+                    self._check(val, [1, 3, n, -1, -2, -n], axis, sorted)
+
+    def test_k0(self):
+        x = tensor.dmatrix()
+        v, i = topk_and_argtopk(x, 0)
+        f = theano.function([x], [v, i])
+        rv, ri = f(self.rng.rand(3, 4))
+        assert rv.shape == (3, 0) and ri.shape == (3, 0)
+
+    def test_nan(self):
+        x = tensor.dvector()
+        f = theano.function([x], [topk(x, 2), topk(x, -2)])
+        big, small = f(np.array([1., np.nan, 3., 0.]))
+        assert np.isnan(big[0]) and big[1] == 3.
+        assert np.all(small == [0., 1.])
+
+    def test_ties(self):
+        # The C and Python implementations break the ties by index, NaN
+        # being the largest value.
+        x = tensor.dmatrix()
+        k = tensor.iscalar()
+        linkers = ['py']
+        if theano.config.cxx:
+            linkers.append('c')
+        val = np.array([[1, 1, 1, 0, np.nan, 1],
+                        [3, 5, 5, 5, 3, np.nan],
+                        [np.nan, 2, np.nan, 2, 2, 2]])
+        cases = [
+            (val[:2, :4], 2, -1, [[0, 1], [1, 2]]),
+            (val, 2, -1, [[4, 0], [5, 1], [0, 2]]),
+            (val, -2, -1, [[3, 0], [0, 4], [1, 3]]),
+            (val, 6, -1, [[4, 0, 1, 2, 5, 3], [5, 1, 2, 3, 0, 4],
+                          [0, 2, 1, 3, 4, 5]]),
+            (val, 2, 0, [[2, 1, 2, 1, 0, 1], [1, 2, 1, 2, 1, 2]]),
+            (val, -1, 0, [[0, 0, 0, 0, 2, 0]])]
+        for linker in linkers:
+            mode = theano.compile.Mode(linker=linker, optimizer=None)
+            for axis in [0, -1]:
+                f = theano.function([x, k], argtopk(x, k, axis), mode=mode)
+                for v, kv, ax, idx in cases:
+                    if ax == axis:
+                        assert np.all(f(v, kv) == idx), (linker, kv, axis)
+
+    def test_errors(self):
+        x = tensor.dmatrix()
+        k = tensor.iscalar()
+        f = theano.function([x, k], topk(x, k))
+        self.assertRaises(ValueError, f, self.rng.rand(2, 3), 4)
+        self.assertRaises(ValueError, f, self.rng.rand(2, 3), -4)
+        self.assertRaises(TypeError, topk, x, tensor.dscalar())
+        self.assertRaises(ValueError, topk, x, 1, 2)
+
+    def test_argtopk(self):
+        x = tensor.dmatrix()
+        f = theano.function([x], argtopk(x, 2, axis=0))
+        val = self.rng.rand(5, 3)
+        assert np.all(f(val) == np.argsort(val, 0)[::-1][:2])
+
+    def test_grad(self):
+        data = self.rng.rand(3, 7).astype(theano.config.floatX)
+        for axis in [0, 1, -1]:
+            for k in [1, 2, -3]:
+                utt.verify_grad(lambda x: topk(x, k, axis), [data])
+        utt.verify_grad(lambda x: topk(x, 4, None), [data])
+        # The values of the gradient.
+        x = tensor.dvector()
+        g = theano.grad(topk(x, 2).sum(), x)
+        f = theano.function([x], g)
+        assert np.all(f(np.array([1., 5., 3., 4.])) == [0, 1, 0, 1])
+
+
 class TensorInferShapeTester(utt.InferShapeTester):
     def test_sort(self):
         x = tensor.matrix()
@@ -147,6 +275,16 @@ class TensorInferShapeTester(utt.InferShapeTester):
                 [np.random.randn(10, 40).astype(theano.config.floatX)],
                 SortOp)
 
+    def test_topk(self):
+        x = tensor.tensor3()
+        for axis in [0, 1, -1]:
+            for k in [2, -3]:
+                self._compile_and_check(
+                    [x],
+                    topk_and_argtopk(x, k, axis),
+                    [np.random.randn(4, 5, 6).astype(theano.config.floatX)],
+                    TopKOp)
+
 
 def test_argsort():
     # Set up
@@ -1236,6 +1236,97 @@ class TestIncSubtensor1(unittest.TestCase):
         self.assertRaises(TypeError,
                           lambda: inc_subtensor(self.v[self.adv1q], fmatrix()))
 
+    def test_c_rows(self):
+        # The C code, with the short lists scattered directly and the long
+        # ones sorted by row, already sorted, or bucketed.
+        if not theano.config.cxx:
+            raise SkipTest("Need cxx for the C code")
+        rng = numpy.random.RandomState(utt.fetch_seed())
+        mode = theano.compile.Mode(linker='cvm', optimizer=None)
+        x = tensor.dtensor3()
+        idx = tensor.lvector()
+        n_big = AdvancedIncSubtensor1.sort_min_size + 1
+        idx_vals = [rng.randint(-20, 20, size=7),
+                    # Few rows: counting sort.
+                    rng.randint(0, 20, size=n_big),
+                    numpy.sort(rng.randint(0, 20, size=n_big)),
+                    numpy.arange(-1, -n_big - 1, -1) % 40000,
+                    # Many rows: comparison sort.
+                    rng.randint(-40000, 40000, size=n_big),
+                    numpy.zeros(0, dtype='int64')]
+        for y in [tensor.dtensor3(), tensor.dmatrix(), tensor.ftensor3(),
+                  tensor.TensorType('float64', (True, False, False))()]:
+            for set_instead_of_inc in [False, True]:
+                op = AdvancedIncSubtensor1(
+                    set_instead_of_inc=set_instead_of_inc)
+                f = theano.function([x, y, idx], op(x, y, idx), mode=mode)
+                for idx_val in idx_vals:
+                    if len(idx_val) and abs(idx_val).max() > 20:
+                        nb_rows = 40000
+                    else:
+                        nb_rows = 20
+                    x_val = rng.rand(nb_rows, 2, 3)
+                    if y.ndim == 2:
+                        y_shp = (2, 3)
+                    elif y.broadcastable[0]:
+                        y_shp = (1, 2, 3)
+                    else:
+                        y_shp = (len(idx_val), 2, 3)
+                    y_val = rng.rand(*y_shp).astype(y.dtype)
+                    expected = x_val.copy()
+                    y_rows = y_val.reshape((-1, 2, 3)) if y.ndim == 3 \
+                        else y_val[None]
+                    for j, i in enumerate(idx_val):
+                        y_j = y_rows[j % len(y_rows)]
+                        if set_instead_of_inc:
+                            expected[i] = y_j
+                        else:
+                            expected[i] += y_j
+                    utt.assert_allclose(f(x_val, y_val, idx_val), expected)
+
+        # A list that does not match y, and indices out of bounds.
+        y = tensor.dtensor3()
+        f = theano.function([x, y, idx], advanced_inc_subtensor1(x, y, idx),
+                            mode=mode)
+        x_val = rng.rand(5, 2, 3)
+        self.assertRaises(ValueError, f, x_val, rng.rand(3, 2, 3), [0, 1])
+        self.assertRaises(IndexError, f, x_val, rng.rand(2, 2, 3), [0, 5])
+        self.assertRaises(IndexError, f, x_val, rng.rand(2, 2, 3), [0, -6])
+
+        # An inplace update of a view that is not C-contiguous.
+        m = tensor.dmatrix()
+        v = tensor.dmatrix()
+        op = AdvancedIncSubtensor1(inplace=True)
+        f = theano.function([theano.In(m, mutable=True), v, idx],
+                            op(m, v, idx),
+                            mode=mode, accept_inplace=True)
+        m_val = rng.rand(3, 8)
+        view = m_val[:, ::2]
+        expected = view.copy()
+        expected[[0, 2]] += 1
+        utt.assert_allclose(f(view, numpy.ones((2, 4)), [0, 2]), expected)
+        utt.assert_allclose(view, expected)
+
+    def test_c_code_cache_version(self):
+        # The thresholds in the C code are in its version.
+        x = tensor.dmatrix()
+        y = tensor.dmatrix()
+        idx = tensor.lvector()
+        node = AdvancedIncSubtensor1(openmp=True)(x, y, idx).owner
+        orig = (config.openmp_elemwise_autotune,
+                config.openmp_elemwise_minsize)
+        try:
+            config.openmp_elemwise_autotune = False
+            version = node.op.c_code_cache_version_apply(node)
+            config.openmp_elemwise_minsize = orig[1] + 1
+            assert node.op.c_code_cache_version_apply(node) != version
+            config.openmp_elemwise_minsize = orig[1]
+            node.op.sort_min_size = 2 * AdvancedIncSubtensor1.sort_min_size
+            assert node.op.c_code_cache_version_apply(node) != version
+        finally:
+            (config.openmp_elemwise_autotune,
+             config.openmp_elemwise_minsize) = orig
+
 
 inplace_increment_missing = SkipTest(
     "inc_subtensor with advanced indexing not enabled. "
@@ -1470,6 +1561,64 @@ class TestAdvancedSubtensor(unittest.TestCase):
         utt.verify_grad(fun, [numpy.random.rand(5, 5).astype(self.dtype),
                               numpy.random.rand(2).astype(self.dtype)])
 
+    def test_c_code(self):
+        # Index arrays next to each other or not, broadcast against each
+        # other, with slices around them.
+        if self.sub is not tensor.AdvancedSubtensor:
+            raise SkipTest("Test the C code of AdvancedSubtensor only")
+        if not theano.config.cxx:
+            raise SkipTest("Need cxx for the C code")
+        rng = numpy.random.RandomState(utt.fetch_seed())
+        mode = theano.compile.Mode(linker='cvm', optimizer=None)
+        x = tensor.dtensor4()
+        a = tensor.lvector()
+        b = tensor.imatrix()
+        x_val = rng.rand(5, 6, 7, 8)
+        a_val = numpy.asarray([-1, 0, 3])
+        cases = [(x[a, b], (a, b)),
+                 (x[:, a, 1:5:2, b], (slice(None), a, slice(1, 5, 2), b)),
+                 (x[1::2, a, b], (slice(1, None, 2), a, b)),
+                 (x[a, ::-1, b], (a, slice(None, None, -1), b))]
+        for z, idx in cases:
+            assert isinstance(z.owner.op, tensor.AdvancedSubtensor)
+            b_val = rng.randint(0, 5, (2, 3)).astype('int32')
+            np_idx = tuple(a_val if i is a else b_val if i is b else i
+                           for i in idx)
+            f = theano.function([x, a, b], z, mode=mode)
+            utt.assert_allclose(f(x_val, a_val, b_val), x_val[np_idx])
+
+            y = tensor.tensor('float32', (False,) * (z.ndim - 1))
+            y_val = rng.rand(*x_val[np_idx].shape[1:]).astype('float32')
+            for set_instead_of_inc in [False, True]:
+                for inplace in [False, True]:
+                    op = tensor.AdvancedIncSubtensor(
+                        inplace=inplace,
+                        set_instead_of_inc=set_instead_of_inc)
+                    f = theano.function(
+                        [theano.In(x, mutable=True), y, a, b],
+                        op(x, y, *z.owner.inputs[1:]),
+                        mode=mode, accept_inplace=True)
+                    expected = x_val.copy()
+                    if set_instead_of_inc:
+                        expected[np_idx] = y_val
+                    else:
+                        # a has no duplicates, b has some.
+                        numpy.add.at(expected, np_idx, y_val)
+                    x_copy = x_val.copy()
+                    utt.assert_allclose(f(x_copy, y_val, a_val, b_val),
+                                        expected)
+                    if inplace:
+                        utt.assert_allclose(x_copy, expected)
+
+        f = theano.function([x, a, b], x[a, b], mode=mode)
+        self.assertRaises(IndexError, f, x_val, [0, 5], [[0, 1]])
+        self.assertRaises(IndexError, f, x_val, [0, 1, 2], [[0, 1]])
+        y = tensor.dtensor3()
+        f = theano.function([x, y, a, b], advanced_inc_subtensor(x, y, a, b),
+                            mode=mode)
+        self.assertRaises(ValueError, f, x_val, rng.rand(3, 7, 8),
+                          [0], [[0, 1]])
+
 
 class TestInferShape(utt.InferShapeTester):
     @attr('slow')
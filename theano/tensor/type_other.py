@@ -5,7 +5,7 @@
 import numpy
 
 import theano
-from theano.gof import Apply, Constant, Generic, Op, Type, hashtype
+from theano.gof import Apply, Constant, Generic, Op, hashtype
 from theano.gradient import DisconnectedType
 
 
@@ -42,13 +42,33 @@ class MakeSlice(Op):
         out, = out_
         out[0] = slice(*inp)
 
+    def c_code(self, node, name, inp, out_, sub):
+        start, stop, step = inp
+        out, = out_
+        fail = sub['fail']
+        # The bounds are 0-d arrays or None, like in perform.
+        return """
+        Py_XDECREF(%(out)s);
+        %(out)s = PySlice_New((PyObject*)%(start)s, (PyObject*)%(stop)s,
+                              (PyObject*)%(step)s);
+        if (!%(out)s)
+            %(fail)s
+        """ % locals()
+
+    def c_code_cache_version(self):
+        return (1,)
+
     def grad(self, inputs, grads):
         return [DisconnectedType()() for i in inputs]
 
 make_slice = MakeSlice()
 
 
-class SliceType(Type):
+class SliceType(Generic):
+    """
+    Inherit from Generic to have c code working.
+
+    """
 
     def filter(self, x, strict=False, allow_downcast=None):
         if isinstance(x, slice):